@@ -32,11 +32,62 @@ CREATE TABLE `agent_learning_data` (
   `agent_id` int(11) NOT NULL,
   `data_type` enum('message_history','profile_interaction','preferences') DEFAULT NULL,
   `data_content` json NOT NULL,
+  `source` varchar(64) DEFAULT NULL,
+  `metadata` json DEFAULT NULL,
+  `is_processed` tinyint(1) NOT NULL DEFAULT '0',
+  `processed_at` timestamp NULL DEFAULT NULL,
   `created_at` timestamp NULL DEFAULT CURRENT_TIMESTAMP
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
 -- --------------------------------------------------------
 
+--
+-- Структура таблицы `agent_learning_aggregates`
+--
+
+CREATE TABLE `agent_learning_aggregates` (
+  `agent_id` int(11) NOT NULL,
+  `aggregate_data` json NOT NULL,
+  `processed_count` int(11) NOT NULL DEFAULT '0',
+  `updated_at` timestamp NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- --------------------------------------------------------
+
+--
+-- Структура таблицы `agent_learning_stats`
+--
+
+CREATE TABLE `agent_learning_stats` (
+  `agent_id` int(11) NOT NULL,
+  `data_type` varchar(32) NOT NULL DEFAULT '',
+  `source` varchar(64) NOT NULL DEFAULT '',
+  `hour_bucket` datetime NOT NULL,
+  `total_count` int(11) NOT NULL DEFAULT '0',
+  `processed_count` int(11) NOT NULL DEFAULT '0'
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- --------------------------------------------------------
+
+--
+-- Структура таблицы `agent_personality_features`
+--
+
+CREATE TABLE `agent_personality_features` (
+  `agent_id` int(11) NOT NULL,
+  `feature_version` tinyint(4) NOT NULL DEFAULT '1',
+  `communication_style` varchar(32) DEFAULT NULL,
+  `attribute_count` smallint(6) NOT NULL DEFAULT '0',
+  `interest_count` smallint(6) NOT NULL DEFAULT '0',
+  `pattern_count` smallint(6) NOT NULL DEFAULT '0',
+  `learning_records` int(11) NOT NULL DEFAULT '0',
+  `avg_message_length` float DEFAULT NULL,
+  `embedding` varbinary(256) NOT NULL,
+  `updated_at` timestamp NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- --------------------------------------------------------
+
 --
 -- Структура таблицы `agent_simulations`
 --
@@ -51,6 +102,12 @@ CREATE TABLE `agent_simulations` (
   `simulation_summary` text,
   `started_at` timestamp NULL DEFAULT NULL,
   `completed_at` timestamp NULL DEFAULT NULL,
+  `attempts` int(11) NOT NULL DEFAULT '0',
+  `max_attempts` int(11) NOT NULL DEFAULT '3',
+  `available_at` timestamp NULL DEFAULT CURRENT_TIMESTAMP,
+  `locked_by` varchar(64) DEFAULT NULL,
+  `lease_expires_at` timestamp NULL DEFAULT NULL,
+  `last_error` text,
   `created_at` timestamp NULL DEFAULT CURRENT_TIMESTAMP
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
@@ -87,6 +144,22 @@ CREATE TABLE `agent_simulation_messages` (
 
 -- --------------------------------------------------------
 
+--
+-- Структура таблицы `agent_simulation_transcripts`
+--
+
+CREATE TABLE `agent_simulation_transcripts` (
+  `simulation_id` int(11) NOT NULL,
+  `format_version` tinyint(4) NOT NULL DEFAULT '1',
+  `turn_count` int(11) NOT NULL DEFAULT '0',
+  `raw_size` int(11) NOT NULL DEFAULT '0',
+  `transcript` mediumblob NOT NULL,
+  `started_at` timestamp NULL DEFAULT NULL,
+  `created_at` timestamp NULL DEFAULT CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- --------------------------------------------------------
+
 --
 -- Структура таблицы `chat_conversations`
 --
@@ -100,6 +173,27 @@ CREATE TABLE `chat_conversations` (
 
 -- --------------------------------------------------------
 
+--
+-- Структура таблицы `chat_inbox`
+--
+
+CREATE TABLE `chat_inbox` (
+  `user_id` int(11) NOT NULL,
+  `conversation_id` int(11) NOT NULL,
+  `match_id` int(11) NOT NULL,
+  `user1_id` int(11) NOT NULL,
+  `user2_id` int(11) NOT NULL,
+  `match_status` enum('active','paused','ended') DEFAULT 'active',
+  `other_user_id` int(11) NOT NULL,
+  `other_user_name` varchar(255) DEFAULT NULL,
+  `other_user_photo` varchar(255) DEFAULT NULL,
+  `last_message_preview` varchar(255) DEFAULT NULL,
+  `last_message_at` timestamp NULL DEFAULT NULL,
+  `created_at` timestamp NULL DEFAULT CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- --------------------------------------------------------
+
 --
 -- Структура таблицы `chat_messages`
 --
@@ -116,6 +210,19 @@ CREATE TABLE `chat_messages` (
 
 -- --------------------------------------------------------
 
+--
+-- Структура таблицы `chat_unread_counters`
+--
+
+CREATE TABLE `chat_unread_counters` (
+  `user_id` int(11) NOT NULL,
+  `conversation_id` int(11) NOT NULL,
+  `unread_count` int(11) NOT NULL DEFAULT '0',
+  `updated_at` timestamp NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- --------------------------------------------------------
+
 --
 -- Структура таблицы `matches`
 --
@@ -150,6 +257,24 @@ CREATE TABLE `profile_details` (
 
 -- --------------------------------------------------------
 
+--
+-- Структура таблицы `simulation_result_cache`
+--
+
+CREATE TABLE `simulation_result_cache` (
+  `cache_key` char(64) NOT NULL,
+  `agent1_id` int(11) NOT NULL,
+  `agent2_id` int(11) NOT NULL,
+  `engine_version` varchar(64) NOT NULL,
+  `simulation_id` int(11) NOT NULL,
+  `compatibility_score` decimal(3,2) DEFAULT NULL,
+  `simulation_summary` text,
+  `hit_count` int(11) NOT NULL DEFAULT '0',
+  `created_at` timestamp NULL DEFAULT CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- --------------------------------------------------------
+
 --
 -- Структура таблицы `users`
 --
@@ -250,7 +375,29 @@ CREATE TABLE `user_sessions` (
 --
 ALTER TABLE `agent_learning_data`
   ADD PRIMARY KEY (`id`),
-  ADD KEY `agent_id` (`agent_id`);
+  ADD KEY `agent_id` (`agent_id`),
+  ADD KEY `idx_agent_learning_data_unprocessed` (`is_processed`,`id`);
+
+--
+-- Индексы таблицы `agent_learning_aggregates`
+--
+ALTER TABLE `agent_learning_aggregates`
+  ADD PRIMARY KEY (`agent_id`);
+
+--
+-- Индексы таблицы `agent_learning_stats`
+--
+ALTER TABLE `agent_learning_stats`
+  ADD PRIMARY KEY (`agent_id`,`data_type`,`source`,`hour_bucket`),
+  ADD KEY `idx_agent_learning_stats_hour` (`hour_bucket`);
+
+--
+-- Индексы таблицы `agent_personality_features`
+--
+ALTER TABLE `agent_personality_features`
+  ADD PRIMARY KEY (`agent_id`),
+  ADD KEY `idx_agent_personality_features_style` (`communication_style`),
+  ADD KEY `idx_agent_personality_features_updated` (`updated_at`);
 
 --
 -- Индексы таблицы `agent_simulations`
@@ -260,7 +407,9 @@ ALTER TABLE `agent_simulations`
   ADD KEY `conversation_id` (`conversation_id`),
   ADD KEY `agent1_id` (`agent1_id`),
   ADD KEY `agent2_id` (`agent2_id`),
-  ADD KEY `idx_agent_simulations_status` (`simulation_status`,`created_at`);
+  ADD KEY `idx_agent_simulations_status` (`simulation_status`,`created_at`),
+  ADD KEY `idx_agent_simulations_queue` (`simulation_status`,`available_at`),
+  ADD KEY `idx_agent_simulations_lease` (`simulation_status`,`lease_expires_at`);
 
 --
 -- Индексы таблицы `agent_simulation_feedback`
@@ -276,7 +425,14 @@ ALTER TABLE `agent_simulation_feedback`
 ALTER TABLE `agent_simulation_messages`
   ADD PRIMARY KEY (`id`),
   ADD KEY `sender_agent_id` (`sender_agent_id`),
-  ADD KEY `idx_agent_simulation_messages_simulation` (`simulation_id`,`created_at`);
+  ADD KEY `idx_agent_simulation_messages_simulation` (`simulation_id`,`created_at`),
+  ADD FULLTEXT KEY `ft_agent_simulation_messages_text` (`message_text`) WITH PARSER ngram;
+
+--
+-- Индексы таблицы `agent_simulation_transcripts`
+--
+ALTER TABLE `agent_simulation_transcripts`
+  ADD PRIMARY KEY (`simulation_id`);
 
 --
 -- Индексы таблицы `chat_conversations`
@@ -286,13 +442,31 @@ ALTER TABLE `chat_conversations`
   ADD KEY `match_id` (`match_id`),
   ADD KEY `idx_chat_conversations_last_message` (`last_message_at`);
 
+--
+-- Индексы таблицы `chat_inbox`
+--
+ALTER TABLE `chat_inbox`
+  ADD PRIMARY KEY (`user_id`,`conversation_id`),
+  ADD KEY `idx_chat_inbox_user_last_message` (`user_id`,`last_message_at`),
+  ADD KEY `conversation_id` (`conversation_id`),
+  ADD KEY `other_user_id` (`other_user_id`),
+  ADD KEY `match_id` (`match_id`);
+
 --
 -- Индексы таблицы `chat_messages`
 --
 ALTER TABLE `chat_messages`
   ADD PRIMARY KEY (`id`),
   ADD KEY `sender_id` (`sender_id`),
-  ADD KEY `idx_chat_messages_conversation` (`conversation_id`,`created_at`);
+  ADD KEY `idx_chat_messages_conversation` (`conversation_id`,`created_at`),
+  ADD FULLTEXT KEY `ft_chat_messages_text` (`message_text`) WITH PARSER ngram;
+
+--
+-- Индексы таблицы `chat_unread_counters`
+--
+ALTER TABLE `chat_unread_counters`
+  ADD PRIMARY KEY (`user_id`,`conversation_id`),
+  ADD KEY `conversation_id` (`conversation_id`);
 
 --
 -- Индексы таблицы `matches`
@@ -301,7 +475,8 @@ ALTER TABLE `matches`
   ADD PRIMARY KEY (`id`),
   ADD UNIQUE KEY `unique_match` (`user1_id`,`user2_id`),
   ADD KEY `user2_id` (`user2_id`),
-  ADD KEY `idx_matches_users` (`user1_id`,`user2_id`,`match_status`);
+  ADD KEY `idx_matches_users` (`user1_id`,`user2_id`,`match_status`),
+  ADD KEY `idx_matches_updated_at` (`updated_at`);
 
 --
 -- Индексы таблицы `profile_details`
@@ -311,13 +486,24 @@ ALTER TABLE `profile_details`
   ADD KEY `user_id` (`user_id`),
   ADD KEY `idx_profile_details_gender` (`gender`),
   ADD KEY `idx_profile_details_age` (`age`),
-  ADD KEY `idx_profile_details_location` (`location`);
+  ADD KEY `idx_profile_details_location` (`location`),
+  ADD KEY `idx_profile_details_updated_at` (`updated_at`);
+
+--
+-- Индексы таблицы `simulation_result_cache`
+--
+ALTER TABLE `simulation_result_cache`
+  ADD PRIMARY KEY (`cache_key`),
+  ADD KEY `idx_simulation_result_cache_agent1` (`agent1_id`),
+  ADD KEY `idx_simulation_result_cache_agent2` (`agent2_id`),
+  ADD KEY `simulation_id` (`simulation_id`);
 
 --
 -- Индексы таблицы `users`
 --
 ALTER TABLE `users`
   ADD PRIMARY KEY (`id`),
+  ADD UNIQUE KEY `idx_users_email` (`email`),
   ADD KEY `idx_users_last_activity` (`last_activity`);
 
 --
@@ -325,7 +511,8 @@ ALTER TABLE `users`
 --
 ALTER TABLE `user_agents`
   ADD PRIMARY KEY (`id`),
-  ADD UNIQUE KEY `unique_user_agent` (`user_id`);
+  ADD UNIQUE KEY `unique_user_agent` (`user_id`),
+  ADD KEY `idx_user_agents_last_updated` (`last_updated_at`);
 
 --
 -- Индексы таблицы `user_conversation_feedback`
@@ -456,6 +643,24 @@ ALTER TABLE `user_sessions`
 ALTER TABLE `agent_learning_data`
   ADD CONSTRAINT `agent_learning_data_ibfk_1` FOREIGN KEY (`agent_id`) REFERENCES `user_agents` (`id`);
 
+--
+-- Ограничения внешнего ключа таблицы `agent_learning_aggregates`
+--
+ALTER TABLE `agent_learning_aggregates`
+  ADD CONSTRAINT `agent_learning_aggregates_ibfk_1` FOREIGN KEY (`agent_id`) REFERENCES `user_agents` (`id`) ON DELETE CASCADE;
+
+--
+-- Ограничения внешнего ключа таблицы `agent_learning_stats`
+--
+ALTER TABLE `agent_learning_stats`
+  ADD CONSTRAINT `agent_learning_stats_ibfk_1` FOREIGN KEY (`agent_id`) REFERENCES `user_agents` (`id`) ON DELETE CASCADE;
+
+--
+-- Ограничения внешнего ключа таблицы `agent_personality_features`
+--
+ALTER TABLE `agent_personality_features`
+  ADD CONSTRAINT `agent_personality_features_ibfk_1` FOREIGN KEY (`agent_id`) REFERENCES `user_agents` (`id`) ON DELETE CASCADE;
+
 --
 -- Ограничения внешнего ключа таблицы `agent_simulations`
 --
@@ -478,12 +683,25 @@ ALTER TABLE `agent_simulation_messages`
   ADD CONSTRAINT `agent_simulation_messages_ibfk_1` FOREIGN KEY (`simulation_id`) REFERENCES `agent_simulations` (`id`),
   ADD CONSTRAINT `agent_simulation_messages_ibfk_2` FOREIGN KEY (`sender_agent_id`) REFERENCES `user_agents` (`id`);
 
+--
+-- Ограничения внешнего ключа таблицы `agent_simulation_transcripts`
+--
+ALTER TABLE `agent_simulation_transcripts`
+  ADD CONSTRAINT `agent_simulation_transcripts_ibfk_1` FOREIGN KEY (`simulation_id`) REFERENCES `agent_simulations` (`id`) ON DELETE CASCADE;
+
 --
 -- Ограничения внешнего ключа таблицы `chat_conversations`
 --
 ALTER TABLE `chat_conversations`
   ADD CONSTRAINT `chat_conversations_ibfk_1` FOREIGN KEY (`match_id`) REFERENCES `matches` (`id`);
 
+--
+-- Ограничения внешнего ключа таблицы `chat_inbox`
+--
+ALTER TABLE `chat_inbox`
+  ADD CONSTRAINT `chat_inbox_ibfk_1` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`),
+  ADD CONSTRAINT `chat_inbox_ibfk_2` FOREIGN KEY (`conversation_id`) REFERENCES `chat_conversations` (`id`);
+
 --
 -- Ограничения внешнего ключа таблицы `chat_messages`
 --
@@ -491,6 +709,13 @@ ALTER TABLE `chat_messages`
   ADD CONSTRAINT `chat_messages_ibfk_1` FOREIGN KEY (`conversation_id`) REFERENCES `chat_conversations` (`id`),
   ADD CONSTRAINT `chat_messages_ibfk_2` FOREIGN KEY (`sender_id`) REFERENCES `users` (`id`);
 
+--
+-- Ограничения внешнего ключа таблицы `chat_unread_counters`
+--
+ALTER TABLE `chat_unread_counters`
+  ADD CONSTRAINT `chat_unread_counters_ibfk_1` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`),
+  ADD CONSTRAINT `chat_unread_counters_ibfk_2` FOREIGN KEY (`conversation_id`) REFERENCES `chat_conversations` (`id`);
+
 --
 -- Ограничения внешнего ключа таблицы `matches`
 --
@@ -504,6 +729,12 @@ ALTER TABLE `matches`
 ALTER TABLE `profile_details`
   ADD CONSTRAINT `profile_details_ibfk_1` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`);
 
+--
+-- Ограничения внешнего ключа таблицы `simulation_result_cache`
+--
+ALTER TABLE `simulation_result_cache`
+  ADD CONSTRAINT `simulation_result_cache_ibfk_1` FOREIGN KEY (`simulation_id`) REFERENCES `agent_simulations` (`id`) ON DELETE CASCADE;
+
 --
 -- Ограничения внешнего ключа таблицы `user_agents`
 --
@@ -53,6 +53,18 @@ class Users(BaseModel):
                                          examples=[f"{datetime.now()}"])
 
 
+class UserCards(BaseModel):
+    """
+    Публичная карточка пользователя (без email и пароля)
+    """
+    id: StrictInt = Field(..., 
+                         examples=[1])
+    first_name: StrictStr = Field(..., 
+                                 examples=["Александр"])
+    last_activity: datetime = Field(..., 
+                                   examples=[f"{datetime.now()}"])
+
+
 class UserSessions(BaseModel):
     """
     Модель сессий пользователей
@@ -197,7 +209,15 @@ class AgentLearningData(BaseModel):
                                    examples=["message_history"])
     data_content: Dict[str, Any] = Field(..., 
                                         examples=[{"messages": [{"text": "Привет!", "timestamp": "2025-06-27T22:15:30"}]}])
-    created_at: Optional[datetime] = Field(None, 
+    source: Optional[StrictStr] = Field(None,
+                                       examples=["chat"])
+    metadata: Optional[Dict[str, Any]] = Field(None,
+                                              examples=[{"conversation_id": 1}])
+    is_processed: StrictBool = Field(default=False,
+                                    examples=[False])
+    processed_at: Optional[datetime] = Field(None,
+                                            examples=[f"{datetime.now()}"])
+    created_at: Optional[datetime] = Field(None,
                                          examples=[f"{datetime.now()}"])
 
 
@@ -223,6 +243,12 @@ class AgentSimulations(BaseModel):
                                          examples=[f"{datetime.now()}"])
     completed_at: Optional[datetime] = Field(None, 
                                            examples=[f"{datetime.now()}"])
+    attempts: Optional[StrictInt] = Field(None, 
+                                         examples=[1])
+    max_attempts: Optional[StrictInt] = Field(None, 
+                                             examples=[3])
+    last_error: Optional[StrictStr] = Field(None, 
+                                           examples=["Lease expired"])
     created_at: Optional[datetime] = Field(None, 
                                          examples=[f"{datetime.now()}"])
 
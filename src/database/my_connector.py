@@ -1,4 +1,6 @@
+import threading
 import pymysql
+from contextlib import contextmanager
 from pymysql.err import OperationalError
 from src.utils.env import Env
 from src.utils.custom_logging import get_logger
@@ -9,19 +11,29 @@ log = get_logger(__name__)
 
 class Database:
     def __init__(self):
-        self.connection = pymysql.connect(
-            host=env.__getattr__("DB_HOST"),
-            db=env.__getattr__("DB"),
-            port=int(env.__getattr__("DB_PORT")),
-            user=env.__getattr__("DB_USER"),
-            password=env.__getattr__("DB_PASSWORD"),
-            charset='utf8mb4',
-            cursorclass=pymysql.cursors.DictCursor
-        )
+        # Соединение pymysql нельзя делить между потоками: у каждого потока (в том числе
+        # пула, куда async-обработчики выносят работу с БД) своё соединение
+        self._local = threading.local()
+
+    @property
+    def connection(self):
+        # Подключаемся при первом запросе, а не при импорте модуля: импорт и старт воркера не ждут БД
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = pymysql.connect(
+                host=env.__getattr__("DB_HOST"),
+                db=env.__getattr__("DB"),
+                port=int(env.__getattr__("DB_PORT")),
+                user=env.__getattr__("DB_USER"),
+                password=env.__getattr__("DB_PASSWORD"),
+                charset='utf8mb4',
+                cursorclass=pymysql.cursors.DictCursor
+            )
+        return connection
 
     def check_and_reconnect(self):
+        # Переподключение только при обрыве: ping открывает соединение заново, если оно закрыто
         try:
-            self.connection.close()
             self.connection.ping(reconnect=True)
         except OperationalError as e:
             log.exception(e)
@@ -45,5 +57,17 @@ class Database:
             cursor.execute(query, params)
             return cursor.fetchall()
 
+    @contextmanager
+    def transaction(self):
+        """Выполнить несколько запросов в одной транзакции (commit или rollback в конце)"""
+        self.check_and_reconnect()
+        try:
+            with self.connection.cursor() as cursor:
+                yield cursor
+            self.connection.commit()
+        except Exception:
+            self.connection.rollback()
+            raise
+
 
 db = Database()
@@ -0,0 +1,91 @@
+import signal
+import time
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict
+from src.utils.custom_logging import get_logger
+from src.utils.env import Env
+from src.utils.retraining_scheduler import RetrainingQueue
+
+env = Env()
+log = get_logger(__name__)
+
+
+def _env_int(name: str, default: int) -> int:
+    value = env.__getattr__(name)
+    return int(value) if value else default
+
+
+def _env_float(name: str, default: float) -> float:
+    value = env.__getattr__(name)
+    return float(value) if value else default
+
+
+LEARNING_WORKERS = _env_int("LEARNING_WORKERS", 2)
+LEARNING_BATCH_SIZE = _env_int("LEARNING_BATCH_SIZE", 500)
+LEARNING_POLL_INTERVAL = _env_float("LEARNING_POLL_INTERVAL", 5.0)
+RETRAINING_STALE_DAYS = _env_int("RETRAINING_STALE_DAYS", 7)
+
+
+def learning_loop(workers: int = LEARNING_WORKERS) -> None:
+    """
+    Планировщик переобучения: периодически пересчитывать приоритеты агентов
+    и отдавать самых ценных ограниченному пулу процессов обучения.
+    Каждый процесс сворачивает необработанные данные своего агента в его агрегаты
+    """
+    from src.services import agent_learning_data_services, user_agents_services
+
+    stopping = False
+
+    def _stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+    log.info(f"Learning scheduler started with {workers} workers")
+
+    queue = RetrainingQueue()
+    in_flight: Dict[Future, int] = {}
+    next_refresh = 0.0
+    # Процессы-воркеры открывают собственные подключения к БД
+    context = multiprocessing.get_context("spawn")
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        while not stopping:
+            if time.monotonic() >= next_refresh:
+                try:
+                    candidates = user_agents_services.get_retraining_candidates(RETRAINING_STALE_DAYS)
+                except Exception as e:
+                    log.error(f"Learning scheduler failed to load candidates: {str(e)}")
+                    candidates = None
+                if candidates is not None:
+                    running = set(in_flight.values())
+                    current = {c['agent_id']: c['priority'] for c in candidates if c['agent_id'] not in running}
+                    queue.retain(current)
+                    queue.extend(current.items())
+                next_refresh = time.monotonic() + LEARNING_POLL_INTERVAL
+
+            while queue and len(in_flight) < workers:
+                agent_id, _ = queue.pop()
+                future = pool.submit(agent_learning_data_services.retrain_agent, agent_id, LEARNING_BATCH_SIZE)
+                in_flight[future] = agent_id
+
+            if not in_flight:
+                time.sleep(max(0.0, next_refresh - time.monotonic()))
+                continue
+
+            done, _ = wait(list(in_flight), timeout=LEARNING_POLL_INTERVAL, return_when=FIRST_COMPLETED)
+            for future in done:
+                agent_id = in_flight.pop(future)
+                try:
+                    result = future.result()
+                    log.info(f"Agent {agent_id} retrained: {result['processed_count']} records")
+                except Exception as e:
+                    log.error(f"Retraining agent {agent_id} failed: {str(e)}")
+
+    log.info("Learning scheduler stopped")
+
+
+if __name__ == "__main__":
+    learning_loop()
@@ -0,0 +1,104 @@
+"""
+Замер стоимости списочных эндпоинтов на строку: создание моделей по одной (как было)
+против пакетной сборки db_models(). Строки синтетические, БД не нужна.
+
+    python -m src.pipeline.serialization_benchmark --rows 2000 --repeat 20
+"""
+import argparse
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Type
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from pydantic import BaseModel
+
+from src.database.models import ChatMessages, ProfileDetails
+from src.utils.serialization import db_models
+
+
+def _message_row(i: int) -> Dict[str, Any]:
+    return {
+        "id": i,
+        "conversation_id": i % 50 + 1,
+        "sender_id": i % 7 + 1,
+        "message_text": f"Сообщение номер {i}, немного текста для реалистичной длины строки",
+        "is_read": i % 2,
+        "message_type": "user",
+        "created_at": datetime(2025, 1, 1, 12, 0, i % 60)
+    }
+
+
+def _profile_row(i: int) -> Dict[str, Any]:
+    return {
+        "id": i,
+        "user_id": i,
+        "age": 18 + i % 40,
+        "gender": "женский" if i % 2 else "мужской",
+        "interests": "музыка, спорт, путешествия",
+        "bio": "Увлекаюсь горными походами и фотографией. " * 4,
+        "profile_photo_url": f"https://example.com/photos/user{i}.jpg",
+        "location": "Москва",
+        "created_at": datetime(2025, 1, 1),
+        "updated_at": datetime(2025, 1, 2)
+    }
+
+
+def _per_row(model: Type[BaseModel], rows: List[Dict[str, Any]]) -> List[BaseModel]:
+    converted = []
+    for row in rows:
+        if "is_read" in row:
+            row = {**row, "is_read": bool(row["is_read"])}
+        converted.append(model(**row))
+    return converted
+
+
+def _build_app(rows: Dict[str, List[Dict[str, Any]]], convert: Callable) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/chat-messages/", response_model=List[ChatMessages])
+    async def get_messages():
+        return convert(ChatMessages, rows["messages"])
+
+    @app.get("/profiles/", response_model=List[ProfileDetails])
+    async def get_profiles():
+        return convert(ProfileDetails, rows["profiles"])
+
+    return app
+
+
+def _measure(client: TestClient, path: str, rows: int, repeat: int) -> float:
+    client.get(path)
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = client.get(path)
+        elapsed = time.perf_counter() - started
+        assert response.status_code == 200, response.text
+        best = min(best, elapsed)
+    return best / rows * 1e6
+
+
+def run(rows: int, repeat: int) -> None:
+    data = {
+        "messages": [_message_row(i) for i in range(rows)],
+        "profiles": [_profile_row(i) for i in range(rows)]
+    }
+    before = TestClient(_build_app(data, _per_row))
+    after = TestClient(_build_app(data, db_models))
+    assert before.get("/profiles/").json() == after.get("/profiles/").json()
+    assert before.get("/chat-messages/").json() == after.get("/chat-messages/").json()
+
+    print(f"{'endpoint':<16}{'per-row, us/row':>20}{'db_models, us/row':>20}{'speedup':>10}")
+    for path in ("/chat-messages/", "/profiles/"):
+        old = _measure(before, path, rows, repeat)
+        new = _measure(after, path, rows, repeat)
+        print(f"{path:<16}{old:>20.2f}{new:>20.2f}{old / new:>9.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-row serialization cost of list endpoints")
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=20)
+    arguments = parser.parse_args()
+    run(arguments.rows, arguments.repeat)
@@ -2,20 +2,28 @@ import os
 import asyncio
 import json
 from fastapi import (FastAPI, HTTPException, Depends, Request, File, UploadFile,
-                     status, Form, Query, Response, Body)
+                     status, Form, Query, Response, Body, WebSocket, WebSocketDisconnect)
 from typing import Dict, List, Any, Optional
 from fastapi.openapi.models import Tag as OpenApiTag
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 # from fastapi.responses import JSONResponse, FileResponse
 from src.utils.custom_logging import get_logger
 from src.utils.env import Env
 from datetime import datetime
 from src.services.cookie_services import session_manager
+from src.utils.chat_hub import chat_hub, simulation_hub, ChatSubscription, configure_event_brokers
+from src.utils.entity_cache import get_entity_cache_stats
+from src.utils.http_cache import ConditionalGetMiddleware, conditional_get, get_http_cache_stats
+from src.utils.projection import parse_fields
+from src.utils.data_loader import DataLoaderMiddleware, parse_expand, parse_ids
 import asyncio
 from contextlib import asynccontextmanager
 
 from src.database.models import (
     Users,
+    UserCards,
     UserSessions,
     MatchStatusEnum,
     MessageTypeEnum,
@@ -64,6 +72,10 @@ app_server = FastAPI(title="DatingApp Server API",
 
 app.mount("/server", app_server)
 
+app_server.add_middleware(ConditionalGetMiddleware)
+configure_event_brokers()
+app_server.add_middleware(DataLoaderMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -83,6 +95,7 @@ ServerAgentTag = OpenApiTag(name="Agent", description="AI agent operations")
 ServerSimulationTag = OpenApiTag(name="Simulation", description="Agent simulation operations")
 ServerFeedbackTag = OpenApiTag(name="Feedback", description="Feedback operations")
 ServerPreferenceTag = OpenApiTag(name="Preference", description="User preference operations")
+ServerCacheTag = OpenApiTag(name="Cache", description="Cache diagnostics")
 
 app_server.openapi_tags = [
     ServerCookieTag.model_dump(),
@@ -95,8 +108,15 @@ app_server.openapi_tags = [
     ServerSimulationTag.model_dump(),
     ServerFeedbackTag.model_dump(),
     ServerPreferenceTag.model_dump(),
+    ServerCacheTag.model_dump(),
 ]
 
+# Выбор полей для списочных эндпоинтов: колонки попадают в SELECT, ответ содержит только их
+FIELDS_QUERY = Query(None, description="Поля через запятую, например id,user_id,age")
+EXPAND_QUERY = Query(None, description="Связи для разворачивания через запятую, например user1_id,user2_id")
+IDS_QUERY = Query(..., description="ID через запятую, например 1,2,3")
+IDS_BODY = Body(..., embed=True, description="Список ID, например [1, 2, 3]")
+
 
 # ------------------------------------------
 # Agent Learning Data Endpoints
@@ -118,6 +138,72 @@ async def get_all_learning_data():
     """Get all agent learning data entries"""
     return agent_learning_data_services.get_all_learning_data()
 
+@app_server.get("/agent-learning-data/unprocessed", 
+                response_model=List[AgentLearningData], 
+                tags=["Agent Learning Data"])
+async def get_unprocessed_learning_data(limit: int = Query(1000, gt=0, le=10000)):
+    """Get unprocessed learning data, oldest first"""
+    return agent_learning_data_services.get_unprocessed_learning_data(limit)
+
+@app_server.get("/agent-learning-data/source/{source}", 
+                response_model=List[AgentLearningData], 
+                tags=["Agent Learning Data"])
+async def get_learning_data_from_source(source: str):
+    """Get learning data from specific source"""
+    return agent_learning_data_services.get_learning_data_from_source(source)
+
+@app_server.get("/agent-learning-data/recent", 
+                response_model=List[AgentLearningData], 
+                tags=["Agent Learning Data"])
+async def get_recent_learning_data(hours: int = Query(24, gt=0)):
+    """Get recent learning data entries within specified hours"""
+    return agent_learning_data_services.get_recent_learning_data(hours)
+
+@app_server.get("/agent-learning-data/metadata", 
+                response_model=List[AgentLearningData], 
+                tags=["Agent Learning Data"])
+async def get_learning_data_by_metadata(
+    key: str = Query(..., description="Metadata key to search for"),
+    value: Optional[str] = Query(None, description="Optional value to filter by"),
+    limit: int = Query(100, gt=0, le=1000)
+):
+    """Get the most recent learning data containing specific metadata key"""
+    return agent_learning_data_services.get_learning_data_by_metadata_key(key, value, limit)
+
+@app_server.get("/agent-learning-data/stats", 
+                response_model=Dict[str, Any], 
+                tags=["Agent Learning Data"])
+async def get_learning_data_statistics():
+    """Get overall learning data statistics"""
+    return agent_learning_data_services.get_learning_data_stats()
+
+@app_server.get("/agent-learning-data/stats/hourly", 
+                response_model=List[Dict[str, Any]], 
+                tags=["Agent Learning Data"])
+async def get_hourly_learning_data_statistics(
+    hours: int = Query(24, gt=0, le=24 * 90),
+    agent_id: Optional[int] = Query(None)
+):
+    """Get learning data intake and processing per hour"""
+    return agent_learning_data_services.get_hourly_learning_stats(hours, agent_id)
+
+@app_server.post("/agent-learning-data/stats/rebuild", 
+                 response_model=Dict[str, Any], 
+                 tags=["Agent Learning Data"])
+async def rebuild_learning_data_statistics():
+    """Recompute learning data statistics from the source table"""
+    return agent_learning_data_services.rebuild_learning_stats()
+
+@app_server.post("/agent-learning-data/process", 
+                 response_model=Dict[str, Any], 
+                 tags=["Agent Learning Data"])
+async def process_learning_data(
+    batch_size: int = Form(500, gt=0, le=5000),
+    max_batches: Optional[int] = Form(None, gt=0)
+):
+    """Fold unprocessed learning data into agent personalities in batches"""
+    return agent_learning_data_services.run_learning_pipeline(batch_size, max_batches)
+
 @app_server.get("/agent-learning-data/{data_id}", 
                 response_model=AgentLearningData, 
                 tags=["Agent Learning Data"])
@@ -168,37 +254,6 @@ async def delete_all_agent_learning_data(agent_id: int):
     """Delete all learning data for a specific agent"""
     return agent_learning_data_services.delete_agent_learning_data(agent_id)
 
-@app_server.get("/agent-learning-data/unprocessed", 
-                response_model=List[AgentLearningData], 
-                tags=["Agent Learning Data"])
-async def get_unprocessed_learning_data():
-    """Get all unprocessed learning data"""
-    return agent_learning_data_services.get_unprocessed_learning_data()
-
-@app_server.get("/agent-learning-data/source/{source}", 
-                response_model=List[AgentLearningData], 
-                tags=["Agent Learning Data"])
-async def get_learning_data_from_source(source: str):
-    """Get learning data from specific source"""
-    return agent_learning_data_services.get_learning_data_from_source(source)
-
-@app_server.get("/agent-learning-data/recent", 
-                response_model=List[AgentLearningData], 
-                tags=["Agent Learning Data"])
-async def get_recent_learning_data(hours: int = Query(24, gt=0)):
-    """Get recent learning data entries within specified hours"""
-    return agent_learning_data_services.get_recent_learning_data(hours)
-
-@app_server.get("/agent-learning-data/metadata", 
-                response_model=List[AgentLearningData], 
-                tags=["Agent Learning Data"])
-async def get_learning_data_by_metadata(
-    key: str = Query(..., description="Metadata key to search for"),
-    value: Optional[str] = Query(None, description="Optional value to filter by")
-):
-    """Get learning data containing specific metadata key"""
-    return agent_learning_data_services.get_learning_data_by_metadata_key(key, value)
-
 @app_server.get("/agents/{agent_id}/learning-data/stats", 
                 response_model=Dict[str, Any], 
                 tags=["Agent Learning Data"])
@@ -206,12 +261,12 @@ async def get_agent_learning_stats(agent_id: int):
     """Count learning data statistics for specific agent"""
     return agent_learning_data_services.count_learning_data_by_agent(agent_id)
 
-@app_server.get("/agent-learning-data/stats", 
+@app_server.get("/agents/{agent_id}/learning-data/aggregate", 
                 response_model=Dict[str, Any], 
                 tags=["Agent Learning Data"])
-async def get_learning_data_statistics():
-    """Get overall learning data statistics"""
-    return agent_learning_data_services.get_learning_data_stats()
+async def get_agent_learning_aggregate(agent_id: int):
+    """Get accumulated learning aggregates for specific agent"""
+    return agent_learning_data_services.get_agent_learning_aggregate(agent_id)
 
 # ------------------------------------------
 # Agent Simulation Feedback Endpoints
@@ -334,28 +389,16 @@ async def get_overall_feedback_statistics():
                  status_code=status.HTTP_201_CREATED)
 async def create_simulation_message(
     simulation_id: int = Form(...),
-    message_content: str = Form(...),
-    role: str = Form(...),
-    message_type: str = Form(...),
-    metadata: Optional[str] = Form(None)
+    sender_agent_id: int = Form(...),
+    message_text: str = Form(...),
+    sentiment_score: Optional[float] = Form(None)
 ):
     """Создать новое сообщение симуляции"""
-    metadata_dict = None
-    if metadata:
-        try:
-            metadata_dict = json.loads(metadata)
-        except json.JSONDecodeError:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Неверный формат метаданных JSON"
-            )
-    
     return agent_simulation_messages_services.create_simulation_message(
         simulation_id=simulation_id,
-        message_content=message_content,
-        role=role,
-        message_type=message_type,
-        metadata=metadata_dict
+        sender_agent_id=sender_agent_id,
+        message_text=message_text,
+        sentiment_score=sentiment_score
     )
 
 @app_server.get("/agent-simulation-messages/", 
@@ -365,6 +408,23 @@ async def get_all_simulation_messages():
     """Получить все сообщения симуляций агентов"""
     return agent_simulation_messages_services.get_all_simulation_messages()
 
+@app_server.get("/agent-simulation-messages/search", 
+                response_model=List[AgentSimulationMessages], 
+                tags=["Simulation"])
+async def search_simulation_messages(
+    search_term: str = Query(..., min_length=3),
+    simulation_id: Optional[int] = Query(None),
+    limit: int = Query(50, gt=0, le=500),
+    offset: int = Query(0, ge=0)
+):
+    """Поиск сообщений симуляции по содержимому (отсортированы по релевантности)"""
+    return agent_simulation_messages_services.search_simulation_messages(
+        search_term=search_term,
+        simulation_id=simulation_id,
+        limit=limit,
+        offset=offset
+    )
+
 @app_server.get("/agent-simulation-messages/{message_id}", 
                 response_model=AgentSimulationMessages, 
                 tags=["Simulation"])
@@ -437,28 +497,16 @@ async def delete_simulation_messages(simulation_id: int):
                  status_code=status.HTTP_201_CREATED)
 async def add_message_to_simulation(
     simulation_id: int,
-    role: str = Form(...),
+    sender_agent_id: int = Form(...),
     content: str = Form(...),
-    message_type: str = Form("text"),
-    metadata: Optional[str] = Form(None)
+    sentiment_score: Optional[float] = Form(None)
 ):
     """Добавить новое сообщение в симуляцию с автоматической валидацией"""
-    metadata_dict = None
-    if metadata:
-        try:
-            metadata_dict = json.loads(metadata)
-        except json.JSONDecodeError:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Неверный формат метаданных JSON"
-            )
-    
     return agent_simulation_messages_services.add_message_to_simulation(
         simulation_id=simulation_id,
-        role=role,
+        sender_agent_id=sender_agent_id,
         content=content,
-        message_type=message_type,
-        metadata=metadata_dict
+        sentiment_score=sentiment_score
     )
 
 @app_server.get("/simulations/{simulation_id}/messages/count", 
@@ -475,13 +523,6 @@ async def get_simulation_message_stats(simulation_id: int):
     """Подсчитать количество сообщений в симуляции по типам"""
     return agent_simulation_messages_services.get_message_stats_by_type(simulation_id)
 
-@app_server.get("/agent-simulation-messages/search", 
-                response_model=List[AgentSimulationMessages], 
-                tags=["Simulation"])
-async def search_simulation_messages(search_term: str = Query(..., min_length=3)):
-    """Поиск сообщений симуляции по содержимому"""
-    return agent_simulation_messages_services.search_simulation_messages(search_term)
-
 @app_server.get("/agent-simulation-messages/recent", 
                 response_model=List[AgentSimulationMessages], 
                 tags=["Simulation"])
@@ -535,7 +576,7 @@ async def run_agent_simulation(
     conversation_id: int = Form(...),
     simulation_data: Optional[str] = Form(None)
 ):
-    """Запустить новую симуляцию агента и автоматически начать ее"""
+    """Поставить симуляцию агента в очередь на выполнение воркерами"""
     simulation_data_dict = None
     if simulation_data:
         try:
@@ -552,6 +593,37 @@ async def run_agent_simulation(
         simulation_data=simulation_data_dict
     )
 
+@app_server.post("/agent-simulations/batch",
+                 response_model=Dict[str, Any],
+                 tags=["Simulation"])
+async def run_batch_agent_simulations(
+    agent_id: int = Form(...),
+    candidates: str = Form(...),
+    persist: bool = Form(True)
+):
+    """
+    Прогнать симуляции агента с пакетом кандидатов (результаты из кеша или движка, по убыванию совместимости).
+    candidates — JSON-список вида [{"conversation_id": 1, "agent_id": 2}, ...] (agent_id необязателен)
+    """
+    try:
+        candidates_list = json.loads(candidates)
+    except json.JSONDecodeError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Неверный формат списка кандидатов JSON"
+        )
+    if not isinstance(candidates_list, list):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Список кандидатов должен быть JSON-массивом"
+        )
+
+    return agents_simulations_services.run_batch_compatibility(
+        agent_id=agent_id,
+        candidates=candidates_list,
+        persist=persist
+    )
+
 @app_server.get("/agent-simulations/", 
                 response_model=List[AgentSimulations], 
                 tags=["Simulation"])
@@ -559,13 +631,6 @@ async def get_all_agent_simulations():
     """Получить все симуляции агентов"""
     return agents_simulations_services.get_all_simulations()
 
-@app_server.get("/agent-simulations/{simulation_id}", 
-                response_model=AgentSimulations, 
-                tags=["Simulation"])
-async def get_agent_simulation_by_id(simulation_id: int):
-    """Получить симуляцию по ID"""
-    return agents_simulations_services.get_simulation_by_id(simulation_id)
-
 @app_server.get("/agents/{agent_id}/simulations", 
                 response_model=List[AgentSimulations], 
                 tags=["Simulation"])
@@ -608,6 +673,89 @@ async def get_recent_agent_simulations(hours: int = Query(24, gt=0, le=168)):
     """Получить недавние симуляции за указанное количество часов"""
     return agents_simulations_services.get_recent_simulations(hours)
 
+@app_server.get("/agent-simulations/stats", 
+                response_model=Dict[str, Any], 
+                tags=["Simulation"])
+async def get_agent_simulation_stats():
+    """Получить статистику по симуляциям агентов"""
+    return agents_simulations_services.get_simulation_stats()
+
+@app_server.get("/agent-simulations/top-agents", 
+                response_model=List[Dict[str, Any]], 
+                tags=["Simulation"])
+async def get_top_agent_simulations(limit: int = Query(10, gt=0, le=100)):
+    """Получить топ агентов по количеству успешных симуляций"""
+    return agents_simulations_services.get_top_agent_simulations(limit)
+
+@app_server.get("/agent-simulations/cache-stats",
+                response_model=Dict[str, Any],
+                tags=["Simulation"])
+async def get_agent_simulation_cache_stats():
+    """Получить статистику кеша результатов симуляций"""
+    return agents_simulations_services.get_result_cache_stats()
+
+@app_server.get("/agent-simulations/transcripts/stats",
+                response_model=Dict[str, Any],
+                tags=["Simulation"])
+async def get_agent_simulation_transcript_stats():
+    """Получить статистику сжатых транскриптов симуляций"""
+    return agent_simulation_messages_services.get_transcript_stats()
+
+@app_server.post("/agent-simulations/transcripts/compact",
+                 response_model=Dict[str, int],
+                 tags=["Simulation"])
+async def compact_agent_simulation_transcripts(
+    limit: int = Query(100, gt=0, le=1000),
+    retention_hours: int = Query(
+        agent_simulation_messages_services.TRANSCRIPT_RETENTION_HOURS, ge=1,
+        description="Сколько часов после завершения сообщения остаются построчными (поиск, доступ по ID)"
+    )
+):
+    """Сжать сообщения симуляций, завершённых раньше окна хранения, у которых ещё нет транскрипта"""
+    return agent_simulation_messages_services.compact_simulation_transcripts(
+        limit=limit, retention_hours=retention_hours
+    )
+
+@app_server.get("/agent-simulations/{simulation_id}", 
+                response_model=AgentSimulations, 
+                tags=["Simulation"])
+async def get_agent_simulation_by_id(simulation_id: int):
+    """Получить симуляцию по ID"""
+    return agents_simulations_services.get_simulation_by_id(simulation_id)
+
+@app_server.get("/agent-simulations/{simulation_id}/events",
+                tags=["Simulation"])
+async def stream_agent_simulation_events(simulation_id: int, request: Request):
+    """
+    Поток Server-Sent Events симуляции: текущий статус и сообщения, затем новые
+    сообщения (simulation.message) и переходы статуса (simulation.status).
+    Поток закрывается после перехода в completed или failed
+    """
+    subscription = simulation_hub.subscribe(None, [simulation_id])
+    try:
+        simulation = agents_simulations_services.get_simulation_by_id(simulation_id)
+    except HTTPException:
+        simulation_hub.unsubscribe(subscription)
+        raise
+
+    async def event_stream():
+        try:
+            async for event in _iter_simulation_events(subscription, simulation):
+                if await request.is_disconnected():
+                    break
+                if event is None:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {event['event']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+        finally:
+            simulation_hub.unsubscribe(subscription)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app_server.put("/agent-simulations/{simulation_id}", 
                 response_model=AgentSimulations, 
                 tags=["Simulation"])
@@ -677,20 +825,6 @@ async def delete_agent_simulation(simulation_id: int):
     """Удалить симуляцию"""
     return agents_simulations_services.delete_simulation(simulation_id)
 
-@app_server.get("/agent-simulations/stats", 
-                response_model=Dict[str, Any], 
-                tags=["Simulation"])
-async def get_agent_simulation_stats():
-    """Получить статистику по симуляциям агентов"""
-    return agents_simulations_services.get_simulation_stats()
-
-@app_server.get("/agent-simulations/top-agents", 
-                response_model=List[Dict[str, Any]], 
-                tags=["Simulation"])
-async def get_top_agent_simulations(limit: int = Query(10, gt=0, le=100)):
-    """Получить топ агентов по количеству успешных симуляций"""
-    return agents_simulations_services.get_top_agent_simulations(limit)
-
 # ------------------------------------------
 # Chat Conversations Endpoints
 # ------------------------------------------
@@ -738,6 +872,13 @@ async def get_user_chat_conversations(user_id: int):
     """Получить все беседы пользователя с дополнительной информацией"""
     return chat_conversations_services.get_user_conversations(user_id)
 
+@app_server.post("/chat-conversations/inbox/rebuild", 
+                 response_model=Dict[str, int], 
+                 tags=["Chat"])
+async def rebuild_chat_inbox():
+    """Пересобрать входящие всех пользователей по текущим беседам"""
+    return chat_conversations_services.rebuild_inbox()
+
 @app_server.get("/users/{user1_id}/conversations/with/{user2_id}", 
                 response_model=Optional[ChatConversations], 
                 tags=["Chat"])
@@ -840,9 +981,29 @@ async def create_chat_message(
 @app_server.get("/chat-messages/", 
                 response_model=List[ChatMessages], 
                 tags=["Chat"])
-async def get_all_chat_messages():
-    """Получить все сообщения"""
-    return chat_messages_services.get_all_messages()
+async def get_all_chat_messages(fields: Optional[str] = FIELDS_QUERY, expand: Optional[str] = EXPAND_QUERY):
+    """Получить все сообщения (?fields=a,b — только выбранные поля, ?expand=sender_id — с отправителями)"""
+    return chat_messages_services.get_all_messages(
+        parse_fields(ChatMessages, fields),
+        parse_expand(chat_messages_services.MESSAGE_RELATIONS, expand)
+    )
+
+@app_server.get("/chat-messages/search", 
+                response_model=List[ChatMessages], 
+                tags=["Chat"])
+async def search_chat_messages(
+    search_term: str = Query(..., min_length=3),
+    conversation_id: Optional[int] = Query(None),
+    limit: int = Query(50, gt=0, le=500),
+    offset: int = Query(0, ge=0)
+):
+    """Поиск сообщений по тексту (отсортированы по релевантности)"""
+    return chat_messages_services.search_messages(
+        search_term=search_term,
+        conversation_id=conversation_id,
+        limit=limit,
+        offset=offset
+    )
 
 @app_server.get("/chat-messages/{message_id}", 
                 response_model=ChatMessages, 
@@ -902,6 +1063,13 @@ async def get_user_unread_messages_count(user_id: int):
     """Подсчитать непрочитанные сообщения для пользователя по всем беседам и для каждой беседы"""
     return chat_messages_services.count_unread_messages(user_id)
 
+@app_server.post("/chat-messages/unread-counters/rebuild", 
+                 response_model=Dict[str, int], 
+                 tags=["Chat"])
+async def rebuild_unread_message_counters():
+    """Пересчитать счётчики непрочитанных сообщений по истории сообщений"""
+    return chat_messages_services.rebuild_unread_counters()
+
 @app_server.get("/chat-messages/recent", 
                 response_model=List[ChatMessages], 
                 tags=["Chat"])
@@ -909,19 +1077,6 @@ async def get_recent_chat_messages(hours: int = Query(24, gt=0, le=168)):
     """Получить сообщения за последние часы"""
     return chat_messages_services.get_recent_messages(hours)
 
-@app_server.get("/chat-messages/search", 
-                response_model=List[ChatMessages], 
-                tags=["Chat"])
-async def search_chat_messages(
-    search_term: str = Query(..., min_length=3),
-    conversation_id: Optional[int] = Query(None)
-):
-    """Поиск сообщений по тексту"""
-    return chat_messages_services.search_messages(
-        search_term=search_term,
-        conversation_id=conversation_id
-    )
-
 @app_server.put("/chat-messages/{message_id}", 
                 response_model=ChatMessages, 
                 tags=["Chat"])
@@ -956,6 +1111,154 @@ async def get_conversation_message_statistics(conversation_id: int):
     """Получить статистику сообщений для беседы"""
     return chat_messages_services.get_conversation_statistics(conversation_id)
 
+@app_server.websocket("/ws/chat")
+async def chat_websocket(websocket: WebSocket):
+    """
+    Получать новые сообщения и отметки о прочтении в беседах текущего пользователя.
+    Авторизация по куки session_token. Команды клиента:
+    {"action": "subscribe", "conversation_ids": [...]}, {"action": "mark_read", "conversation_id": ...},
+    {"action": "ping"}
+    Запросы к БД выполняются в пуле потоков: синхронный драйвер не блокирует цикл событий остальных сокетов
+    """
+    try:
+        user_data = session_manager.get_current_user_from_request(websocket)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    user_id = user_data["user_id"]
+    await websocket.accept()
+    subscription = chat_hub.subscribe(
+        user_id,
+        await run_in_threadpool(chat_conversations_services.get_user_conversation_ids, user_id)
+    )
+    forwarder = asyncio.create_task(_forward_chat_events(websocket, subscription))
+
+    try:
+        while True:
+            try:
+                command = json.loads(await websocket.receive_text())
+            except json.JSONDecodeError:
+                await websocket.send_json({"event": "error", "data": {"detail": "Invalid JSON"}})
+                continue
+            await _handle_chat_command(websocket, subscription, command)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        forwarder.cancel()
+        chat_hub.unsubscribe(subscription)
+
+
+async def _forward_chat_events(websocket: WebSocket, subscription: ChatSubscription):
+    while True:
+        event = await subscription.queue.get()
+        await websocket.send_json(event)
+
+
+async def _handle_chat_command(websocket: WebSocket, subscription: ChatSubscription, command: Any):
+    action = command.get("action") if isinstance(command, dict) else None
+
+    if action == "ping":
+        await websocket.send_json({"event": "pong"})
+    elif action == "subscribe":
+        requested = [cid for cid in command.get("conversation_ids", []) if isinstance(cid, int)]
+        allowed = await run_in_threadpool(
+            chat_conversations_services.get_user_conversation_ids, subscription.user_id, requested
+        )
+        chat_hub.add_conversations(subscription, allowed)
+        await websocket.send_json({"event": "subscribed", "data": {"conversation_ids": allowed}})
+    elif action == "mark_read":
+        conversation_id = command.get("conversation_id")
+        if conversation_id not in subscription.conversation_ids:
+            await websocket.send_json({"event": "error", "data": {"detail": "Conversation is not subscribed"}})
+            return
+        await run_in_threadpool(chat_messages_services.mark_messages_as_read, conversation_id, subscription.user_id)
+    else:
+        await websocket.send_json({"event": "error", "data": {"detail": f"Unknown action: {action}"}})
+
+@app_server.websocket("/ws/simulations/{simulation_id}")
+async def simulation_websocket(websocket: WebSocket, simulation_id: int):
+    """То же, что /agent-simulations/{simulation_id}/events, но через WebSocket"""
+    subscription = simulation_hub.subscribe(None, [simulation_id])
+    try:
+        simulation = agents_simulations_services.get_simulation_by_id(simulation_id)
+    except HTTPException:
+        simulation_hub.unsubscribe(subscription)
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    try:
+        async for event in _iter_simulation_events(subscription, simulation):
+            await websocket.send_json(event if event is not None else {"event": "ping"})
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        simulation_hub.unsubscribe(subscription)
+
+
+SIMULATION_STREAM_KEEPALIVE_SECONDS = 15
+# Без событий дольше этого интервала поток сверяется с БД: события воркеров могли не дойти
+SIMULATION_STREAM_POLL_SECONDS = 5
+SIMULATION_FINAL_STATUSES = {SimulationStatusEnum.COMPLETED.value, SimulationStatusEnum.FAILED.value}
+
+
+async def _iter_simulation_events(subscription: ChatSubscription, simulation: AgentSimulations):
+    """
+    Снимок симуляции (статус и уже записанные сообщения), затем события из подписки.
+    Если событий нет дольше SIMULATION_STREAM_POLL_SECONDS, новые сообщения и статус
+    добираются из БД. None означает keepalive; генератор завершается на финальном статусе
+    """
+    snapshot = simulation.model_dump(mode="json")
+    yield {"event": "simulation.status", "simulation_id": simulation.id, "data": snapshot}
+
+    sent_message_ids = set()
+    for message in agent_simulation_messages_services.get_messages_by_simulation(simulation.id):
+        sent_message_ids.add(message.id)
+        yield {"event": "simulation.message", "simulation_id": simulation.id, "data": message.model_dump(mode="json")}
+
+    status_value = snapshot["simulation_status"]
+    if status_value in SIMULATION_FINAL_STATUSES:
+        return
+
+    idle_seconds = 0.0
+    while True:
+        try:
+            event = await asyncio.wait_for(subscription.queue.get(), SIMULATION_STREAM_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            polled = False
+            last_id = max((message_id for message_id in sent_message_ids if message_id is not None), default=0)
+            for message in agent_simulation_messages_services.get_messages_after(simulation.id, last_id):
+                sent_message_ids.add(message.id)
+                polled = True
+                yield {"event": "simulation.message", "simulation_id": simulation.id, "data": message.model_dump(mode="json")}
+            current = agents_simulations_services.get_simulation_by_id(simulation.id).model_dump(mode="json")
+            if current["simulation_status"] != status_value:
+                status_value = current["simulation_status"]
+                polled = True
+                yield {"event": "simulation.status", "simulation_id": simulation.id, "data": current}
+                if status_value in SIMULATION_FINAL_STATUSES:
+                    return
+            idle_seconds = 0.0 if polled else idle_seconds + SIMULATION_STREAM_POLL_SECONDS
+            if idle_seconds >= SIMULATION_STREAM_KEEPALIVE_SECONDS:
+                idle_seconds = 0.0
+                yield None
+            continue
+
+        idle_seconds = 0.0
+        if event["event"] == "simulation.status":
+            status_value = event["data"]["simulation_status"]
+        if event["event"] == "simulation.message":
+            # Сообщение могло попасть и в снимок, и в подписку
+            if event["data"]["id"] in sent_message_ids:
+                continue
+            sent_message_ids.add(event["data"]["id"])
+
+        yield event
+        if event["event"] == "simulation.status" and event["data"]["simulation_status"] in SIMULATION_FINAL_STATUSES:
+            return
+
 # ------------------------------------------
 # Cookie Endpoints
 # ------------------------------------------
@@ -1250,9 +1553,55 @@ async def create_match_from_mutual_likes(
 @app_server.get("/matches/", 
                 response_model=List[Matches], 
                 tags=["Match"])
-async def get_all_matches():
-    """Получить все совпадения (матчи)"""
-    return matches_services.get_all_matches()
+async def get_all_matches(fields: Optional[str] = FIELDS_QUERY, expand: Optional[str] = EXPAND_QUERY):
+    """Получить все совпадения (матчи) (?fields=a,b — только выбранные поля, ?expand=user1_id,user2_id — с пользователями)"""
+    return matches_services.get_all_matches(
+        parse_fields(Matches, fields),
+        parse_expand(matches_services.MATCH_RELATIONS, expand)
+    )
+
+@app_server.get("/matches/batch", 
+                response_model=Dict[int, Matches], 
+                tags=["Match"])
+async def get_matches_batch(ids: str = IDS_QUERY):
+    """Получить матчи по списку ID (?ids=1,2,3; ключ ответа — ID, ненайденные пропускаются)"""
+    return matches_services.get_matches_by_ids(parse_ids(ids))
+
+@app_server.post("/matches/batch", 
+                 response_model=Dict[int, Matches], 
+                 tags=["Match"])
+async def post_matches_batch(ids: List[int] = IDS_BODY):
+    """Получить матчи по списку ID из тела запроса (тело {"ids": [1, 2, 3]}; ключ ответа — ID)"""
+    return matches_services.get_matches_by_ids(parse_ids(ids))
+
+@app_server.get("/matches/recent", 
+                response_model=List[Dict[str, Any]], 
+                tags=["Match"])
+async def get_recent_matches(hours: int = Query(24, gt=0, le=168)):
+    """Получить недавние матчи за указанное количество часов"""
+    return matches_services.get_recent_matches(hours)
+
+@app_server.get("/matches/with-conversations", 
+                response_model=List[Dict[str, Any]], 
+                tags=["Match"])
+async def get_matches_with_conversations():
+    """Получить матчи, которые имеют активные беседы"""
+    return matches_services.get_matches_with_conversations()
+
+@app_server.get("/matches/without-conversations", 
+                response_model=List[Dict[str, Any]], 
+                tags=["Match"])
+async def get_matches_without_conversations():
+    """Получить матчи, которые не имеют активных бесед"""
+    return matches_services.get_matches_without_conversations()
+
+@app_server.get("/matches/statistics", 
+                response_model=Dict[str, int], 
+                tags=["Match"])
+@conditional_get(matches_services.get_matches_count_version, cache_control="public, max-age=30")
+async def get_matches_statistics():
+    """Получить статистику по количеству матчей в разных статусах"""
+    return matches_services.get_matches_count()
 
 @app_server.get("/matches/{match_id}", 
                 response_model=Matches, 
@@ -1316,34 +1665,6 @@ async def get_user_match_statistics(user_id: int):
     """Получить статистику матчей для конкретного пользователя"""
     return matches_services.get_user_match_stats(user_id)
 
-@app_server.get("/matches/recent", 
-                response_model=List[Dict[str, Any]], 
-                tags=["Match"])
-async def get_recent_matches(hours: int = Query(24, gt=0, le=168)):
-    """Получить недавние матчи за указанное количество часов"""
-    return matches_services.get_recent_matches(hours)
-
-@app_server.get("/matches/with-conversations", 
-                response_model=List[Dict[str, Any]], 
-                tags=["Match"])
-async def get_matches_with_conversations():
-    """Получить матчи, которые имеют активные беседы"""
-    return matches_services.get_matches_with_conversations()
-
-@app_server.get("/matches/without-conversations", 
-                response_model=List[Dict[str, Any]], 
-                tags=["Match"])
-async def get_matches_without_conversations():
-    """Получить матчи, которые не имеют активных бесед"""
-    return matches_services.get_matches_without_conversations()
-
-@app_server.get("/matches/statistics", 
-                response_model=Dict[str, int], 
-                tags=["Match"])
-async def get_matches_statistics():
-    """Получить статистику по количеству матчей в разных статусах"""
-    return matches_services.get_matches_count()
-
 @app_server.put("/matches/{match_id}", 
                 response_model=Matches, 
                 tags=["Match"])
@@ -1446,9 +1767,37 @@ async def create_user_profile(
 @app_server.get("/profiles/", 
                 response_model=List[ProfileDetails], 
                 tags=["Profile"])
-async def get_all_user_profiles():
-    """Получить все профили пользователей"""
-    return profile_details_services.get_all_profiles()
+async def get_all_user_profiles(fields: Optional[str] = FIELDS_QUERY):
+    """Получить все профили пользователей (?fields=a,b — только выбранные поля)"""
+    return profile_details_services.get_all_profiles(parse_fields(ProfileDetails, fields))
+
+@app_server.get("/profiles/batch", 
+                response_model=Dict[int, ProfileDetails], 
+                tags=["Profile"])
+async def get_profiles_batch(ids: str = IDS_QUERY):
+    """Получить профили по списку ID (?ids=1,2,3; ключ ответа — ID, ненайденные пропускаются)"""
+    return profile_details_services.get_profiles_by_ids(parse_ids(ids))
+
+@app_server.post("/profiles/batch", 
+                 response_model=Dict[int, ProfileDetails], 
+                 tags=["Profile"])
+async def post_profiles_batch(ids: List[int] = IDS_BODY):
+    """Получить профили по списку ID из тела запроса (тело {"ids": [1, 2, 3]}; ключ ответа — ID)"""
+    return profile_details_services.get_profiles_by_ids(parse_ids(ids))
+
+@app_server.get("/users/batch/profiles", 
+                response_model=Dict[int, ProfileDetails], 
+                tags=["Profile"])
+async def get_user_profiles_batch(ids: str = IDS_QUERY):
+    """Получить профили по списку ID пользователей (?ids=1,2,3; ключ ответа — ID, ненайденные пропускаются)"""
+    return profile_details_services.get_profiles_by_user_ids(parse_ids(ids))
+
+@app_server.post("/users/batch/profiles", 
+                 response_model=Dict[int, ProfileDetails], 
+                 tags=["Profile"])
+async def post_user_profiles_batch(ids: List[int] = IDS_BODY):
+    """Получить профили по списку ID пользователей из тела запроса (тело {"ids": [1, 2, 3]}; ключ ответа — ID)"""
+    return profile_details_services.get_profiles_by_user_ids(parse_ids(ids))
 
 @app_server.get("/profiles/{profile_id}", 
                 response_model=ProfileDetails, 
@@ -1460,6 +1809,7 @@ async def get_profile_by_id(profile_id: int):
 @app_server.get("/users/{user_id}/profile", 
                 response_model=ProfileDetails, 
                 tags=["Profile"])
+@conditional_get(profile_details_services.get_profile_version)
 async def get_user_profile(user_id: int):
     """Получить профиль по ID пользователя"""
     return profile_details_services.get_profile_by_user_id(user_id)
@@ -1537,6 +1887,7 @@ async def get_incomplete_profiles():
 @app_server.get("/profiles/statistics/completion", 
                 response_model=Dict[str, Any], 
                 tags=["Profile"])
+@conditional_get(profile_details_services.get_profile_completion_version, cache_control="public, max-age=30")
 async def get_profile_completion_statistics():
     """Получить статистику заполнения профилей"""
     return profile_details_services.get_profile_completion_stats()
@@ -1667,16 +2018,37 @@ async def create_user_agent(
 @app_server.get("/user-agents/", 
                 response_model=List[UserAgents], 
                 tags=["Agent"])
-async def get_all_user_agents():
-    """Получить всех агентов пользователей"""
-    return user_agents_services.get_all_agents()
+async def get_all_user_agents(fields: Optional[str] = FIELDS_QUERY):
+    """Получить всех агентов пользователей (?fields=a,b — только выбранные поля)"""
+    return user_agents_services.get_all_agents(parse_fields(UserAgents, fields))
 
-@app_server.get("/user-agents/{agent_id}", 
-                response_model=UserAgents, 
+@app_server.get("/user-agents/batch", 
+                response_model=Dict[int, UserAgents], 
                 tags=["Agent"])
-async def get_user_agent_by_id(agent_id: int):
-    """Получить агента по ID"""
-    return user_agents_services.get_agent_by_id(agent_id)
+async def get_user_agents_batch(ids: str = IDS_QUERY):
+    """Получить агентов по списку ID (?ids=1,2,3; ключ ответа — ID, ненайденные пропускаются)"""
+    return user_agents_services.get_agents_by_ids(parse_ids(ids))
+
+@app_server.post("/user-agents/batch", 
+                 response_model=Dict[int, UserAgents], 
+                 tags=["Agent"])
+async def post_user_agents_batch(ids: List[int] = IDS_BODY):
+    """Получить агентов по списку ID из тела запроса (тело {"ids": [1, 2, 3]}; ключ ответа — ID)"""
+    return user_agents_services.get_agents_by_ids(parse_ids(ids))
+
+@app_server.get("/users/batch/agents", 
+                response_model=Dict[int, UserAgents], 
+                tags=["Agent"])
+async def get_user_agents_by_users_batch(ids: str = IDS_QUERY):
+    """Получить агентов по списку ID пользователей (?ids=1,2,3; ключ ответа — ID, ненайденные пропускаются)"""
+    return user_agents_services.get_agents_by_user_ids(parse_ids(ids))
+
+@app_server.post("/users/batch/agents", 
+                 response_model=Dict[int, UserAgents], 
+                 tags=["Agent"])
+async def post_user_agents_by_users_batch(ids: List[int] = IDS_BODY):
+    """Получить агентов по списку ID пользователей из тела запроса (тело {"ids": [1, 2, 3]}; ключ ответа — ID)"""
+    return user_agents_services.get_agents_by_user_ids(parse_ids(ids))
 
 @app_server.get("/users/{user_id}/agent", 
                 response_model=UserAgents, 
@@ -1705,9 +2077,16 @@ async def get_learning_user_agents():
 async def get_agents_requiring_update(
     days_threshold: int = Query(7, gt=0, le=365, description="Количество дней с последнего обновления")
 ):
-    """Получить агентов, требующих обновления (не обновлялись более N дней)"""
+    """Получить агентов, требующих обновления (не обновлялись более N дней), в порядке приоритета"""
     return user_agents_services.get_agents_requiring_update(days_threshold)
 
+@app_server.get("/user-agents/{agent_id}/features", 
+                response_model=Dict[str, Any], 
+                tags=["Agent"])
+async def get_agent_personality_features(agent_id: int):
+    """Получить извлечённые признаки личности агента"""
+    return user_agents_services.get_agent_features(agent_id)
+
 @app_server.get("/user-agents/{agent_id}/similar", 
                 response_model=List[Dict[str, Any]], 
                 tags=["Agent"])
@@ -1726,6 +2105,38 @@ async def get_user_agents_statistics():
     """Получить статистику по агентам"""
     return user_agents_services.get_agents_stats()
 
+@app_server.get("/user-agents/retraining-queue", 
+                response_model=List[Dict[str, Any]], 
+                tags=["Agent"])
+async def get_retraining_queue(
+    days_threshold: int = Query(7, gt=0, le=365, description="Количество дней с последнего обновления"),
+    limit: int = Query(100, gt=0, le=1000)
+):
+    """Получить очередь агентов на переобучение в порядке приоритета"""
+    return user_agents_services.get_retraining_candidates(days_threshold)[:limit]
+
+@app_server.get("/user-agents/features/stats", 
+                response_model=Dict[str, Any], 
+                tags=["Agent"])
+async def get_personality_features_stats():
+    """Получить сводку извлечённых признаков личности агентов"""
+    return user_agents_services.get_features_stats()
+
+@app_server.post("/user-agents/features/rebuild", 
+                 response_model=Dict[str, int], 
+                 tags=["Agent"])
+async def rebuild_personality_features():
+    """Пересчитать признаки личности всех агентов"""
+    return user_agents_services.rebuild_personality_features()
+
+@app_server.get("/user-agents/{agent_id}", 
+                response_model=UserAgents, 
+                tags=["Agent"])
+@conditional_get(user_agents_services.get_agent_version)
+async def get_user_agent_by_id(agent_id: int):
+    """Получить агента по ID"""
+    return user_agents_services.get_agent_by_id(agent_id)
+
 @app_server.put("/user-agents/{agent_id}", 
                 response_model=UserAgents, 
                 tags=["Agent"])
@@ -2175,6 +2586,7 @@ async def get_preferences_by_id(preference_id: int):
 @app_server.get("/users/{user_id}/preferences", 
                 response_model=UserPreferences, 
                 tags=["Preference"])
+@conditional_get(user_preferences_services.get_preferences_version)
 async def get_user_preferences(user_id: int):
     """Получить предпочтения пользователя по ID пользователя"""
     return user_preferences_services.get_preferences_by_user(user_id)
@@ -2348,9 +2760,23 @@ async def authenticate_user(
 @app_server.get("/users/", 
                 response_model=List[Users], 
                 tags=["User"])
-async def get_all_users():
-    """Получить всех пользователей"""
-    return user_services.get_all_users()
+async def get_all_users(fields: Optional[str] = FIELDS_QUERY):
+    """Получить всех пользователей (?fields=a,b — только выбранные поля)"""
+    return user_services.get_all_users(parse_fields(Users, fields))
+
+@app_server.get("/users/batch", 
+                response_model=Dict[int, UserCards], 
+                tags=["User"])
+async def get_users_batch(ids: str = IDS_QUERY):
+    """Получить карточки пользователей по списку ID (?ids=1,2,3; ключ ответа — ID, ненайденные пропускаются)"""
+    return user_services.get_user_cards_by_ids(parse_ids(ids))
+
+@app_server.post("/users/batch", 
+                 response_model=Dict[int, UserCards], 
+                 tags=["User"])
+async def post_users_batch(ids: List[int] = IDS_BODY):
+    """Получить карточки пользователей по списку ID из тела запроса (тело {"ids": [1, 2, 3]}; ключ ответа — ID)"""
+    return user_services.get_user_cards_by_ids(parse_ids(ids))
 
 @app_server.get("/users/{user_id}", 
                 response_model=Users, 
@@ -2627,6 +3053,24 @@ async def cleanup_expired_user_sessions():
     """Очистить истекшие сессии"""
     return user_sessions_services.cleanup_expired_sessions()
 
+# ------------------------------------------
+# Cache Endpoints
+# ------------------------------------------
+
+@app_server.get("/cache/entities/stats", 
+                response_model=Dict[str, Dict[str, Any]], 
+                tags=["Cache"])
+async def get_entity_cache_statistics():
+    """Получить метрики кэшей сущностей (размер, попадания, промахи, вытеснения)"""
+    return get_entity_cache_stats()
+
+@app_server.get("/cache/http/stats", 
+                response_model=Dict[str, Any], 
+                tags=["Cache"])
+async def get_http_cache_statistics():
+    """Получить метрики условных GET (ответы 304, ответы с ETag)"""
+    return get_http_cache_stats()
+
 
 
 
@@ -0,0 +1,57 @@
+"""
+Пропускная способность движка симуляций без БД: синтетические пары личностей
+прогоняются пакетами через бэкенд из настроек окружения (SIMULATION_BACKEND и др.).
+
+    python -m src.pipeline.simulation_benchmark --simulations 1000 --batch 100
+"""
+import argparse
+import random
+import time
+from typing import Dict
+
+from src.utils.simulation_engine import SimulationSpec, get_simulation_engine
+
+INTERESTS = ["путешествия", "музыка", "кино", "спорт", "книги", "кулинария"]
+
+
+def benchmark(simulations: int = 1000, batch: int = 100) -> Dict[str, float]:
+    """Замерить пропускную способность движка (симуляций и реплик в секунду)"""
+    engine = get_simulation_engine()
+    rng = random.Random(0)
+    specs = [
+        SimulationSpec(
+            simulation_id=i,
+            agent1_id=2 * i,
+            personality1={"interests": rng.sample(INTERESTS, 3), "response_patterns": ["often asks questions"]},
+            agent2_id=2 * i + 1,
+            personality2={"interests": rng.sample(INTERESTS, 3), "response_patterns": ["uses emojis"]}
+        )
+        for i in range(simulations)
+    ]
+
+    started = time.perf_counter()
+    for start in range(0, simulations, batch):
+        engine.run(specs[start:start + batch])
+    elapsed = time.perf_counter() - started
+    return {
+        "simulations": simulations,
+        "seconds": round(elapsed, 3),
+        "simulations_per_second": round(simulations / elapsed, 1),
+        "turns_per_second": round(simulations * engine.turns / elapsed, 1)
+    }
+
+
+def run(simulations: int, batch: int) -> None:
+    engine = get_simulation_engine()
+    result = benchmark(simulations, batch)
+    print(f"engine {engine.version}, backend batch {engine.batch_size}, run batch {batch}")
+    print(f"{result['simulations']} simulations in {result['seconds']} s: "
+          f"{result['simulations_per_second']} simulations/s, {result['turns_per_second']} turns/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulation engine throughput without the database")
+    parser.add_argument("--simulations", type=int, default=1000)
+    parser.add_argument("--batch", type=int, default=100)
+    arguments = parser.parse_args()
+    run(arguments.simulations, arguments.batch)
@@ -0,0 +1,114 @@
+import os
+import signal
+import socket
+import time
+import multiprocessing
+from src.utils.custom_logging import get_logger
+from src.utils.env import Env
+
+env = Env()
+log = get_logger(__name__)
+
+
+def _env_int(name: str, default: int) -> int:
+    value = env.__getattr__(name)
+    return int(value) if value else default
+
+
+def _env_float(name: str, default: float) -> float:
+    value = env.__getattr__(name)
+    return float(value) if value else default
+
+
+SIMULATION_WORKERS = _env_int("SIMULATION_WORKERS", 2)
+SIMULATION_BATCH_SIZE = _env_int("SIMULATION_BATCH_SIZE", 16)
+SIMULATION_LEASE_SECONDS = _env_int("SIMULATION_LEASE_SECONDS", 300)
+SIMULATION_RETRY_DELAY_SECONDS = _env_int("SIMULATION_RETRY_DELAY_SECONDS", 30)
+SIMULATION_POLL_INTERVAL = _env_float("SIMULATION_POLL_INTERVAL", 1.0)
+SIMULATION_COMPACT_INTERVAL_SECONDS = _env_float("SIMULATION_COMPACT_INTERVAL_SECONDS", 600.0)
+SIMULATION_TRANSCRIPT_RETENTION_HOURS = _env_int("SIMULATION_TRANSCRIPT_RETENTION_HOURS", 168)
+
+
+def worker_loop(worker_number: int) -> None:
+    """Цикл воркера: вернуть просроченные симуляции, захватить новые и выполнить их"""
+    # Импорт внутри процесса: у каждого воркера своё подключение к БД
+    from src.services import agents_simulations_services, agent_simulation_messages_services
+    from src.utils.chat_hub import configure_event_brokers
+
+    # Статусы и реплики публикуются подписчикам сервера через общий брокер событий
+    configure_event_brokers()
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    stopping = False
+    next_compaction = time.monotonic()
+
+    def _stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+    log.info(f"Simulation worker {worker_number} started ({worker_id})")
+
+    while not stopping:
+        try:
+            agents_simulations_services.reclaim_expired_simulations(worker_id, SIMULATION_RETRY_DELAY_SECONDS)
+            simulations = agents_simulations_services.claim_simulations(
+                worker_id, SIMULATION_BATCH_SIZE, SIMULATION_LEASE_SECONDS
+            )
+        except Exception as e:
+            log.error(f"Simulation worker {worker_number} failed to poll queue: {str(e)}")
+            time.sleep(SIMULATION_POLL_INTERVAL)
+            continue
+
+        if not simulations:
+            # Простой очереди — сжать сообщения симуляций, вышедших из окна хранения
+            if time.monotonic() >= next_compaction:
+                next_compaction = time.monotonic() + SIMULATION_COMPACT_INTERVAL_SECONDS
+                try:
+                    agent_simulation_messages_services.compact_simulation_transcripts(
+                        retention_hours=SIMULATION_TRANSCRIPT_RETENTION_HOURS
+                    )
+                except Exception as e:
+                    log.error(f"Simulation worker {worker_number} failed to compact transcripts: {str(e)}")
+            time.sleep(SIMULATION_POLL_INTERVAL)
+            continue
+
+        try:
+            agents_simulations_services.process_simulations(
+                simulations, worker_id, SIMULATION_RETRY_DELAY_SECONDS
+            )
+        except Exception as e:
+            # Сбой вне движка (БД, кэш результатов) не должен останавливать воркер:
+            # захваченные симуляции возвращаются в очередь, цикл продолжается
+            log.exception(f"Simulation worker {worker_number} failed to process batch")
+            agents_simulations_services.release_simulations(
+                simulations, worker_id, str(e), SIMULATION_RETRY_DELAY_SECONDS
+            )
+            time.sleep(SIMULATION_POLL_INTERVAL)
+
+    log.info(f"Simulation worker {worker_number} stopped ({worker_id})")
+
+
+def run_simulation_workers(workers: int = SIMULATION_WORKERS) -> None:
+    """Запустить пул процессов-воркеров очереди симуляций"""
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=worker_loop, args=(number,), name=f"simulation-worker-{number}")
+        for number in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
+
+
+if __name__ == "__main__":
+    log.info(f"Starting {SIMULATION_WORKERS} simulation workers")
+    run_simulation_workers()
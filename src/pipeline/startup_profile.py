@@ -0,0 +1,98 @@
+"""
+Профиль холодного старта: время импорта и инициализации модулей (тело модуля —
+подключения, кэши, регистрация маршрутов) при загрузке точки входа в чистом процессе.
+
+    python -m src.pipeline.startup_profile --target src.pipeline.server --top 20 --repeat 3
+"""
+import argparse
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+from src import path_to_project
+
+PROJECT_PACKAGE = "src"
+
+# Замер в дочернем процессе: строки -X importtime уходят в stderr, полное время — в stdout
+_PROBE = "import time; started = time.perf_counter(); import {target}; print(time.perf_counter() - started)"
+
+
+class ImportRecord:
+    """Строка -X importtime: собственное и накопленное время модуля в микросекундах"""
+
+    def __init__(self, name: str, self_us: int, cumulative_us: int) -> None:
+        self.name = name
+        self.self_us = self_us
+        self.cumulative_us = cumulative_us
+
+    @property
+    def package(self) -> str:
+        return self.name.split(".")[0]
+
+
+def parse_importtime(output: str) -> List[ImportRecord]:
+    """Разобрать вывод python -X importtime"""
+    records = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        records.append(ImportRecord(name.strip(), int(self_us), int(cumulative_us)))
+    return records
+
+
+def profile_once(target: str) -> Tuple[float, List[ImportRecord]]:
+    """Импортировать target в новом процессе; вернуть полное время (с) и записи по модулям"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROBE.format(target=target)],
+        cwd=path_to_project(),
+        env=os.environ.copy(),
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Import of {target} failed:\n{result.stderr[-2000:]}")
+    return float(result.stdout.strip().splitlines()[-1]), parse_importtime(result.stderr)
+
+
+def summarize(records: List[ImportRecord]) -> Tuple[List[ImportRecord], Dict[str, int]]:
+    """Модули проекта по собственному времени и сторонние пакеты по суммарному времени"""
+    project = sorted(
+        (record for record in records if record.package == PROJECT_PACKAGE),
+        key=lambda record: record.self_us,
+        reverse=True
+    )
+    packages: Dict[str, int] = defaultdict(int)
+    for record in records:
+        if record.package != PROJECT_PACKAGE:
+            packages[record.package] += record.self_us
+    return project, dict(packages)
+
+
+def run(target: str, top: int, repeat: int) -> None:
+    runs = [profile_once(target) for _ in range(repeat)]
+    wall, records = min(runs, key=lambda run_result: run_result[0])
+    project, packages = summarize(records)
+    project_total = sum(record.self_us for record in project)
+
+    print(f"{target}: {wall * 1000:.1f} ms (best of {repeat}), {len(records)} modules")
+    print(f"  project modules: {project_total / 1000:.1f} ms, third-party: {sum(packages.values()) / 1000:.1f} ms")
+
+    print(f"\n{'project module (import + init)':<56}{'self, ms':>10}{'total, ms':>11}")
+    for record in project[:top]:
+        print(f"{record.name:<56}{record.self_us / 1000:>10.1f}{record.cumulative_us / 1000:>11.1f}")
+
+    print(f"\n{'third-party package':<56}{'self, ms':>10}")
+    for package, self_us in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]:
+        print(f"{package:<56}{self_us / 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-module import and initialization time of an entry point")
+    parser.add_argument("--target", default="src.pipeline.server")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3)
+    arguments = parser.parse_args()
+    run(arguments.target, arguments.top, arguments.repeat)
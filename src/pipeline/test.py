@@ -146,6 +146,18 @@ def create_test_conversation(match_id):
     return assert_response(response, 201, keys=["id"])
 
 
+def create_test_message(conversation_id, sender_id, message_text="Привет!"):
+    """Создание тестового сообщения в беседе"""
+    message_data = {
+        "conversation_id": conversation_id,
+        "sender_id": sender_id,
+        "message_text": message_text,
+        "message_type": "user"
+    }
+    response = api_request("POST", "/chat-messages/", form_data=message_data)
+    return assert_response(response, 201, keys=["id"])
+
+
 @pytest.fixture
 def test_user():
     """Фикстура для создания и очистки тестового пользователя"""
@@ -553,5 +565,1068 @@ def test_endpoint_methods():
                 assert response.status_code in [200, 404, 422], f"{method} {endpoint} не работает"
 
 
+def test_chat_websocket_requires_session():
+    """Тест отклонения WebSocket-подключения к чату без куки сессии"""
+    from starlette.websockets import WebSocketDisconnect
+    
+    client.cookies.clear()
+    with pytest.raises(WebSocketDisconnect):
+        with client.websocket_connect(f"{BASE_PREFIX}/ws/chat") as websocket:
+            websocket.receive_json()
+
+
+def test_matches_statistics_conditional_get(test_match):
+    """Тест условного GET статистики матчей: повтор с If-None-Match получает 304 без тела"""
+    import time
+
+    # Запись в текущую секунду не даёт версии (racy), ждём её окончания
+    time.sleep(1.1)
+    response = api_request("GET", "/matches/statistics")
+    assert_response(response, 200)
+    etag = response.headers.get("ETag")
+    assert etag, "Ответ статистики матчей должен содержать ETag"
+    assert response.headers.get("Cache-Control") == "public, max-age=30"
+
+    response = client.get(f"{BASE_PREFIX}/matches/statistics", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers.get("ETag") == etag
+    assert response.content == b""
+
+    # Смена статуса матча меняет версию: прежний ETag больше не совпадает
+    response = api_request("PATCH", f"/matches/{test_match['match']['id']}/status", form_data={"new_status": "paused"})
+    assert_response(response, 200)
+    response = client.get(f"{BASE_PREFIX}/matches/statistics", headers={"If-None-Match": etag})
+    assert_response(response, 200)
+    assert response.headers.get("ETag") != etag
+
+
+
+@pytest.fixture
+def resp_url():
+    """Локальный RESP-сервер (замена Redis) на свободном порту в фоновом потоке"""
+    import asyncio
+    import threading
+    from src.utils.resp_server import RespStandInServer
+
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(
+        asyncio.start_server(RespStandInServer().handle, "127.0.0.1", 0)
+    )
+    port = server.sockets[0].getsockname()[1]
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield f"redis://127.0.0.1:{port}/0"
+
+    async def shutdown():
+        # Сначала закрываются клиентские соединения (подписки живут до конца процесса), затем сервер
+        server.close()
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await server.wait_closed()
+
+    asyncio.run_coroutine_threadsafe(shutdown(), loop).result(timeout=5)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(timeout=5)
+    loop.close()
+
+
+def test_resp_round_trip(resp_url):
+    """Тест RESP-клиента против локального сервера: строки, срок жизни, удаление, pub/sub"""
+    import threading
+    from src.utils.resp_client import RespConnection
+
+    connection = RespConnection.from_url(resp_url)
+    assert connection.execute("PING") == "PONG"
+    assert connection.execute("SET", "key", "значение".encode("utf-8"), "PX", 60000) == "OK"
+    assert connection.execute("GET", "key").decode("utf-8") == "значение"
+    assert connection.execute("EXISTS", "key") == 1
+    assert connection.execute("DEL", "key") == 1
+    assert connection.execute("GET", "key") is None
+
+    subscriber = RespConnection.from_url(resp_url)
+    messages = subscriber.listen("channel")
+    received = []
+    listener = threading.Thread(target=lambda: received.append(next(messages)), daemon=True)
+    listener.start()
+    for _ in range(50):
+        if connection.execute("PUBLISH", "channel", b"payload"):
+            break
+        threading.Event().wait(0.05)
+    listener.join(timeout=5)
+    assert received == [("channel", b"payload")]
+    connection.close()
+    subscriber.close()
+
+
+def test_cache_row_serialization():
+    """Тест сериализации строк БД для общего кэша: типы datetime, Decimal и bytes сохраняются"""
+    from decimal import Decimal
+    from src.utils.cache_backend import dumps_row, loads_row
+
+    row = {
+        "id": 1,
+        "first_name": "Александр",
+        "last_activity": datetime(2024, 5, 1, 12, 30, 15, 250000),
+        "birth_date": datetime(1990, 1, 2).date(),
+        "score": Decimal("0.85"),
+        "embedding": b"\x00\x01\xff",
+        "note": None
+    }
+    assert loads_row(dumps_row(row)) == row
+    assert loads_row(dumps_row(None)) is None
+
+
+def test_redis_cache_backend_invalidation_and_breaker(resp_url):
+    """Тест общего кэша: patch сбрасывает ближний кэш других воркеров, при сбое Redis кэш работает локально"""
+    import time
+    from src.utils.cache_backend import MISSING, RedisCacheBackend
+    from src.utils.resp_client import RespConnection
+
+    row = {"id": 1, "first_name": "Анна"}
+    first = RedisCacheBackend(resp_url)
+    second = RedisCacheBackend(resp_url)
+    first.set("users", 1, row, 60)
+    assert second.get("users", 1) == row
+
+    # Подписка второго воркера поднимается в фоне: повторяем patch, пока сообщение не дойдёт
+    for _ in range(100):
+        first.patch("users", 1, {"first_name": "Анна-Мария"}, 60)
+        if second.stats("users")["invalidations_received"]:
+            break
+        time.sleep(0.05)
+    assert second.stats("users")["invalidations_received"] >= 1
+    assert second.get("users", 1) is MISSING
+    assert first.get("users", 1) == {"id": 1, "first_name": "Анна-Мария"}
+
+    class UnreachableRedis:
+        calls = 0
+
+        def execute(self, *args):
+            UnreachableRedis.calls += 1
+            raise ConnectionRefusedError("Redis is down")
+
+    down = RedisCacheBackend(resp_url)
+    down._conn = UnreachableRedis()
+    down.set("users", 1, row, 60)
+    assert UnreachableRedis.calls == 1 and not down.stats("users")["available"]
+
+    # Пока автомат разомкнут, Redis не опрашивается: чтения идут из ближнего кэша
+    assert down.get("users", 1) == row
+    assert down.get("users", 2) is MISSING
+    down.patch("users", 1, {"first_name": "Мария"}, 60)
+    down.delete("users", 2)
+    assert UnreachableRedis.calls == 1
+    assert down.get("users", 1) == {"id": 1, "first_name": "Мария"}
+
+    # По истечении интервала идёт один пробный запрос, после удачного автомат замыкается
+    down._retry_at = 0.0
+    assert down.get("users", 2) is MISSING
+    assert down.get("users", 3) is MISSING
+    assert UnreachableRedis.calls == 2
+    down._conn = RespConnection.from_url(resp_url)
+    down._retry_at = 0.0
+    down.set("users", 2, row, 60)
+    assert down.stats("users")["available"]
+    assert second.get("users", 2) == row
+
+
+def test_unread_counters(test_match):
+    """Тест счётчиков непрочитанных: растут у получателя, уменьшаются при удалении и прочтении"""
+    conversation = create_test_conversation(test_match["match"]["id"])
+    sender_id = test_match["user1"]["id"]
+    reader_id = test_match["user2"]["id"]
+    messages = [create_test_message(conversation["id"], sender_id, text) for text in ("Один", "Два", "Три")]
+
+    def unread(user_id):
+        response = api_request("GET", f"/users/{user_id}/unread-messages")
+        return assert_response(response, 200, keys=["total_unread", "by_conversation"])
+
+    assert unread(reader_id) == {"total_unread": 3, "by_conversation": {str(conversation["id"]): 3}}
+    # Собственные сообщения отправителю непрочитанными не считаются
+    assert unread(sender_id)["total_unread"] == 0
+
+    response = api_request("DELETE", f"/chat-messages/{messages[0]['id']}")
+    assert_response(response, 200)
+    assert unread(reader_id)["total_unread"] == 2
+
+    response = api_request("PATCH", f"/conversations/{conversation['id']}/messages/mark-read",
+                           form_data={"user_id": reader_id})
+    assert assert_response(response, 200, keys=["updated_count"])["updated_count"] == 2
+    assert unread(reader_id) == {"total_unread": 0, "by_conversation": {}}
+
+    # Повторное прочтение ничего не меняет, пересчёт по истории сообщений даёт те же значения
+    response = api_request("PATCH", f"/conversations/{conversation['id']}/messages/mark-read",
+                           form_data={"user_id": reader_id})
+    assert assert_response(response, 200, keys=["updated_count"])["updated_count"] == 0
+    create_test_message(conversation["id"], sender_id, "Четыре")
+    response = api_request("POST", "/chat-messages/unread-counters/rebuild")
+    assert_response(response, 200)
+    assert unread(reader_id) == {"total_unread": 1, "by_conversation": {str(conversation["id"]): 1}}
+
+
+def create_test_simulation_agents(test_match):
+    """Создание агентов обоих участников матча и их беседы для тестов симуляций"""
+    agent1 = create_test_agent(test_match["user1"]["id"])
+    agent2 = create_test_agent(test_match["user2"]["id"])
+    conversation = create_test_conversation(test_match["match"]["id"])
+    return agent1, agent2, conversation
+
+
+def test_simulation_queue_lease(test_match):
+    """Тест очереди симуляций: захват с арендой, пропуск заблокированных строк, возврат по истечении аренды"""
+    from src.database.my_connector import Database, db
+    from src.database.models import SimulationStatusEnum
+    from src.repository import agents_simulations_repository
+    from src.services import agents_simulations_services
+
+    agent1, agent2, conversation = create_test_simulation_agents(test_match)
+    response = api_request("POST", "/agent-simulations/",
+                           form_data={"agent_id": agent1["id"], "conversation_id": conversation["id"]})
+    simulation_id = assert_response(response, 201, keys=["id"])["id"]
+    # Симуляция теста — первая в очереди
+    db.execute_query("UPDATE agent_simulations SET available_at = '2000-01-01' WHERE id = %s", (simulation_id,))
+
+    def claim_excluding_ours(worker_id):
+        """Захват другим воркером: чужие строки, если попались, сразу возвращаются в очередь"""
+        claimed = agents_simulations_repository.claim_simulations(worker_id, 1, 60)
+        for row in claimed:
+            if row["id"] != simulation_id:
+                agents_simulations_repository.release_simulation(row["id"], worker_id, "test", 0)
+        return [row["id"] for row in claimed]
+
+    # Строка, заблокированная другой транзакцией, пропускается (SKIP LOCKED), а не ждёт
+    other = Database()
+    with other.transaction() as cursor:
+        cursor.execute("SELECT id FROM agent_simulations WHERE id = %s FOR UPDATE", (simulation_id,))
+        assert simulation_id not in claim_excluding_ours("test-worker-locked")
+    other.connection.close()
+
+    claimed = agents_simulations_services.claim_simulations("test-worker-a", limit=1, lease_seconds=60)
+    assert [s.id for s in claimed] == [simulation_id]
+    assert claimed[0].simulation_status == SimulationStatusEnum.IN_PROGRESS and claimed[0].attempts == 1
+    # Повторный захват пропускает строку, уже взятую в аренду
+    assert simulation_id not in claim_excluding_ours("test-worker-b")
+    # Завершить или вернуть симуляцию может только владелец аренды
+    assert not agents_simulations_repository.release_simulation(simulation_id, "test-worker-b", "test", 0)
+
+    # Истекшая аренда возвращает симуляцию в очередь
+    db.execute_query("UPDATE agent_simulations SET lease_expires_at = NOW() - INTERVAL 1 MINUTE WHERE id = %s",
+                     (simulation_id,))
+    agents_simulations_services.reclaim_expired_simulations("test-worker-c", retry_delay_seconds=0)
+    simulation = agents_simulations_services.get_simulation_by_id(simulation_id)
+    assert simulation.simulation_status == SimulationStatusEnum.PENDING and simulation.last_error == "Lease expired"
+
+    # Аренда, истекшая на последней попытке, завершает симуляцию с ошибкой
+    db.execute_query(
+        """
+        UPDATE agent_simulations
+        SET simulation_status = 'in_progress', attempts = max_attempts, locked_by = 'test-worker-a',
+            lease_expires_at = NOW() - INTERVAL 1 MINUTE
+        WHERE id = %s
+        """,
+        (simulation_id,)
+    )
+    agents_simulations_services.reclaim_expired_simulations("test-worker-c", retry_delay_seconds=0)
+    simulation = agents_simulations_services.get_simulation_by_id(simulation_id)
+    assert simulation.simulation_status == SimulationStatusEnum.FAILED
+    assert simulation.last_error.startswith("Simulation timed out")
+
+    api_request("DELETE", f"/agent-simulations/{simulation_id}")
+
+
+def test_simulation_permanent_error_is_not_retried(test_match):
+    """Тест: симуляция с отсутствующим агентом сразу завершается с ошибкой, без возврата в очередь"""
+    from src.database.my_connector import db
+    from src.database.models import SimulationStatusEnum
+    from src.services import agents_simulations_services
+
+    agent1, agent2, conversation = create_test_simulation_agents(test_match)
+    response = api_request("POST", "/agent-simulations/",
+                           form_data={"agent_id": agent1["id"], "conversation_id": conversation["id"]})
+    simulation_id = assert_response(response, 201, keys=["id"])["id"]
+    db.execute_query(
+        """
+        UPDATE agent_simulations
+        SET simulation_status = 'in_progress', attempts = 1, locked_by = 'test-worker',
+            lease_expires_at = NOW() + INTERVAL 1 MINUTE
+        WHERE id = %s
+        """,
+        (simulation_id,)
+    )
+    simulation = agents_simulations_services.get_simulation_by_id(simulation_id)
+    simulation.agent2_id = -1  # агент удалён после постановки в очередь
+
+    agents_simulations_services.process_simulations([simulation], "test-worker", retry_delay_seconds=0)
+    simulation = agents_simulations_services.get_simulation_by_id(simulation_id)
+    assert simulation.simulation_status == SimulationStatusEnum.FAILED
+    assert simulation.attempts == 1
+    assert "Simulation agent -1 not found" in simulation.last_error
+
+    api_request("DELETE", f"/agent-simulations/{simulation_id}")
+
+
+def test_simulation_engine_deterministic_batches():
+    """Тест движка симуляций: результат не зависит от размера пакета и повторного прогона"""
+    from src.utils.simulation_engine import SimulationEngine, SimulationSpec, TemplateBackend
+
+    def specs():
+        return [
+            SimulationSpec(i, 2 * i, {"interests": ["музыка", "кино"][: i % 2 + 1], "response_patterns": ["question"]},
+                           2 * i + 1, json.dumps({"interests": ["кино"]}))
+            for i in range(5)
+        ]
+
+    rounds = []
+    whole = SimulationEngine(TemplateBackend(), turns=4, batch_size=64).run(specs(), on_round=rounds.append)
+    chunked = SimulationEngine(TemplateBackend(), turns=4, batch_size=2).run(specs())
+    assert [(r.compatibility_score, r.simulation_summary, r.turns) for r in whole] == \
+        [(r.compatibility_score, r.simulation_summary, r.turns) for r in chunked]
+    assert len(rounds) == 4 and all(len(turns) == 5 for turns in rounds)
+    assert [turn.sender_agent_id for turn in whole[1].turns] == [2, 3, 2, 3]
+    assert all(0.0 <= r.compatibility_score <= 1.0 for r in whole)
+
+
+def test_database_connection_per_thread():
+    """Тест соединений с БД: у каждого потока своё, между запросами соединение не переоткрывается"""
+    from concurrent.futures import ThreadPoolExecutor
+    from src.database.my_connector import db
+
+    def connection_ids():
+        return [db.fetch_one("SELECT CONNECTION_ID() as id")["id"] for _ in range(3)]
+
+    main_ids = connection_ids()
+    assert len(set(main_ids)) == 1
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        thread_ids = pool.submit(connection_ids).result()
+    assert len(set(thread_ids)) == 1 and thread_ids[0] != main_ids[0]
+
+
+def test_fulltext_boolean_query():
+    """Тест преобразования поисковой строки в запрос FULLTEXT BOOLEAN MODE"""
+    from src.utils.fulltext import NGRAM_TOKEN_SIZE, to_boolean_query
+
+    assert NGRAM_TOKEN_SIZE == 2
+    assert to_boolean_query("привет мир") == '+"привет" +"мир"'
+    assert to_boolean_query('+ab -bc "cd" (de)* ~ef<fg>@gh') == '+"ab" +"bc" +"cd" +"de" +"ef" +"fg" +"gh"'
+    # Слова короче ngram_token_size не попадают в индекс и не должны обнулять результат
+    assert to_boolean_query("я люблю и кино") == '+"люблю" +"кино"'
+    assert to_boolean_query("я и ты") == '+"ты"'
+    assert to_boolean_query("я и") == ""
+    assert to_boolean_query("  ") == ""
+    assert to_boolean_query(None) == ""
+
+
+def test_message_search_ignores_short_words(test_match):
+    """Тест полнотекстового поиска: однобуквенное слово в запросе не обнуляет результат"""
+    conversation = create_test_conversation(test_match["match"]["id"])
+    marker = generate_random_data("string", 12).lower()
+    message = create_test_message(conversation["id"], test_match["user1"]["id"], f"я люблю {marker} и кино")
+
+    response = api_request("GET", "/chat-messages/search",
+                           params={"search_term": f"я {marker}", "conversation_id": conversation["id"]})
+    results = assert_response(response, 200, keys=["id"])
+    assert [item["id"] for item in results] == [message["id"]]
+
+    response = api_request("GET", "/chat-messages/search", params={"search_term": "я и я"})
+    assert_response(response, 400)
+
+
+def test_personality_numeric_features_bucketed():
+    """Тест кодирования чисел: вес не зависит от величины, близкие значения делят корзины"""
+    from src.utils.personality_index import _iter_features
+
+    def buckets(value):
+        return dict(_iter_features("", {"age": value}))
+
+    for value in (0, 1, 30, 1000000):
+        weights = buckets(value)
+        assert abs(sum(weights.values()) - 1.0) < 1e-9 and all(0 < w <= 1 for w in weights.values())
+    assert set(buckets(30)) & set(buckets(31))
+    assert not set(buckets(30)) & set(buckets(70))
+    assert not set(buckets(5)) & set(buckets(-5))
+    assert buckets(float("nan")) == {}
+    assert dict(_iter_features("", {"active": True})) == {"active=True": 1.0}
+
+
+def test_personality_index_search():
+    """Тест индекса IVF: ближайший сосед находится после обучения центроидов, upsert и remove применяются"""
+    import numpy as np
+    from src.utils.personality_index import PersonalityIndex, TRAIN_THRESHOLD, VECTOR_DIM, encode_personality
+
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(TRAIN_THRESHOLD + 200, VECTOR_DIM)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    index = PersonalityIndex(n_probes=4)
+    index.build((item_id, vector) for item_id, vector in enumerate(vectors))
+    assert index.loaded and len(index) == len(vectors)
+
+    hits = sum(index.search(vectors[item_id], k=1)[0][0] == item_id for item_id in range(0, len(vectors), 50))
+    assert hits == len(range(0, len(vectors), 50))
+
+    query = encode_personality({"interests": ["музыка", "кино"], "age": 30})
+    index.upsert(5, query)
+    assert index.search(query, k=1)[0][0] == 5
+    assert 5 not in [item_id for item_id, _ in index.search(query, k=3, exclude=5)]
+    index.remove(5)
+    assert 5 not in index and all(item_id != 5 for item_id, _ in index.search(query, k=10))
+    assert all(score >= 0.5 for _, score in index.search(vectors[7], k=10, threshold=0.5))
+
+
+def test_inbox_follows_conversation_changes(test_match):
+    """Тест входящих: запись создаётся с беседой и обновляется при сообщениях, смене имени и статуса матча"""
+    user1, user2 = test_match["user1"], test_match["user2"]
+    conversation = create_test_conversation(test_match["match"]["id"])
+
+    def inbox_entry(user_id):
+        response = api_request("GET", f"/users/{user_id}/conversations")
+        entries = [entry for entry in assert_response(response, 200, keys=["id"])
+                   if entry["id"] == conversation["id"]]
+        return entries[0] if entries else None
+
+    entry = inbox_entry(user1["id"])
+    assert entry["other_user_id"] == user2["id"] and entry["last_message_preview"] is None
+    assert inbox_entry(user2["id"])["other_user_id"] == user1["id"]
+
+    message = create_test_message(conversation["id"], user2["id"], "Привет из теста входящих")
+    entry = inbox_entry(user1["id"])
+    assert entry["last_message_preview"] == "Привет из теста входящих" and entry["unread_count"] == 1
+    assert inbox_entry(user2["id"])["unread_count"] == 0
+
+    response = api_request("PUT", f"/users/{user2['id']}", json_data={"first_name": "Переименован"})
+    assert_response(response, 200)
+    response = api_request("PATCH", f"/matches/{test_match['match']['id']}/status", form_data={"new_status": "paused"})
+    assert_response(response, 200)
+    entry = inbox_entry(user1["id"])
+    assert entry["other_user_name"] == "Переименован" and entry["match_status"] == "paused"
+
+    # Пересборка из исходных таблиц даёт ту же запись
+    response = api_request("POST", "/chat-conversations/inbox/rebuild")
+    assert_response(response, 200, keys=["updated_count"])
+    assert inbox_entry(user1["id"]) == entry
+
+    # Удаление последнего сообщения пересобирает превью, удаление беседы убирает записи
+    response = api_request("DELETE", f"/chat-messages/{message['id']}")
+    assert_response(response, 200)
+    assert inbox_entry(user1["id"])["last_message_preview"] is None
+    response = api_request("DELETE", f"/chat-conversations/{conversation['id']}")
+    assert_response(response, 200)
+    assert inbox_entry(user1["id"]) is None and inbox_entry(user2["id"]) is None
+
+
+def test_simulation_result_cache(test_match):
+    """Тест кеша результатов: повторная симуляция той же пары берётся из кеша, смена личности его сбрасывает"""
+    from src.database.my_connector import db
+    from src.services import agents_simulations_services
+
+    agent1, agent2, conversation = create_test_simulation_agents(test_match)
+    form_data = {"agent_id": agent1["id"], "conversation_id": conversation["id"]}
+
+    def cache_hits():
+        response = api_request("GET", "/agent-simulations/cache-stats")
+        return assert_response(response, 200, keys=["entries", "hits"])["hits"]
+
+    def simulation_messages(simulation_id):
+        response = api_request("GET", f"/simulations/{simulation_id}/messages")
+        return assert_response(response, 200, keys=["sender_agent_id", "message_text"])
+
+    response = api_request("POST", "/agent-simulations/run", form_data=form_data)
+    source = assert_response(response, 201, keys=["id", "simulation_status"])
+    assert source["simulation_status"] == "pending"
+    db.execute_query(
+        """
+        UPDATE agent_simulations
+        SET simulation_status = 'in_progress', attempts = 1, locked_by = 'test-worker',
+            lease_expires_at = NOW() + INTERVAL 1 MINUTE
+        WHERE id = %s
+        """,
+        (source["id"],)
+    )
+    agents_simulations_services.process_simulations(
+        [agents_simulations_services.get_simulation_by_id(source["id"])], "test-worker", retry_delay_seconds=0
+    )
+    response = api_request("GET", f"/agent-simulations/{source['id']}")
+    source = assert_response(response, 200, keys=["simulation_status", "compatibility_score"])
+    assert source["simulation_status"] == "completed"
+    source_messages = simulation_messages(source["id"])
+    assert source_messages
+
+    # Та же пара личностей: симуляция сразу завершена с результатом и диалогом источника
+    hits = cache_hits()
+    response = api_request("POST", "/agent-simulations/run", form_data=form_data)
+    cached = assert_response(response, 201, keys=["id", "simulation_status"])
+    assert cached["id"] != source["id"] and cached["simulation_status"] == "completed"
+    assert cached["compatibility_score"] == source["compatibility_score"]
+    assert cached["simulation_summary"] == source["simulation_summary"]
+    assert [(m["sender_agent_id"], m["message_text"]) for m in simulation_messages(cached["id"])] == \
+        [(m["sender_agent_id"], m["message_text"]) for m in source_messages]
+    assert cache_hits() == hits + 1
+
+    # Новая личность партнёра делает прежний результат неактуальным
+    response = api_request("PUT", f"/user-agents/{agent2['id']}",
+                           json_data={"personality_data": {"interests": ["новое увлечение"]}})
+    assert_response(response, 200)
+    response = api_request("POST", "/agent-simulations/run", form_data=form_data)
+    assert assert_response(response, 201, keys=["simulation_status"])["simulation_status"] == "pending"
+
+
+def test_transcript_codec_round_trip():
+    """Тест сжатого транскрипта: раскодированные реплики совпадают с исходными сообщениями"""
+    from src.utils.transcript_codec import CompactTranscript, encode_transcript
+
+    started = datetime(2024, 5, 1, 12, 0, 0)
+    messages = [
+        {"sender_agent_id": 10, "message_text": "Привет!", "sentiment_score": 0.75, "created_at": started},
+        {"sender_agent_id": 20, "message_text": "Hi 👋", "sentiment_score": -1.0,
+         "created_at": started + timedelta(milliseconds=1500)},
+        {"sender_agent_id": 30, "message_text": "", "sentiment_score": None,
+         "created_at": started + timedelta(seconds=3)}
+    ]
+    blob, turn_count, raw_size, base_time = encode_transcript(messages, 10, 20)
+    assert turn_count == 3 and raw_size > 0 and base_time == started
+
+    turns = CompactTranscript(blob, 10, 20, base_time).turns
+    assert [turn["role"] for turn in turns] == ["agent1", "agent2", "other"]
+    for turn, message in zip(turns, messages):
+        assert {key: turn[key] for key in message} == message
+
+    with pytest.raises(ValueError):
+        CompactTranscript(b"XX" + blob[2:], 10, 20, base_time)
+
+
+def test_simulation_transcript_compaction(test_match):
+    """Тест сжатия: сообщения симуляции после окна хранения заменяются транскриптом с теми же репликами"""
+    from src.database.my_connector import db
+    from src.services import agent_simulation_messages_services
+
+    agent1, agent2, conversation = create_test_simulation_agents(test_match)
+    response = api_request("POST", "/agent-simulations/",
+                           form_data={"agent_id": agent1["id"], "conversation_id": conversation["id"]})
+    simulation_id = assert_response(response, 201, keys=["id"])["id"]
+    for sender, text in ((agent1, "Привет!"), (agent2, "Здравствуй"), (agent1, "Как дела?")):
+        response = api_request("POST", f"/simulations/{simulation_id}/messages/add",
+                               form_data={"sender_agent_id": sender["id"], "content": text, "sentiment_score": 0.5})
+        assert_response(response, 201)
+    db.execute_query(
+        "UPDATE agent_simulations SET simulation_status = 'completed', completed_at = NOW() WHERE id = %s",
+        (simulation_id,)
+    )
+
+    def turns():
+        response = api_request("GET", f"/simulations/{simulation_id}/messages")
+        return [(m["sender_agent_id"], m["message_text"], float(m["sentiment_score"]))
+                for m in assert_response(response, 200, keys=["sender_agent_id", "message_text"])]
+
+    before = turns()
+    assert len(before) == 3
+
+    # В окне хранения сообщения остаются построчными
+    result = agent_simulation_messages_services.compact_simulation_transcripts([simulation_id], retention_hours=1)
+    assert result == {"compacted_count": 0}
+
+    db.execute_query(
+        "UPDATE agent_simulations SET completed_at = NOW() - INTERVAL 2 HOUR WHERE id = %s", (simulation_id,)
+    )
+    result = agent_simulation_messages_services.compact_simulation_transcripts([simulation_id], retention_hours=1)
+    assert result == {"compacted_count": 1}
+    count = db.fetch_one(
+        "SELECT COUNT(*) as count FROM agent_simulation_messages WHERE simulation_id = %s", (simulation_id,)
+    )
+    assert count["count"] == 0
+    assert turns() == before
+    # Повторное сжатие не трогает симуляцию с транскриптом
+    result = agent_simulation_messages_services.compact_simulation_transcripts([simulation_id], retention_hours=1)
+    assert result == {"compacted_count": 0}
+
+    api_request("DELETE", f"/agent-simulations/{simulation_id}")
+
+
+def test_learning_fold_is_incremental():
+    """Тест свёртки данных обучения: обработка частями даёт тот же агрегат и личность, что и целиком"""
+    from src.utils.learning_aggregates import fold_learning_batch
+
+    rows = [
+        {"agent_id": 1, "data_type": "chat", "data_content": {"messages": ["Как дела?", "Отлично :)"],
+                                                              "interests": ["кино"]}},
+        {"agent_id": 1, "data_type": "profile", "data_content": json.dumps({"interests": ["кино", "музыка"],
+                                                                            "communication_style": "friendly"})},
+        {"agent_id": 1, "data_type": "chat", "data_content": "не JSON"},
+        {"agent_id": 2, "data_type": "chat", "data_content": {"interests": ["спорт"]}}
+    ]
+    agents = {1: {"personality_data": json.dumps({"name": "Агент"}), "aggregate_data": None}}
+
+    whole = fold_learning_batch(rows, agents)
+    # Агент 2 отсутствует (удалён) — его записи не сворачиваются
+    assert list(whole) == [1] and whole[1]["processed"] == 3
+
+    first = fold_learning_batch(rows[:1], agents)
+    second = fold_learning_batch(rows[1:3], {1: {"personality_data": first[1]["personality_data"],
+                                                 "aggregate_data": first[1]["aggregate_data"]}})
+    assert second[1]["aggregate_data"] == whole[1]["aggregate_data"]
+    assert second[1]["personality_data"] == whole[1]["personality_data"]
+
+    personality = whole[1]["personality_data"]
+    assert personality["name"] == "Агент"
+    assert personality["interests"] == ["кино", "музыка"]
+    assert personality["communication_style"] == "friendly"
+    assert "often asks questions" in personality["response_patterns"]
+    assert personality["learning_stats"] == {"records": 3, "messages": 2, "avg_message_length": 9.5}
+
+
+def test_learning_batch_processing(test_user):
+    """Тест конвейера обучения: записи сворачиваются один раз, заблокированные другим обработчиком пропускаются"""
+    from src.database.my_connector import Database
+    from src.services import agent_learning_data_services
+
+    agent = create_test_agent(test_user["id"])
+
+    def add_learning_data(interests):
+        response = api_request("POST", "/agent-learning-data/", json_data={
+            "agent_id": agent["id"], "data_type": "chat", "data_content": {"interests": interests}
+        })
+        return assert_response(response, 201, keys=["id"])
+
+    def aggregate():
+        response = api_request("GET", f"/agents/{agent['id']}/learning-data/aggregate")
+        return assert_response(response, 200, keys=["processed_count", "aggregate_data"])
+
+    add_learning_data(["походы"])
+    add_learning_data(["походы", "шахматы"])
+    result = agent_learning_data_services.process_learning_batch(agent_id=agent["id"])
+    assert result == {"processed_count": 2, "agent_ids": [agent["id"]]}
+    response = api_request("GET", f"/user-agents/{agent['id']}")
+    personality = assert_response(response, 200, keys=["personality_data"])["personality_data"]
+    assert personality["interests"] == ["походы", "шахматы"]
+    assert aggregate()["processed_count"] == 2
+
+    # Обработанные записи повторно не выбираются
+    assert agent_learning_data_services.process_learning_batch(agent_id=agent["id"])["processed_count"] == 0
+
+    # Запись, заблокированная другой транзакцией, пропускается (SKIP LOCKED), а не ждёт
+    locked = add_learning_data(["шахматы"])
+    other = Database()
+    with other.transaction() as cursor:
+        cursor.execute("SELECT id FROM agent_learning_data WHERE id = %s FOR UPDATE", (locked["id"],))
+        assert agent_learning_data_services.process_learning_batch(agent_id=agent["id"])["processed_count"] == 0
+    other.connection.close()
+
+    assert agent_learning_data_services.process_learning_batch(agent_id=agent["id"])["processed_count"] == 1
+    state = aggregate()
+    assert state["processed_count"] == 3
+    assert state["aggregate_data"]["interests"] == {"походы": 2, "шахматы": 2}
+
+
+def test_learning_stats_follow_mutations(test_user):
+    """Тест скользящей статистики обучения: счётчики следуют за изменениями и совпадают с пересчётом"""
+    agent = create_test_agent(test_user["id"])
+
+    def add_learning_data(data_type):
+        response = api_request("POST", "/agent-learning-data/", json_data={
+            "agent_id": agent["id"], "data_type": data_type, "data_content": {"interests": ["чтение"]}
+        })
+        return assert_response(response, 201, keys=["id"])
+
+    def agent_stats():
+        response = api_request("GET", f"/agents/{agent['id']}/learning-data/stats")
+        return assert_response(response, 200, keys=["всего", "обработано", "по_типам"])
+
+    records = [add_learning_data(data_type) for data_type in ("chat", "chat", "profile")]
+    stats = agent_stats()
+    assert (stats["всего"], stats["обработано"], stats["по_типам"]) == (3, 0, {"chat": 2, "profile": 1})
+
+    response = api_request("PATCH", f"/agent-learning-data/{records[0]['id']}/mark-processed")
+    assert_response(response, 200)
+    # Смена типа переносит запись между ключами статистики вместе с признаком обработки
+    response = api_request("PUT", f"/agent-learning-data/{records[0]['id']}", json_data={"data_type": "profile"})
+    assert_response(response, 200)
+    stats = agent_stats()
+    assert (stats["всего"], stats["обработано"], stats["по_типам"]) == (3, 1, {"chat": 1, "profile": 2})
+
+    response = api_request("DELETE", f"/agent-learning-data/{records[1]['id']}")
+    assert_response(response, 204)
+    stats = agent_stats()
+    assert (stats["всего"], stats["обработано"], stats["по_типам"]) == (2, 1, {"profile": 2})
+
+    response = api_request("GET", "/agent-learning-data/stats/hourly", params={"hours": 2, "agent_id": agent["id"]})
+    hourly = assert_response(response, 200, keys=["total_count", "processed_count"])
+    assert sum(row["total_count"] for row in hourly) == 2
+    assert sum(row["processed_count"] for row in hourly) == 1
+
+    # Пересчёт по исходной таблице даёт те же значения
+    response = api_request("POST", "/agent-learning-data/stats/rebuild")
+    assert_response(response, 200, keys=["records", "buckets"])
+    assert agent_stats() == stats
+
+
+def test_retraining_queue_priority():
+    """Тест очереди переобучения: порядок по приоритету и замена приоритета при повторном добавлении"""
+    from src.utils.retraining_scheduler import RetrainingQueue, retraining_priority
+
+    now = datetime(2024, 5, 1, 12, 0, 0)
+    active = retraining_priority({"last_activity": now, "unprocessed_count": 10}, now)
+    idle = retraining_priority({"last_activity": now - timedelta(days=30), "unprocessed_count": 10}, now)
+    waiting = retraining_priority({"oldest_unprocessed": now - timedelta(days=10)}, now)
+    assert active > idle
+    assert waiting > retraining_priority({"oldest_unprocessed": now}, now)
+
+    queue = RetrainingQueue()
+    queue.extend([(1, 1.0), (2, 3.0), (3, 2.0)])
+    queue.push(1, 5.0)
+    queue.push(2, 0.5)
+    assert len(queue) == 3 and 2 in queue
+    assert [queue.pop() for _ in range(3)] == [(1, 5.0), (3, 2.0), (2, 0.5)]
+    with pytest.raises(IndexError):
+        queue.pop()
+
+    queue.extend([(1, 1.0), (2, 2.0)])
+    queue.retain([1])
+    assert len(queue) == 1 and queue.pop() == (1, 1.0)
+
+
+def test_retraining_candidates(test_user):
+    """Тест очереди переобучения: агент попадает в неё с новыми данными или устарев и выходит после переобучения"""
+    from src.database.my_connector import db
+    from src.services import agent_learning_data_services, user_agents_services
+
+    agent = create_test_agent(test_user["id"])
+
+    def candidate():
+        candidates = [c for c in user_agents_services.get_retraining_candidates(7) if c["agent_id"] == agent["id"]]
+        return candidates[0] if candidates else None
+
+    assert candidate() is None
+    response = api_request("POST", "/agent-learning-data/", json_data={
+        "agent_id": agent["id"], "data_type": "chat", "data_content": {"interests": ["йога"]}
+    })
+    assert_response(response, 201)
+    queued = candidate()
+    assert queued["unprocessed_count"] == 1 and queued["priority"] > 0
+
+    assert agent_learning_data_services.retrain_agent(agent["id"]) == {"agent_id": agent["id"], "processed_count": 1}
+    assert candidate() is None
+
+    # Агент, устаревший при активном владельце, без новых данных только отмечается обновлённым
+    db.execute_query(
+        "UPDATE user_agents SET last_updated_at = NOW() - INTERVAL 30 DAY WHERE id = %s", (agent["id"],)
+    )
+    db.execute_query("UPDATE users SET last_activity = NOW() WHERE id = %s", (test_user["id"],))
+    assert candidate()["unprocessed_count"] == 0
+    assert agent_learning_data_services.retrain_agent(agent["id"]) == {"agent_id": agent["id"], "processed_count": 0}
+    assert candidate() is None
+
+
+def test_entity_cache_read_through():
+    """Тест кэша сущностей: строка загружается один раз, отсутствие кешируется, сброс и patch применяются"""
+    from src.utils.cache_backend import LocalCacheBackend
+    from src.utils.entity_cache import EntityCache
+
+    cache = EntityCache("test_entities", ttl=60, backend=LocalCacheBackend())
+    loads = []
+
+    def loader(row):
+        def load():
+            loads.append(row)
+            return row
+        return load
+
+    assert cache.get_or_load(1, loader({"id": 1, "name": "Анна"})) == {"id": 1, "name": "Анна"}
+    cached = cache.get_or_load(1, loader({"id": 1, "name": "Другое"}))
+    assert cached == {"id": 1, "name": "Анна"} and len(loads) == 1
+    # Изменение возвращённой строки не портит кэш
+    cached["name"] = "Изменено"
+    assert cache.get_or_load(1, loader(None))["name"] == "Анна"
+
+    cache.patch(1, {"name": "Мария"})
+    assert cache.get_or_load(1, loader(None))["name"] == "Мария"
+    cache.invalidate(1)
+    assert cache.get_or_load(1, loader({"id": 1, "name": "Ольга"}))["name"] == "Ольга"
+
+    assert cache.get_or_load(2, loader(None)) is None
+    assert cache.get_or_load(2, loader({"id": 2})) is None
+    assert cache.get_or_load(3, loader(None), cache_missing=False) is None
+    assert cache.get_or_load(3, loader({"id": 3}), cache_missing=False) == {"id": 3}
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["invalidations"]) == (4, 5, 1)
+    assert stats["size"] == 3
+
+
+def test_entity_cache_write_invalidation(test_user_with_profile):
+    """Тест кэша сущностей через API: после изменения чтение сразу возвращает новые данные"""
+    user = test_user_with_profile["user"]
+    profile = test_user_with_profile["profile"]
+    agent = create_test_agent(user["id"])
+
+    def get(endpoint, key):
+        response = api_request("GET", endpoint)
+        return assert_response(response, 200, keys=[key])[key]
+
+    # Первое чтение заполняет кэш, следующее после записи должно увидеть изменение
+    get(f"/users/{user['id']}", "first_name")
+    response = api_request("PUT", f"/users/{user['id']}", json_data={"first_name": "Кешированный"})
+    assert_response(response, 200)
+    assert get(f"/users/{user['id']}", "first_name") == "Кешированный"
+
+    get(f"/users/{user['id']}/profile", "bio")
+    response = api_request("PUT", f"/profiles/{profile['id']}", json_data={"bio": "Новое описание"})
+    assert_response(response, 200)
+    assert get(f"/users/{user['id']}/profile", "bio") == "Новое описание"
+
+    get(f"/user-agents/{agent['id']}", "learning_status")
+    response = api_request("PATCH", f"/user-agents/{agent['id']}/status", form_data={"status": "ready"})
+    assert_response(response, 200)
+    assert get(f"/user-agents/{agent['id']}", "learning_status") == "ready"
+
+    response = api_request("GET", "/cache/entities/stats")
+    stats = assert_response(response, 200, keys=["users", "profiles", "agents"])
+    assert stats["users"]["invalidations"] > 0
+
+
+def test_parse_fields():
+    """Тест разбора ?fields=: порядок и дубликаты, неизвестные и пустые поля — 400"""
+    from fastapi import HTTPException
+    from src.database.models import Matches
+    from src.utils.projection import parse_fields, select_columns
+
+    assert parse_fields(Matches, None) is None
+    assert parse_fields(Matches, "id, user1_id,id") == ("id", "user1_id")
+    for fields in ("id,unknown", " , "):
+        with pytest.raises(HTTPException) as error:
+            parse_fields(Matches, fields)
+        assert error.value.status_code == 400
+
+    assert select_columns(None) == "*"
+    assert select_columns(("id", "user1_id"), "m") == "m.`id`, m.`user1_id`"
+
+
+def test_list_fields_projection(test_match):
+    """Тест ?fields= на списке матчей: в ответе только выбранные поля"""
+    response = api_request("GET", "/matches/", params={"fields": "id,match_status"})
+    matches = assert_response(response, 200, keys=["id", "match_status"])
+    assert all(set(match) == {"id", "match_status"} for match in matches)
+    assert {"id": test_match["match"]["id"], "match_status": "active"} in matches
+
+    response = api_request("GET", "/matches/", params={"fields": "id,password"})
+    assert_response(response, 400)
+
+
+def test_email_existence_checks():
+    """Тест проверок существования: занятый email — 400 при создании и смене, своя запись не мешает"""
+    from src.repository import user_repository
+    from src.utils.exam_services import find_id
+
+    first = create_test_user()
+    second = create_test_user()
+    email = first["email"]
+
+    assert find_id("users", "email", email) == first["id"]
+    assert find_id("users", "email", email, exclude_id=first["id"]) is None
+    assert find_id("users", "email", email.upper(), cache=user_repository.email_cache) == first["id"]
+    with pytest.raises(ValueError):
+        find_id("users", "email; DROP TABLE users", email)
+
+    # Повторная регистрация с тем же email (в любом регистре) отклоняется
+    for duplicate in (email, email.upper()):
+        response = api_request("POST", "/users/", form_data={
+            "email": duplicate, "password": generate_random_data("password"), "first_name": "Дубликат"
+        })
+        assert_response(response, 400)
+
+    response = api_request("PUT", f"/users/{second['id']}", json_data={"email": email})
+    assert_response(response, 400)
+    response = api_request("PUT", f"/users/{first['id']}", json_data={"email": email, "first_name": "Тот же"})
+    assert_response(response, 200)
+
+    # После смены адреса прежний email снова свободен
+    new_email = generate_random_data("email")
+    response = api_request("PUT", f"/users/{first['id']}", json_data={"email": new_email})
+    assert_response(response, 200)
+    assert find_id("users", "email", email, cache=user_repository.email_cache) is None
+    response = api_request("PUT", f"/users/{second['id']}", json_data={"email": email})
+    assert_response(response, 200)
+
+    for user in (first, second):
+        api_request("DELETE", f"/users/{user['id']}")
+
+
+def test_expand_fields_batches_relations():
+    """Тест развёртывания связей: один запрос на тип сущности, повторные ID берутся из загрузчика"""
+    from fastapi import HTTPException
+    from src.utils.data_loader import DataLoaders, expand_fields, parse_expand
+
+    calls = []
+
+    def fetch_users(ids):
+        calls.append(sorted(ids))
+        return [{"id": user_id, "first_name": f"user{user_id}"} for user_id in ids if user_id != 99]
+
+    relations = {"user1_id": fetch_users, "user2_id": fetch_users}
+    assert parse_expand(relations, None) is None
+    assert parse_expand(relations, "user2_id, user1_id,user2_id") == ("user2_id", "user1_id")
+    for expand in ("user1_id,sender_id", ","):
+        with pytest.raises(HTTPException) as error:
+            parse_expand(relations, expand)
+        assert error.value.status_code == 400
+
+    rows = [{"id": 1, "user1_id": 1, "user2_id": 2}, {"id": 2, "user1_id": 2, "user2_id": 99}]
+    loaders = DataLoaders()
+    expand_fields(rows, relations, loaders)
+    assert calls == [[1, 2, 99]]
+    assert rows[0]["user1"] == {"id": 1, "first_name": "user1"} and "user1_id" not in rows[0]
+    assert rows[1]["user2"] is None
+    expand_fields([{"user1_id": 1}], {"user1_id": fetch_users}, loaders)
+    assert calls == [[1, 2, 99]] and loaders.batches == 1
+
+
+def test_list_expand_relations(test_match):
+    """Тест ?expand= на списке матчей: вместо ID пользователей — их публичные карточки"""
+    response = api_request("GET", "/matches/", params={"fields": "id,user1_id", "expand": "user1_id,user2_id"})
+    matches = assert_response(response, 200, keys=["id", "user1", "user2"])
+    match = next(match for match in matches if match["id"] == test_match["match"]["id"])
+    assert set(match) == {"id", "user1", "user2"}
+    assert match["user1"]["id"] == test_match["user1"]["id"]
+    assert match["user2"]["first_name"] == test_match["user2"]["first_name"]
+    assert "email" not in match["user1"] and "password" not in match["user2"]
+
+    response = api_request("GET", "/matches/", params={"expand": "match_status"})
+    assert_response(response, 400)
+
+
+def test_parse_ids():
+    """Тест разбора ?ids=: порядок без повторов, ошибочные, пустые и слишком длинные списки — 400"""
+    from fastapi import HTTPException
+    from src.utils.data_loader import MAX_BATCH_IDS, parse_ids
+
+    assert parse_ids("3,1,3, 2") == (3, 1, 2)
+    assert parse_ids([5, 5, 6]) == (5, 6)
+    for ids in ("1,a", "", [], list(range(MAX_BATCH_IDS + 1))):
+        with pytest.raises(HTTPException) as error:
+            parse_ids(ids)
+        assert error.value.status_code == 400
+
+
+def test_multi_get_endpoints(test_user_with_profile):
+    """Тест multi-get: ответ по ID одним запросом, ненайденные пропускаются, карточки без email и пароля"""
+    user = test_user_with_profile["user"]
+    profile = test_user_with_profile["profile"]
+    other = create_test_user()
+    missing_id = 2_000_000_000
+
+    response = api_request("GET", "/users/batch", params={"ids": f"{other['id']},{user['id']},{missing_id}"})
+    cards = assert_response(response, 200, keys=[str(user["id"]), str(other["id"])])
+    assert set(cards) == {str(user["id"]), str(other["id"])}
+    assert set(cards[str(user["id"])]) == {"id", "first_name", "last_activity"}
+
+    response = api_request("POST", "/users/batch", json_data={"ids": [user["id"], other["id"]]})
+    assert assert_response(response, 200, keys=[str(user["id"])]) == cards
+
+    response = api_request("GET", "/users/batch/profiles", params={"ids": f"{user['id']},{other['id']}"})
+    profiles = assert_response(response, 200, keys=[str(user["id"])])
+    assert set(profiles) == {str(user["id"])} and profiles[str(user["id"])]["id"] == profile["id"]
+
+    response = api_request("GET", "/profiles/batch", params={"ids": f"{profile['id']},{missing_id}"})
+    assert set(assert_response(response, 200, keys=[str(profile["id"])])) == {str(profile["id"])}
+
+    response = api_request("GET", "/users/batch", params={"ids": "1,x"})
+    assert_response(response, 400)
+
+    api_request("DELETE", f"/users/{other['id']}")
+
+
+def test_log_sampling_filter():
+    """Тест ограничения повторяющихся записей лога: burst за окно и счётчик отброшенных"""
+    import logging
+    from src.utils.custom_logging import SamplingFilter
+
+    sampling = SamplingFilter(window_seconds=60, burst=3)
+
+    def record(level=logging.INFO, lineno=10):
+        return logging.LogRecord("test", level, "test.py", lineno, "message", None, None)
+
+    assert [sampling.filter(record()) for _ in range(5)] == [True, True, True, False, False]
+    assert sampling.filter(record(lineno=11))
+    assert sampling.filter(record(level=logging.CRITICAL))
+
+    sampling.window_seconds = 0
+    next_window = record()
+    assert sampling.filter(next_window)
+    assert next_window.suppressed == 2
+
+
+def test_log_queue_handler_and_json_format():
+    """Тест неблокирующего лога: аргументы подставляются при постановке в очередь, переполнение считается"""
+    import logging
+    import queue
+    from src.utils.custom_logging import JsonFormatter, NonBlockingQueueHandler
+
+    log_queue = queue.Queue(maxsize=2)
+    handler = NonBlockingQueueHandler(log_queue)
+    logger = logging.getLogger("test.queue_handler")
+    logger.propagate = False
+    logger.addHandler(handler)
+    try:
+        items = ["первый"]
+        logger.warning("items: %s", items)
+        items.append("второй")  # изменение после вызова не попадает в запись
+        logger.warning("full")
+        logger.warning("dropped")
+        assert log_queue.qsize() == 2
+
+        first = log_queue.get_nowait()
+        assert first.getMessage() == "items: ['первый']" and first.args is None
+        log_queue.get_nowait()
+        try:
+            raise ValueError("ошибка")
+        except ValueError:
+            logger.exception("after drop")
+    finally:
+        logger.removeHandler(handler)
+
+    entry = json.loads(JsonFormatter().format(log_queue.get_nowait()))
+    assert entry["msg"] == "after drop" and entry["level"] == "ERROR" and entry["dropped"] == 1
+    assert "ValueError: ошибка" in entry["exc"]
+
+
+def test_batch_compatibility_runs_simulations(test_match):
+    """Тест пакетной симуляции: кандидаты проходят через движок, результат сохраняется и затем берётся из кеша"""
+    agent1, agent2, conversation = create_test_simulation_agents(test_match)
+    missing_conversation = {"conversation_id": 2_000_000_000}
+
+    def run_batch(persist):
+        response = api_request("POST", "/agent-simulations/batch", form_data={
+            "agent_id": agent1["id"],
+            "candidates": json.dumps([{"conversation_id": conversation["id"]}, missing_conversation]),
+            "persist": persist
+        })
+        batch = assert_response(response, 200, keys=["results", "invalid_candidates"])
+        assert batch["invalid_candidates"] == [missing_conversation] and len(batch["results"]) == 1
+        return batch["results"][0]
+
+    def agent_simulations():
+        response = api_request("GET", f"/agents/{agent1['id']}/simulations")
+        return assert_response(response, 200, keys=["id"])
+
+    # Без сохранения: результат движка, ни симуляций, ни кеша
+    preview = run_batch("false")
+    assert preview["agent_id"] == agent2["id"] and preview["rank"] == 1
+    assert preview["simulation_id"] is None and not preview["cached"]
+    assert agent_simulations() == []
+
+    computed = run_batch("true")
+    assert not computed["cached"] and computed["compatibility_score"] == preview["compatibility_score"]
+    response = api_request("GET", f"/agent-simulations/{computed['simulation_id']}")
+    simulation = assert_response(response, 200, keys=["simulation_status", "compatibility_score"])
+    assert simulation["simulation_status"] == "completed"
+    assert float(simulation["compatibility_score"]) == pytest.approx(computed["compatibility_score"], abs=0.01)
+    response = api_request("GET", f"/simulations/{computed['simulation_id']}/messages")
+    assert assert_response(response, 200, keys=["sender_agent_id", "message_text"])
+
+    cached = run_batch("true")
+    assert cached["cached"] and cached["simulation_id"] not in (None, computed["simulation_id"])
+    assert cached["compatibility_score"] == computed["compatibility_score"]
+    assert len(agent_simulations()) == 2
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v", "-s"])
\ No newline at end of file
@@ -1,8 +1,9 @@
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Callable, Tuple, Iterator
 from datetime import datetime
 import json
 from src.database.my_connector import db
 from src.database.models import AgentLearningData
+from src.utils.entity_cache import get_entity_cache
 
 
 def get_all_learning_data() -> List[Dict[str, Any]]:
@@ -20,11 +21,9 @@ def get_learning_data_by_id(data_id: int) -> Optional[Dict[str, Any]]:
 def get_learning_data_by_agent(agent_id: int) -> List[Dict[str, Any]]:
     """Получить все данные обучения для конкретного агента"""
     query = """
-        SELECT ald.*, u.first_name as creator_name
-        FROM agent_learning_data ald
-        LEFT JOIN users u ON ald.created_by = u.id
-        WHERE ald.agent_id = %s
-        ORDER BY ald.created_at DESC
+        SELECT * FROM agent_learning_data
+        WHERE agent_id = %s
+        ORDER BY created_at DESC
     """
     return db.fetch_all(query, (agent_id,))
 
@@ -32,12 +31,9 @@ def get_learning_data_by_agent(agent_id: int) -> List[Dict[str, Any]]:
 def get_learning_data_by_type(data_type: str) -> List[Dict[str, Any]]:
     """Получить данные обучения определённого типа"""
     query = """
-        SELECT ald.*, u.first_name as creator_name, ua.user_id as agent_owner_id
-        FROM agent_learning_data ald
-        LEFT JOIN users u ON ald.created_by = u.id
-        JOIN user_agents ua ON ald.agent_id = ua.id
-        WHERE ald.data_type = %s
-        ORDER BY ald.created_at DESC
+        SELECT * FROM agent_learning_data
+        WHERE data_type = %s
+        ORDER BY created_at DESC
     """
     return db.fetch_all(query, (data_type,))
 
@@ -45,24 +41,26 @@ def get_learning_data_by_type(data_type: str) -> List[Dict[str, Any]]:
 def create_learning_data(learning_data: AgentLearningData) -> int:
     """Создать новую запись данных обучения"""
     # Сериализуем JSON поля
-    training_data = json.dumps(learning_data.TrainingData) if learning_data.TrainingData else None
-    metadata = json.dumps(learning_data.Metadata) if learning_data.Metadata else None
-    
+    data_content = json.dumps(learning_data.data_content)
+    metadata = json.dumps(learning_data.metadata) if learning_data.metadata else None
+
     query = """
         INSERT INTO agent_learning_data 
-        (agent_id, data_type, training_data, source, metadata, created_by)
-        VALUES (%s, %s, %s, %s, %s, %s)
+        (agent_id, data_type, data_content, source, metadata)
+        VALUES (%s, %s, %s, %s, %s)
     """
     params = (
-        learning_data.AgentID,
-        learning_data.DataType,
-        training_data,
-        learning_data.Source,
-        metadata,
-        learning_data.CreatedBy
+        learning_data.agent_id,
+        learning_data.data_type,
+        data_content,
+        learning_data.source,
+        metadata
     )
-    cursor = db.execute_query(query, params)
-    return cursor.lastrowid
+    with db.transaction() as cursor:
+        cursor.execute(query, params)
+        data_id = cursor.lastrowid
+        _apply_stats(cursor, "id = %s", (data_id,), 1)
+    return data_id
 
 
 def update_learning_data(data_id: int, updates: Dict[str, Any]) -> None:
@@ -71,37 +69,32 @@ def update_learning_data(data_id: int, updates: Dict[str, Any]) -> None:
     params = []
 
     # Особая обработка для JSON полей
-    if 'training_data' in updates and updates['training_data'] is not None:
-        set_clauses.append("training_data = %s")
-        params.append(json.dumps(updates['training_data']))
-        updates.pop('training_data')
-    
-    if 'metadata' in updates and updates['metadata'] is not None:
-        set_clauses.append("metadata = %s")
-        params.append(json.dumps(updates['metadata']))
-        updates.pop('metadata')
-    
+    for json_field in ('data_content', 'metadata'):
+        if updates.get(json_field) is not None:
+            set_clauses.append(f"{json_field} = %s")
+            params.append(json.dumps(updates.pop(json_field)))
+
     # Обработка остальных полей
-    field_mapping = {
-        "data_type": "DataType",
-        "source": "Source",
-        "is_processed": "IsProcessed"
-    }
+    allowed_fields = {"data_type", "source", "is_processed"}
 
     for db_field, value in updates.items():
-        if db_field in field_mapping and value is not None:
+        if db_field in allowed_fields and value is not None:
             set_clauses.append(f"{db_field} = %s")
             params.append(value)
 
     if not set_clauses:
         return
 
-    # Автоматическое обновление поля updated_at
-    set_clauses.append("updated_at = NOW()")
-    
+    if updates.get('is_processed'):
+        set_clauses.append("processed_at = NOW()")
+
     params.append(data_id)
     query = f"UPDATE agent_learning_data SET {', '.join(set_clauses)} WHERE id = %s"
-    db.execute_query(query, params)
+    with db.transaction() as cursor:
+        # Запись переносится между ключами статистики: вычитаем старое состояние, добавляем новое
+        _apply_stats(cursor, "id = %s", (data_id,), -1)
+        cursor.execute(query, params)
+        _apply_stats(cursor, "id = %s", (data_id,), 1)
 
 
 def mark_as_processed(data_id: int, processed_metadata: Dict[str, Any] = None) -> None:
@@ -124,35 +117,36 @@ def mark_as_processed(data_id: int, processed_metadata: Dict[str, Any] = None) -
 def delete_learning_data(data_id: int) -> None:
     """Удалить запись данных обучения"""
     query = "DELETE FROM agent_learning_data WHERE id = %s"
-    db.execute_query(query, (data_id,))
+    with db.transaction() as cursor:
+        _apply_stats(cursor, "id = %s", (data_id,), -1)
+        cursor.execute(query, (data_id,))
 
 
 def delete_agent_learning_data(agent_id: int) -> int:
     """Удалить все данные обучения для конкретного агента"""
     query = "DELETE FROM agent_learning_data WHERE agent_id = %s"
-    cursor = db.execute_query(query, (agent_id,))
-    return cursor.rowcount
+    with db.transaction() as cursor:
+        cursor.execute("DELETE FROM agent_learning_stats WHERE agent_id = %s", (agent_id,))
+        cursor.execute(query, (agent_id,))
+        return cursor.rowcount
 
 
-def get_unprocessed_learning_data() -> List[Dict[str, Any]]:
+def get_unprocessed_learning_data(limit: int = 1000) -> List[Dict[str, Any]]:
     """Получить необработанные данные обучения"""
     query = """
-        SELECT ald.*, u.first_name as creator_name, ua.user_id as agent_owner_id
-        FROM agent_learning_data ald
-        LEFT JOIN users u ON ald.created_by = u.id
-        JOIN user_agents ua ON ald.agent_id = ua.id
-        WHERE ald.is_processed = FALSE
-        ORDER BY ald.created_at ASC
+        SELECT * FROM agent_learning_data
+        WHERE is_processed = FALSE
+        ORDER BY id
+        LIMIT %s
     """
-    return db.fetch_all(query)
+    return db.fetch_all(query, (limit,))
 
 
 def get_learning_data_from_source(source: str) -> List[Dict[str, Any]]:
     """Получить данные обучения из определенного источника"""
     query = """
-        SELECT ald.*, u.first_name as creator_name
+        SELECT ald.*
         FROM agent_learning_data ald
-        LEFT JOIN users u ON ald.created_by = u.id
         WHERE ald.source = %s
         ORDER BY ald.created_at DESC
     """
@@ -162,121 +156,286 @@ def get_learning_data_from_source(source: str) -> List[Dict[str, Any]]:
 def get_recent_learning_data(hours: int = 24) -> List[Dict[str, Any]]:
     """Получить недавние данные обучения за указанное количество часов"""
     query = """
-        SELECT ald.*, u.first_name as creator_name
+        SELECT ald.*
         FROM agent_learning_data ald
-        LEFT JOIN users u ON ald.created_by = u.id
         WHERE ald.created_at >= DATE_SUB(NOW(), INTERVAL %s HOUR)
         ORDER BY ald.created_at DESC
     """
     return db.fetch_all(query, (hours,))
 
 
-def get_learning_data_by_metadata_key(key: str, value: Any = None) -> List[Dict[str, Any]]:
+def get_learning_data_by_metadata_key(key: str, value: Any = None, limit: int = 100) -> List[Dict[str, Any]]:
     """
-    Получить данные обучения, содержащие определенный ключ в метаданных
-    Опционально можно указать значение для фильтрации
+    Получить последние данные обучения, содержащие определенный ключ в метаданных
+    Опционально можно указать значение для фильтрации. Просмотр идёт от новых записей
+    к старым и останавливается на limit совпадениях
     """
     if value is not None:
         # Поиск по ключу и значению
         query = """
-            SELECT ald.*, u.first_name as creator_name
+            SELECT ald.*
             FROM agent_learning_data ald
-            LEFT JOIN users u ON ald.created_by = u.id
-            WHERE JSON_EXTRACT(ald.metadata, %s) = %s
-            ORDER BY ald.created_at DESC
+            WHERE JSON_EXTRACT(ald.metadata, %s) = CAST(%s AS JSON)
+            ORDER BY ald.id DESC
+            LIMIT %s
         """
-        return db.fetch_all(query, (f"$.{key}", json.dumps(value)))
+        return db.fetch_all(query, (f"$.{key}", json.dumps(value), limit))
     else:
         # Поиск только по наличию ключа
         query = """
-            SELECT ald.*, u.first_name as creator_name
+            SELECT ald.*
             FROM agent_learning_data ald
-            LEFT JOIN users u ON ald.created_by = u.id
             WHERE JSON_CONTAINS_PATH(ald.metadata, 'one', %s)
-            ORDER BY ald.created_at DESC
+            ORDER BY ald.id DESC
+            LIMIT %s
         """
-        return db.fetch_all(query, (f"$.{key}",))
+        return db.fetch_all(query, (f"$.{key}", limit))
 
 
 def count_learning_data_by_agent(agent_id: int) -> Dict[str, int]:
-    """Подсчитать количество данных обучения для агента по типам"""
-    query = """
-        SELECT 
-            COUNT(*) as total,
-            SUM(CASE WHEN is_processed = TRUE THEN 1 ELSE 0 END) as processed_count,
-            SUM(CASE WHEN is_processed = FALSE THEN 1 ELSE 0 END) as unprocessed_count,
-            COUNT(DISTINCT data_type) as unique_types
-        FROM agent_learning_data
-        WHERE agent_id = %s
-    """
-    
-    result = db.fetch_one(query, (agent_id,)) or {}
-    
-    # Дополнительный запрос для подсчета по типам данных
-    types_query = """
-        SELECT data_type, COUNT(*) as count
-        FROM agent_learning_data
+    """Подсчитать количество данных обучения для агента по типам (по скользящей статистике)"""
+    types = db.fetch_all(
+        """
+        SELECT data_type,
+               SUM(total_count) as total,
+               SUM(processed_count) as processed_count
+        FROM agent_learning_stats
         WHERE agent_id = %s
         GROUP BY data_type
-    """
-    
-    types = db.fetch_all(types_query, (agent_id,))
-    types_dict = {record['data_type']: record['count'] for record in types}
-    
+        HAVING total > 0
+        """,
+        (agent_id,)
+    )
+    total = sum(int(record['total']) for record in types)
+    processed = sum(int(record['processed_count']) for record in types)
+
     return {
-        "всего": result.get("total", 0),
-        "обработано": result.get("processed_count", 0),
-        "не_обработано": result.get("unprocessed_count", 0),
-        "уникальных_типов": result.get("unique_types", 0),
-        "по_типам": types_dict
+        "всего": total,
+        "обработано": processed,
+        "не_обработано": total - processed,
+        "уникальных_типов": len(types),
+        "по_типам": {record['data_type']: int(record['total']) for record in types}
     }
 
 
 def get_learning_data_stats() -> Dict[str, Any]:
-    """Получить общую статистику по данным обучения"""
+    """Получить общую статистику по данным обучения (по скользящей статистике)"""
     query = """
         SELECT 
-            COUNT(*) as total_records,
-            COUNT(DISTINCT agent_id) as unique_agents,
-            COUNT(DISTINCT data_type) as unique_data_types,
-            COUNT(DISTINCT source) as unique_sources,
-            SUM(CASE WHEN is_processed = TRUE THEN 1 ELSE 0 END) as processed_count,
-            MIN(created_at) as oldest_record,
-            MAX(created_at) as newest_record
-        FROM agent_learning_data
+            COALESCE(SUM(total_count), 0) as total_records,
+            COUNT(DISTINCT CASE WHEN total_count > 0 THEN agent_id END) as unique_agents,
+            COALESCE(SUM(processed_count), 0) as processed_count,
+            MIN(CASE WHEN total_count > 0 THEN hour_bucket END) as oldest_record,
+            MAX(CASE WHEN total_count > 0 THEN hour_bucket END) as newest_record
+        FROM agent_learning_stats
     """
     
     result = db.fetch_one(query) or {}
     
-    # Дополнительный запрос для статистики по типам данных
-    types_query = """
-        SELECT data_type, COUNT(*) as count
-        FROM agent_learning_data
+    types = db.fetch_all("""
+        SELECT data_type, SUM(total_count) as count
+        FROM agent_learning_stats
         GROUP BY data_type
+        HAVING count > 0
         ORDER BY count DESC
-    """
-    
-    types = db.fetch_all(types_query)
+    """)
     
-    # Дополнительный запрос для статистики по источникам
-    sources_query = """
-        SELECT source, COUNT(*) as count
-        FROM agent_learning_data
+    sources = db.fetch_all("""
+        SELECT source, SUM(total_count) as count
+        FROM agent_learning_stats
         GROUP BY source
+        HAVING count > 0
         ORDER BY count DESC
-    """
-    
-    sources = db.fetch_all(sources_query)
-    
+    """)
+
+    total = int(result.get("total_records", 0))
+    processed = int(result.get("processed_count", 0))
     return {
-        "всего_записей": result.get("total_records", 0),
+        "всего_записей": total,
         "уникальных_агентов": result.get("unique_agents", 0),
-        "уникальных_типов_данных": result.get("unique_data_types", 0),
-        "уникальных_источников": result.get("unique_sources", 0),
-        "обработанных_записей": result.get("processed_count", 0),
-        "процент_обработки": round(result.get("processed_count", 0) * 100 / result.get("total_records", 1), 1),
+        "уникальных_типов_данных": len(types),
+        "уникальных_источников": len(sources),
+        "обработанных_записей": processed,
+        "процент_обработки": round(processed * 100 / (total or 1), 1),
         "самая_старая_запись": result.get("oldest_record"),
         "самая_новая_запись": result.get("newest_record"),
-        "по_типам_данных": [{"тип": t["data_type"], "количество": t["count"]} for t in types],
-        "по_источникам": [{"источник": s["source"], "количество": s["count"]} for s in sources]
-    }
\ No newline at end of file
+        "по_типам_данных": [{"тип": t["data_type"] or None, "количество": int(t["count"])} for t in types],
+        "по_источникам": [{"источник": src["source"] or None, "количество": int(src["count"])} for src in sources]
+    }
+
+
+def get_hourly_learning_stats(hours: int = 24, agent_id: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Получить поступление и обработку данных обучения по часам"""
+    agent_filter = "AND agent_id = %s" if agent_id is not None else ""
+    params: List[Any] = [hours]
+    if agent_id is not None:
+        params.append(agent_id)
+
+    query = f"""
+        SELECT hour_bucket,
+               SUM(total_count) as total_count,
+               SUM(processed_count) as processed_count
+        FROM agent_learning_stats
+        WHERE hour_bucket >= DATE_SUB(NOW(), INTERVAL %s HOUR)
+        {agent_filter}
+        GROUP BY hour_bucket
+        ORDER BY hour_bucket
+    """
+    return db.fetch_all(query, params)
+
+
+def _apply_stats(cursor, where: str, params: Any, total_sign: int, processed_sign: Optional[int] = None) -> None:
+    """
+    Учесть записи, выбранные условием where, в скользящей статистике.
+    total_sign / processed_sign: +1 — добавить записи, -1 — вычесть, 0 — не менять счётчик.
+    По умолчанию processed_count меняется вместе с total_count для уже обработанных записей
+    """
+    if processed_sign is None:
+        processed_expression = f"{total_sign} * COALESCE(SUM(is_processed), 0)"
+    else:
+        processed_expression = f"{processed_sign} * COUNT(*)"
+
+    cursor.execute(
+        f"""
+        INSERT INTO agent_learning_stats
+        (agent_id, data_type, source, hour_bucket, total_count, processed_count)
+        SELECT agent_id, COALESCE(data_type, ''), COALESCE(source, ''),
+               DATE_FORMAT(created_at, '%%Y-%%m-%%d %%H:00:00') as bucket,
+               {total_sign} * COUNT(*), {processed_expression}
+        FROM agent_learning_data
+        WHERE {where}
+        GROUP BY agent_id, data_type, source, bucket
+        ON DUPLICATE KEY UPDATE
+            total_count = total_count + VALUES(total_count),
+            processed_count = processed_count + VALUES(processed_count)
+        """,
+        params
+    )
+
+
+def iter_learning_data_chunks(chunk_size: int = 5000) -> Iterator[List[Dict[str, Any]]]:
+    """Последовательно выдавать записи обучения пакетами по возрастанию ID (без содержимого)"""
+    last_id = 0
+    while True:
+        chunk = db.fetch_all(
+            """
+            SELECT id, agent_id, data_type, source, is_processed, created_at
+            FROM agent_learning_data
+            WHERE id > %s
+            ORDER BY id
+            LIMIT %s
+            """,
+            (last_id, chunk_size)
+        )
+        if not chunk:
+            return
+        yield chunk
+        last_id = chunk[-1]['id']
+
+
+def replace_learning_stats(buckets: Dict[Tuple[int, str, str, datetime], List[int]]) -> int:
+    """Заменить скользящую статистику пересчитанными значениями: ключ -> [total_count, processed_count]"""
+    with db.transaction() as cursor:
+        cursor.execute("DELETE FROM agent_learning_stats")
+        if buckets:
+            cursor.executemany(
+                """
+                INSERT INTO agent_learning_stats
+                (agent_id, data_type, source, hour_bucket, total_count, processed_count)
+                VALUES (%s, %s, %s, %s, %s, %s)
+                """,
+                [(*key, counts[0], counts[1]) for key, counts in buckets.items()]
+            )
+    return len(buckets)
+
+
+def get_aggregate(agent_id: int) -> Optional[Dict[str, Any]]:
+    """Получить накопленные агрегаты обучения агента"""
+    query = "SELECT * FROM agent_learning_aggregates WHERE agent_id = %s"
+    return db.fetch_one(query, (agent_id,))
+
+
+def process_unprocessed_batch(
+    fold: Callable[[List[Dict[str, Any]], Dict[int, Dict[str, Any]]], Dict[int, Dict[str, Any]]],
+    limit: int = 500,
+    agent_id: Optional[int] = None
+) -> Tuple[int, List[int]]:
+    """
+    Обработать пакет необработанных записей в одной транзакции: свернуть их в агрегаты
+    агентов функцией fold, записать по одному обновлению личности на агента и отметить
+    записи обработанными. Строки, занятые другим обработчиком, пропускаются.
+    Возвращает (число обработанных записей, ID обновлённых агентов)
+    """
+    agent_filter = "AND agent_id = %s" if agent_id is not None else ""
+    params: List[Any] = [agent_id] if agent_id is not None else []
+    params.append(limit)
+
+    with db.transaction() as cursor:
+        cursor.execute(
+            f"""
+            SELECT id, agent_id, data_type, data_content, source
+            FROM agent_learning_data
+            WHERE is_processed = FALSE {agent_filter}
+            ORDER BY id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+            """,
+            params
+        )
+        rows = cursor.fetchall()
+        if not rows:
+            return 0, []
+
+        agent_ids = sorted({row['agent_id'] for row in rows})
+        cursor.execute(
+            f"""
+            SELECT a.id, a.personality_data, g.aggregate_data
+            FROM user_agents a
+            LEFT JOIN agent_learning_aggregates g ON g.agent_id = a.id
+            WHERE a.id IN ({', '.join(['%s'] * len(agent_ids))})
+            ORDER BY a.id
+            FOR UPDATE
+            """,
+            agent_ids
+        )
+        agents = {agent['id']: agent for agent in cursor.fetchall()}
+
+        updates = fold(rows, agents)
+        if updates:
+            cursor.executemany(
+                """
+                INSERT INTO agent_learning_aggregates (agent_id, aggregate_data, processed_count)
+                VALUES (%s, %s, %s)
+                ON DUPLICATE KEY UPDATE
+                    aggregate_data = VALUES(aggregate_data),
+                    processed_count = processed_count + VALUES(processed_count)
+                """,
+                [
+                    (updated_id, json.dumps(update['aggregate_data']), update['processed'])
+                    for updated_id, update in updates.items()
+                ]
+            )
+            cursor.executemany(
+                "UPDATE user_agents SET personality_data = %s, last_updated_at = NOW() WHERE id = %s",
+                [
+                    (json.dumps(update['personality_data']), updated_id)
+                    for updated_id, update in updates.items()
+                ]
+            )
+
+        # Записи удалённых агентов тоже закрываются, чтобы не выбираться повторно
+        row_ids = [row['id'] for row in rows]
+        cursor.execute(
+            f"""
+            UPDATE agent_learning_data
+            SET is_processed = TRUE, processed_at = NOW()
+            WHERE id IN ({', '.join(['%s'] * len(row_ids))})
+            """,
+            row_ids
+        )
+        _apply_stats(cursor, f"id IN ({', '.join(['%s'] * len(row_ids))})", row_ids, 0, 1)
+
+    agent_cache = get_entity_cache("agents")
+    for updated_id in updates:
+        agent_cache.invalidate(updated_id)
+    return len(rows), sorted(updates)
@@ -0,0 +1,126 @@
+from typing import TYPE_CHECKING, Optional, Dict, Any, List, Tuple
+from src.database.my_connector import db
+
+if TYPE_CHECKING:
+    # Только для аннотаций: модуль признаков тянет numpy, а репозиторий импортируется при старте
+    from src.utils.personality_features import PersonalityFeatures
+
+
+def save_features(features: List[Tuple[int, "PersonalityFeatures"]]) -> int:
+    """Сохранить признаки личности агентов (существующие строки заменяются)"""
+    if not features:
+        return 0
+
+    query = """
+        INSERT INTO agent_personality_features
+        (agent_id, feature_version, communication_style, attribute_count, interest_count,
+         pattern_count, learning_records, avg_message_length, embedding)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            feature_version = VALUES(feature_version),
+            communication_style = VALUES(communication_style),
+            attribute_count = VALUES(attribute_count),
+            interest_count = VALUES(interest_count),
+            pattern_count = VALUES(pattern_count),
+            learning_records = VALUES(learning_records),
+            avg_message_length = VALUES(avg_message_length),
+            embedding = VALUES(embedding)
+    """
+    params = [
+        (
+            agent_id, item.feature_version, item.communication_style, item.attribute_count,
+            item.interest_count, item.pattern_count, item.learning_records,
+            item.avg_message_length, item.embedding
+        )
+        for agent_id, item in features
+    ]
+    with db.transaction() as cursor:
+        cursor.executemany(query, params)
+    return len(params)
+
+
+def get_features(agent_id: int) -> Optional[Dict[str, Any]]:
+    """Получить признаки личности агента"""
+    query = "SELECT * FROM agent_personality_features WHERE agent_id = %s"
+    return db.fetch_one(query, (agent_id,))
+
+
+def get_ready_agent_embeddings(feature_version: int) -> List[Dict[str, Any]]:
+    """
+    Получить векторы личности готовых агентов. Для агентов без актуальных признаков
+    дополнительно возвращается personality_data, чтобы вектор можно было вычислить
+    """
+    query = """
+        SELECT a.id,
+               CASE WHEN f.feature_version = %s THEN f.embedding END as embedding,
+               CASE WHEN f.feature_version = %s THEN NULL ELSE a.personality_data END as personality_data
+        FROM user_agents a
+        LEFT JOIN agent_personality_features f ON f.agent_id = a.id
+        WHERE a.learning_status = 'ready'
+    """
+    return db.fetch_all(query, (feature_version, feature_version))
+
+
+def get_embeddings_watermark() -> Optional[Any]:
+    """Время последнего изменения признаков или агентов (отметка для догрузки индекса)"""
+    row = db.fetch_one("""
+        SELECT CAST(GREATEST(
+            COALESCE((SELECT MAX(updated_at) FROM agent_personality_features), '1970-01-02'),
+            COALESCE((SELECT MAX(last_updated_at) FROM user_agents), '1970-01-02')
+        ) AS DATETIME) as watermark
+    """)
+    return row['watermark'] if row else None
+
+
+def get_agent_embeddings_changed_since(since: Any, feature_version: int) -> List[Dict[str, Any]]:
+    """
+    Получить агентов, у которых признаки или статус менялись позже since:
+    вектор (или personality_data без актуальных признаков), статус и время изменения
+    """
+    query = """
+        SELECT a.id, a.learning_status,
+               CASE WHEN f.feature_version = %s THEN f.embedding END as embedding,
+               CASE WHEN f.feature_version = %s THEN NULL ELSE a.personality_data END as personality_data,
+               GREATEST(COALESCE(f.updated_at, a.last_updated_at), a.last_updated_at) as changed_at
+        FROM user_agents a
+        LEFT JOIN agent_personality_features f ON f.agent_id = a.id
+        WHERE a.id IN (
+            SELECT agent_id FROM agent_personality_features WHERE updated_at > %s
+            UNION
+            SELECT id FROM user_agents WHERE last_updated_at > %s
+        )
+    """
+    return db.fetch_all(query, (feature_version, feature_version, since, since))
+
+
+def get_agent_personalities_after(last_id: int, limit: int) -> List[Dict[str, Any]]:
+    """Получить личности агентов пакетом по возрастанию ID (для пересчёта признаков)"""
+    query = """
+        SELECT id, personality_data
+        FROM user_agents
+        WHERE id > %s
+        ORDER BY id
+        LIMIT %s
+    """
+    return db.fetch_all(query, (last_id, limit))
+
+
+def get_feature_stats() -> Dict[str, Any]:
+    """Получить сводку признаков личности по всем агентам"""
+    summary = db.fetch_one("""
+        SELECT COUNT(*) as agents,
+               AVG(attribute_count) as avg_attributes,
+               AVG(interest_count) as avg_interests,
+               AVG(pattern_count) as avg_patterns,
+               AVG(avg_message_length) as avg_message_length
+        FROM agent_personality_features
+    """) or {}
+    styles = db.fetch_all("""
+        SELECT communication_style, COUNT(*) as count
+        FROM agent_personality_features
+        WHERE communication_style IS NOT NULL
+        GROUP BY communication_style
+        ORDER BY count DESC
+    """)
+    summary['communication_styles'] = {row['communication_style']: row['count'] for row in styles}
+    return summary
@@ -20,36 +20,86 @@ def get_message_by_id(message_id: int) -> Optional[Dict[str, Any]]:
 def get_messages_by_simulation(simulation_id: int) -> List[Dict[str, Any]]:
     """Получить все сообщения конкретной симуляции"""
     query = """
-        SELECT asm.*, as.agent_id, as.conversation_id
-        FROM agent_simulation_messages asm
-        JOIN agents_simulations as ON asm.simulation_id = as.id
-        WHERE asm.simulation_id = %s
-        ORDER BY asm.created_at ASC
+        SELECT * FROM agent_simulation_messages
+        WHERE simulation_id = %s
+        ORDER BY created_at ASC, id ASC
     """
     return db.fetch_all(query, (simulation_id,))
 
 
 def create_message(message: AgentSimulationMessages) -> int:
     """Создать новое сообщение симуляции"""
-    # Сериализуем JSON-поле с метаданными
-    metadata = json.dumps(message.Metadata) if message.Metadata else None
-    
     query = """
-        INSERT INTO agent_simulation_messages 
-        (simulation_id, message_content, role, message_type, metadata)
-        VALUES (%s, %s, %s, %s, %s)
+        INSERT INTO agent_simulation_messages
+        (simulation_id, sender_agent_id, message_text, sentiment_score)
+        VALUES (%s, %s, %s, %s)
     """
     params = (
-        message.SimulationID,
-        message.MessageContent,
-        message.Role,
-        message.MessageType,
-        metadata
+        message.simulation_id,
+        message.sender_agent_id,
+        message.message_text,
+        message.sentiment_score
     )
     cursor = db.execute_query(query, params)
     return cursor.lastrowid
 
 
+def create_messages_bulk(messages: List[AgentSimulationMessages]) -> int:
+    """Сохранить пакет сообщений симуляций одним INSERT; возвращает ID первой вставленной строки"""
+    if not messages:
+        return 0
+
+    placeholders = ", ".join(["(%s, %s, %s, %s)"] * len(messages))
+    params = []
+    for message in messages:
+        params.extend((message.simulation_id, message.sender_agent_id, message.message_text, message.sentiment_score))
+
+    query = f"""
+        INSERT INTO agent_simulation_messages
+        (simulation_id, sender_agent_id, message_text, sentiment_score)
+        VALUES {placeholders}
+    """
+    cursor = db.execute_query(query, params)
+    return cursor.lastrowid
+
+
+def copy_simulation_messages(
+    source_simulation_id: int,
+    target_simulation_id: int,
+    source_agent1_id: int,
+    target_agent1_id: int,
+    target_agent2_id: int
+) -> int:
+    """Скопировать диалог одной симуляции в другую, подставив агентов новой симуляции"""
+    query = """
+        INSERT INTO agent_simulation_messages
+        (simulation_id, sender_agent_id, message_text, sentiment_score)
+        SELECT %s, CASE WHEN sender_agent_id = %s THEN %s ELSE %s END,
+               message_text, sentiment_score
+        FROM agent_simulation_messages
+        WHERE simulation_id = %s
+        ORDER BY id
+    """
+    cursor = db.execute_query(query, (
+        target_simulation_id, source_agent1_id, target_agent1_id, target_agent2_id, source_simulation_id
+    ))
+    return cursor.rowcount
+
+
+def get_messages_since(simulation_ids: List[int], first_message_id: int) -> List[Dict[str, Any]]:
+    """Получить сообщения симуляций начиная с указанного ID"""
+    if not simulation_ids:
+        return []
+
+    placeholders = ", ".join(["%s"] * len(simulation_ids))
+    query = f"""
+        SELECT * FROM agent_simulation_messages
+        WHERE id >= %s AND simulation_id IN ({placeholders})
+        ORDER BY id
+    """
+    return db.fetch_all(query, (first_message_id, *simulation_ids))
+
+
 def update_message(message_id: int, updates: Dict[str, Any]) -> None:
     """Обновить сообщение симуляции"""
     set_clauses = []
@@ -185,16 +235,34 @@ def get_message_stats_by_type(simulation_id: int) -> Dict[str, int]:
     return stats
 
 
-def search_simulation_messages(search_term: str) -> List[Dict[str, Any]]:
-    """Поиск сообщений симуляции по содержимому"""
-    query = """
-        SELECT asm.*, as.agent_id, as.conversation_id
+def search_simulation_messages(
+    boolean_query: str,
+    simulation_id: int = None,
+    limit: int = 50,
+    offset: int = 0
+) -> List[Dict[str, Any]]:
+    """Полнотекстовый поиск сообщений симуляций (индекс ft_agent_simulation_messages_text)"""
+    query_parts = [
+        """
+        SELECT asm.*, s.conversation_id,
+               MATCH(asm.message_text) AGAINST (%s IN BOOLEAN MODE) as relevance
         FROM agent_simulation_messages asm
-        JOIN agents_simulations as ON asm.simulation_id = as.id
-        WHERE asm.message_content LIKE %s
-        ORDER BY asm.created_at DESC
-    """
-    return db.fetch_all(query, (f"%{search_term}%",))
+        JOIN agent_simulations s ON asm.simulation_id = s.id
+        WHERE MATCH(asm.message_text) AGAINST (%s IN BOOLEAN MODE)
+        """
+    ]
+    
+    params = [boolean_query, boolean_query]
+    
+    if simulation_id:
+        query_parts.append("AND asm.simulation_id = %s")
+        params.append(simulation_id)
+    
+    query_parts.append("ORDER BY relevance DESC, asm.created_at DESC LIMIT %s OFFSET %s")
+    params.extend([limit, offset])
+    
+    query = " ".join(query_parts)
+    return db.fetch_all(query, tuple(params))
 
 
 def get_recent_simulation_messages(hours: int = 24) -> List[Dict[str, Any]]:
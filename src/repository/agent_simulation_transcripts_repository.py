@@ -0,0 +1,121 @@
+from typing import Optional, Dict, Any, List
+from src.database.my_connector import db
+
+
+def get_transcript(simulation_id: int) -> Optional[Dict[str, Any]]:
+    """Получить сжатый транскрипт симуляции вместе с её агентами"""
+    query = """
+        SELECT t.*, s.agent1_id, s.agent2_id
+        FROM agent_simulation_transcripts t
+        JOIN agent_simulations s ON s.id = t.simulation_id
+        WHERE t.simulation_id = %s
+    """
+    return db.fetch_one(query, (simulation_id,))
+
+
+def get_simulations_to_compact(
+    simulation_ids: Optional[List[int]] = None,
+    limit: int = 100,
+    retention_hours: int = 0
+) -> List[Dict[str, Any]]:
+    """
+    Получить симуляции с сообщениями без транскрипта, завершённые раньше,
+    чем retention_hours часов назад
+    """
+    filter_clause = ""
+    params: List[Any] = [retention_hours]
+    if simulation_ids:
+        filter_clause = f"AND s.id IN ({', '.join(['%s'] * len(simulation_ids))})"
+        params.extend(simulation_ids)
+    params.append(limit)
+
+    query = f"""
+        SELECT s.id, s.agent1_id, s.agent2_id
+        FROM agent_simulations s
+        LEFT JOIN agent_simulation_transcripts t ON t.simulation_id = s.id
+        WHERE s.simulation_status = 'completed'
+        AND s.completed_at < NOW() - INTERVAL %s HOUR
+        AND t.simulation_id IS NULL
+        AND EXISTS (SELECT 1 FROM agent_simulation_messages m WHERE m.simulation_id = s.id)
+        {filter_clause}
+        ORDER BY s.id
+        LIMIT %s
+    """
+    return db.fetch_all(query, params)
+
+
+def get_messages_for_simulations(simulation_ids: List[int]) -> List[Dict[str, Any]]:
+    """Получить сообщения нескольких симуляций одним запросом"""
+    if not simulation_ids:
+        return []
+
+    placeholders = ", ".join(["%s"] * len(simulation_ids))
+    query = f"""
+        SELECT simulation_id, sender_agent_id, message_text, sentiment_score, created_at
+        FROM agent_simulation_messages
+        WHERE simulation_id IN ({placeholders})
+        ORDER BY simulation_id, created_at, id
+    """
+    return db.fetch_all(query, tuple(simulation_ids))
+
+
+def save_transcripts(transcripts: List[Dict[str, Any]]) -> int:
+    """
+    Сохранить транскрипты и удалить построчные сообщения этих симуляций
+    в одной транзакции
+    """
+    if not transcripts:
+        return 0
+
+    placeholders = ", ".join(["(%s, %s, %s, %s, %s, %s)"] * len(transcripts))
+    params = []
+    for transcript in transcripts:
+        params.extend((
+            transcript['simulation_id'],
+            transcript['format_version'],
+            transcript['turn_count'],
+            transcript['raw_size'],
+            transcript['transcript'],
+            transcript['started_at']
+        ))
+    simulation_ids = [transcript['simulation_id'] for transcript in transcripts]
+
+    with db.transaction() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO agent_simulation_transcripts
+            (simulation_id, format_version, turn_count, raw_size, transcript, started_at)
+            VALUES {placeholders}
+            """,
+            params
+        )
+        cursor.execute(
+            f"DELETE FROM agent_simulation_messages WHERE simulation_id IN ({', '.join(['%s'] * len(simulation_ids))})",
+            tuple(simulation_ids)
+        )
+    return len(transcripts)
+
+
+def copy_transcript(source_simulation_id: int, target_simulation_id: int) -> int:
+    """Скопировать транскрипт в другую симуляцию (отправители кодируются относительно её агентов)"""
+    query = """
+        INSERT INTO agent_simulation_transcripts
+        (simulation_id, format_version, turn_count, raw_size, transcript, started_at)
+        SELECT %s, format_version, turn_count, raw_size, transcript, NOW()
+        FROM agent_simulation_transcripts
+        WHERE simulation_id = %s
+    """
+    cursor = db.execute_query(query, (target_simulation_id, source_simulation_id))
+    return cursor.rowcount
+
+
+def get_transcript_stats() -> Dict[str, Any]:
+    """Получить статистику сжатых транскриптов"""
+    query = """
+        SELECT COUNT(*) as transcripts,
+               COALESCE(SUM(turn_count), 0) as turns,
+               COALESCE(SUM(raw_size), 0) as raw_bytes,
+               COALESCE(SUM(LENGTH(transcript)), 0) as stored_bytes
+        FROM agent_simulation_transcripts
+    """
+    return db.fetch_one(query)
@@ -1,19 +1,17 @@
 from typing import Optional, Dict, Any, List
-from datetime import datetime
-import json
 from src.database.my_connector import db
 from src.database.models import AgentSimulations
 
 
 def get_all_simulations() -> List[Dict[str, Any]]:
     """Получить все симуляции агентов"""
-    query = "SELECT * FROM agents_simulations"
+    query = "SELECT * FROM agent_simulations"
     return db.fetch_all(query)
 
 
 def get_simulation_by_id(simulation_id: int) -> Optional[Dict[str, Any]]:
     """Получить симуляцию по ID"""
-    query = "SELECT * FROM agents_simulations WHERE id = %s"
+    query = "SELECT * FROM agent_simulations WHERE id = %s"
     return db.fetch_one(query, (simulation_id,))
 
 
@@ -21,21 +19,21 @@ def get_simulations_by_agent(agent_id: int) -> List[Dict[str, Any]]:
     """Получить все симуляции конкретного агента"""
     query = """
         SELECT s.*, u.first_name as agent_owner_name
-        FROM agents_simulations s
-        JOIN user_agents a ON s.agent_id = a.id
+        FROM agent_simulations s
+        JOIN user_agents a ON a.id = %s
         JOIN users u ON a.user_id = u.id
-        WHERE s.agent_id = %s
+        WHERE s.agent1_id = %s OR s.agent2_id = %s
         ORDER BY s.created_at DESC
     """
-    return db.fetch_all(query, (agent_id,))
+    return db.fetch_all(query, (agent_id, agent_id, agent_id))
 
 
 def get_simulations_by_conversation(conversation_id: int) -> List[Dict[str, Any]]:
     """Получить все симуляции для конкретной беседы"""
     query = """
         SELECT s.*, a.user_id as agent_owner_id, u.first_name as agent_owner_name
-        FROM agents_simulations s
-        JOIN user_agents a ON s.agent_id = a.id
+        FROM agent_simulations s
+        JOIN user_agents a ON s.agent1_id = a.id
         JOIN users u ON a.user_id = u.id
         WHERE s.conversation_id = %s
         ORDER BY s.created_at DESC
@@ -44,123 +42,234 @@ def get_simulations_by_conversation(conversation_id: int) -> List[Dict[str, Any]
 
 
 def create_simulation(simulation: AgentSimulations) -> int:
-    """Создать новую симуляцию агента"""
-    # Сериализуем JSON поле с данными симуляции
-    simulation_data = json.dumps(simulation.SimulationData) if simulation.SimulationData else None
-    
+    """Создать новую симуляцию агентов"""
     query = """
-        INSERT INTO agents_simulations 
-        (agent_id, conversation_id, simulation_status, start_time, end_time, simulation_data)
-        VALUES (%s, %s, %s, %s, %s, %s)
+        INSERT INTO agent_simulations
+        (conversation_id, agent1_id, agent2_id, simulation_status,
+         compatibility_score, simulation_summary, started_at, completed_at)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
     """
     params = (
-        simulation.AgentID,
-        simulation.ConversationID,
-        simulation.SimulationStatus,
-        simulation.StartTime or datetime.utcnow(),
-        simulation.EndTime,
-        simulation_data
+        simulation.conversation_id,
+        simulation.agent1_id,
+        simulation.agent2_id,
+        simulation.simulation_status.value,
+        simulation.compatibility_score,
+        simulation.simulation_summary,
+        simulation.started_at,
+        simulation.completed_at
     )
     cursor = db.execute_query(query, params)
     return cursor.lastrowid
 
 
+def get_batch_candidates(agent_id: int, candidates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Проверить пакет кандидатов одним запросом: беседа существует, владелец агента
+    участвует в её матче, агент кандидата существует (по умолчанию — агент собеседника).
+    Вместе с личностями возвращаются сохранённые векторы агентов
+    """
+    if not candidates:
+        return []
+
+    requested = " UNION ALL ".join(
+        ["SELECT %s as position, %s as conversation_id, %s as agent2_id"] * len(candidates)
+    )
+    params = []
+    for position, candidate in enumerate(candidates):
+        params.extend((position, candidate['conversation_id'], candidate.get('agent_id')))
+    params.append(agent_id)
+
+    query = f"""
+        SELECT r.position, c.id as conversation_id,
+               sa.id as agent1_id, sa.personality_data as agent1_personality,
+               pa.id as agent2_id, pa.user_id as agent2_user_id,
+               pa.personality_data as agent2_personality,
+               sf.embedding as agent1_embedding, sf.feature_version as agent1_feature_version,
+               pf.embedding as agent2_embedding, pf.feature_version as agent2_feature_version
+        FROM ({requested}) r
+        JOIN user_agents sa ON sa.id = %s
+        JOIN chat_conversations c ON c.id = r.conversation_id
+        JOIN matches m ON m.id = c.match_id AND sa.user_id IN (m.user1_id, m.user2_id)
+        JOIN user_agents pa ON (
+            (r.agent2_id IS NOT NULL AND pa.id = r.agent2_id)
+            OR (r.agent2_id IS NULL
+                AND pa.user_id = CASE WHEN m.user1_id = sa.user_id THEN m.user2_id ELSE m.user1_id END)
+        )
+        LEFT JOIN agent_personality_features sf ON sf.agent_id = sa.id
+        LEFT JOIN agent_personality_features pf ON pf.agent_id = pa.id
+        WHERE pa.id <> sa.id
+        ORDER BY r.position
+    """
+    return db.fetch_all(query, params)
+
+
 def update_simulation(simulation_id: int, updates: Dict[str, Any]) -> None:
-    """Обновить симуляцию агента"""
+    """Обновить симуляцию агентов"""
     set_clauses = []
     params = []
 
-    # Особая обработка для JSON поля simulation_data
-    if 'simulation_data' in updates and updates['simulation_data'] is not None:
-        set_clauses.append("simulation_data = %s")
-        params.append(json.dumps(updates['simulation_data']))
-        updates.pop('simulation_data')
-    
-    # Обработка остальных полей
-    field_mapping = {
-        "simulation_status": "SimulationStatus",
-        "start_time": "StartTime",
-        "end_time": "EndTime"
+    allowed_fields = {
+        "simulation_status",
+        "compatibility_score",
+        "simulation_summary",
+        "started_at",
+        "completed_at",
+        "last_error"
     }
 
     for db_field, value in updates.items():
-        if db_field in field_mapping and value is not None:
+        if db_field in allowed_fields and value is not None:
             set_clauses.append(f"{db_field} = %s")
             params.append(value)
 
     if not set_clauses:
         return
 
-    # Автоматическое обновление поля updated_at
-    set_clauses.append("updated_at = NOW()")
-    
     params.append(simulation_id)
-    query = f"UPDATE agents_simulations SET {', '.join(set_clauses)} WHERE id = %s"
+    query = f"UPDATE agent_simulations SET {', '.join(set_clauses)} WHERE id = %s"
     db.execute_query(query, params)
 
 
 def update_simulation_status(simulation_id: int, status: str) -> None:
-    """Обновить статус симуляции агента"""
+    """Обновить статус симуляции агентов"""
+    query = "UPDATE agent_simulations SET simulation_status = %s WHERE id = %s"
+    db.execute_query(query, (status, simulation_id))
+
+
+def delete_simulation(simulation_id: int) -> None:
+    """Удалить симуляцию агентов"""
+    query = "DELETE FROM agent_simulations WHERE id = %s"
+    db.execute_query(query, (simulation_id,))
+
+
+def claim_simulations(worker_id: str, limit: int, lease_seconds: int) -> List[Dict[str, Any]]:
+    """
+    Захватить ожидающие симуляции для воркера: строки блокируются через
+    FOR UPDATE SKIP LOCKED, переводятся в in_progress и получают аренду
+    """
+    with db.transaction() as cursor:
+        cursor.execute(
+            """
+            SELECT id FROM agent_simulations
+            WHERE simulation_status = 'pending' AND available_at <= NOW()
+            ORDER BY available_at, id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+            """,
+            (limit,)
+        )
+        simulation_ids = [row['id'] for row in cursor.fetchall()]
+        if not simulation_ids:
+            return []
+
+        placeholders = ", ".join(["%s"] * len(simulation_ids))
+        cursor.execute(
+            f"""
+            UPDATE agent_simulations
+            SET simulation_status = 'in_progress',
+                started_at = COALESCE(started_at, NOW()),
+                attempts = attempts + 1,
+                locked_by = %s,
+                lease_expires_at = DATE_ADD(NOW(), INTERVAL %s SECOND)
+            WHERE id IN ({placeholders})
+            """,
+            (worker_id, lease_seconds, *simulation_ids)
+        )
+        cursor.execute(
+            f"SELECT * FROM agent_simulations WHERE id IN ({placeholders}) ORDER BY id",
+            tuple(simulation_ids)
+        )
+        return cursor.fetchall()
+
+
+def complete_claimed_simulation(
+    simulation_id: int,
+    worker_id: str,
+    compatibility_score: Optional[float],
+    simulation_summary: Optional[str]
+) -> bool:
+    """Завершить симуляцию, если аренда всё ещё принадлежит воркеру"""
     query = """
-        UPDATE agents_simulations 
-        SET simulation_status = %s, updated_at = NOW()
-        WHERE id = %s
+        UPDATE agent_simulations
+        SET simulation_status = 'completed', completed_at = NOW(),
+            compatibility_score = %s, simulation_summary = %s,
+            locked_by = NULL, lease_expires_at = NULL
+        WHERE id = %s AND locked_by = %s AND simulation_status = 'in_progress'
     """
-    db.execute_query(query, (status, simulation_id))
+    cursor = db.execute_query(query, (compatibility_score, simulation_summary, simulation_id, worker_id))
+    return cursor.rowcount > 0
 
 
-def complete_simulation(simulation_id: int, simulation_data: Dict[str, Any] = None) -> None:
-    """Завершить симуляцию агента и сохранить данные результата"""
-    updates = {
-        "simulation_status": "completed",
-        "end_time": datetime.utcnow()
-    }
-    
-    if simulation_data:
-        updates["simulation_data"] = simulation_data
-    
-    update_simulation(simulation_id, updates)
-
-
-def fail_simulation(simulation_id: int, error_data: Dict[str, Any] = None) -> None:
-    """Отметить симуляцию как неудачную с данными об ошибке"""
-    updates = {
-        "simulation_status": "failed",
-        "end_time": datetime.utcnow()
-    }
-    
-    if error_data:
-        # Получаем текущие данные симуляции и добавляем информацию об ошибке
-        simulation = get_simulation_by_id(simulation_id)
-        if simulation and simulation.get('simulation_data'):
-            current_data = json.loads(simulation['simulation_data']) if isinstance(simulation['simulation_data'], str) else simulation['simulation_data']
-            current_data["error"] = error_data
-            updates["simulation_data"] = current_data
-        else:
-            updates["simulation_data"] = {"error": error_data}
-    
-    update_simulation(simulation_id, updates)
+def release_simulation(simulation_id: int, worker_id: str, error_message: str, retry_delay_seconds: int) -> bool:
+    """Вернуть симуляцию в очередь для повторной попытки"""
+    query = """
+        UPDATE agent_simulations
+        SET simulation_status = 'pending', last_error = %s,
+            available_at = DATE_ADD(NOW(), INTERVAL %s SECOND),
+            locked_by = NULL, lease_expires_at = NULL
+        WHERE id = %s AND locked_by = %s AND simulation_status = 'in_progress'
+    """
+    cursor = db.execute_query(query, (error_message, retry_delay_seconds, simulation_id, worker_id))
+    return cursor.rowcount > 0
 
 
-def delete_simulation(simulation_id: int) -> None:
-    """Удалить симуляцию агента"""
-    query = "DELETE FROM agents_simulations WHERE id = %s"
-    db.execute_query(query, (simulation_id,))
+def reclaim_expired_simulations(worker_id: str, retry_delay_seconds: int, grace_seconds: int = 60) -> List[int]:
+    """
+    Вернуть в очередь симуляции с истекшей арендой.
+    Возвращает ID симуляций, исчерпавших попытки: они остаются за воркером
+    на grace_seconds, чтобы он отметил их как неудачные
+    """
+    with db.transaction() as cursor:
+        cursor.execute(
+            """
+            SELECT id, attempts, max_attempts FROM agent_simulations
+            WHERE simulation_status = 'in_progress' AND lease_expires_at < NOW()
+            FOR UPDATE SKIP LOCKED
+            """
+        )
+        expired = cursor.fetchall()
+        retry_ids = [row['id'] for row in expired if row['attempts'] < row['max_attempts']]
+        exhausted_ids = [row['id'] for row in expired if row['attempts'] >= row['max_attempts']]
+
+        if retry_ids:
+            placeholders = ", ".join(["%s"] * len(retry_ids))
+            cursor.execute(
+                f"""
+                UPDATE agent_simulations
+                SET simulation_status = 'pending', last_error = 'Lease expired',
+                    available_at = DATE_ADD(NOW(), INTERVAL %s SECOND),
+                    locked_by = NULL, lease_expires_at = NULL
+                WHERE id IN ({placeholders})
+                """,
+                (retry_delay_seconds, *retry_ids)
+            )
+        if exhausted_ids:
+            placeholders = ", ".join(["%s"] * len(exhausted_ids))
+            cursor.execute(
+                f"""
+                UPDATE agent_simulations
+                SET locked_by = %s, lease_expires_at = DATE_ADD(NOW(), INTERVAL %s SECOND)
+                WHERE id IN ({placeholders})
+                """,
+                (worker_id, grace_seconds, *exhausted_ids)
+            )
+        return exhausted_ids
 
 
 def get_active_simulations() -> List[Dict[str, Any]]:
-    """Получить все активные симуляции агентов"""
+    """Получить все выполняющиеся симуляции агентов"""
     query = """
-        SELECT s.*, 
-               a.user_id as agent_owner_id, 
+        SELECT s.*,
+               a.user_id as agent_owner_id,
                u.first_name as agent_owner_name,
                c.match_id
-        FROM agents_simulations s
-        JOIN user_agents a ON s.agent_id = a.id
+        FROM agent_simulations s
+        JOIN user_agents a ON s.agent1_id = a.id
         JOIN users u ON a.user_id = u.id
         JOIN chat_conversations c ON s.conversation_id = c.id
-        WHERE s.simulation_status = 'active'
-        ORDER BY s.start_time DESC
+        WHERE s.simulation_status = 'in_progress'
+        ORDER BY s.started_at DESC
     """
     return db.fetch_all(query)
 
@@ -168,15 +277,15 @@ def get_active_simulations() -> List[Dict[str, Any]]:
 def get_completed_simulations(limit: int = 100) -> List[Dict[str, Any]]:
     """Получить завершенные симуляции агентов"""
     query = """
-        SELECT s.*, 
-               TIMESTAMPDIFF(SECOND, s.start_time, s.end_time) as duration_seconds,
-               a.user_id as agent_owner_id, 
+        SELECT s.*,
+               TIMESTAMPDIFF(SECOND, s.started_at, s.completed_at) as duration_seconds,
+               a.user_id as agent_owner_id,
                u.first_name as agent_owner_name
-        FROM agents_simulations s
-        JOIN user_agents a ON s.agent_id = a.id
+        FROM agent_simulations s
+        JOIN user_agents a ON s.agent1_id = a.id
         JOIN users u ON a.user_id = u.id
         WHERE s.simulation_status = 'completed'
-        ORDER BY s.end_time DESC
+        ORDER BY s.completed_at DESC
         LIMIT %s
     """
     return db.fetch_all(query, (limit,))
@@ -185,15 +294,15 @@ def get_completed_simulations(limit: int = 100) -> List[Dict[str, Any]]:
 def get_failed_simulations(limit: int = 100) -> List[Dict[str, Any]]:
     """Получить неудачные симуляции агентов"""
     query = """
-        SELECT s.*, 
-               TIMESTAMPDIFF(SECOND, s.start_time, s.end_time) as duration_seconds,
-               a.user_id as agent_owner_id, 
+        SELECT s.*,
+               TIMESTAMPDIFF(SECOND, s.started_at, s.completed_at) as duration_seconds,
+               a.user_id as agent_owner_id,
                u.first_name as agent_owner_name
-        FROM agents_simulations s
-        JOIN user_agents a ON s.agent_id = a.id
+        FROM agent_simulations s
+        JOIN user_agents a ON s.agent1_id = a.id
         JOIN users u ON a.user_id = u.id
         WHERE s.simulation_status = 'failed'
-        ORDER BY s.end_time DESC
+        ORDER BY s.completed_at DESC
         LIMIT %s
     """
     return db.fetch_all(query, (limit,))
@@ -202,15 +311,15 @@ def get_failed_simulations(limit: int = 100) -> List[Dict[str, Any]]:
 def get_recent_simulations(hours: int = 24) -> List[Dict[str, Any]]:
     """Получить недавние симуляции за указанное количество часов"""
     query = """
-        SELECT s.*, 
-               a.user_id as agent_owner_id, 
+        SELECT s.*,
+               a.user_id as agent_owner_id,
                u.first_name as agent_owner_name,
-               CASE 
-                 WHEN s.end_time IS NOT NULL THEN TIMESTAMPDIFF(SECOND, s.start_time, s.end_time)
-                 ELSE TIMESTAMPDIFF(SECOND, s.start_time, NOW())
+               CASE
+                 WHEN s.completed_at IS NOT NULL THEN TIMESTAMPDIFF(SECOND, s.started_at, s.completed_at)
+                 ELSE TIMESTAMPDIFF(SECOND, s.started_at, NOW())
                END as duration_seconds
-        FROM agents_simulations s
-        JOIN user_agents a ON s.agent_id = a.id
+        FROM agent_simulations s
+        JOIN user_agents a ON s.agent1_id = a.id
         JOIN users u ON a.user_id = u.id
         WHERE s.created_at >= DATE_SUB(NOW(), INTERVAL %s HOUR)
         ORDER BY s.created_at DESC
@@ -221,41 +330,43 @@ def get_recent_simulations(hours: int = 24) -> List[Dict[str, Any]]:
 def get_simulation_stats() -> Dict[str, Any]:
     """Получить статистику по симуляциям агентов"""
     query = """
-        SELECT 
+        SELECT
             COUNT(*) as total_simulations,
-            SUM(CASE WHEN simulation_status = 'active' THEN 1 ELSE 0 END) as active_count,
+            SUM(CASE WHEN simulation_status = 'pending' THEN 1 ELSE 0 END) as pending_count,
+            SUM(CASE WHEN simulation_status = 'in_progress' THEN 1 ELSE 0 END) as active_count,
             SUM(CASE WHEN simulation_status = 'completed' THEN 1 ELSE 0 END) as completed_count,
             SUM(CASE WHEN simulation_status = 'failed' THEN 1 ELSE 0 END) as failed_count,
-            AVG(CASE 
-                WHEN simulation_status = 'completed' AND end_time IS NOT NULL 
-                THEN TIMESTAMPDIFF(SECOND, start_time, end_time) 
-                ELSE NULL 
+            AVG(CASE
+                WHEN simulation_status = 'completed' AND completed_at IS NOT NULL
+                THEN TIMESTAMPDIFF(SECOND, started_at, completed_at)
+                ELSE NULL
             END) as avg_duration_seconds
-        FROM agents_simulations
+        FROM agent_simulations
     """
-    
+
     result = db.fetch_one(query) or {}
-    
+
     # Дополнительный запрос для получения статистики по последним 24 часам
     recent_query = """
-        SELECT 
+        SELECT
             COUNT(*) as recent_simulations,
             SUM(CASE WHEN simulation_status = 'completed' THEN 1 ELSE 0 END) as recent_completed
-        FROM agents_simulations
+        FROM agent_simulations
         WHERE created_at >= DATE_SUB(NOW(), INTERVAL 24 HOUR)
     """
-    
+
     recent = db.fetch_one(recent_query) or {}
-    
+
     return {
         "всего_симуляций": result.get("total_simulations", 0),
-        "активных": result.get("active_count", 0),
-        "завершенных": result.get("completed_count", 0),
-        "неудачных": result.get("failed_count", 0),
-        "средняя_продолжительность_сек": float(result.get("avg_duration_seconds", 0)),
+        "в_очереди": result.get("pending_count") or 0,
+        "активных": result.get("active_count") or 0,
+        "завершенных": result.get("completed_count") or 0,
+        "неудачных": result.get("failed_count") or 0,
+        "средняя_продолжительность_сек": float(result.get("avg_duration_seconds") or 0),
         "за_последние_24ч": {
             "всего": recent.get("recent_simulations", 0),
-            "завершенных": recent.get("recent_completed", 0)
+            "завершенных": recent.get("recent_completed") or 0
         }
     }
 
@@ -263,22 +374,22 @@ def get_simulation_stats() -> Dict[str, Any]:
 def get_top_agent_simulations(limit: int = 10) -> List[Dict[str, Any]]:
     """Получить топ агентов по количеству успешных симуляций"""
     query = """
-        SELECT 
+        SELECT
             a.id as agent_id,
             u.id as user_id,
             u.first_name,
             COUNT(*) as total_simulations,
             SUM(CASE WHEN s.simulation_status = 'completed' THEN 1 ELSE 0 END) as successful_simulations,
-            AVG(CASE 
-                WHEN s.simulation_status = 'completed' AND s.end_time IS NOT NULL 
-                THEN TIMESTAMPDIFF(SECOND, s.start_time, s.end_time) 
-                ELSE NULL 
+            AVG(CASE
+                WHEN s.simulation_status = 'completed' AND s.completed_at IS NOT NULL
+                THEN TIMESTAMPDIFF(SECOND, s.started_at, s.completed_at)
+                ELSE NULL
             END) as avg_duration_seconds
-        FROM agents_simulations s
-        JOIN user_agents a ON s.agent_id = a.id
+        FROM agent_simulations s
+        JOIN user_agents a ON a.id IN (s.agent1_id, s.agent2_id)
         JOIN users u ON a.user_id = u.id
         GROUP BY a.id, u.id, u.first_name
         ORDER BY successful_simulations DESC
         LIMIT %s
     """
-    return db.fetch_all(query, (limit,))
\ No newline at end of file
+    return db.fetch_all(query, (limit,))
@@ -2,6 +2,10 @@ from typing import Optional, Dict, Any, List
 from datetime import datetime
 from src.database.my_connector import db
 from src.database.models import ChatConversations
+from src.utils.entity_cache import get_entity_cache
+
+# conversation_id -> участники матча беседы: они не меняются, кэш ограничен по размеру и TTL
+participants_cache = get_entity_cache("conversation_participants")
 
 
 def get_all_conversations() -> List[Dict[str, Any]]:
@@ -25,7 +29,7 @@ def get_conversation_by_match_id(match_id: int) -> Optional[Dict[str, Any]]:
 def create_conversation(conversation: ChatConversations) -> int:
     """Создать новую беседу"""
     # Проверяем, не существует ли уже беседа для этого матча
-    existing = get_conversation_by_match_id(conversation.MatchID)
+    existing = get_conversation_by_match_id(conversation.match_id)
     if existing:
         # Беседа уже существует
         return existing['id']
@@ -36,8 +40,8 @@ def create_conversation(conversation: ChatConversations) -> int:
         VALUES (%s, %s)
     """
     params = (
-        conversation.MatchID,
-        conversation.LastMessageAt or datetime.utcnow()
+        conversation.match_id,
+        conversation.last_message_at or datetime.utcnow()
     )
     cursor = db.execute_query(query, params)
     return cursor.lastrowid
@@ -77,29 +81,39 @@ def delete_conversation(conversation_id: int) -> None:
     # в зависимости от настроек внешних ключей в базе данных
     query = "DELETE FROM chat_conversations WHERE id = %s"
     db.execute_query(query, (conversation_id,))
+    participants_cache.invalidate(conversation_id)
 
 
-def get_user_conversations(user_id: int) -> List[Dict[str, Any]]:
-    """Получить все беседы пользователя"""
+def get_conversation_participants(conversation_id: int) -> Optional[Dict[str, Any]]:
+    """Получить участников беседы"""
     query = """
-        SELECT c.*, 
-               m.user1_id, m.user2_id, m.match_status,
-               CASE 
-                 WHEN m.user1_id = %s THEN m.user2_id 
-                 ELSE m.user1_id 
-               END as other_user_id,
-               u.first_name as other_user_name,
-               p.profile_photo_url as other_user_photo,
-               (SELECT COUNT(*) FROM chat_messages msg 
-                WHERE msg.conversation_id = c.id AND msg.is_read = FALSE AND msg.sender_id != %s) as unread_count
+        SELECT m.user1_id, m.user2_id
         FROM chat_conversations c
         JOIN matches m ON c.match_id = m.id
-        JOIN users u ON (CASE WHEN m.user1_id = %s THEN m.user2_id ELSE m.user1_id END) = u.id
-        LEFT JOIN profile_details p ON u.id = p.user_id
-        WHERE m.user1_id = %s OR m.user2_id = %s
-        ORDER BY c.last_message_at DESC
+        WHERE c.id = %s
+    """
+    # Отсутствие не кешируется: беседа с этим ID может появиться позже
+    return participants_cache.get_or_load(
+        conversation_id, lambda: db.fetch_one(query, (conversation_id,)), cache_missing=False
+    )
+
+
+def get_user_conversation_ids(user_id: int, conversation_ids: Optional[List[int]] = None) -> List[int]:
+    """Получить ID бесед пользователя (при необходимости только из переданного списка)"""
+    query = """
+        SELECT c.id
+        FROM chat_conversations c
+        JOIN matches m ON c.match_id = m.id
+        WHERE (m.user1_id = %s OR m.user2_id = %s)
     """
-    return db.fetch_all(query, (user_id, user_id, user_id, user_id, user_id))
+    params = [user_id, user_id]
+    if conversation_ids is not None:
+        if not conversation_ids:
+            return []
+        placeholders = ", ".join(["%s"] * len(conversation_ids))
+        query += f" AND c.id IN ({placeholders})"
+        params.extend(conversation_ids)
+    return [row['id'] for row in db.fetch_all(query, tuple(params))]
 
 
 def get_active_conversations() -> List[Dict[str, Any]]:
@@ -0,0 +1,97 @@
+from typing import Optional, Dict, Any, List
+from datetime import datetime
+from src.database.my_connector import db
+
+INBOX_PREVIEW_LENGTH = 120
+
+
+def get_user_inbox(user_id: int) -> List[Dict[str, Any]]:
+    """Получить входящие беседы пользователя, отсортированные по последнему сообщению"""
+    query = """
+        SELECT i.conversation_id as id, i.match_id, i.last_message_at, i.created_at,
+               i.user1_id, i.user2_id, i.match_status,
+               i.other_user_id, i.other_user_name, i.other_user_photo,
+               i.last_message_preview,
+               COALESCE(uc.unread_count, 0) as unread_count
+        FROM chat_inbox i
+        LEFT JOIN chat_unread_counters uc
+               ON uc.user_id = i.user_id AND uc.conversation_id = i.conversation_id
+        WHERE i.user_id = %s
+        ORDER BY i.last_message_at DESC
+    """
+    return db.fetch_all(query, (user_id,))
+
+
+def upsert_conversation_inbox(conversation_id: Optional[int] = None) -> int:
+    """
+    Построить записи входящих для обоих участников беседы
+    (или для всех бесед, если conversation_id не указан)
+    """
+    query = f"""
+        INSERT INTO chat_inbox
+        (user_id, conversation_id, match_id, user1_id, user2_id, match_status,
+         other_user_id, other_user_name, other_user_photo,
+         last_message_preview, last_message_at, created_at)
+        SELECT CASE WHEN s.side = 1 THEN m.user1_id ELSE m.user2_id END,
+               c.id, c.match_id, m.user1_id, m.user2_id, m.match_status,
+               u.id, u.first_name, p.profile_photo_url,
+               (SELECT LEFT(msg.message_text, {INBOX_PREVIEW_LENGTH}) FROM chat_messages msg
+                WHERE msg.conversation_id = c.id
+                ORDER BY msg.created_at DESC, msg.id DESC LIMIT 1),
+               c.last_message_at, c.created_at
+        FROM chat_conversations c
+        JOIN matches m ON c.match_id = m.id
+        JOIN (SELECT 1 as side UNION ALL SELECT 2) s
+        JOIN users u ON u.id = CASE WHEN s.side = 1 THEN m.user2_id ELSE m.user1_id END
+        LEFT JOIN profile_details p ON p.user_id = u.id
+        {"WHERE c.id = %s" if conversation_id is not None else ""}
+        ON DUPLICATE KEY UPDATE
+            match_status = VALUES(match_status),
+            other_user_name = VALUES(other_user_name),
+            other_user_photo = VALUES(other_user_photo),
+            last_message_preview = VALUES(last_message_preview),
+            last_message_at = VALUES(last_message_at)
+    """
+    params = (conversation_id,) if conversation_id is not None else None
+    cursor = db.execute_query(query, params)
+    return cursor.rowcount
+
+
+def update_last_message(conversation_id: int, message_text: str, last_message_at: datetime) -> None:
+    """Обновить превью и время последнего сообщения беседы"""
+    query = """
+        UPDATE chat_inbox
+        SET last_message_preview = %s, last_message_at = %s
+        WHERE conversation_id = %s
+    """
+    db.execute_query(query, (message_text[:INBOX_PREVIEW_LENGTH], last_message_at, conversation_id))
+
+
+def update_last_message_time(conversation_id: int, last_message_at: datetime) -> None:
+    """Обновить время последнего сообщения беседы"""
+    query = "UPDATE chat_inbox SET last_message_at = %s WHERE conversation_id = %s"
+    db.execute_query(query, (last_message_at, conversation_id))
+
+
+def update_other_user_name(user_id: int, first_name: str) -> None:
+    """Обновить имя собеседника во входящих других пользователей"""
+    query = "UPDATE chat_inbox SET other_user_name = %s WHERE other_user_id = %s"
+    db.execute_query(query, (first_name, user_id))
+
+
+def update_other_user_photo(user_id: int, photo_url: Optional[str]) -> None:
+    """Обновить фото собеседника во входящих других пользователей"""
+    query = "UPDATE chat_inbox SET other_user_photo = %s WHERE other_user_id = %s"
+    db.execute_query(query, (photo_url, user_id))
+
+
+def update_match_status(match_id: int, match_status: str) -> None:
+    """Обновить статус матча во входящих"""
+    query = "UPDATE chat_inbox SET match_status = %s WHERE match_id = %s"
+    db.execute_query(query, (match_status, match_id))
+
+
+def delete_conversation_inbox(conversation_id: int) -> None:
+    """Удалить записи входящих для беседы"""
+    query = "DELETE FROM chat_inbox WHERE conversation_id = %s"
+    db.execute_query(query, (conversation_id,))
@@ -1,12 +1,13 @@
 from typing import Optional, Dict, Any, List
 from datetime import datetime
 from src.database.my_connector import db
+from src.utils.projection import Fields, select_columns
 from src.database.models import ChatMessages
 
 
-def get_all_messages() -> List[Dict[str, Any]]:
-    """Получить все сообщения"""
-    query = "SELECT * FROM chat_messages"
+def get_all_messages(fields: Optional[Fields] = None) -> List[Dict[str, Any]]:
+    """Получить все сообщения (fields — только выбранные колонки)"""
+    query = f"SELECT {select_columns(fields)} FROM chat_messages"
     return db.fetch_all(query)
 
 
@@ -37,16 +38,16 @@ def create_message(message: ChatMessages) -> int:
         VALUES (%s, %s, %s, %s, %s)
     """
     params = (
-        message.ConversationID,
-        message.SenderID,
-        message.MessageText,
-        message.IsRead,
-        message.MessageType
+        message.conversation_id,
+        message.sender_id,
+        message.message_text,
+        message.is_read,
+        message.message_type.value
     )
     cursor = db.execute_query(query, params)
     
     # Обновляем время последнего сообщения в беседе
-    update_conversation_last_message(message.ConversationID)
+    update_conversation_last_message(message.conversation_id)
     
     return cursor.lastrowid
 
@@ -91,47 +92,29 @@ def mark_messages_as_read(conversation_id: int, user_id: int) -> int:
     """
     Отметить все непрочитанные сообщения в беседе как прочитанные
     для указанного пользователя (исключая его собственные сообщения)
+    и в той же транзакции уменьшить его счётчик непрочитанных на их число
     """
-    query = """
-        UPDATE chat_messages 
-        SET is_read = TRUE 
-        WHERE conversation_id = %s AND sender_id != %s AND is_read = FALSE
-    """
-    cursor = db.execute_query(query, (conversation_id, user_id))
-    return cursor.rowcount
-
-
-def count_unread_messages(user_id: int) -> Dict[str, Any]:
-    """
-    Подсчитать непрочитанные сообщения для пользователя 
-    по всем беседам и для каждой беседы
-    """
-    total_query = """
-        SELECT COUNT(*) as total_unread
-        FROM chat_messages m
-        JOIN chat_conversations c ON m.conversation_id = c.id
-        JOIN matches mt ON c.match_id = mt.id
-        WHERE m.is_read = FALSE AND m.sender_id != %s
-        AND (mt.user1_id = %s OR mt.user2_id = %s)
-    """
-    
-    by_conversation_query = """
-        SELECT m.conversation_id, COUNT(*) as unread_count
-        FROM chat_messages m
-        JOIN chat_conversations c ON m.conversation_id = c.id
-        JOIN matches mt ON c.match_id = mt.id
-        WHERE m.is_read = FALSE AND m.sender_id != %s
-        AND (mt.user1_id = %s OR mt.user2_id = %s)
-        GROUP BY m.conversation_id
-    """
-    
-    total_result = db.fetch_one(total_query, (user_id, user_id, user_id)) or {}
-    conversations = db.fetch_all(by_conversation_query, (user_id, user_id, user_id))
-    
-    return {
-        "total_unread": total_result.get("total_unread", 0),
-        "by_conversation": {conv['conversation_id']: conv['unread_count'] for conv in conversations}
-    }
+    with db.transaction() as cursor:
+        cursor.execute(
+            """
+            UPDATE chat_messages 
+            SET is_read = TRUE 
+            WHERE conversation_id = %s AND sender_id != %s AND is_read = FALSE
+            """,
+            (conversation_id, user_id)
+        )
+        updated_count = cursor.rowcount
+        if updated_count:
+            # Вычитаем ровно отмеченные сообщения, а не обнуляем: пришедшие параллельно остаются в счётчике
+            cursor.execute(
+                """
+                UPDATE chat_unread_counters
+                SET unread_count = GREATEST(unread_count - %s, 0)
+                WHERE user_id = %s AND conversation_id = %s
+                """,
+                (updated_count, user_id, conversation_id)
+            )
+    return updated_count
 
 
 def get_agent_simulation_messages(conversation_id: int) -> List[Dict[str, Any]]:
@@ -214,25 +197,32 @@ def get_recent_messages(hours: int = 24) -> List[Dict[str, Any]]:
     return db.fetch_all(query, (hours,))
 
 
-def search_messages(search_term: str, conversation_id: int = None) -> List[Dict[str, Any]]:
-    """Поиск сообщений по тексту"""
+def search_messages(
+    boolean_query: str,
+    conversation_id: int = None,
+    limit: int = 50,
+    offset: int = 0
+) -> List[Dict[str, Any]]:
+    """Полнотекстовый поиск сообщений (индекс ft_chat_messages_text) с ранжированием"""
     query_parts = [
         """
-        SELECT m.*, c.match_id, u.first_name as sender_name
+        SELECT m.*, c.match_id, u.first_name as sender_name,
+               MATCH(m.message_text) AGAINST (%s IN BOOLEAN MODE) as relevance
         FROM chat_messages m
         JOIN chat_conversations c ON m.conversation_id = c.id
         JOIN users u ON m.sender_id = u.id
-        WHERE m.message_text LIKE %s
+        WHERE MATCH(m.message_text) AGAINST (%s IN BOOLEAN MODE)
         """
     ]
     
-    params = [f"%{search_term}%"]
+    params = [boolean_query, boolean_query]
     
     if conversation_id:
         query_parts.append("AND m.conversation_id = %s")
         params.append(conversation_id)
     
-    query_parts.append("ORDER BY m.created_at DESC")
+    query_parts.append("ORDER BY relevance DESC, m.created_at DESC LIMIT %s OFFSET %s")
+    params.extend([limit, offset])
     
     query = " ".join(query_parts)
     return db.fetch_all(query, tuple(params))
\ No newline at end of file
@@ -0,0 +1,47 @@
+from typing import Dict, Any, List
+from src.database.my_connector import db
+
+
+def get_user_unread_counters(user_id: int) -> List[Dict[str, Any]]:
+    """Получить ненулевые счётчики непрочитанных сообщений пользователя"""
+    query = """
+        SELECT conversation_id, unread_count
+        FROM chat_unread_counters
+        WHERE user_id = %s AND unread_count > 0
+    """
+    return db.fetch_all(query, (user_id,))
+
+
+def increment_unread(conversation_id: int, user_id: int, delta: int = 1) -> None:
+    """Изменить счётчик непрочитанных сообщений пользователя в беседе"""
+    query = """
+        INSERT INTO chat_unread_counters (user_id, conversation_id, unread_count)
+        VALUES (%s, %s, GREATEST(%s, 0))
+        ON DUPLICATE KEY UPDATE unread_count = GREATEST(unread_count + %s, 0)
+    """
+    db.execute_query(query, (user_id, conversation_id, delta, delta))
+
+
+def delete_conversation_counters(conversation_id: int) -> None:
+    """Удалить счётчики беседы"""
+    query = "DELETE FROM chat_unread_counters WHERE conversation_id = %s"
+    db.execute_query(query, (conversation_id,))
+
+
+def rebuild_unread_counters() -> int:
+    """Пересчитать все счётчики по таблице chat_messages"""
+    db.execute_query("UPDATE chat_unread_counters SET unread_count = 0")
+    query = """
+        INSERT INTO chat_unread_counters (user_id, conversation_id, unread_count)
+        SELECT CASE WHEN msg.sender_id = mt.user1_id THEN mt.user2_id ELSE mt.user1_id END,
+               msg.conversation_id,
+               COUNT(*)
+        FROM chat_messages msg
+        JOIN chat_conversations c ON msg.conversation_id = c.id
+        JOIN matches mt ON c.match_id = mt.id
+        WHERE msg.is_read = FALSE
+        GROUP BY 1, 2
+        ON DUPLICATE KEY UPDATE unread_count = VALUES(unread_count)
+    """
+    cursor = db.execute_query(query)
+    return cursor.rowcount
@@ -1,12 +1,14 @@
 from typing import Optional, Dict, Any, List
 from datetime import datetime
 from src.database.my_connector import db
+from src.repository import chat_inbox_repository
+from src.utils.projection import Fields, select_columns
 from src.database.models import Matches
 
 
-def get_all_matches() -> List[Dict[str, Any]]:
-    """Получить все совпадения (матчи)"""
-    query = "SELECT * FROM matches"
+def get_all_matches(fields: Optional[Fields] = None) -> List[Dict[str, Any]]:
+    """Получить все совпадения (матчи) (fields — только выбранные колонки)"""
+    query = f"SELECT {select_columns(fields)} FROM matches"
     return db.fetch_all(query)
 
 
@@ -16,6 +18,16 @@ def get_match_by_id(match_id: int) -> Optional[Dict[str, Any]]:
     return db.fetch_one(query, (match_id,))
 
 
+def get_matches_by_ids(match_ids: List[int]) -> List[Dict[str, Any]]:
+    """Получить матчи по списку ID"""
+    if not match_ids:
+        return []
+
+    placeholders = ", ".join(["%s"] * len(match_ids))
+    query = f"SELECT * FROM matches WHERE id IN ({placeholders})"
+    return db.fetch_all(query, tuple(match_ids))
+
+
 def check_match_exists(user1_id: int, user2_id: int) -> Optional[Dict[str, Any]]:
     """Проверить существование матча между двумя пользователями"""
     query = """
@@ -45,6 +57,8 @@ def create_match(match: Matches) -> int:
         # Если матч уже существует и не активен, можем его активировать
         if existing['match_status'] != 'active':
             update_match_status(existing['id'], 'active')
+            # Статус матча продублирован во входящих — обновляем его там же, как при update_match
+            chat_inbox_repository.update_match_status(existing['id'], 'active')
         return existing['id']
     
     query = """
@@ -254,6 +268,17 @@ def get_matches_count() -> Dict[str, int]:
     }
 
 
+def get_matches_version() -> Dict[str, Any]:
+    """Число матчей и время последнего изменения (racy — изменение в текущую секунду)"""
+    query = """
+        SELECT COUNT(*) as row_count,
+               MAX(updated_at) as last_updated,
+               MAX(updated_at) >= NOW() - INTERVAL 1 SECOND as racy
+        FROM matches
+    """
+    return db.fetch_one(query) or {}
+
+
 def get_user_match_stats(user_id: int) -> Dict[str, Any]:
     """Получить статистику матчей для конкретного пользователя"""
     query = """
@@ -1,12 +1,16 @@
 from typing import Optional, Dict, Any, List
 from datetime import datetime
 from src.database.my_connector import db
+from src.utils.projection import Fields, select_columns
 from src.database.models import ProfileDetails
+from src.utils.entity_cache import get_entity_cache
 
+profile_cache = get_entity_cache("profiles")
 
-def get_all_profiles() -> List[Dict[str, Any]]:
-    """Получить все профили пользователей"""
-    query = "SELECT * FROM profile_details"
+
+def get_all_profiles(fields: Optional[Fields] = None) -> List[Dict[str, Any]]:
+    """Получить все профили пользователей (fields — только выбранные колонки)"""
+    query = f"SELECT {select_columns(fields)} FROM profile_details"
     return db.fetch_all(query)
 
 
@@ -19,7 +23,27 @@ def get_profile_by_id(profile_id: int) -> Optional[Dict[str, Any]]:
 def get_profile_by_user_id(user_id: int) -> Optional[Dict[str, Any]]:
     """Получить профиль по ID пользователя"""
     query = "SELECT * FROM profile_details WHERE user_id = %s"
-    return db.fetch_one(query, (user_id,))
+    return profile_cache.get_or_load(user_id, lambda: db.fetch_one(query, (user_id,)))
+
+
+def get_profiles_by_ids(profile_ids: List[int]) -> List[Dict[str, Any]]:
+    """Получить профили по списку ID"""
+    if not profile_ids:
+        return []
+
+    placeholders = ", ".join(["%s"] * len(profile_ids))
+    query = f"SELECT * FROM profile_details WHERE id IN ({placeholders})"
+    return db.fetch_all(query, tuple(profile_ids))
+
+
+def get_profiles_by_user_ids(user_ids: List[int]) -> List[Dict[str, Any]]:
+    """Получить профили по списку ID пользователей"""
+    if not user_ids:
+        return []
+
+    placeholders = ", ".join(["%s"] * len(user_ids))
+    query = f"SELECT * FROM profile_details WHERE user_id IN ({placeholders})"
+    return db.fetch_all(query, tuple(user_ids))
 
 
 def create_profile(profile: ProfileDetails) -> int:
@@ -45,6 +69,7 @@ def create_profile(profile: ProfileDetails) -> int:
         profile.location
     )
     cursor = db.execute_query(query, params)
+    profile_cache.invalidate(profile.user_id)
     return cursor.lastrowid
 
 
@@ -76,6 +101,9 @@ def update_profile(profile_id: int, updates: Dict[str, Any]) -> None:
     params.append(profile_id)
     query = f"UPDATE profile_details SET {', '.join(set_clauses)} WHERE id = %s"
     db.execute_query(query, params)
+    user_id = _get_profile_owner(profile_id)
+    if user_id is not None:
+        profile_cache.invalidate(user_id)
 
 
 def update_user_profile(user_id: int, updates: Dict[str, Any]) -> None:
@@ -87,27 +115,37 @@ def update_user_profile(user_id: int, updates: Dict[str, Any]) -> None:
     else:
         # Если профиля еще нет, создаем новый
         new_profile = ProfileDetails(
-            UserID=user_id,
-            Age=updates.get('age'),
-            Gender=updates.get('gender'),
-            Interests=updates.get('interests'),
-            Bio=updates.get('bio'),
-            ProfilePhotoUrl=updates.get('profile_photo_url'),
-            Location=updates.get('location')
+            user_id=user_id,
+            age=updates.get('age'),
+            gender=updates.get('gender'),
+            interests=updates.get('interests'),
+            bio=updates.get('bio'),
+            profile_photo_url=updates.get('profile_photo_url'),
+            location=updates.get('location')
         )
         create_profile(new_profile)
 
 
 def delete_profile(profile_id: int) -> None:
     """Удалить профиль по ID"""
+    user_id = _get_profile_owner(profile_id)
     query = "DELETE FROM profile_details WHERE id = %s"
     db.execute_query(query, (profile_id,))
+    if user_id is not None:
+        profile_cache.invalidate(user_id)
 
 
 def delete_user_profile(user_id: int) -> None:
     """Удалить профиль по ID пользователя"""
     query = "DELETE FROM profile_details WHERE user_id = %s"
     db.execute_query(query, (user_id,))
+    profile_cache.invalidate(user_id)
+
+
+def _get_profile_owner(profile_id: int) -> Optional[int]:
+    """ID пользователя профиля — по нему ключуется кэш профилей"""
+    row = db.fetch_one("SELECT user_id FROM profile_details WHERE id = %s", (profile_id,))
+    return row['user_id'] if row else None
 
 
 def get_profiles_by_age_range(min_age: int, max_age: int) -> List[Dict[str, Any]]:
@@ -193,6 +231,17 @@ def get_incomplete_profiles() -> List[Dict[str, Any]]:
     return db.fetch_all(query)
 
 
+def get_profiles_version() -> Dict[str, Any]:
+    """Число профилей и время последнего изменения (racy — изменение в текущую секунду)"""
+    query = """
+        SELECT COUNT(*) as row_count,
+               MAX(updated_at) as last_updated,
+               MAX(updated_at) >= NOW() - INTERVAL 1 SECOND as racy
+        FROM profile_details
+    """
+    return db.fetch_one(query) or {}
+
+
 def get_profile_completion_stats() -> Dict[str, Any]:
     """Получить статистику заполнения профилей"""
     query = """
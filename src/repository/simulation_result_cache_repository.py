@@ -0,0 +1,68 @@
+from typing import Optional, Dict, Any, List
+from src.database.my_connector import db
+
+
+def get_cached_result(cache_key: str) -> Optional[Dict[str, Any]]:
+    """Получить закешированный результат симуляции по ключу"""
+    query = "SELECT * FROM simulation_result_cache WHERE cache_key = %s"
+    return db.fetch_one(query, (cache_key,))
+
+
+def get_cached_results(cache_keys: List[str]) -> List[Dict[str, Any]]:
+    """Получить закешированные результаты по списку ключей одним запросом"""
+    if not cache_keys:
+        return []
+    placeholders = ", ".join(["%s"] * len(cache_keys))
+    query = f"SELECT * FROM simulation_result_cache WHERE cache_key IN ({placeholders})"
+    return db.fetch_all(query, list(cache_keys))
+
+
+def save_result(
+    cache_key: str,
+    agent1_id: int,
+    agent2_id: int,
+    engine_version: str,
+    simulation_id: int,
+    compatibility_score: float,
+    simulation_summary: str
+) -> None:
+    """Сохранить результат симуляции (повторный результат для того же ключа заменяет прежний)"""
+    query = """
+        INSERT INTO simulation_result_cache
+        (cache_key, agent1_id, agent2_id, engine_version, simulation_id,
+         compatibility_score, simulation_summary)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            simulation_id = VALUES(simulation_id),
+            compatibility_score = VALUES(compatibility_score),
+            simulation_summary = VALUES(simulation_summary),
+            created_at = NOW()
+    """
+    db.execute_query(query, (
+        cache_key, agent1_id, agent2_id, engine_version, simulation_id,
+        compatibility_score, simulation_summary
+    ))
+
+
+def record_hit(cache_key: str) -> None:
+    """Увеличить счётчик попаданий"""
+    query = "UPDATE simulation_result_cache SET hit_count = hit_count + 1 WHERE cache_key = %s"
+    db.execute_query(query, (cache_key,))
+
+
+def delete_agent_results(agent_id: int) -> int:
+    """Удалить закешированные результаты с участием агента"""
+    query = "DELETE FROM simulation_result_cache WHERE agent1_id = %s OR agent2_id = %s"
+    cursor = db.execute_query(query, (agent_id, agent_id))
+    return cursor.rowcount
+
+
+def get_cache_stats() -> Dict[str, Any]:
+    """Получить статистику кеша результатов симуляций"""
+    query = """
+        SELECT COUNT(*) as entries,
+               COALESCE(SUM(hit_count), 0) as hits,
+               COUNT(DISTINCT engine_version) as engine_versions
+        FROM simulation_result_cache
+    """
+    return db.fetch_one(query)
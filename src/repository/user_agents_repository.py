@@ -2,25 +2,32 @@ from typing import Optional, Dict, Any, List
 from datetime import datetime
 import json
 from src.database.my_connector import db
+from src.utils.projection import Fields, select_columns
 from src.database.models import UserAgents
+from src.utils.entity_cache import get_entity_cache
 
+agent_cache = get_entity_cache("agents")
+# user_id -> {"id": agent_id}: у пользователя один агент, связь меняется только при создании и удалении
+agent_id_cache = get_entity_cache("agent_ids_by_user")
 
-def get_all_agents() -> List[Dict[str, Any]]:
-    """Получить всех агентов пользователей"""
-    query = "SELECT * FROM user_agents"
+
+def get_all_agents(fields: Optional[Fields] = None) -> List[Dict[str, Any]]:
+    """Получить всех агентов пользователей (fields — только выбранные колонки)"""
+    query = f"SELECT {select_columns(fields)} FROM user_agents"
     return db.fetch_all(query)
 
 
 def get_agent_by_id(agent_id: int) -> Optional[Dict[str, Any]]:
     """Получить агента по ID"""
     query = "SELECT * FROM user_agents WHERE id = %s"
-    return db.fetch_one(query, (agent_id,))
+    return agent_cache.get_or_load(agent_id, lambda: db.fetch_one(query, (agent_id,)))
 
 
 def get_agent_by_user_id(user_id: int) -> Optional[Dict[str, Any]]:
     """Получить агента по ID пользователя"""
-    query = "SELECT * FROM user_agents WHERE user_id = %s"
-    return db.fetch_one(query, (user_id,))
+    query = "SELECT id FROM user_agents WHERE user_id = %s"
+    row = agent_id_cache.get_or_load(user_id, lambda: db.fetch_one(query, (user_id,)))
+    return get_agent_by_id(row['id']) if row else None
 
 
 def create_agent(agent: UserAgents) -> int:
@@ -46,6 +53,8 @@ def create_agent(agent: UserAgents) -> int:
         agent.last_updated_at or datetime.utcnow()
     )
     cursor = db.execute_query(query, params)
+    agent_cache.invalidate(cursor.lastrowid)
+    agent_id_cache.invalidate(agent.user_id)
     return cursor.lastrowid
 
 
@@ -79,30 +88,41 @@ def update_agent(agent_id: int, updates: Dict[str, Any]) -> None:
     params.append(agent_id)
     query = f"UPDATE user_agents SET {', '.join(set_clauses)} WHERE id = %s"
     db.execute_query(query, params)
+    agent_cache.invalidate(agent_id)
 
 
 def update_agent_status(agent_id: int, learning_status: str) -> None:
     """Обновить статус обучения агента"""
     query = "UPDATE user_agents SET learning_status = %s, last_updated_at = NOW() WHERE id = %s"
     db.execute_query(query, (learning_status, agent_id))
+    agent_cache.invalidate(agent_id)
 
 
 def update_agent_personality(agent_id: int, personality_data: Dict[str, Any]) -> None:
     """Обновить данные о личности агента"""
     query = "UPDATE user_agents SET personality_data = %s, last_updated_at = NOW() WHERE id = %s"
     db.execute_query(query, (json.dumps(personality_data), agent_id))
+    agent_cache.invalidate(agent_id)
 
 
 def delete_agent(agent_id: int) -> None:
     """Удалить агента"""
+    agent = get_agent_by_id(agent_id)
     query = "DELETE FROM user_agents WHERE id = %s"
     db.execute_query(query, (agent_id,))
+    agent_cache.invalidate(agent_id)
+    if agent:
+        agent_id_cache.invalidate(agent['user_id'])
 
 
 def delete_user_agent(user_id: int) -> None:
     """Удалить агента по ID пользователя"""
+    agent = get_agent_by_user_id(user_id)
     query = "DELETE FROM user_agents WHERE user_id = %s"
     db.execute_query(query, (user_id,))
+    agent_id_cache.invalidate(user_id)
+    if agent:
+        agent_cache.invalidate(agent['id'])
 
 
 def get_ready_agents() -> List[Dict[str, Any]]:
@@ -129,19 +149,53 @@ def get_learning_agents() -> List[Dict[str, Any]]:
     return db.fetch_all(query)
 
 
-def get_agents_requiring_update(days_threshold: int = 7) -> List[Dict[str, Any]]:
-    """Получить агентов, требующих обновления (не обновлялись более N дней)"""
-    query = """
-        SELECT a.*, u.first_name, u.last_activity
+def get_agents_requiring_update(days_threshold: int = 7, include_unprocessed: bool = False) -> List[Dict[str, Any]]:
+    """
+    Получить агентов, требующих обновления (не обновлялись более N дней при активном владельце),
+    вместе с данными для приоритизации: активность владельца, объём необработанных данных обучения,
+    время ожидания самых старых из них и число ожидающих симуляций.
+    include_unprocessed добавляет агентов с любыми необработанными данными
+    """
+    unprocessed_clause = "OR ls.unprocessed_count > 0" if include_unprocessed else ""
+    query = f"""
+        SELECT a.*, u.first_name, u.last_activity,
+               COALESCE(ls.unprocessed_count, 0) as unprocessed_count,
+               ls.oldest_unprocessed,
+               COALESCE(ps.pending_simulations, 0) as pending_simulations
         FROM user_agents a
         JOIN users u ON a.user_id = u.id
-        WHERE a.last_updated_at < DATE_SUB(NOW(), INTERVAL %s DAY)
-        AND u.last_activity > a.last_updated_at
-        ORDER BY a.last_updated_at ASC
+        LEFT JOIN (
+            SELECT agent_id,
+                   SUM(total_count - processed_count) as unprocessed_count,
+                   MIN(CASE WHEN total_count > processed_count THEN hour_bucket END) as oldest_unprocessed
+            FROM agent_learning_stats
+            GROUP BY agent_id
+        ) ls ON ls.agent_id = a.id
+        LEFT JOIN (
+            SELECT agent_id, COUNT(*) as pending_simulations
+            FROM (
+                SELECT agent1_id as agent_id FROM agent_simulations
+                WHERE simulation_status IN ('pending', 'in_progress')
+                UNION ALL
+                SELECT agent2_id FROM agent_simulations
+                WHERE simulation_status IN ('pending', 'in_progress')
+            ) pending
+            GROUP BY agent_id
+        ) ps ON ps.agent_id = a.id
+        WHERE (a.last_updated_at < DATE_SUB(NOW(), INTERVAL %s DAY)
+               AND u.last_activity > a.last_updated_at)
+        {unprocessed_clause}
     """
     return db.fetch_all(query, (days_threshold,))
 
 
+def touch_agent(agent_id: int) -> None:
+    """Отметить агента как обновлённого"""
+    query = "UPDATE user_agents SET last_updated_at = NOW() WHERE id = %s"
+    db.execute_query(query, (agent_id,))
+    agent_cache.invalidate(agent_id)
+
+
 def get_agents_stats() -> Dict[str, Any]:
     """Получить статистику по агентам"""
     query = """
@@ -150,8 +204,9 @@ def get_agents_stats() -> Dict[str, Any]:
             SUM(CASE WHEN learning_status = 'learning' THEN 1 ELSE 0 END) as learning_count,
             SUM(CASE WHEN learning_status = 'ready' THEN 1 ELSE 0 END) as ready_count,
             SUM(CASE WHEN learning_status = 'updating' THEN 1 ELSE 0 END) as updating_count,
-            AVG(JSON_LENGTH(personality_data)) as avg_personality_attributes
-        FROM user_agents
+            AVG(f.attribute_count) as avg_personality_attributes
+        FROM user_agents a
+        LEFT JOIN agent_personality_features f ON f.agent_id = a.id
     """
     
     result = db.fetch_one(query) or {}
@@ -170,51 +225,42 @@ def get_agents_stats() -> Dict[str, Any]:
         "learning_agents": result.get("learning_count", 0),
         "ready_agents": result.get("ready_count", 0),
         "updating_agents": result.get("updating_count", 0),
-        "avg_personality_attributes": float(result.get("avg_personality_attributes", 0)),
+        "avg_personality_attributes": float(result.get("avg_personality_attributes") or 0),
         "recent_updates": recent.get("recent_updates", 0)
     }
 
 
-def find_similar_agents(agent_id: int, threshold: float = 0.5, limit: int = 10) -> List[Dict[str, Any]]:
-    """
-    Найти агентов с похожими характеристиками личности
-    Примечание: Это упрощенная версия - в реальном приложении
-    может потребоваться более сложная логика для определения сходства
-    """
-    agent = get_agent_by_id(agent_id)
-    if not agent or 'personality_data' not in agent:
+def get_agents_by_ids(agent_ids: List[int]) -> List[Dict[str, Any]]:
+    """Получить агентов по списку ID"""
+    if not agent_ids:
         return []
-    
-    # Предполагается, что в personality_data есть ключи с характеристиками личности
-    # В реальном приложении здесь должна быть логика сравнения
-    # Для примера используем простой подход с поиском по ключевым словам
-    personality = json.loads(agent['personality_data']) if isinstance(agent['personality_data'], str) else agent['personality_data']
-    
-    # Предполагаемые ключи для сравнения
-    key_traits = ['communication_style', 'interests', 'response_patterns']
-    
-    conditions = []
-    params = []
-    
-    for trait in key_traits:
-        if trait in personality:
-            conditions.append("JSON_CONTAINS_PATH(personality_data, 'one', %s)")
-            params.append(f"$.{trait}")
-    
-    if not conditions:
+
+    placeholders = ", ".join(["%s"] * len(agent_ids))
+    query = f"SELECT * FROM user_agents WHERE id IN ({placeholders})"
+    return db.fetch_all(query, tuple(agent_ids))
+
+
+def get_agents_by_user_ids(user_ids: List[int]) -> List[Dict[str, Any]]:
+    """Получить агентов по списку ID пользователей"""
+    if not user_ids:
         return []
-    
-    # Исключаем текущего агента из результатов
-    params.append(agent_id)
-    
+
+    placeholders = ", ".join(["%s"] * len(user_ids))
+    query = f"SELECT * FROM user_agents WHERE user_id IN ({placeholders})"
+    return db.fetch_all(query, tuple(user_ids))
+
+
+def get_ready_agents_by_ids(agent_ids: List[int]) -> List[Dict[str, Any]]:
+    """Получить готовых агентов по списку ID"""
+    if not agent_ids:
+        return []
+
+    placeholders = ", ".join(["%s"] * len(agent_ids))
     query = f"""
         SELECT a.*, u.first_name
         FROM user_agents a
         JOIN users u ON a.user_id = u.id
-        WHERE ({' OR '.join(conditions)})
-        AND a.id != %s
+        WHERE a.id IN ({placeholders})
         AND a.learning_status = 'ready'
-        LIMIT {limit}
     """
-    
-    return db.fetch_all(query, tuple(params))
\ No newline at end of file
+    return db.fetch_all(query, tuple(agent_ids))
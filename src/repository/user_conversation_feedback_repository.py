@@ -25,12 +25,12 @@ def get_feedback_by_user_conversation(user_id: int, conversation_id: int) -> Opt
 def create_feedback(feedback: UserConversationFeedback) -> int:
     """Создать новую запись обратной связи"""
     # Проверяем, не оставлял ли пользователь уже отзыв на эту беседу
-    existing = get_feedback_by_user_conversation(feedback.UserID, feedback.ConversationID)
+    existing = get_feedback_by_user_conversation(feedback.user_id, feedback.conversation_id)
     if existing:
         # Если отзыв уже есть, обновим его
         update_feedback(existing['id'], {
-            'rating': feedback.Rating,
-            'feedback_text': feedback.FeedbackText
+            'rating': feedback.rating,
+            'feedback_text': feedback.feedback_text
         })
         return existing['id']
     
@@ -40,10 +40,10 @@ def create_feedback(feedback: UserConversationFeedback) -> int:
         VALUES (%s, %s, %s, %s)
     """
     params = (
-        feedback.UserID,
-        feedback.ConversationID,
-        feedback.Rating,
-        feedback.FeedbackText
+        feedback.user_id,
+        feedback.conversation_id,
+        feedback.rating,
+        feedback.feedback_text
     )
     cursor = db.execute_query(query, params)
     return cursor.lastrowid
@@ -3,6 +3,9 @@ from datetime import datetime
 import json
 from src.database.my_connector import db
 from src.database.models import UserPreferences
+from src.utils.entity_cache import get_entity_cache
+
+preferences_cache = get_entity_cache("preferences")
 
 
 def get_all_preferences() -> List[Dict[str, Any]]:
@@ -20,13 +23,13 @@ def get_preference_by_id(preference_id: int) -> Optional[Dict[str, Any]]:
 def get_preference_by_user_id(user_id: int) -> Optional[Dict[str, Any]]:
     """Получить предпочтения пользователя по ID пользователя"""
     query = "SELECT * FROM user_preferences WHERE user_id = %s"
-    return db.fetch_one(query, (user_id,))
+    return preferences_cache.get_or_load(user_id, lambda: db.fetch_one(query, (user_id,)))
 
 
 def create_preference(preference: UserPreferences) -> int:
     """Создать новую запись о предпочтениях пользователя"""
-    preferred_genders = json.dumps(preference.PreferredGenders) if preference.PreferredGenders else None
-    other_preferences = json.dumps(preference.OtherPreferences) if preference.OtherPreferences else None
+    preferred_genders = json.dumps(preference.preferred_genders) if preference.preferred_genders else None
+    other_preferences = json.dumps(preference.other_preferences) if preference.other_preferences else None
 
     query = """
         INSERT INTO user_preferences 
@@ -34,14 +37,15 @@ def create_preference(preference: UserPreferences) -> int:
         VALUES (%s, %s, %s, %s, %s, %s)
     """
     params = (
-        preference.UserID,
-        preference.AgeMin,
-        preference.AgeMax,
+        preference.user_id,
+        preference.age_min,
+        preference.age_max,
         preferred_genders,
-        preference.PreferredDistance,
+        preference.preferred_distance,
         other_preferences
     )
     cursor = db.execute_query(query, params)
+    preferences_cache.invalidate(preference.user_id)
     return cursor.lastrowid
 
 
@@ -82,6 +86,9 @@ def update_preference(preference_id: int, updates: Dict[str, Any]) -> None:
     params.append(preference_id)
     query = f"UPDATE user_preferences SET {', '.join(set_clauses)} WHERE id = %s"
     db.execute_query(query, params)
+    user_id = _get_preference_owner(preference_id)
+    if user_id is not None:
+        preferences_cache.invalidate(user_id)
 
 
 def update_user_preference(user_id: int, updates: Dict[str, Any]) -> None:
@@ -93,26 +100,30 @@ def update_user_preference(user_id: int, updates: Dict[str, Any]) -> None:
     else:
         # Если предпочтений еще нет, создадим новую запись
         new_preference = UserPreferences(
-            UserID=user_id,
-            AgeMin=updates.get('age_min'),
-            AgeMax=updates.get('age_max'),
-            PreferredGenders=updates.get('preferred_genders'),
-            PreferredDistance=updates.get('preferred_distance'),
-            OtherPreferences=updates.get('other_preferences')
+            user_id=user_id,
+            age_min=updates.get('age_min'),
+            age_max=updates.get('age_max'),
+            preferred_genders=updates.get('preferred_genders'),
+            preferred_distance=updates.get('preferred_distance'),
+            other_preferences=updates.get('other_preferences')
         )
         create_preference(new_preference)
 
 
 def delete_preference(preference_id: int) -> None:
     """Удалить запись о предпочтениях"""
+    user_id = _get_preference_owner(preference_id)
     query = "DELETE FROM user_preferences WHERE id = %s"
     db.execute_query(query, (preference_id,))
+    if user_id is not None:
+        preferences_cache.invalidate(user_id)
 
 
 def delete_user_preferences(user_id: int) -> None:
     """Удалить предпочтения пользователя по ID пользователя"""
     query = "DELETE FROM user_preferences WHERE user_id = %s"
     db.execute_query(query, (user_id,))
+    preferences_cache.invalidate(user_id)
 
 
 def get_users_by_preferences(age: int, gender: str, distance: int = None, interests: List[str] = None) -> List[Dict[str, Any]]:
@@ -166,4 +177,10 @@ def get_common_preferences(user_id1: int, user_id2: int) -> Dict[str, Any]:
     return {
         "common_interests": common_interests,
         "interest_match_percent": round(len(common_interests) * 100 / max(len(user1_interests), len(user2_interests), 1))
-    }
\ No newline at end of file
+    }
+
+
+def _get_preference_owner(preference_id: int) -> Optional[int]:
+    """ID пользователя записи предпочтений — по нему ключуется кэш предпочтений"""
+    row = db.fetch_one("SELECT user_id FROM user_preferences WHERE id = %s", (preference_id,))
+    return row['user_id'] if row else None
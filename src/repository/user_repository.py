@@ -1,20 +1,72 @@
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from datetime import datetime
+from fastapi import HTTPException, status
+from pymysql.err import IntegrityError
 from src.database.my_connector import db
 from src.database.models import Users
+from src.utils.entity_cache import get_entity_cache
+from src.utils.projection import Fields, select_columns
 
+user_cache = get_entity_cache("users")
+# email (casefold) -> {"id": user_id}: поиск при входе и проверки уникальности email
+email_cache = get_entity_cache("user_ids_by_email")
+# Публичная карточка пользователя для развёрнутых связей (без email и пароля)
+USER_CARD_FIELDS = ("id", "first_name", "last_activity")
+# Код ошибки MySQL ER_DUP_ENTRY: нарушен уникальный индекс (idx_users_email)
+DUPLICATE_ENTRY = 1062
 
-def get_all_users() -> list[Dict[str, Any]]:
-    query = "SELECT * FROM users"
+
+class UserEmailExistsError(HTTPException):
+    def __init__(self):
+        super().__init__(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail='User with this email already exists'
+        )
+
+
+def _execute_user_write(query: str, params):
+    """
+    Запись в users: гонка двух регистраций с одним email, прошедших проверку
+    уникальности, заканчивается ошибкой уникального индекса — отдаём её как 400
+    """
+    try:
+        return db.execute_query(query, params)
+    except IntegrityError as e:
+        if e.args and e.args[0] == DUPLICATE_ENTRY:
+            raise UserEmailExistsError()
+        raise
+
+
+def _invalidate_email(email: Optional[str]) -> None:
+    if email:
+        email_cache.invalidate(email.casefold())
+
+
+def get_all_users(fields: Optional[Fields] = None) -> list[Dict[str, Any]]:
+    query = f"SELECT {select_columns(fields)} FROM users"
     return db.fetch_all(query)
 
 def get_user_by_id(user_id: int) -> Optional[Dict[str, Any]]:
     query = "SELECT * FROM users WHERE id = %s"
-    return db.fetch_one(query, (user_id,))
+    return user_cache.get_or_load(user_id, lambda: db.fetch_one(query, (user_id,)))
+
+def get_users_by_ids(user_ids: List[int], fields: Optional[Fields] = None) -> List[Dict[str, Any]]:
+    """Получить пользователей по списку ID одним запросом"""
+    if not user_ids:
+        return []
+    placeholders = ", ".join(["%s"] * len(user_ids))
+    query = f"SELECT {select_columns(fields)} FROM users WHERE id IN ({placeholders})"
+    return db.fetch_all(query, tuple(user_ids))
+
+def get_user_cards_by_ids(user_ids: List[int]) -> List[Dict[str, Any]]:
+    """Публичные карточки пользователей по списку ID"""
+    return get_users_by_ids(user_ids, USER_CARD_FIELDS)
 
 def get_user_by_email(email: str) -> Optional[Dict[str, Any]]:
-    query = "SELECT * FROM users WHERE email = %s"
-    return db.fetch_one(query, (email,))
+    query = "SELECT id FROM users WHERE email = %s LIMIT 1"
+    # Отсутствие не кешируется: иначе только что зарегистрированный пользователь не сможет войти до истечения TTL
+    row = email_cache.get_or_load(email.casefold(), lambda: db.fetch_one(query, (email,)), cache_missing=False)
+    return get_user_by_id(row['id']) if row else None
 
 def create_user(user: Users) -> int:
     query = """
@@ -22,12 +74,14 @@ def create_user(user: Users) -> int:
         VALUES (%s, %s, %s, %s)
     """
     params = (
-        user.Email,
-        user.Password,
-        user.FirstName,
-        user.LastActivity
+        user.email,
+        user.password,
+        user.first_name,
+        user.last_activity
     )
-    cursor = db.execute_query(query, params)
+    cursor = _execute_user_write(query, params)
+    user_cache.invalidate(cursor.lastrowid)
+    _invalidate_email(user.email)
     return cursor.lastrowid
 
 def update_user(user_id: int, updates: Dict[str, Any]) -> None:
@@ -49,17 +103,34 @@ def update_user(user_id: int, updates: Dict[str, Any]) -> None:
     if not set_clauses:
         return
 
+    previous = get_user_by_id(user_id) if 'email' in updates else None
     params.append(user_id)
     query = f"UPDATE users SET {', '.join(set_clauses)} WHERE id = %s"
-    db.execute_query(query, params)
+    _execute_user_write(query, params)
+    user_cache.invalidate(user_id)
+    if previous:
+        _invalidate_email(previous['email'])
+        _invalidate_email(updates['email'])
 
 def update_user_activity(user_id: int, last_activity: datetime) -> None:
     query = "UPDATE users SET last_activity = %s WHERE id = %s"
     db.execute_query(query, (last_activity, user_id))
+    # Активность обновляется на каждом запросе — правим закешированную строку, а не сбрасываем её
+    user_cache.patch(user_id, {"last_activity": last_activity})
 
 def delete_user(user_id: int) -> None:
+    user = get_user_by_id(user_id)
+    agent = db.fetch_one("SELECT id FROM user_agents WHERE user_id = %s", (user_id,))
     query = "DELETE FROM users WHERE id = %s"
     db.execute_query(query, (user_id,))
+    user_cache.invalidate(user_id)
+    if user:
+        _invalidate_email(user['email'])
+    # Профиль, предпочтения и агент пользователя удаляются вместе с ним
+    for name in ("profiles", "preferences", "agent_ids_by_user"):
+        get_entity_cache(name).invalidate(user_id)
+    if agent:
+        get_entity_cache("agents").invalidate(agent['id'])
 
 def get_users_by_activity_period(start_date: datetime, end_date: datetime) -> list[Dict[str, Any]]:
     query = "SELECT * FROM users WHERE last_activity BETWEEN %s AND %s ORDER BY last_activity DESC"
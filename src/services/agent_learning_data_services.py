@@ -1,13 +1,20 @@
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple
+from collections import defaultdict
 from datetime import datetime
 import json
 from fastapi import HTTPException, status
+from pydantic import ValidationError
 from src.database.models import AgentLearningData
 from src.repository import agent_learning_data_repository
 from src.utils.custom_logging import get_logger
+from src.utils.serialization import db_model, db_models
+from src.utils.learning_aggregates import LearningAggregate, fold_learning_batch
 
 log = get_logger(__name__)
 
+# Records folded per transaction by the learning pipeline
+LEARNING_BATCH_SIZE = 500
+
 
 class LearningDataNotFoundError(HTTPException):
     def __init__(self, data_id: int):
@@ -28,7 +35,7 @@ class AgentNotFoundError(HTTPException):
 def get_all_learning_data() -> List[AgentLearningData]:
     """Get all agent learning data entries"""
     learning_data = agent_learning_data_repository.get_all_learning_data()
-    return [AgentLearningData(**data) for data in learning_data]
+    return _convert_db_learning_data_list(learning_data)
 
 
 def get_learning_data_by_id(data_id: int) -> AgentLearningData:
@@ -36,25 +43,29 @@ def get_learning_data_by_id(data_id: int) -> AgentLearningData:
     data = agent_learning_data_repository.get_learning_data_by_id(data_id)
     if not data:
         raise LearningDataNotFoundError(data_id)
-    return AgentLearningData(**data)
+    return _convert_db_learning_data(data)
 
 
 def get_learning_data_by_agent(agent_id: int) -> List[AgentLearningData]:
     """Get all learning data for a specific agent"""
     learning_data = agent_learning_data_repository.get_learning_data_by_agent(agent_id)
-    return [AgentLearningData(**data) for data in learning_data]
+    return _convert_db_learning_data_list(learning_data)
 
 
 def get_learning_data_by_type(data_type: str) -> List[AgentLearningData]:
     """Get learning data of specific type"""
     learning_data = agent_learning_data_repository.get_learning_data_by_type(data_type)
-    return [AgentLearningData(**data) for data in learning_data]
+    return _convert_db_learning_data_list(learning_data)
 
 
 def create_learning_data(learning_data: Dict[str, Any]) -> AgentLearningData:
     """Create new agent learning data entry"""
+    # Older clients send the payload as training_data
+    if learning_data.get('data_content') is None and learning_data.get('training_data') is not None:
+        learning_data['data_content'] = learning_data.pop('training_data')
+
     # Validate required fields
-    required_fields = ['agent_id', 'data_type', 'training_data']
+    required_fields = ['agent_id', 'data_type', 'data_content']
     for field in required_fields:
         if field not in learning_data or learning_data[field] is None:
             raise HTTPException(
@@ -62,39 +73,32 @@ def create_learning_data(learning_data: Dict[str, Any]) -> AgentLearningData:
                 detail=f"Missing required field: {field}"
             )
 
-    # Validate training_data is a valid JSON-serializable structure
+    # Validate JSON fields are serializable structures
+    for json_field in ('data_content', 'metadata'):
+        if learning_data.get(json_field) is not None:
+            try:
+                json.dumps(learning_data[json_field])
+            except (TypeError, ValueError) as e:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Invalid {json_field} format: {str(e)}"
+                )
+
+    # Prepare model
     try:
-        training_data = json.dumps(learning_data['training_data'])
-    except (TypeError, ValueError) as e:
+        data = AgentLearningData(
+            agent_id=learning_data['agent_id'],
+            data_type=learning_data['data_type'],
+            data_content=learning_data['data_content'],
+            source=learning_data.get('source'),
+            metadata=learning_data.get('metadata')
+        )
+    except ValidationError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Invalid training_data format: {str(e)}"
+            detail=f"Invalid learning data: {str(e)}"
         )
 
-    # Prepare metadata if provided
-    metadata = None
-    if 'metadata' in learning_data and learning_data['metadata'] is not None:
-        try:
-            metadata = json.dumps(learning_data['metadata'])
-        except (TypeError, ValueError) as e:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Invalid metadata format: {str(e)}"
-            )
-
-    # Prepare model
-    data = AgentLearningData(
-        AgentID=learning_data['agent_id'],
-        DataType=learning_data['data_type'],
-        TrainingData=learning_data['training_data'],
-        Source=learning_data.get('source'),
-        Metadata=learning_data.get('metadata'),
-        CreatedBy=learning_data.get('created_by'),
-        IsProcessed=False,
-        CreatedAt=datetime.now(),
-        UpdatedAt=datetime.now()
-    )
-
     # Create in repository
     data_id = agent_learning_data_repository.create_learning_data(data)
     return get_learning_data_by_id(data_id)
@@ -106,13 +110,13 @@ def update_learning_data(data_id: int, updates: Dict[str, Any]) -> AgentLearning
     existing_data = get_learning_data_by_id(data_id)
     
     # Validate JSON fields
-    if 'training_data' in updates and updates['training_data'] is not None:
+    if 'data_content' in updates and updates['data_content'] is not None:
         try:
-            json.dumps(updates['training_data'])
+            json.dumps(updates['data_content'])
         except (TypeError, ValueError) as e:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Invalid training_data format: {str(e)}"
+                detail=f"Invalid data_content format: {str(e)}"
             )
     
     if 'metadata' in updates and updates['metadata'] is not None:
@@ -159,16 +163,16 @@ def delete_agent_learning_data(agent_id: int) -> Dict[str, str]:
     return {"message": f"Deleted {count} learning data entries for agent {agent_id}"}
 
 
-def get_unprocessed_learning_data() -> List[AgentLearningData]:
-    """Get all unprocessed learning data"""
-    learning_data = agent_learning_data_repository.get_unprocessed_learning_data()
-    return [AgentLearningData(**data) for data in learning_data]
+def get_unprocessed_learning_data(limit: int = 1000) -> List[AgentLearningData]:
+    """Get unprocessed learning data, oldest first"""
+    learning_data = agent_learning_data_repository.get_unprocessed_learning_data(limit)
+    return _convert_db_learning_data_list(learning_data)
 
 
 def get_learning_data_from_source(source: str) -> List[AgentLearningData]:
     """Get learning data from specific source"""
     learning_data = agent_learning_data_repository.get_learning_data_from_source(source)
-    return [AgentLearningData(**data) for data in learning_data]
+    return _convert_db_learning_data_list(learning_data)
 
 
 def get_recent_learning_data(hours: int = 24) -> List[AgentLearningData]:
@@ -180,19 +184,19 @@ def get_recent_learning_data(hours: int = 24) -> List[AgentLearningData]:
         )
     
     learning_data = agent_learning_data_repository.get_recent_learning_data(hours)
-    return [AgentLearningData(**data) for data in learning_data]
+    return _convert_db_learning_data_list(learning_data)
 
 
-def get_learning_data_by_metadata_key(key: str, value: Any = None) -> List[AgentLearningData]:
-    """Get learning data containing specific metadata key (and optionally value)"""
+def get_learning_data_by_metadata_key(key: str, value: Any = None, limit: int = 100) -> List[AgentLearningData]:
+    """Get the most recent learning data containing specific metadata key (and optionally value)"""
     if not key or not isinstance(key, str):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Key must be a non-empty string"
         )
     
-    learning_data = agent_learning_data_repository.get_learning_data_by_metadata_key(key, value)
-    return [AgentLearningData(**data) for data in learning_data]
+    learning_data = agent_learning_data_repository.get_learning_data_by_metadata_key(key, value, limit)
+    return _convert_db_learning_data_list(learning_data)
 
 
 def count_learning_data_by_agent(agent_id: int) -> Dict[str, Any]:
@@ -202,4 +206,124 @@ def count_learning_data_by_agent(agent_id: int) -> Dict[str, Any]:
 
 def get_learning_data_stats() -> Dict[str, Any]:
     """Get overall learning data statistics"""
-    return agent_learning_data_repository.get_learning_data_stats()
\ No newline at end of file
+    return agent_learning_data_repository.get_learning_data_stats()
+
+
+def get_hourly_learning_stats(hours: int = 24, agent_id: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Get learning data intake and processing per hour"""
+    if hours <= 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Hours parameter must be positive"
+        )
+    return [
+        {
+            "hour": row['hour_bucket'],
+            "total_count": int(row['total_count']),
+            "processed_count": int(row['processed_count'])
+        }
+        for row in agent_learning_data_repository.get_hourly_learning_stats(hours, agent_id)
+    ]
+
+
+def rebuild_learning_stats(chunk_size: int = 5000) -> Dict[str, Any]:
+    """
+    Recompute the rolling statistics store from agent_learning_data.
+    The table is read in id-ordered chunks so memory stays bounded by the number of buckets
+    """
+    buckets: Dict[Tuple[int, str, str, datetime], List[int]] = defaultdict(lambda: [0, 0])
+    records = 0
+    for chunk in agent_learning_data_repository.iter_learning_data_chunks(chunk_size):
+        for row in chunk:
+            key = (
+                row['agent_id'],
+                row['data_type'] or '',
+                row['source'] or '',
+                row['created_at'].replace(minute=0, second=0, microsecond=0)
+            )
+            buckets[key][0] += 1
+            buckets[key][1] += bool(row['is_processed'])
+        records += len(chunk)
+
+    stored = agent_learning_data_repository.replace_learning_stats(buckets)
+    log.info(f"Learning stats rebuilt: {records} records in {stored} buckets")
+    return {"records": records, "buckets": stored}
+
+
+def process_learning_batch(batch_size: int = LEARNING_BATCH_SIZE, agent_id: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Fold the next batch of unprocessed learning data into per-agent aggregates.
+    Each agent in the batch gets one personality update; rows are marked processed
+    in the same transaction
+    """
+    if batch_size <= 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Batch size must be positive"
+        )
+
+    processed, agent_ids = agent_learning_data_repository.process_unprocessed_batch(
+        fold_learning_batch, batch_size, agent_id
+    )
+    if agent_ids:
+        from src.services import user_agents_services
+        user_agents_services.refresh_trained_agents(agent_ids)
+        log.info(f"Learning batch: {processed} records folded into {len(agent_ids)} agents")
+    return {"processed_count": processed, "agent_ids": agent_ids}
+
+
+def retrain_agent(agent_id: int, batch_size: int = LEARNING_BATCH_SIZE) -> Dict[str, Any]:
+    """
+    Drain one agent's unprocessed learning data. An agent picked only for being stale
+    is marked refreshed so it leaves the retraining queue
+    """
+    processed = 0
+    while True:
+        result = process_learning_batch(batch_size, agent_id)
+        processed += result["processed_count"]
+        if result["processed_count"] < batch_size:
+            break
+
+    if not processed:
+        from src.services import user_agents_services
+        user_agents_services.touch_agent(agent_id)
+    return {"agent_id": agent_id, "processed_count": processed}
+
+
+def run_learning_pipeline(batch_size: int = LEARNING_BATCH_SIZE, max_batches: Optional[int] = None) -> Dict[str, Any]:
+    """Process batches until the backlog is drained or max_batches is reached"""
+    processed = 0
+    agent_ids = set()
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        result = process_learning_batch(batch_size)
+        if not result["processed_count"]:
+            break
+        batches += 1
+        processed += result["processed_count"]
+        agent_ids.update(result["agent_ids"])
+    return {"batches": batches, "processed_count": processed, "agents_updated": len(agent_ids)}
+
+
+def get_agent_learning_aggregate(agent_id: int) -> Dict[str, Any]:
+    """Get accumulated learning aggregates for an agent"""
+    aggregate = agent_learning_data_repository.get_aggregate(agent_id)
+    if not aggregate:
+        return {"agent_id": agent_id, "processed_count": 0, "aggregate_data": LearningAggregate().to_dict()}
+    return {
+        "agent_id": agent_id,
+        "processed_count": aggregate['processed_count'],
+        "aggregate_data": LearningAggregate(aggregate['aggregate_data']).to_dict(),
+        "updated_at": aggregate['updated_at']
+    }
+
+
+def _convert_db_learning_data(data: Dict[str, Any]) -> AgentLearningData:
+    """Convert a database row into the Pydantic model"""
+    return db_model(AgentLearningData, data)
+
+
+def _convert_db_learning_data_list(rows: List[Dict[str, Any]]) -> List[AgentLearningData]:
+    """Convert database rows into a list of Pydantic models"""
+    return db_models(AgentLearningData, rows)
+
@@ -1,13 +1,20 @@
 from typing import Optional, Dict, Any, List
-from datetime import datetime
 import json
 from fastapi import HTTPException, status
-from src.repository import agent_simulation_messages_repository
+from src.repository import agent_simulation_messages_repository, agent_simulation_transcripts_repository
 from src.database.models import AgentSimulationMessages
 from src.utils.custom_logging import get_logger
+from src.utils.serialization import db_model, db_models
+from src.utils.fulltext import NGRAM_TOKEN_SIZE, to_boolean_query
+from src.utils.chat_hub import simulation_hub
+from src.utils.transcript_codec import CompactTranscript, encode_transcript, FORMAT_VERSION
 
 log = get_logger(__name__)
 
+# Сколько часов после завершения симуляции её сообщения остаются построчными:
+# в это окно они доступны по ID и в полнотекстовом поиске, затем сжимаются в транскрипт
+TRANSCRIPT_RETENTION_HOURS = 168
+
 
 class SimulationMessageNotFoundError(HTTPException):
     def __init__(self, message_id: int):
@@ -28,7 +35,7 @@ class SimulationMessageValidationError(HTTPException):
 def get_all_simulation_messages() -> List[AgentSimulationMessages]:
     """Получить все сообщения симуляций агентов"""
     messages_data = agent_simulation_messages_repository.get_all_simulation_messages()
-    return [_convert_db_message(msg) for msg in messages_data]
+    return _convert_db_message_list(messages_data)
 
 
 def get_message_by_id(message_id: int) -> AgentSimulationMessages:
@@ -40,40 +47,142 @@ def get_message_by_id(message_id: int) -> AgentSimulationMessages:
 
 
 def get_messages_by_simulation(simulation_id: int) -> List[AgentSimulationMessages]:
-    """Получить все сообщения конкретной симуляции"""
+    """Получить все сообщения конкретной симуляции (для сжатых симуляций — из транскрипта)"""
     messages_data = agent_simulation_messages_repository.get_messages_by_simulation(simulation_id)
-    return [_convert_db_message(msg) for msg in messages_data]
+    if messages_data:
+        return _convert_db_message_list(messages_data)
+
+    transcript = get_compact_transcript(simulation_id)
+    if transcript is None:
+        return []
+    return [
+        AgentSimulationMessages(
+            simulation_id=simulation_id,
+            sender_agent_id=turn['sender_agent_id'],
+            message_text=turn['message_text'],
+            sentiment_score=turn['sentiment_score'],
+            created_at=turn['created_at']
+        )
+        for turn in transcript.turns
+    ]
+
+
+def get_messages_after(simulation_id: int, after_message_id: int) -> List[AgentSimulationMessages]:
+    """Сообщения симуляции с ID больше after_message_id (догрузка для потоков событий)"""
+    rows = agent_simulation_messages_repository.get_messages_since([simulation_id], after_message_id + 1)
+    return _convert_db_message_list(rows)
+
+
+def get_compact_transcript(simulation_id: int) -> Optional[CompactTranscript]:
+    """Получить сжатый транскрипт симуляции (реплики распаковываются при обращении)"""
+    transcript_data = agent_simulation_transcripts_repository.get_transcript(simulation_id)
+    if not transcript_data:
+        return None
+    return CompactTranscript(
+        transcript_data['transcript'],
+        transcript_data['agent1_id'],
+        transcript_data['agent2_id'],
+        transcript_data['started_at']
+    )
+
+
+def compact_simulation_transcripts(
+    simulation_ids: Optional[List[int]] = None,
+    limit: int = 100,
+    retention_hours: int = TRANSCRIPT_RETENTION_HOURS
+) -> Dict[str, int]:
+    """
+    Сжать сообщения симуляций, завершённых раньше окна хранения retention_hours, в транскрипты
+    (по одной строке на симуляцию) и удалить построчные сообщения.
+    Без simulation_ids обрабатываются любые несжатые симуляции
+    """
+    simulations = agent_simulation_transcripts_repository.get_simulations_to_compact(
+        simulation_ids, limit, retention_hours
+    )
+    if not simulations:
+        return {"compacted_count": 0}
+
+    messages_by_simulation: Dict[int, List[Dict[str, Any]]] = {}
+    for message in agent_simulation_transcripts_repository.get_messages_for_simulations(
+        [simulation['id'] for simulation in simulations]
+    ):
+        messages_by_simulation.setdefault(message['simulation_id'], []).append(message)
+
+    transcripts = []
+    for simulation in simulations:
+        blob, turn_count, raw_size, started_at = encode_transcript(
+            messages_by_simulation.get(simulation['id'], []),
+            simulation['agent1_id'],
+            simulation['agent2_id']
+        )
+        transcripts.append({
+            "simulation_id": simulation['id'],
+            "format_version": FORMAT_VERSION,
+            "turn_count": turn_count,
+            "raw_size": raw_size,
+            "transcript": blob,
+            "started_at": started_at
+        })
+
+    return {"compacted_count": agent_simulation_transcripts_repository.save_transcripts(transcripts)}
+
+
+def get_transcript_stats() -> Dict[str, Any]:
+    """Получить статистику сжатых транскриптов"""
+    return agent_simulation_transcripts_repository.get_transcript_stats()
 
 
 def create_simulation_message(
     simulation_id: int,
-    message_content: str,
-    role: str,
-    message_type: str,
-    metadata: Optional[Dict[str, Any]] = None
+    sender_agent_id: int,
+    message_text: str,
+    sentiment_score: Optional[float] = None
 ) -> AgentSimulationMessages:
     """Создать новое сообщение симуляции"""
     # Валидация входных данных
-    if not message_content or len(message_content.strip()) == 0:
+    if not message_text or len(message_text.strip()) == 0:
         raise SimulationMessageValidationError("Message content cannot be empty")
     
-    if len(message_content) > 5000:
+    if len(message_text) > 5000:
         raise SimulationMessageValidationError("Message is too long (max 5000 characters)")
     
-    if role not in ['system', 'user', 'assistant', 'function']:
-        raise SimulationMessageValidationError("Invalid message role")
-    
     message = AgentSimulationMessages(
-        SimulationID=simulation_id,
-        MessageContent=message_content,
-        Role=role,
-        MessageType=message_type,
-        Metadata=metadata,
-        CreatedAt=datetime.now()
+        simulation_id=simulation_id,
+        sender_agent_id=sender_agent_id,
+        message_text=message_text,
+        sentiment_score=sentiment_score
     )
     
     message_id = agent_simulation_messages_repository.create_message(message)
-    return get_message_by_id(message_id)
+    created_message = get_message_by_id(message_id)
+    simulation_hub.publish(simulation_id, "simulation.message", created_message.model_dump(mode="json"))
+    return created_message
+
+
+def create_simulation_turns(turns: List[Dict[str, Any]]) -> int:
+    """
+    Сохранить реплики нескольких симуляций одним INSERT и разослать их подписчикам.
+    Каждая реплика — dict с simulation_id, sender_agent_id, message_text, sentiment_score
+    """
+    if not turns:
+        return 0
+
+    messages = [
+        AgentSimulationMessages(
+            simulation_id=turn['simulation_id'],
+            sender_agent_id=turn['sender_agent_id'],
+            message_text=turn['message_text'],
+            sentiment_score=turn.get('sentiment_score')
+        )
+        for turn in turns
+    ]
+    first_message_id = agent_simulation_messages_repository.create_messages_bulk(messages)
+
+    simulation_ids = sorted({message.simulation_id for message in messages})
+    for message_data in agent_simulation_messages_repository.get_messages_since(simulation_ids, first_message_id):
+        message = _convert_db_message(message_data)
+        simulation_hub.publish(message.simulation_id, "simulation.message", message.model_dump(mode="json"))
+    return len(messages)
 
 
 def update_message(
@@ -129,13 +238,13 @@ def get_messages_by_role(simulation_id: int, role: str) -> List[AgentSimulationM
         raise SimulationMessageValidationError("Invalid message role")
     
     messages_data = agent_simulation_messages_repository.get_messages_by_role(simulation_id, role)
-    return [_convert_db_message(msg) for msg in messages_data]
+    return _convert_db_message_list(messages_data)
 
 
 def get_messages_by_type(simulation_id: int, message_type: str) -> List[AgentSimulationMessages]:
     """Получить сообщения симуляции по типу сообщения"""
     messages_data = agent_simulation_messages_repository.get_messages_by_type(simulation_id, message_type)
-    return [_convert_db_message(msg) for msg in messages_data]
+    return _convert_db_message_list(messages_data)
 
 
 def get_last_message(simulation_id: int) -> Optional[AgentSimulationMessages]:
@@ -145,15 +254,31 @@ def get_last_message(simulation_id: int) -> Optional[AgentSimulationMessages]:
 
 
 def get_conversation_from_simulation(simulation_id: int) -> List[Dict[str, Any]]:
-    """Получить все сообщения симуляции, отформатированные как диалог"""
-    messages = get_messages_by_simulation(simulation_id)
+    """
+    Получить все сообщения симуляции, отформатированные как диалог.
+    Для сжатых симуляций — одно чтение транскрипта
+    """
+    transcript = get_compact_transcript(simulation_id)
+    if transcript is None:
+        from src.services import agents_simulations_services
+        simulation = agents_simulations_services.get_simulation_by_id(simulation_id)
+        roles = {simulation.agent1_id: "agent1", simulation.agent2_id: "agent2"}
+        turns = [
+            {**msg.model_dump(), "role": roles.get(msg.sender_agent_id, "other")}
+            for msg in get_messages_by_simulation(simulation_id)
+        ]
+    else:
+        turns = transcript.turns
+
     return [
         {
-            "role": msg.Role,
-            "content": msg.MessageContent,
-            "timestamp": msg.CreatedAt.isoformat()
+            "role": turn['role'],
+            "sender_agent_id": turn['sender_agent_id'],
+            "content": turn['message_text'],
+            "sentiment_score": turn['sentiment_score'],
+            "timestamp": turn['created_at'].isoformat() if turn['created_at'] else None
         }
-        for msg in messages
+        for turn in turns
     ]
 
 
@@ -167,60 +292,62 @@ def get_message_stats_by_type(simulation_id: int) -> Dict[str, int]:
     return agent_simulation_messages_repository.get_message_stats_by_type(simulation_id)
 
 
-def search_simulation_messages(search_term: str) -> List[AgentSimulationMessages]:
-    """Поиск сообщений симуляции по содержимому"""
+def search_simulation_messages(
+    search_term: str,
+    simulation_id: int = None,
+    limit: int = 50,
+    offset: int = 0
+) -> List[AgentSimulationMessages]:
+    """Поиск сообщений симуляции по содержимому (отсортированы по релевантности)"""
     if not search_term or len(search_term.strip()) < 3:
         raise SimulationMessageValidationError("Search term must be at least 3 characters long")
     
-    messages_data = agent_simulation_messages_repository.search_simulation_messages(search_term)
-    return [_convert_db_message(msg) for msg in messages_data]
+    boolean_query = to_boolean_query(search_term)
+    if not boolean_query:
+        raise SimulationMessageValidationError(
+            f"Search term must contain at least one word of {NGRAM_TOKEN_SIZE} or more characters"
+        )
+    
+    messages_data = agent_simulation_messages_repository.search_simulation_messages(
+        boolean_query, simulation_id, limit, offset
+    )
+    return _convert_db_message_list(messages_data)
 
 
 def get_recent_simulation_messages(hours: int = 24) -> List[AgentSimulationMessages]:
     """Получить недавние сообщения симуляций за указанное количество часов"""
     messages_data = agent_simulation_messages_repository.get_recent_simulation_messages(hours)
-    return [_convert_db_message(msg) for msg in messages_data]
+    return _convert_db_message_list(messages_data)
 
 
 def get_messages_with_metadata_key(key: str) -> List[AgentSimulationMessages]:
     """Получить сообщения, содержащие определенный ключ в метаданных"""
     messages_data = agent_simulation_messages_repository.get_messages_with_metadata_key(key)
-    return [_convert_db_message(msg) for msg in messages_data]
+    return _convert_db_message_list(messages_data)
 
 
 def add_message_to_simulation(
     simulation_id: int,
-    role: str,
+    sender_agent_id: int,
     content: str,
-    message_type: str = "text",
-    metadata: Optional[Dict[str, Any]] = None
+    sentiment_score: Optional[float] = None
 ) -> AgentSimulationMessages:
     """
     Добавить новое сообщение в симуляцию с автоматической валидацией
     """
     return create_simulation_message(
         simulation_id=simulation_id,
-        message_content=content,
-        role=role,
-        message_type=message_type,
-        metadata=metadata
+        sender_agent_id=sender_agent_id,
+        message_text=content,
+        sentiment_score=sentiment_score
     )
 
 
 def _convert_db_message(message_data: Dict[str, Any]) -> AgentSimulationMessages:
     """Конвертировать данные из БД в Pydantic модель"""
-    metadata = (
-        json.loads(message_data['metadata'])
-        if isinstance(message_data.get('metadata'), str)
-        else message_data.get('metadata')
-    )
-    
-    return AgentSimulationMessages(
-        ID=message_data['id'],
-        SimulationID=message_data['simulation_id'],
-        MessageContent=message_data['message_content'],
-        Role=message_data['role'],
-        MessageType=message_data['message_type'],
-        Metadata=metadata,
-        CreatedAt=message_data['created_at']
-    )
\ No newline at end of file
+    return db_model(AgentSimulationMessages, message_data)
+
+
+def _convert_db_message_list(rows: List[Dict[str, Any]]) -> List[AgentSimulationMessages]:
+    """Конвертировать строки из БД в список Pydantic моделей"""
+    return db_models(AgentSimulationMessages, rows)
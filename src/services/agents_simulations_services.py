@@ -1,13 +1,22 @@
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple
 from datetime import datetime
+from dataclasses import asdict
 import json
 from fastapi import HTTPException, status
-from src.repository import agents_simulations_repository
-from src.database.models import AgentSimulations, SimulationStatusEnum
+from src.repository import agents_simulations_repository, simulation_result_cache_repository
+from src.database.models import AgentSimulations, SimulationStatusEnum, UserAgents
 from src.utils.custom_logging import get_logger
+from src.utils.serialization import db_model, db_models
+from src.utils.chat_hub import simulation_hub
 
 log = get_logger(__name__)
 
+DEFAULT_LEASE_SECONDS = 300
+DEFAULT_RETRY_DELAY_SECONDS = 30
+# Значение по умолчанию колонки agent_simulations.max_attempts
+DEFAULT_MAX_ATTEMPTS = 3
+MAX_BATCH_CANDIDATES = 500
+
 
 class SimulationNotFoundError(HTTPException):
     def __init__(self, simulation_id: int):
@@ -28,7 +37,7 @@ class SimulationValidationError(HTTPException):
 def get_all_simulations() -> List[AgentSimulations]:
     """Получить все симуляции агентов"""
     simulations_data = agents_simulations_repository.get_all_simulations()
-    return [_convert_db_simulation(sim) for sim in simulations_data]
+    return _convert_db_simulation_list(simulations_data)
 
 
 def get_simulation_by_id(simulation_id: int) -> AgentSimulations:
@@ -42,13 +51,13 @@ def get_simulation_by_id(simulation_id: int) -> AgentSimulations:
 def get_simulations_by_agent(agent_id: int) -> List[AgentSimulations]:
     """Получить все симуляции конкретного агента"""
     simulations_data = agents_simulations_repository.get_simulations_by_agent(agent_id)
-    return [_convert_db_simulation(sim) for sim in simulations_data]
+    return _convert_db_simulation_list(simulations_data)
 
 
 def get_simulations_by_conversation(conversation_id: int) -> List[AgentSimulations]:
     """Получить все симуляции для конкретной беседы"""
     simulations_data = agents_simulations_repository.get_simulations_by_conversation(conversation_id)
-    return [_convert_db_simulation(sim) for sim in simulations_data]
+    return _convert_db_simulation_list(simulations_data)
 
 
 def create_simulation(
@@ -56,50 +65,76 @@ def create_simulation(
     conversation_id: int,
     simulation_data: Optional[Dict[str, Any]] = None
 ) -> AgentSimulations:
-    """Создать новую симуляцию агента"""
+    """
+    Создать новую симуляцию агента. Второй агент берётся из simulation_data['agent2_id']
+    или определяется как агент собеседника по матчу беседы
+    """
+    simulation, _, _ = _build_simulation(agent_id, conversation_id, simulation_data)
+    simulation_id = agents_simulations_repository.create_simulation(simulation)
+    return get_simulation_by_id(simulation_id)
+
+
+def _build_simulation(
+    agent_id: int,
+    conversation_id: int,
+    simulation_data: Optional[Dict[str, Any]] = None
+) -> Tuple[AgentSimulations, UserAgents, UserAgents]:
+    """Проверить агентов и беседу и подготовить (не сохраняя) ожидающую симуляцию"""
     from src.services import user_agents_services, chat_conversations_services
-    
+
     # Проверяем существование агента и беседы
-    user_agents_services.get_agent_by_id(agent_id)
-    chat_conversations_services.get_conversation_by_id(conversation_id)
-    
+    agent = user_agents_services.get_agent_by_id(agent_id)
+    conversation = chat_conversations_services.get_conversation_by_id(conversation_id)
+
+    partner_agent_id = (simulation_data or {}).get('agent2_id')
+    if partner_agent_id is None:
+        partner_agent_id = _resolve_partner_agent_id(agent.user_id, conversation.match_id)
+
+    if partner_agent_id == agent_id:
+        raise SimulationValidationError("Agent cannot be simulated against itself")
+    partner_agent = user_agents_services.get_agent_by_id(partner_agent_id)
+
     simulation = AgentSimulations(
-        AgentID=agent_id,
-        ConversationID=conversation_id,
-        SimulationStatus=SimulationStatusEnum.PENDING,
-        StartTime=datetime.now(),
-        SimulationData=simulation_data
+        conversation_id=conversation_id,
+        agent1_id=agent_id,
+        agent2_id=partner_agent_id,
+        simulation_status=SimulationStatusEnum.PENDING
     )
-    
-    simulation_id = agents_simulations_repository.create_simulation(simulation)
-    return get_simulation_by_id(simulation_id)
+    return simulation, agent, partner_agent
 
 
 def update_simulation(simulation_id: int, updates: Dict[str, Any]) -> AgentSimulations:
     """Обновить симуляцию агента"""
-    existing = get_simulation_by_id(simulation_id)
-    
-    # Валидация обновлений
-    if 'SimulationStatus' in updates:
-        if updates['SimulationStatus'] not in SimulationStatusEnum.__members__.values():
+    get_simulation_by_id(simulation_id)
+
+    simulation_status = updates.get('simulation_status') or updates.get('SimulationStatus')
+    if simulation_status is not None:
+        try:
+            simulation_status = SimulationStatusEnum(simulation_status).value
+        except ValueError:
             raise SimulationValidationError(
-                f"Invalid status. Must be one of: {list(SimulationStatusEnum.__members__.values())}"
+                f"Invalid status. Must be one of: {[e.value for e in SimulationStatusEnum]}"
             )
-    
+
     update_data = {
-        'simulation_status': updates.get('SimulationStatus'),
-        'start_time': updates.get('StartTime'),
-        'end_time': updates.get('EndTime'),
-        'simulation_data': updates.get('SimulationData')
+        'simulation_status': simulation_status,
+        'compatibility_score': updates.get('compatibility_score') or updates.get('CompatibilityScore'),
+        'simulation_summary': updates.get('simulation_summary') or updates.get('SimulationSummary'),
+        'started_at': updates.get('started_at') or updates.get('StartedAt'),
+        'completed_at': updates.get('completed_at') or updates.get('CompletedAt'),
+        'last_error': updates.get('last_error')
     }
-    
+
     # Удаляем None значения
     update_data = {k: v for k, v in update_data.items() if v is not None}
-    
+
     if update_data:
         agents_simulations_repository.update_simulation(simulation_id, update_data)
-    
-    return get_simulation_by_id(simulation_id)
+
+    simulation = get_simulation_by_id(simulation_id)
+    if 'simulation_status' in update_data:
+        _publish_status(simulation)
+    return simulation
 
 
 def start_simulation(simulation_id: int) -> AgentSimulations:
@@ -107,8 +142,8 @@ def start_simulation(simulation_id: int) -> AgentSimulations:
     return update_simulation(
         simulation_id,
         {
-            'SimulationStatus': SimulationStatusEnum.IN_PROGRESS,
-            'StartTime': datetime.now()
+            'simulation_status': SimulationStatusEnum.IN_PROGRESS,
+            'started_at': datetime.now()
         }
     )
 
@@ -117,15 +152,16 @@ def complete_simulation(
     simulation_id: int,
     simulation_data: Optional[Dict[str, Any]] = None
 ) -> AgentSimulations:
-    """Завершить симуляцию успешно"""
+    """Завершить симуляцию успешно (simulation_data может содержать compatibility_score и simulation_summary)"""
     updates = {
-        'SimulationStatus': SimulationStatusEnum.COMPLETED,
-        'EndTime': datetime.now()
+        'simulation_status': SimulationStatusEnum.COMPLETED,
+        'completed_at': datetime.now()
     }
-    
+
     if simulation_data:
-        updates['SimulationData'] = simulation_data
-    
+        updates['compatibility_score'] = simulation_data.get('compatibility_score')
+        updates['simulation_summary'] = simulation_data.get('simulation_summary')
+
     return update_simulation(simulation_id, updates)
 
 
@@ -135,28 +171,16 @@ def fail_simulation(
     error_details: Optional[Dict[str, Any]] = None
 ) -> AgentSimulations:
     """Завершить симуляцию с ошибкой"""
-    simulation = get_simulation_by_id(simulation_id)
-    
-    # Обновляем данные симуляции с информацией об ошибке
-    error_data = {
-        'error': {
-            'message': error_message,
-            'details': error_details,
-            'timestamp': datetime.now().isoformat()
-        }
-    }
-    
-    if simulation.SimulationData:
-        updated_data = {**simulation.SimulationData, **error_data}
-    else:
-        updated_data = error_data
-    
+    last_error = error_message
+    if error_details:
+        last_error = f"{error_message}: {json.dumps(error_details, ensure_ascii=False, default=str)}"
+
     return update_simulation(
         simulation_id,
         {
-            'SimulationStatus': SimulationStatusEnum.FAILED,
-            'EndTime': datetime.now(),
-            'SimulationData': updated_data
+            'simulation_status': SimulationStatusEnum.FAILED,
+            'completed_at': datetime.now(),
+            'last_error': last_error
         }
     )
 
@@ -171,25 +195,25 @@ def delete_simulation(simulation_id: int) -> Dict[str, str]:
 def get_active_simulations() -> List[AgentSimulations]:
     """Получить все активные симуляции агентов"""
     simulations_data = agents_simulations_repository.get_active_simulations()
-    return [_convert_db_simulation(sim) for sim in simulations_data]
+    return _convert_db_simulation_list(simulations_data)
 
 
 def get_completed_simulations(limit: int = 100) -> List[AgentSimulations]:
     """Получить завершенные симуляции агентов"""
     simulations_data = agents_simulations_repository.get_completed_simulations(limit)
-    return [_convert_db_simulation(sim) for sim in simulations_data]
+    return _convert_db_simulation_list(simulations_data)
 
 
 def get_failed_simulations(limit: int = 100) -> List[AgentSimulations]:
     """Получить неудачные симуляции агентов"""
     simulations_data = agents_simulations_repository.get_failed_simulations(limit)
-    return [_convert_db_simulation(sim) for sim in simulations_data]
+    return _convert_db_simulation_list(simulations_data)
 
 
 def get_recent_simulations(hours: int = 24) -> List[AgentSimulations]:
     """Получить недавние симуляции за указанное количество часов"""
     simulations_data = agents_simulations_repository.get_recent_simulations(hours)
-    return [_convert_db_simulation(sim) for sim in simulations_data]
+    return _convert_db_simulation_list(simulations_data)
 
 
 def get_simulation_stats() -> Dict[str, Any]:
@@ -208,28 +232,400 @@ def run_agent_simulation(
     simulation_data: Optional[Dict[str, Any]] = None
 ) -> AgentSimulations:
     """
-    Запустить новую симуляцию агента и автоматически начать ее
+    Запустить симуляцию агента. Если для пары личностей уже есть результат
+    текущей версии движка, симуляция сразу создаётся завершённой с копией диалога;
+    иначе она ставится в очередь в статусе 'pending' до обработки воркером
     """
-    simulation = create_simulation(agent_id, conversation_id, simulation_data)
-    return start_simulation(simulation.ID)
+    # Движок симуляций и оценка совместимости (numpy) загружаются при первой симуляции, а не при старте
+    from src.utils.simulation_engine import get_simulation_engine, simulation_cache_key
+
+    simulation, agent, partner_agent = _build_simulation(agent_id, conversation_id, simulation_data)
+    cache_key = simulation_cache_key(
+        agent.personality_data, partner_agent.personality_data, get_simulation_engine().version
+    )
+    cached = simulation_result_cache_repository.get_cached_result(cache_key)
+    if cached is None:
+        simulation_id = agents_simulations_repository.create_simulation(simulation)
+        return get_simulation_by_id(simulation_id)
+
+    simulation_id = _create_cached_simulation(simulation, cached, cache_key)
+    return get_simulation_by_id(simulation_id)
+
+
+def _create_cached_simulation(simulation: AgentSimulations, cached: Dict[str, Any], cache_key: str) -> int:
+    """Сохранить симуляцию завершённой по результату из кеша вместе с копией диалога источника"""
+    from src.repository import agent_simulation_messages_repository, agent_simulation_transcripts_repository
+
+    now = datetime.now()
+    simulation.simulation_status = SimulationStatusEnum.COMPLETED
+    simulation.compatibility_score = cached['compatibility_score']
+    simulation.simulation_summary = cached['simulation_summary']
+    simulation.started_at = now
+    simulation.completed_at = now
+    simulation_id = agents_simulations_repository.create_simulation(simulation)
+
+    # Построчные сообщения источника есть, пока он в окне хранения; после сжатия копируется
+    # транскрипт — он кодирует отправителей относительно агентов симуляции и копируется как есть
+    if not agent_simulation_messages_repository.copy_simulation_messages(
+        cached['simulation_id'], simulation_id, cached['agent1_id'], simulation.agent1_id, simulation.agent2_id
+    ):
+        agent_simulation_transcripts_repository.copy_transcript(cached['simulation_id'], simulation_id)
+    simulation_result_cache_repository.record_hit(cache_key)
+    log.info(f"Simulation {simulation_id} served from cache (source simulation {cached['simulation_id']})")
+    return simulation_id
+
+
+def invalidate_agent_results(agent_id: int) -> int:
+    """Удалить закешированные результаты симуляций с участием агента"""
+    return simulation_result_cache_repository.delete_agent_results(agent_id)
+
+
+def get_result_cache_stats() -> Dict[str, Any]:
+    """Получить статистику кеша результатов симуляций"""
+    return simulation_result_cache_repository.get_cache_stats()
+
+
+def _score_candidates(rows: List[Dict[str, Any]]) -> List[float]:
+    """
+    Оценить совместимость личностей пар из get_batch_candidates одной матричной
+    операцией (вход движка симуляций): векторы берутся из актуальных сохранённых
+    признаков, а для остальных агентов вычисляются по личности (один раз на агента)
+    """
+    import numpy as np
+    from src.utils.compatibility import personality_embedding, score_embeddings
+    from src.utils.personality_features import FEATURE_VERSION, decode_embedding
+
+    if not rows:
+        return []
+
+    embeddings: Dict[int, Any] = {}
+
+    def embedding(agent_id: int, stored: Any, feature_version: Any, personality_data: Any):
+        if agent_id not in embeddings:
+            vector = decode_embedding(stored) if feature_version == FEATURE_VERSION else None
+            embeddings[agent_id] = vector if vector is not None else personality_embedding(personality_data)
+        return embeddings[agent_id]
+
+    return score_embeddings(
+        np.stack([
+            embedding(row['agent1_id'], row['agent1_embedding'], row['agent1_feature_version'], row['agent1_personality'])
+            for row in rows
+        ]),
+        np.stack([
+            embedding(row['agent2_id'], row['agent2_embedding'], row['agent2_feature_version'], row['agent2_personality'])
+            for row in rows
+        ])
+    )
+
+
+def run_batch_compatibility(
+    agent_id: int,
+    candidates: List[Dict[str, Any]],
+    persist: bool = True
+) -> Dict[str, Any]:
+    """
+    Прогнать симуляции агента с пакетом кандидатов. Каждый кандидат — беседа
+    (conversation_id) и, опционально, агент (agent_id; по умолчанию агент собеседника).
+    Пары с результатом текущей версии движка берутся из кеша, остальные прогоняются
+    движком одним пакетом (реплики всех симуляций — пачками по ходам).
+    При persist=False ничего не сохраняется. Возвращает результаты,
+    отсортированные по убыванию совместимости
+    """
+    from src.services import user_agents_services, agent_simulation_messages_services
+    from src.utils.simulation_engine import SimulationSpec, get_simulation_engine, simulation_cache_key
+
+    if not candidates:
+        raise SimulationValidationError("Candidates list is empty")
+    if len(candidates) > MAX_BATCH_CANDIDATES:
+        raise SimulationValidationError(f"Too many candidates, maximum is {MAX_BATCH_CANDIDATES}")
+    if any(not isinstance(c, dict) or not isinstance(c.get('conversation_id'), int) for c in candidates):
+        raise SimulationValidationError("Each candidate must contain an integer conversation_id")
+
+    rows = agents_simulations_repository.get_batch_candidates(agent_id, candidates)
+    if not rows:
+        user_agents_services.get_agent_by_id(agent_id)  # 404, если агента нет
+
+    valid_positions = {row['position'] for row in rows}
+    invalid = [c for position, c in enumerate(candidates) if position not in valid_positions]
+
+    engine = get_simulation_engine()
+    cache_keys = [
+        simulation_cache_key(row['agent1_personality'], row['agent2_personality'], engine.version)
+        for row in rows
+    ]
+    cached_results = {
+        cached['cache_key']: cached
+        for cached in simulation_result_cache_repository.get_cached_results(sorted(set(cache_keys)))
+    }
+
+    results = []
+    specs = []
+    misses = {}
+    now = datetime.now()
+    for row, cache_key, affinity in zip(rows, cache_keys, _score_candidates(rows)):
+        simulation = AgentSimulations(
+            conversation_id=row['conversation_id'],
+            agent1_id=row['agent1_id'],
+            agent2_id=row['agent2_id'],
+            simulation_status=SimulationStatusEnum.IN_PROGRESS,
+            started_at=now
+        )
+        cached = cached_results.get(cache_key)
+        if cached is not None:
+            simulation_id = _create_cached_simulation(simulation, cached, cache_key) if persist else None
+            results.append(_batch_result(
+                row, simulation_id, cached['compatibility_score'], cached['simulation_summary'], True
+            ))
+            continue
+
+        # Без сохранения симуляции нумеруются позицией кандидата
+        simulation_id = agents_simulations_repository.create_simulation(simulation) if persist else row['position']
+        misses[simulation_id] = (row, cache_key)
+        specs.append(SimulationSpec(
+            simulation_id=simulation_id,
+            agent1_id=row['agent1_id'],
+            personality1=row['agent1_personality'],
+            agent2_id=row['agent2_id'],
+            personality2=row['agent2_personality'],
+            affinity=affinity
+        ))
+
+    if specs:
+        try:
+            engine_results = engine.run(
+                specs,
+                on_round=(lambda turns: agent_simulation_messages_services.create_simulation_turns(
+                    [asdict(turn) for turn in turns]
+                )) if persist else None
+            )
+        except Exception as e:
+            log.exception(f"Simulation engine failed for batch of agent {agent_id}")
+            if persist:
+                for spec in specs:
+                    fail_simulation(spec.simulation_id, str(e))
+            raise
+
+        for result in engine_results:
+            row, cache_key = misses[result.simulation_id]
+            simulation_id = None
+            if persist:
+                simulation_id = result.simulation_id
+                agents_simulations_repository.update_simulation(simulation_id, {
+                    'simulation_status': SimulationStatusEnum.COMPLETED.value,
+                    'compatibility_score': result.compatibility_score,
+                    'simulation_summary': result.simulation_summary,
+                    'completed_at': datetime.now()
+                })
+                simulation_result_cache_repository.save_result(
+                    cache_key, row['agent1_id'], row['agent2_id'], engine.version, simulation_id,
+                    result.compatibility_score, result.simulation_summary
+                )
+            results.append(_batch_result(
+                row, simulation_id, result.compatibility_score, result.simulation_summary, False
+            ))
+
+    results.sort(key=lambda r: r['compatibility_score'], reverse=True)
+    for rank, result in enumerate(results, start=1):
+        result['rank'] = rank
+
+    return {"agent_id": agent_id, "results": results, "invalid_candidates": invalid}
+
+
+def _batch_result(
+    row: Dict[str, Any],
+    simulation_id: Optional[int],
+    compatibility_score: float,
+    simulation_summary: str,
+    cached: bool
+) -> Dict[str, Any]:
+    """Строка результата пакетной симуляции для кандидата"""
+    return {
+        "conversation_id": row['conversation_id'],
+        "agent_id": row['agent2_id'],
+        "user_id": row['agent2_user_id'],
+        "simulation_id": simulation_id,
+        "compatibility_score": float(compatibility_score),
+        "simulation_summary": simulation_summary,
+        "cached": cached
+    }
+
+
+def claim_simulations(
+    worker_id: str,
+    limit: int = 1,
+    lease_seconds: int = DEFAULT_LEASE_SECONDS
+) -> List[AgentSimulations]:
+    """Захватить ожидающие симуляции для выполнения воркером"""
+    simulations_data = agents_simulations_repository.claim_simulations(worker_id, limit, lease_seconds)
+    simulations = _convert_db_simulation_list(simulations_data)
+    for simulation in simulations:
+        _publish_status(simulation)
+    return simulations
+
+
+def process_simulations(
+    simulations: List[AgentSimulations],
+    worker_id: str,
+    retry_delay_seconds: int = DEFAULT_RETRY_DELAY_SECONDS
+) -> None:
+    """
+    Выполнить захваченные симуляции одним прогоном движка: реплики всех симуляций
+    генерируются и сохраняются пачками по ходам; при ошибке симуляция
+    возвращается в очередь или завершается с ошибкой
+    """
+    from src.repository import user_agents_repository, agent_simulation_messages_repository
+    from src.services import agent_simulation_messages_services
+    from src.utils.simulation_engine import SimulationSpec, get_simulation_engine, simulation_cache_key
+
+    if not simulations:
+        return
+
+    agent_ids = {s.agent1_id for s in simulations} | {s.agent2_id for s in simulations}
+    agents = {a['id']: a for a in user_agents_repository.get_agents_by_ids(list(agent_ids))}
+
+    specs = []
+    for simulation in simulations:
+        permanent_error = _permanent_simulation_error(simulation, agents)
+        if permanent_error:
+            # Повтор не поможет: симуляция сразу завершается с ошибкой, без возврата в очередь
+            fail_simulation(simulation.id, permanent_error, {"attempts": simulation.attempts, "worker_id": worker_id})
+            continue
+        if simulation.attempts and simulation.attempts > 1:
+            # Повторная попытка: реплики прошлой попытки заменяются новыми
+            agent_simulation_messages_repository.delete_simulation_messages(simulation.id)
+        specs.append(SimulationSpec(
+            simulation_id=simulation.id,
+            agent1_id=simulation.agent1_id,
+            personality1=agents[simulation.agent1_id]['personality_data'],
+            agent2_id=simulation.agent2_id,
+            personality2=agents[simulation.agent2_id]['personality_data']
+        ))
+
+    by_id = {simulation.id: simulation for simulation in simulations}
+    specs_by_id = {spec.simulation_id: spec for spec in specs}
+    engine = get_simulation_engine()
+    try:
+        results = engine.run(
+            specs,
+            on_round=lambda turns: agent_simulation_messages_services.create_simulation_turns(
+                [asdict(turn) for turn in turns]
+            )
+        )
+    except Exception as e:
+        log.exception(f"Simulation engine failed for batch {[spec.simulation_id for spec in specs]}")
+        for spec in specs:
+            _handle_simulation_error(by_id[spec.simulation_id], worker_id, str(e), retry_delay_seconds)
+        return
+
+    for result in results:
+        if not agents_simulations_repository.complete_claimed_simulation(
+            result.simulation_id, worker_id, result.compatibility_score, result.simulation_summary
+        ):
+            log.warning(f"Simulation {result.simulation_id} lease was lost by worker {worker_id}, result discarded")
+            continue
+        spec = specs_by_id[result.simulation_id]
+        simulation_result_cache_repository.save_result(
+            simulation_cache_key(spec.personality1, spec.personality2, engine.version),
+            spec.agent1_id,
+            spec.agent2_id,
+            engine.version,
+            result.simulation_id,
+            result.compatibility_score,
+            result.simulation_summary
+        )
+        _publish_status(get_simulation_by_id(result.simulation_id))
+
+
+def _permanent_simulation_error(simulation: AgentSimulations, agents: Dict[int, Dict[str, Any]]) -> Optional[str]:
+    """Ошибка входных данных симуляции, которую не исправит повтор (агент удалён, личность не JSON-объект)"""
+    for agent_id in (simulation.agent1_id, simulation.agent2_id):
+        agent = agents.get(agent_id)
+        if agent is None:
+            return f"Simulation agent {agent_id} not found"
+        personality_data = agent['personality_data']
+        if isinstance(personality_data, (str, bytes)):
+            try:
+                personality_data = json.loads(personality_data)
+            except ValueError:
+                return f"Invalid personality data of agent {agent_id}"
+        if personality_data is not None and not isinstance(personality_data, dict):
+            return f"Invalid personality data of agent {agent_id}"
+    return None
+
+
+def _handle_simulation_error(
+    simulation: AgentSimulations,
+    worker_id: str,
+    error_message: str,
+    retry_delay_seconds: int
+) -> None:
+    """
+    Временная ошибка (сбой движка или БД): вернуть симуляцию в очередь с экспоненциальной
+    задержкой или завершить с ошибкой, если исчерпаны попытки (max_attempts строки —
+    тот же предел, что и при возврате по аренде)
+    """
+    if simulation.attempts >= (simulation.max_attempts or DEFAULT_MAX_ATTEMPTS):
+        fail_simulation(simulation.id, error_message, {"attempts": simulation.attempts, "worker_id": worker_id})
+        return
+
+    delay = retry_delay_seconds * 2 ** (simulation.attempts - 1)
+    if agents_simulations_repository.release_simulation(simulation.id, worker_id, error_message, delay):
+        _publish_status(get_simulation_by_id(simulation.id))
+
+
+def release_simulations(
+    simulations: List[AgentSimulations],
+    worker_id: str,
+    error_message: str,
+    retry_delay_seconds: int = DEFAULT_RETRY_DELAY_SECONDS
+) -> None:
+    """Вернуть в очередь (или завершить с ошибкой) захваченные симуляции после сбоя обработки"""
+    for simulation in simulations:
+        try:
+            # Часть пачки могла успеть завершиться до сбоя — такие симуляции не трогаем
+            current = get_simulation_by_id(simulation.id)
+            if current.simulation_status != SimulationStatusEnum.IN_PROGRESS:
+                continue
+            _handle_simulation_error(current, worker_id, error_message, retry_delay_seconds)
+        except Exception as e:
+            # Не отпущенная симуляция вернётся в очередь по истечении аренды
+            log.error(f"Failed to release simulation {simulation.id}: {str(e)}")
+
+
+def reclaim_expired_simulations(worker_id: str, retry_delay_seconds: int = DEFAULT_RETRY_DELAY_SECONDS) -> int:
+    """
+    Вернуть в очередь симуляции с истекшей арендой (упавший или зависший воркер);
+    симуляции, исчерпавшие попытки, завершаются с ошибкой по таймауту
+    """
+    exhausted_ids = agents_simulations_repository.reclaim_expired_simulations(worker_id, retry_delay_seconds)
+    for simulation_id in exhausted_ids:
+        fail_simulation(simulation_id, "Simulation timed out", {"worker_id": worker_id})
+    return len(exhausted_ids)
+
+
+def _resolve_partner_agent_id(user_id: int, match_id: int) -> int:
+    """Найти агента второго участника матча"""
+    from src.services import matches_services, user_agents_services
+
+    match = matches_services.get_match_by_id(match_id)
+    if user_id not in (match.user1_id, match.user2_id):
+        raise SimulationValidationError("Agent owner is not a participant of the conversation")
+
+    partner_user_id = match.user2_id if match.user1_id == user_id else match.user1_id
+    return user_agents_services.get_agent_by_user_id(partner_user_id).id
+
+
+def _publish_status(simulation: AgentSimulations) -> None:
+    """Опубликовать переход статуса симуляции подписчикам потока событий"""
+    simulation_hub.publish(simulation.id, "simulation.status", simulation.model_dump(mode="json"))
 
 
 def _convert_db_simulation(simulation_data: Dict[str, Any]) -> AgentSimulations:
     """Конвертировать данные из БД в Pydantic модель"""
-    simulation_data_json = (
-        json.loads(simulation_data['simulation_data'])
-        if isinstance(simulation_data.get('simulation_data'), str)
-        else simulation_data.get('simulation_data')
-    )
-    
-    return AgentSimulations(
-        ID=simulation_data['id'],
-        AgentID=simulation_data['agent_id'],
-        ConversationID=simulation_data['conversation_id'],
-        SimulationStatus=simulation_data['simulation_status'],
-        StartTime=simulation_data['start_time'],
-        EndTime=simulation_data['end_time'],
-        SimulationData=simulation_data_json,
-        CreatedAt=simulation_data['created_at'],
-        UpdatedAt=simulation_data['updated_at']
-    )
\ No newline at end of file
+    return db_model(AgentSimulations, simulation_data)
+
+
+def _convert_db_simulation_list(rows: List[Dict[str, Any]]) -> List[AgentSimulations]:
+    """Конвертировать строки из БД в список Pydantic моделей"""
+    return db_models(AgentSimulations, rows)
+
@@ -1,9 +1,14 @@
 from typing import Optional, Dict, Any, List
 from datetime import datetime
 from fastapi import HTTPException, status
-from src.repository import chat_conversations_repository
+from src.repository import (
+    chat_conversations_repository,
+    chat_unread_counters_repository,
+    chat_inbox_repository
+)
 from src.database.models import ChatConversations
 from src.utils.custom_logging import get_logger
+from src.utils.serialization import db_model, db_models
 
 log = get_logger(__name__)
 
@@ -28,7 +33,7 @@ class ConversationValidationError(HTTPException):
 def get_all_conversations() -> List[ChatConversations]:
     """Получить все беседы"""
     conversations_data = chat_conversations_repository.get_all_conversations()
-    return [_convert_db_conversation(conv) for conv in conversations_data]
+    return _convert_db_conversation_list(conversations_data)
 
 
 def get_conversation_by_id(conversation_id: int) -> ChatConversations:
@@ -52,17 +57,18 @@ def create_conversation(match_id: int) -> ChatConversations:
     # Проверяем, не существует ли уже беседа для этого матча
     try:
         existing = get_conversation_by_match_id(match_id)
-        raise ConversationValidationError(f"Conversation already exists for match {match_id} (ID: {existing.ID})")
+        raise ConversationValidationError(f"Conversation already exists for match {match_id} (ID: {existing.id})")
     except ConversationNotFoundError:
         pass
     
     conversation = ChatConversations(
-        MatchID=match_id,
-        LastMessageAt=datetime.now(),
-        CreatedAt=datetime.now()
+        match_id=match_id,
+        last_message_at=datetime.now(),
+        created_at=datetime.now()
     )
     
     conversation_id = chat_conversations_repository.create_conversation(conversation)
+    chat_inbox_repository.upsert_conversation_inbox(conversation_id)
     return get_conversation_by_id(conversation_id)
 
 
@@ -81,6 +87,7 @@ def update_conversation(conversation_id: int, updates: Dict[str, Any]) -> ChatCo
         raise ConversationValidationError("No valid fields to update")
     
     chat_conversations_repository.update_conversation(conversation_id, update_data)
+    chat_inbox_repository.update_last_message_time(conversation_id, update_data['last_message_at'])
     return get_conversation_by_id(conversation_id)
 
 
@@ -92,13 +99,25 @@ def update_last_message_time(conversation_id: int) -> ChatConversations:
 def delete_conversation(conversation_id: int) -> Dict[str, str]:
     """Удалить беседу по ID"""
     get_conversation_by_id(conversation_id)  # Проверяем существование
+    chat_unread_counters_repository.delete_conversation_counters(conversation_id)
+    chat_inbox_repository.delete_conversation_inbox(conversation_id)
     chat_conversations_repository.delete_conversation(conversation_id)
     return {"message": f"Conversation {conversation_id} deleted successfully"}
 
 
 def get_user_conversations(user_id: int) -> List[Dict[str, Any]]:
     """Получить все беседы пользователя с дополнительной информацией"""
-    return chat_conversations_repository.get_user_conversations(user_id)
+    return chat_inbox_repository.get_user_inbox(user_id)
+
+
+def rebuild_inbox() -> Dict[str, int]:
+    """Пересобрать входящие всех пользователей по текущим беседам"""
+    return {"updated_count": chat_inbox_repository.upsert_conversation_inbox()}
+
+
+def get_user_conversation_ids(user_id: int, conversation_ids: Optional[List[int]] = None) -> List[int]:
+    """Получить ID бесед, в которых участвует пользователь"""
+    return chat_conversations_repository.get_user_conversation_ids(user_id, conversation_ids)
 
 
 def get_active_conversations() -> List[Dict[str, Any]]:
@@ -156,9 +175,9 @@ def get_conversation_between_users(user1_id: int, user2_id: int) -> Optional[Cha
 
 def _convert_db_conversation(conversation_data: Dict[str, Any]) -> ChatConversations:
     """Конвертировать данные из БД в Pydantic модель"""
-    return ChatConversations(
-        ID=conversation_data['id'],
-        MatchID=conversation_data['match_id'],
-        LastMessageAt=conversation_data['last_message_at'],
-        CreatedAt=conversation_data['created_at']
-    )
\ No newline at end of file
+    return db_model(ChatConversations, conversation_data)
+
+
+def _convert_db_conversation_list(rows: List[Dict[str, Any]]) -> List[ChatConversations]:
+    """Конвертировать строки из БД в список Pydantic моделей"""
+    return db_models(ChatConversations, rows)
@@ -1,12 +1,29 @@
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Union
 from datetime import datetime
 from fastapi import HTTPException, status
-from src.repository import chat_messages_repository
+from fastapi.responses import Response
+from src.repository import (
+    chat_messages_repository,
+    chat_conversations_repository,
+    chat_unread_counters_repository,
+    chat_inbox_repository,
+    user_repository
+)
 from src.database.models import ChatMessages, MessageTypeEnum
 from src.utils.custom_logging import get_logger
+from src.utils.serialization import db_model, db_models
+from src.utils.projection import Fields, projected_response
+from src.utils.data_loader import expanded_response
+from src.utils.chat_hub import chat_hub
+from src.utils.fulltext import NGRAM_TOKEN_SIZE, to_boolean_query
 
 log = get_logger(__name__)
 
+# Связи, которые можно развернуть через ?expand= (отправитель — публичной карточкой)
+MESSAGE_RELATIONS = {
+    "sender_id": user_repository.get_user_cards_by_ids
+}
+
 
 class MessageNotFoundError(HTTPException):
     def __init__(self, message_id: int):
@@ -24,10 +41,22 @@ class MessageValidationError(HTTPException):
         )
 
 
-def get_all_messages() -> List[ChatMessages]:
-    """Получить все сообщения"""
-    messages_data = chat_messages_repository.get_all_messages()
-    return [_convert_db_message(msg) for msg in messages_data]
+def get_all_messages(
+    fields: Optional[Fields] = None,
+    expand: Optional[Fields] = None
+) -> Union[List[ChatMessages], Response]:
+    """
+    Получить все сообщения; с fields — разреженный JSON только с этими полями,
+    с expand — отправители вместо их ID (один запрос на всех отправителей списка)
+    """
+    if expand:
+        fields = tuple(dict.fromkeys(fields + expand)) if fields else None
+    messages_data = chat_messages_repository.get_all_messages(fields)
+    if expand:
+        return expanded_response(ChatMessages, messages_data, fields, {name: MESSAGE_RELATIONS[name] for name in expand})
+    if fields:
+        return projected_response(ChatMessages, messages_data, fields)
+    return _convert_db_message_list(messages_data)
 
 
 def get_message_by_id(message_id: int) -> ChatMessages:
@@ -47,7 +76,7 @@ def get_messages_by_conversation(
     messages_data = chat_messages_repository.get_messages_by_conversation(
         conversation_id, limit, offset
     )
-    return [_convert_db_message(msg) for msg in messages_data]
+    return _convert_db_message_list(messages_data)
 
 
 def create_message(
@@ -64,16 +93,26 @@ def create_message(
         raise MessageValidationError("Message is too long (max 2000 characters)")
     
     message = ChatMessages(
-        ConversationID=conversation_id,
-        SenderID=sender_id,
-        MessageText=message_text,
-        IsRead=False,
-        MessageType=message_type,
-        CreatedAt=datetime.now()
+        conversation_id=conversation_id,
+        sender_id=sender_id,
+        message_text=message_text,
+        is_read=False,
+        message_type=message_type,
+        created_at=datetime.now()
     )
     
-    message_id = chat_messages_repository.create_message(message)
-    return get_message_by_id(message_id)
+    # Счётчик увеличивается до вставки: сообщение, которое mark_messages_as_read отметит
+    # и вычтет сразу после вставки, к этому моменту уже учтено (GREATEST(..., 0) не съест +1)
+    _change_unread(conversation_id, sender_id, 1)
+    try:
+        message_id = chat_messages_repository.create_message(message)
+    except Exception:
+        _change_unread(conversation_id, sender_id, -1)
+        raise
+    created_message = get_message_by_id(message_id)
+    chat_inbox_repository.update_last_message(conversation_id, message_text, created_message.created_at)
+    chat_hub.publish(conversation_id, "message.created", created_message.model_dump(mode="json"))
+    return created_message
 
 
 def update_message(message_id: int, updates: Dict[str, Any]) -> ChatMessages:
@@ -103,13 +142,20 @@ def update_message(message_id: int, updates: Dict[str, Any]) -> ChatMessages:
         raise MessageValidationError("No valid fields to update")
     
     chat_messages_repository.update_message(message_id, update_data)
+    if 'message_text' in update_data:
+        chat_inbox_repository.upsert_conversation_inbox(existing.conversation_id)
+    if 'is_read' in update_data and bool(update_data['is_read']) != existing.is_read:
+        _change_unread(existing.conversation_id, existing.sender_id, -1 if update_data['is_read'] else 1)
     return get_message_by_id(message_id)
 
 
 def delete_message(message_id: int) -> Dict[str, str]:
     """Удалить сообщение по ID"""
-    get_message_by_id(message_id)  # Проверяем существование
+    existing = get_message_by_id(message_id)
     chat_messages_repository.delete_message(message_id)
+    chat_inbox_repository.upsert_conversation_inbox(existing.conversation_id)
+    if not existing.is_read:
+        _change_unread(existing.conversation_id, existing.sender_id, -1)
     return {"message": f"Message {message_id} deleted successfully"}
 
 
@@ -119,6 +165,12 @@ def mark_messages_as_read(conversation_id: int, user_id: int) -> Dict[str, int]:
     для указанного пользователя (исключая его собственные сообщения)
     """
     updated_count = chat_messages_repository.mark_messages_as_read(conversation_id, user_id)
+    if updated_count:
+        chat_hub.publish(conversation_id, "messages.read", {
+            "reader_id": user_id,
+            "updated_count": updated_count,
+            "read_at": datetime.now().isoformat()
+        })
     return {"updated_count": updated_count}
 
 
@@ -127,19 +179,38 @@ def count_unread_messages(user_id: int) -> Dict[str, Any]:
     Подсчитать непрочитанные сообщения для пользователя 
     по всем беседам и для каждой беседы
     """
-    return chat_messages_repository.count_unread_messages(user_id)
+    counters = get_unread_counters(user_id)
+    return {
+        "total_unread": sum(counters.values()),
+        "by_conversation": counters
+    }
+
+
+def get_unread_counters(user_id: int) -> Dict[int, int]:
+    """
+    Получить счётчики непрочитанных сообщений пользователя по беседам
+    (чтение по первичному ключу, без локального кэша — счётчики меняют все воркеры)
+    """
+    rows = chat_unread_counters_repository.get_user_unread_counters(user_id)
+    return {row['conversation_id']: row['unread_count'] for row in rows}
+
+
+def rebuild_unread_counters() -> Dict[str, int]:
+    """Пересчитать счётчики непрочитанных сообщений по истории сообщений"""
+    updated_count = chat_unread_counters_repository.rebuild_unread_counters()
+    return {"updated_count": updated_count}
 
 
 def get_agent_simulation_messages(conversation_id: int) -> List[ChatMessages]:
     """Получить сообщения агентов в конкретной беседе"""
     messages_data = chat_messages_repository.get_agent_simulation_messages(conversation_id)
-    return [_convert_db_message(msg) for msg in messages_data]
+    return _convert_db_message_list(messages_data)
 
 
 def get_user_messages(user_id: int, limit: int = 50, offset: int = 0) -> List[ChatMessages]:
     """Получить все сообщения, отправленные пользователем"""
     messages_data = chat_messages_repository.get_user_messages(user_id, limit, offset)
-    return [_convert_db_message(msg) for msg in messages_data]
+    return _convert_db_message_list(messages_data)
 
 
 def get_conversation_statistics(conversation_id: int) -> Dict[str, Any]:
@@ -150,16 +221,29 @@ def get_conversation_statistics(conversation_id: int) -> Dict[str, Any]:
 def get_recent_messages(hours: int = 24) -> List[ChatMessages]:
     """Получить сообщения за последние часы"""
     messages_data = chat_messages_repository.get_recent_messages(hours)
-    return [_convert_db_message(msg) for msg in messages_data]
+    return _convert_db_message_list(messages_data)
 
 
-def search_messages(search_term: str, conversation_id: int = None) -> List[ChatMessages]:
-    """Поиск сообщений по тексту"""
+def search_messages(
+    search_term: str,
+    conversation_id: int = None,
+    limit: int = 50,
+    offset: int = 0
+) -> List[ChatMessages]:
+    """Поиск сообщений по тексту (отсортированы по релевантности)"""
     if not search_term or len(search_term.strip()) < 3:
         raise MessageValidationError("Search term must be at least 3 characters long")
     
-    messages_data = chat_messages_repository.search_messages(search_term, conversation_id)
-    return [_convert_db_message(msg) for msg in messages_data]
+    boolean_query = to_boolean_query(search_term)
+    if not boolean_query:
+        raise MessageValidationError(
+            f"Search term must contain at least one word of {NGRAM_TOKEN_SIZE} or more characters"
+        )
+    
+    messages_data = chat_messages_repository.search_messages(
+        boolean_query, conversation_id, limit, offset
+    )
+    return _convert_db_message_list(messages_data)
 
 
 def get_last_message_in_conversation(conversation_id: int) -> Optional[ChatMessages]:
@@ -168,14 +252,23 @@ def get_last_message_in_conversation(conversation_id: int) -> Optional[ChatMessa
     return _convert_db_message(message_data) if message_data else None
 
 
+def _change_unread(conversation_id: int, sender_id: int, delta: int) -> None:
+    """Изменить счётчики непрочитанных у всех участников беседы, кроме отправителя"""
+    row = chat_conversations_repository.get_conversation_participants(conversation_id)
+    if not row:
+        return
+
+    for user_id in {row['user1_id'], row['user2_id']}:
+        if user_id == sender_id:
+            continue
+        chat_unread_counters_repository.increment_unread(conversation_id, user_id, delta)
+
+
 def _convert_db_message(message_data: Dict[str, Any]) -> ChatMessages:
     """Конвертировать данные из БД в Pydantic модель"""
-    return ChatMessages(
-        ID=message_data['id'],
-        ConversationID=message_data['conversation_id'],
-        SenderID=message_data['sender_id'],
-        MessageText=message_data['message_text'],
-        IsRead=message_data['is_read'],
-        MessageType=message_data['message_type'],
-        CreatedAt=message_data['created_at']
-    )
\ No newline at end of file
+    return db_model(ChatMessages, message_data)
+
+
+def _convert_db_message_list(rows: List[Dict[str, Any]]) -> List[ChatMessages]:
+    """Конвертировать строки из БД в список Pydantic моделей"""
+    return db_models(ChatMessages, rows)
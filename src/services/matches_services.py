@@ -1,9 +1,14 @@
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Sequence, Union
 from datetime import datetime
 from fastapi import HTTPException, status
-from src.repository import matches_repository
+from fastapi.responses import Response
+from src.repository import matches_repository, chat_inbox_repository, user_repository
 from src.database.models import Matches, MatchStatusEnum
 from src.utils.custom_logging import get_logger
+from src.utils.serialization import db_model, db_models, db_models_by
+from src.utils.projection import Fields, projected_response
+from src.utils.data_loader import expanded_response
+from src.utils.http_cache import table_version
 
 log = get_logger(__name__)
 
@@ -25,10 +30,29 @@ class MatchValidationError(HTTPException):
         )
 
 
-def get_all_matches() -> List[Matches]:
-    """Получить все совпадения (матчи)"""
-    matches_data = matches_repository.get_all_matches()
-    return [_convert_db_match(match) for match in matches_data]
+# Связи, которые можно развернуть через ?expand= (пользователи — публичными карточками)
+MATCH_RELATIONS = {
+    "user1_id": user_repository.get_user_cards_by_ids,
+    "user2_id": user_repository.get_user_cards_by_ids
+}
+
+
+def get_all_matches(
+    fields: Optional[Fields] = None,
+    expand: Optional[Fields] = None
+) -> Union[List[Matches], Response]:
+    """
+    Получить все совпадения (матчи); с fields — разреженный JSON только с этими полями,
+    с expand — пользователи вместо их ID (один запрос на всех пользователей списка)
+    """
+    if expand:
+        fields = tuple(dict.fromkeys(fields + expand)) if fields else None
+    matches_data = matches_repository.get_all_matches(fields)
+    if expand:
+        return expanded_response(Matches, matches_data, fields, {name: MATCH_RELATIONS[name] for name in expand})
+    if fields:
+        return projected_response(Matches, matches_data, fields)
+    return _convert_db_match_list(matches_data)
 
 
 def get_match_by_id(match_id: int) -> Matches:
@@ -39,6 +63,11 @@ def get_match_by_id(match_id: int) -> Matches:
     return _convert_db_match(match_data)
 
 
+def get_matches_by_ids(match_ids: Sequence[int]) -> Dict[int, Matches]:
+    """Получить матчи по списку ID одним запросом (ключ — ID матча)"""
+    return db_models_by(Matches, matches_repository.get_matches_by_ids(list(match_ids)))
+
+
 def check_match_exists(user1_id: int, user2_id: int) -> Optional[Matches]:
     """Проверить существование матча между двумя пользователями"""
     match_data = matches_repository.check_match_exists(user1_id, user2_id)
@@ -88,6 +117,7 @@ def update_match(match_id: int, updates: Dict[str, Any]) -> Matches:
     
     if update_data:
         matches_repository.update_match(match_id, update_data)
+        chat_inbox_repository.update_match_status(match_id, update_data['match_status'])
     
     return get_match_by_id(match_id)
 
@@ -164,6 +194,11 @@ def get_matches_count() -> Dict[str, int]:
     return matches_repository.get_matches_count()
 
 
+def get_matches_count_version() -> Optional[str]:
+    """Версия статистики матчей для ETag"""
+    return table_version(matches_repository.get_matches_version())
+
+
 def get_user_match_stats(user_id: int) -> Dict[str, Any]:
     """Получить статистику матчей для конкретного пользователя"""
     return matches_repository.get_user_match_stats(user_id)
@@ -192,12 +227,9 @@ def end_inactive_matches(days_inactive: int = 30) -> Dict[str, Any]:
 
 def _convert_db_match(match_data: Dict[str, Any]) -> Matches:
     """Конвертировать данные из БД в Pydantic модель"""
-    # Исправлено: используем строчные буквы для полей Pydantic модели
-    return Matches(
-        id=match_data.get('id'),
-        user1_id=match_data.get('user1_id'),
-        user2_id=match_data.get('user2_id'),
-        match_status=match_data.get('match_status', 'active'),  # По умолчанию 'active'
-        created_at=match_data.get('created_at'),
-        updated_at=match_data.get('updated_at')
-    )
\ No newline at end of file
+    return db_model(Matches, match_data)
+
+
+def _convert_db_match_list(rows: List[Dict[str, Any]]) -> List[Matches]:
+    """Конвертировать строки из БД в список Pydantic моделей"""
+    return db_models(Matches, rows)
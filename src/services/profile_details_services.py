@@ -1,9 +1,13 @@
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Sequence, Union
 from datetime import datetime
 from fastapi import HTTPException, status
-from src.repository import profile_details_repository
+from fastapi.responses import Response
+from src.repository import profile_details_repository, chat_inbox_repository
 from src.database.models import ProfileDetails
 from src.utils.custom_logging import get_logger
+from src.utils.serialization import db_model, db_models, db_models_by
+from src.utils.projection import Fields, projected_response
+from src.utils.http_cache import row_version, table_version
 from src.utils.validation import (
     validate_age, validate_gender, validate_bio, validate_url,
     validate_location, validate_interests, sanitize_input_dict,
@@ -30,10 +34,12 @@ class ProfileValidationError(HTTPException):
         )
 
 
-def get_all_profiles() -> List[ProfileDetails]:
-    """Получить все профили пользователей"""
-    profiles_data = profile_details_repository.get_all_profiles()
-    return [_convert_db_profile(profile) for profile in profiles_data]
+def get_all_profiles(fields: Optional[Fields] = None) -> Union[List[ProfileDetails], Response]:
+    """Получить все профили пользователей; с fields — разреженный JSON только с этими полями"""
+    profiles_data = profile_details_repository.get_all_profiles(fields)
+    if fields:
+        return projected_response(ProfileDetails, profiles_data, fields)
+    return _convert_db_profile_list(profiles_data)
 
 
 def get_profile_by_id(profile_id: int) -> ProfileDetails:
@@ -52,6 +58,22 @@ def get_profile_by_user_id(user_id: int) -> ProfileDetails:
     return _convert_db_profile(profile_data)
 
 
+def get_profiles_by_ids(profile_ids: Sequence[int]) -> Dict[int, ProfileDetails]:
+    """Получить профили по списку ID одним запросом (ключ — ID профиля)"""
+    return db_models_by(ProfileDetails, profile_details_repository.get_profiles_by_ids(list(profile_ids)))
+
+
+def get_profiles_by_user_ids(user_ids: Sequence[int]) -> Dict[int, ProfileDetails]:
+    """Получить профили по списку ID пользователей одним запросом (ключ — ID пользователя)"""
+    rows = profile_details_repository.get_profiles_by_user_ids(list(user_ids))
+    return db_models_by(ProfileDetails, rows, key="user_id")
+
+
+def get_profile_version(user_id: int) -> Optional[str]:
+    """Версия профиля пользователя для ETag"""
+    return row_version(profile_details_repository.get_profile_by_user_id(user_id))
+
+
 def create_profile(user_id: int, profile_data: Dict[str, Any]) -> ProfileDetails:
     """Создать новый профиль пользователя"""
     # Validate user_id
@@ -94,6 +116,8 @@ def create_profile(user_id: int, profile_data: Dict[str, Any]) -> ProfileDetails
     )
     
     profile_id = profile_details_repository.create_profile(profile)
+    if profile.profile_photo_url:
+        chat_inbox_repository.update_other_user_photo(user_id, profile.profile_photo_url)
     return get_profile_by_id(profile_id)
 
 
@@ -121,6 +145,8 @@ def update_profile(profile_id: int, updates: Dict[str, Any]) -> ProfileDetails:
     
     if update_data:
         profile_details_repository.update_profile(profile_id, update_data)
+        if 'profile_photo_url' in update_data:
+            chat_inbox_repository.update_other_user_photo(existing.user_id, update_data['profile_photo_url'])
     
     return get_profile_by_id(profile_id)
 
@@ -137,15 +163,16 @@ def update_user_profile(user_id: int, updates: Dict[str, Any]) -> ProfileDetails
 
 def delete_profile(profile_id: int) -> Dict[str, str]:
     """Удалить профиль по ID"""
-    get_profile_by_id(profile_id)  # Проверяем существование
+    existing = get_profile_by_id(profile_id)
     profile_details_repository.delete_profile(profile_id)
+    chat_inbox_repository.update_other_user_photo(existing.user_id, None)
     return {"message": f"Profile {profile_id} deleted successfully"}
 
 
 def delete_user_profile(user_id: int) -> Dict[str, str]:
     """Удалить профиль по ID пользователя"""
     profile = get_profile_by_user_id(user_id)
-    return delete_profile(profile.ID)
+    return delete_profile(profile.id)
 
 
 def get_profiles_by_age_range(min_age: int, max_age: int) -> List[ProfileDetails]:
@@ -154,37 +181,37 @@ def get_profiles_by_age_range(min_age: int, max_age: int) -> List[ProfileDetails
         raise ProfileValidationError("Age range must be between 18 and 120")
     
     profiles_data = profile_details_repository.get_profiles_by_age_range(min_age, max_age)
-    return [_convert_db_profile(profile) for profile in profiles_data]
+    return _convert_db_profile_list(profiles_data)
 
 
 def get_profiles_by_gender(gender: str) -> List[ProfileDetails]:
     """Получить профили по полу"""
     profiles_data = profile_details_repository.get_profiles_by_gender(gender)
-    return [_convert_db_profile(profile) for profile in profiles_data]
+    return _convert_db_profile_list(profiles_data)
 
 
 def get_profiles_by_location(location: str) -> List[ProfileDetails]:
     """Получить профили по местоположению"""
     profiles_data = profile_details_repository.get_profiles_by_location(location)
-    return [_convert_db_profile(profile) for profile in profiles_data]
+    return _convert_db_profile_list(profiles_data)
 
 
 def search_profiles_by_interests(interests: List[str]) -> List[ProfileDetails]:
     """Поиск профилей по интересам"""
     profiles_data = profile_details_repository.search_profiles_by_interests(interests)
-    return [_convert_db_profile(profile) for profile in profiles_data]
+    return _convert_db_profile_list(profiles_data)
 
 
 def get_profiles_with_photo() -> List[ProfileDetails]:
     """Получить профили с фотографиями"""
     profiles_data = profile_details_repository.get_profiles_with_photo()
-    return [_convert_db_profile(profile) for profile in profiles_data]
+    return _convert_db_profile_list(profiles_data)
 
 
 def get_incomplete_profiles() -> List[ProfileDetails]:
     """Получить неполные профили (без важных данных)"""
     profiles_data = profile_details_repository.get_incomplete_profiles()
-    return [_convert_db_profile(profile) for profile in profiles_data]
+    return _convert_db_profile_list(profiles_data)
 
 
 def get_profile_completion_stats() -> Dict[str, Any]:
@@ -192,6 +219,11 @@ def get_profile_completion_stats() -> Dict[str, Any]:
     return profile_details_repository.get_profile_completion_stats()
 
 
+def get_profile_completion_version() -> Optional[str]:
+    """Версия статистики заполнения профилей для ETag"""
+    return table_version(profile_details_repository.get_profiles_version())
+
+
 def get_profile_recommendations(user_id: int, limit: int = 10) -> List[Dict[str, Any]]:
     """Получить рекомендации профилей для пользователя"""
     try:
@@ -201,9 +233,9 @@ def get_profile_recommendations(user_id: int, limit: int = 10) -> List[Dict[str,
         
         # Формируем параметры поиска на основе предпочтений
         search_params = {
-            'min_age': preferences.AgeMin or 18,
-            'max_age': preferences.AgeMax or 100,
-            'gender': preferences.PreferredGenders[0] if preferences.PreferredGenders else None,
+            'min_age': preferences.age_min or 18,
+            'max_age': preferences.age_max or 100,
+            'gender': preferences.preferred_genders[0] if preferences.preferred_genders else None,
             'interests': user_profile.Interests.split(', ') if user_profile.Interests else []
         }
         
@@ -222,15 +254,9 @@ def get_profile_recommendations(user_id: int, limit: int = 10) -> List[Dict[str,
 
 def _convert_db_profile(profile_data: Dict[str, Any]) -> ProfileDetails:
     """Конвертировать данные из БД в Pydantic модель"""
-    return ProfileDetails(
-        id=profile_data.get('id'),
-        user_id=profile_data.get('user_id'),
-        age=profile_data.get('age'),
-        gender=profile_data.get('gender'),
-        interests=profile_data.get('interests'),
-        bio=profile_data.get('bio'),
-        profile_photo_url=profile_data.get('profile_photo_url'),
-        location=profile_data.get('location'),
-        created_at=profile_data.get('created_at'),
-        updated_at=profile_data.get('updated_at')
-    )
\ No newline at end of file
+    return db_model(ProfileDetails, profile_data)
+
+
+def _convert_db_profile_list(rows: List[Dict[str, Any]]) -> List[ProfileDetails]:
+    """Конвертировать строки из БД в список Pydantic моделей"""
+    return db_models(ProfileDetails, rows)
@@ -1,14 +1,24 @@
-from typing import Optional, Dict, Any, List
-from datetime import datetime
+from typing import Optional, Dict, Any, List, Sequence, Tuple, Union
+from datetime import datetime, timedelta
 import json
+import time
 from fastapi import HTTPException, status
-from src.repository import user_agents_repository
+from fastapi.responses import Response
+from src.repository import user_agents_repository, agent_personality_features_repository
 from src.database.models import UserAgents, LearningStatusEnum
 from src.utils.custom_logging import get_logger
+from src.utils.serialization import db_model, db_models, db_models_by
+from src.utils.projection import Fields, projected_response
+from src.utils.http_cache import row_version
 from src.utils.validation import validate_personality_data, ValidationError
+from src.utils.retraining_scheduler import retraining_priority
 
 log = get_logger(__name__)
 
+# Как часто индекс сходства догружает изменения агентов из БД и с каким перекрытием окна
+INDEX_SYNC_INTERVAL_SECONDS = 5.0
+INDEX_SYNC_OVERLAP_SECONDS = 5
+
 
 class AgentNotFoundError(HTTPException):
     def __init__(self, agent_id: int = None, user_id: int = None):
@@ -27,10 +37,12 @@ class AgentValidationError(HTTPException):
         )
 
 
-def get_all_agents() -> List[UserAgents]:
-    """Получить всех агентов пользователей"""
-    agents_data = user_agents_repository.get_all_agents()
-    return [_convert_db_agent(agent) for agent in agents_data]
+def get_all_agents(fields: Optional[Fields] = None) -> Union[List[UserAgents], Response]:
+    """Получить всех агентов пользователей; с fields — разреженный JSON только с этими полями"""
+    agents_data = user_agents_repository.get_all_agents(fields)
+    if fields:
+        return projected_response(UserAgents, agents_data, fields)
+    return _convert_db_agent_list(agents_data)
 
 
 def get_agent_by_id(agent_id: int) -> UserAgents:
@@ -41,6 +53,11 @@ def get_agent_by_id(agent_id: int) -> UserAgents:
     return _convert_db_agent(agent_data)
 
 
+def get_agent_version(agent_id: int) -> Optional[str]:
+    """Версия агента для ETag"""
+    return row_version(user_agents_repository.get_agent_by_id(agent_id))
+
+
 def get_agent_by_user_id(user_id: int) -> UserAgents:
     """Получить агента по ID пользователя"""
     agent_data = user_agents_repository.get_agent_by_user_id(user_id)
@@ -49,6 +66,17 @@ def get_agent_by_user_id(user_id: int) -> UserAgents:
     return _convert_db_agent(agent_data)
 
 
+def get_agents_by_ids(agent_ids: Sequence[int]) -> Dict[int, UserAgents]:
+    """Получить агентов по списку ID одним запросом (ключ — ID агента)"""
+    return db_models_by(UserAgents, user_agents_repository.get_agents_by_ids(list(agent_ids)))
+
+
+def get_agents_by_user_ids(user_ids: Sequence[int]) -> Dict[int, UserAgents]:
+    """Получить агентов по списку ID пользователей одним запросом (ключ — ID пользователя)"""
+    rows = user_agents_repository.get_agents_by_user_ids(list(user_ids))
+    return db_models_by(UserAgents, rows, key="user_id")
+
+
 def create_agent(user_id: int, personality_data: Dict[str, Any]) -> UserAgents:
     """Создать нового агента для пользователя"""
     # Validate input
@@ -69,6 +97,7 @@ def create_agent(user_id: int, personality_data: Dict[str, Any]) -> UserAgents:
     )
 
     agent_id = user_agents_repository.create_agent(agent)
+    _store_features([(agent_id, personality_data)])
     return get_agent_by_id(agent_id)
 
 
@@ -102,7 +131,14 @@ def update_agent(agent_id: int, updates: Dict[str, Any]) -> UserAgents:
     update_data['last_updated_at'] = datetime.now()
     
     user_agents_repository.update_agent(agent_id, update_data)
-    return get_agent_by_id(agent_id)
+    updated_agent = get_agent_by_id(agent_id)
+    _sync_agent_index(updated_agent)
+    if 'personality_data' in update_data:
+        _store_features([(agent_id, updated_agent.personality_data)])
+        # Результаты симуляций с прежней личностью больше не актуальны
+        from src.services import agents_simulations_services
+        agents_simulations_services.invalidate_agent_results(agent_id)
+    return updated_agent
 
 
 def update_agent_status(agent_id: int, status: LearningStatusEnum) -> UserAgents:
@@ -119,6 +155,8 @@ def delete_agent(agent_id: int) -> Dict[str, str]:
     """Удалить агента"""
     get_agent_by_id(agent_id)  # Проверяем существование
     user_agents_repository.delete_agent(agent_id)
+    from src.utils.personality_index import personality_index
+    personality_index.remove(agent_id)
     return {"message": f"Agent {agent_id} deleted successfully"}
 
 
@@ -131,19 +169,43 @@ def delete_user_agent(user_id: int) -> Dict[str, str]:
 def get_ready_agents() -> List[UserAgents]:
     """Получить всех агентов со статусом 'ready'"""
     agents_data = user_agents_repository.get_ready_agents()
-    return [_convert_db_agent(agent) for agent in agents_data]
+    return _convert_db_agent_list(agents_data)
 
 
 def get_learning_agents() -> List[UserAgents]:
     """Получить всех агентов со статусом 'learning'"""
     agents_data = user_agents_repository.get_learning_agents()
-    return [_convert_db_agent(agent) for agent in agents_data]
+    return _convert_db_agent_list(agents_data)
 
 
 def get_agents_requiring_update(days_threshold: int = 7) -> List[UserAgents]:
-    """Получить агентов, требующих обновления (не обновлялись более N дней)"""
+    """Получить агентов, требующих обновления (не обновлялись более N дней), в порядке приоритета"""
     agents_data = user_agents_repository.get_agents_requiring_update(days_threshold)
-    return [_convert_db_agent(agent) for agent in agents_data]
+    now = datetime.now()
+    agents_data.sort(key=lambda agent: retraining_priority(agent, now), reverse=True)
+    return _convert_db_agent_list(agents_data)
+
+
+def get_retraining_candidates(days_threshold: int = 7) -> List[Dict[str, Any]]:
+    """
+    Получить агентов на переобучение — устаревших и с необработанными данными обучения —
+    с приоритетом, по убыванию приоритета
+    """
+    agents_data = user_agents_repository.get_agents_requiring_update(days_threshold, include_unprocessed=True)
+    now = datetime.now()
+    candidates = [
+        {
+            "agent_id": agent['id'],
+            "user_id": agent['user_id'],
+            "priority": retraining_priority(agent, now),
+            "last_activity": agent['last_activity'],
+            "last_updated_at": agent['last_updated_at'],
+            "unprocessed_count": int(agent['unprocessed_count']),
+            "pending_simulations": int(agent['pending_simulations'])
+        }
+        for agent in agents_data
+    ]
+    return sorted(candidates, key=lambda candidate: candidate['priority'], reverse=True)
 
 
 def get_agents_stats() -> Dict[str, Any]:
@@ -152,29 +214,62 @@ def get_agents_stats() -> Dict[str, Any]:
 
 
 def find_similar_agents(agent_id: int, threshold: float = 0.5, limit: int = 10) -> List[Dict[str, Any]]:
-    """Найти агентов с похожими характеристиками личности"""
+    """Найти агентов с похожими характеристиками личности (поиск ближайших соседей по индексу)"""
+    # Индекс и признаки тянут numpy — загружаются при первом обращении, а не при старте сервера
+    from src.utils.personality_index import personality_index, encode_personality
     try:
         agent = get_agent_by_id(agent_id)
-        return user_agents_repository.find_similar_agents(
-            agent_id,
-            threshold,
-            limit
-        )
     except AgentNotFoundError:
         return []
 
+    _ensure_index_loaded()
+    neighbours = personality_index.search(
+        encode_personality(agent.personality_data),
+        k=limit,
+        threshold=threshold,
+        exclude=agent_id
+    )
+    if not neighbours:
+        return []
+
+    scores = dict(neighbours)
+    agents_data = user_agents_repository.get_ready_agents_by_ids(list(scores))
+    for agent_data in agents_data:
+        agent_data['similarity_score'] = round(scores[agent_data['id']], 4)
+    return sorted(agents_data, key=lambda a: a['similarity_score'], reverse=True)
+
 
 def train_agent(agent_id: int, training_data: Dict[str, Any]) -> UserAgents:
-    """Обучить агента на новых данных"""
-    agent = get_agent_by_id(agent_id)
-    
-    # Здесь должна быть логика обработки тренировочных данных
-    # В реальном приложении это может включать вызов ML модели
-    
-    # Обновляем данные личности (упрощенный пример)
-    updated_personality = {**agent.personality_data, **training_data}
-    
-    return update_agent_personality(agent_id, updated_personality)
+    """
+    Обучить агента на новых данных: данные сохраняются как запись обучения
+    и сворачиваются в накопленные агрегаты вместе с остальными необработанными записями агента
+    """
+    get_agent_by_id(agent_id)
+
+    from src.services import agent_learning_data_services
+    agent_learning_data_services.create_learning_data({
+        'agent_id': agent_id,
+        'data_type': 'message_history' if 'messages' in training_data else 'preferences',
+        'data_content': training_data,
+        'source': 'train_agent'
+    })
+    agent_learning_data_services.process_learning_batch(agent_id=agent_id)
+    return get_agent_by_id(agent_id)
+
+
+def touch_agent(agent_id: int) -> None:
+    """Отметить агента как обновлённого без изменения личности"""
+    user_agents_repository.touch_agent(agent_id)
+
+
+def refresh_trained_agents(agent_ids: List[int]) -> None:
+    """Обновить индекс сходства и кеш симуляций после изменения личностей конвейером обучения"""
+    from src.services import agents_simulations_services
+    agents = _convert_db_agent_list(user_agents_repository.get_agents_by_ids(agent_ids))
+    _store_features([(agent.id, agent.personality_data) for agent in agents])
+    for agent in agents:
+        _sync_agent_index(agent)
+        agents_simulations_services.invalidate_agent_results(agent.id)
 
 
 def reset_agent_learning(agent_id: int) -> UserAgents:
@@ -194,15 +289,120 @@ def reset_agent_learning(agent_id: int) -> UserAgents:
     })
 
 
+def get_agent_features(agent_id: int) -> Dict[str, Any]:
+    """Получить извлечённые признаки личности агента"""
+    features = agent_personality_features_repository.get_features(agent_id)
+    if not features:
+        agent = get_agent_by_id(agent_id)
+        _store_features([(agent.id, agent.personality_data)])
+        features = agent_personality_features_repository.get_features(agent_id)
+    features.pop('embedding', None)
+    return features
+
+
+def get_features_stats() -> Dict[str, Any]:
+    """Получить сводку признаков личности агентов"""
+    return agent_personality_features_repository.get_feature_stats()
+
+
+def rebuild_personality_features(chunk_size: int = 1000) -> Dict[str, int]:
+    """Пересчитать признаки личности всех агентов пакетами по chunk_size"""
+    from src.utils.personality_features import FEATURE_VERSION, extract_features
+    last_id = 0
+    total = 0
+    while True:
+        rows = agent_personality_features_repository.get_agent_personalities_after(last_id, chunk_size)
+        if not rows:
+            break
+        total += agent_personality_features_repository.save_features(
+            [(row['id'], extract_features(row['personality_data'])) for row in rows]
+        )
+        last_id = rows[-1]['id']
+    log.info(f"Personality features rebuilt for {total} agents")
+    return {"agents": total, "feature_version": FEATURE_VERSION}
+
+
+def _ensure_index_loaded() -> None:
+    """
+    Построить индекс сходства при первом обращении, затем не чаще раза в
+    INDEX_SYNC_INTERVAL_SECONDS догружать изменения из БД: личности меняют и другие
+    процессы (воркеры обучения, другие воркеры сервера), их индекс в памяти сюда не попадает
+    """
+    from src.utils.personality_index import personality_index
+    from src.utils.personality_features import FEATURE_VERSION
+    if personality_index.loaded:
+        if time.monotonic() - personality_index.synced_at >= INDEX_SYNC_INTERVAL_SECONDS:
+            _sync_index_changes()
+        return
+    # Отметка берётся до чтения векторов: изменения во время построения догрузятся следующей синхронизацией
+    watermark = agent_personality_features_repository.get_embeddings_watermark()
+    rows = agent_personality_features_repository.get_ready_agent_embeddings(FEATURE_VERSION)
+    personality_index.build(
+        (row['id'], _row_embedding(row))
+        for row in rows
+    )
+    personality_index.watermark = watermark
+    personality_index.synced_at = time.monotonic()
+    log.info(f"Personality index built for {len(personality_index)} agents")
+
+
+def _sync_index_changes() -> None:
+    """Применить к индексу изменения агентов и признаков, записанные после отметки индекса"""
+    from src.utils.personality_index import personality_index
+    from src.utils.personality_features import FEATURE_VERSION
+    personality_index.synced_at = time.monotonic()
+    if personality_index.watermark is None:
+        return
+    # Перекрытие окна: строки с тем же временем, закоммиченные позже, не теряются (upsert идемпотентен)
+    since = personality_index.watermark - timedelta(seconds=INDEX_SYNC_OVERLAP_SECONDS)
+    rows = agent_personality_features_repository.get_agent_embeddings_changed_since(since, FEATURE_VERSION)
+    for row in rows:
+        if row['learning_status'] == LearningStatusEnum.READY.value:
+            personality_index.upsert(row['id'], _row_embedding(row))
+        else:
+            personality_index.remove(row['id'])
+        if row['changed_at'] and row['changed_at'] > personality_index.watermark:
+            personality_index.watermark = row['changed_at']
+
+
+def _row_embedding(row: Dict[str, Any]):
+    """Вектор из сохранённых признаков, а для агентов без актуальных признаков — из personality_data"""
+    from src.utils.personality_index import encode_personality
+    from src.utils.personality_features import decode_embedding
+    embedding = decode_embedding(row.get('embedding'))
+    if embedding is None:
+        embedding = encode_personality(_load_personality(row['personality_data']))
+    return embedding
+
+
+def _store_features(agents: List[Tuple[int, Any]]) -> None:
+    """Извлечь и сохранить признаки личности после её записи"""
+    from src.utils.personality_features import extract_features
+    agent_personality_features_repository.save_features(
+        [(agent_id, extract_features(personality_data)) for agent_id, personality_data in agents]
+    )
+
+
+def _sync_agent_index(agent: UserAgents) -> None:
+    """Обновить вектор агента в индексе сходства после изменения"""
+    from src.utils.personality_index import personality_index, encode_personality
+    if not personality_index.loaded:
+        return
+    if agent.learning_status == LearningStatusEnum.READY:
+        personality_index.upsert(agent.id, encode_personality(agent.personality_data))
+    else:
+        personality_index.remove(agent.id)
+
+
+def _load_personality(personality_data: Any) -> Dict[str, Any]:
+    return json.loads(personality_data) if isinstance(personality_data, str) else personality_data
+
+
 def _convert_db_agent(agent_data: Dict[str, Any]) -> UserAgents:
     """Конвертировать данные из БД в Pydantic модель"""
-    personality_data = json.loads(agent_data['personality_data']) if isinstance(agent_data['personality_data'], str) else agent_data['personality_data']
-    
-    return UserAgents(
-        id=agent_data['id'],
-        user_id=agent_data['user_id'],
-        personality_data=personality_data,
-        learning_status=agent_data['learning_status'],
-        last_updated_at=agent_data['last_updated_at'],
-        created_at=agent_data['created_at']
-    )
\ No newline at end of file
+    return db_model(UserAgents, agent_data)
+
+
+def _convert_db_agent_list(rows: List[Dict[str, Any]]) -> List[UserAgents]:
+    """Конвертировать строки из БД в список Pydantic моделей"""
+    return db_models(UserAgents, rows)
@@ -4,6 +4,7 @@ from fastapi import HTTPException, status
 from src.repository import user_conversation_feedback_repository
 from src.database.models import UserConversationFeedback
 from src.utils.custom_logging import get_logger
+from src.utils.serialization import db_model, db_models
 
 log = get_logger(__name__)
 
@@ -35,7 +36,7 @@ class DuplicateFeedbackError(HTTPException):
 def get_all_feedback() -> List[UserConversationFeedback]:
     """Получить все записи обратной связи о беседах"""
     feedback_data = user_conversation_feedback_repository.get_all_feedback()
-    return [_convert_db_feedback(fb) for fb in feedback_data]
+    return _convert_db_feedback_list(feedback_data)
 
 
 def get_feedback_by_id(feedback_id: int) -> UserConversationFeedback:
@@ -55,13 +56,13 @@ def get_feedback_by_user_conversation(user_id: int, conversation_id: int) -> Opt
 def create_feedback(feedback: UserConversationFeedback) -> UserConversationFeedback:
     """Создать новую запись обратной связи"""
     # Проверка валидности оценки
-    if feedback.Rating is not None and (feedback.Rating < 1 or feedback.Rating > 5):
+    if feedback.rating is not None and (feedback.rating < 1 or feedback.rating > 5):
         raise FeedbackValidationError("Rating must be between 1 and 5")
     
     # Проверка существования отзыва
-    existing = get_feedback_by_user_conversation(feedback.UserID, feedback.ConversationID)
+    existing = get_feedback_by_user_conversation(feedback.user_id, feedback.conversation_id)
     if existing:
-        raise DuplicateFeedbackError(feedback.UserID, feedback.ConversationID)
+        raise DuplicateFeedbackError(feedback.user_id, feedback.conversation_id)
     
     feedback_id = user_conversation_feedback_repository.create_feedback(feedback)
     return get_feedback_by_id(feedback_id)
@@ -100,13 +101,13 @@ def delete_feedback(feedback_id: int) -> Dict[str, str]:
 def get_conversation_feedback(conversation_id: int) -> List[UserConversationFeedback]:
     """Получить все отзывы о конкретной беседе"""
     feedback_data = user_conversation_feedback_repository.get_conversation_feedback(conversation_id)
-    return [_convert_db_feedback(fb) for fb in feedback_data]
+    return _convert_db_feedback_list(feedback_data)
 
 
 def get_user_feedback(user_id: int) -> List[UserConversationFeedback]:
     """Получить все отзывы, оставленные пользователем"""
     feedback_data = user_conversation_feedback_repository.get_user_feedback(user_id)
-    return [_convert_db_feedback(fb) for fb in feedback_data]
+    return _convert_db_feedback_list(feedback_data)
 
 
 def get_average_conversation_rating(conversation_id: int) -> float:
@@ -137,28 +138,26 @@ def upsert_feedback(user_id: int, conversation_id: int, rating: int, feedback_te
     existing = get_feedback_by_user_conversation(user_id, conversation_id)
     
     if existing:
-        return update_feedback(existing.ID, {
+        return update_feedback(existing.id, {
             'Rating': rating,
             'FeedbackText': feedback_text
         })
     else:
         new_feedback = UserConversationFeedback(
-            UserID=user_id,
-            ConversationID=conversation_id,
-            Rating=rating,
-            FeedbackText=feedback_text,
-            CreatedAt=datetime.now()
+            user_id=user_id,
+            conversation_id=conversation_id,
+            rating=rating,
+            feedback_text=feedback_text,
+            created_at=datetime.now()
         )
         return create_feedback(new_feedback)
 
 
 def _convert_db_feedback(feedback_data: Dict[str, Any]) -> UserConversationFeedback:
     """Конвертировать данные из БД в Pydantic модель"""
-    return UserConversationFeedback(
-        ID=feedback_data['id'],
-        UserID=feedback_data['user_id'],
-        ConversationID=feedback_data['conversation_id'],
-        Rating=feedback_data['rating'],
-        FeedbackText=feedback_data['feedback_text'],
-        CreatedAt=feedback_data['created_at']
-    )
\ No newline at end of file
+    return db_model(UserConversationFeedback, feedback_data)
+
+
+def _convert_db_feedback_list(rows: List[Dict[str, Any]]) -> List[UserConversationFeedback]:
+    """Конвертировать строки из БД в список Pydantic моделей"""
+    return db_models(UserConversationFeedback, rows)
@@ -4,6 +4,7 @@ from fastapi import HTTPException, status
 from src.repository import user_likes_repository
 from src.database.models import UserLikes
 from src.utils.custom_logging import get_logger
+from src.utils.serialization import db_model, db_models
 
 log = get_logger(__name__)
 
@@ -35,7 +36,7 @@ class LikeValidationError(HTTPException):
 def get_all_likes() -> List[UserLikes]:
     """Получить все лайки между пользователями"""
     likes_data = user_likes_repository.get_all_likes()
-    return [_convert_db_like(like) for like in likes_data]
+    return _convert_db_like_list(likes_data)
 
 
 def get_like_by_id(like_id: int) -> UserLikes:
@@ -88,13 +89,13 @@ def delete_user_like(from_user_id: int, to_user_id: int) -> Dict[str, str]:
 def get_likes_from_user(user_id: int) -> List[UserLikes]:
     """Получить все лайки, поставленные пользователем"""
     likes_data = user_likes_repository.get_likes_from_user(user_id)
-    return [_convert_db_like(like) for like in likes_data]
+    return _convert_db_like_list(likes_data)
 
 
 def get_likes_to_user(user_id: int) -> List[UserLikes]:
     """Получить все лайки, полученные пользователем"""
     likes_data = user_likes_repository.get_likes_to_user(user_id)
-    return [_convert_db_like(like) for like in likes_data]
+    return _convert_db_like_list(likes_data)
 
 
 def check_mutual_like(user1_id: int, user2_id: int) -> bool:
@@ -128,7 +129,7 @@ def count_likes_to_user(user_id: int) -> int:
 def get_recent_likes(hours: int = 24) -> List[UserLikes]:
     """Получить список недавних лайков за указанное количество часов"""
     likes_data = user_likes_repository.get_recent_likes(hours)
-    return [_convert_db_like(like) for like in likes_data]
+    return _convert_db_like_list(likes_data)
 
 
 def check_and_create_match(from_user_id: int, to_user_id: int) -> Optional[Dict[str, Any]]:
@@ -159,9 +160,9 @@ def get_user_likes_stats(user_id: int) -> Dict[str, Any]:
 
 def _convert_db_like(like_data: Dict[str, Any]) -> UserLikes:
     """Конвертировать данные из БД в Pydantic модель"""
-    return UserLikes(
-        id=like_data['id'],
-        from_user_id=like_data['from_user_id'],
-        to_user_id=like_data['to_user_id'],
-        created_at=like_data['created_at']
-    )
\ No newline at end of file
+    return db_model(UserLikes, like_data)
+
+
+def _convert_db_like_list(rows: List[Dict[str, Any]]) -> List[UserLikes]:
+    """Конвертировать строки из БД в список Pydantic моделей"""
+    return db_models(UserLikes, rows)
@@ -1,10 +1,11 @@
 from typing import Optional, Dict, Any, List
 from datetime import datetime
-import json
 from fastapi import HTTPException, status
 from src.repository import user_preferences_repository
 from src.database.models import UserPreferences
 from src.utils.custom_logging import get_logger
+from src.utils.serialization import db_model
+from src.utils.http_cache import row_version
 
 log = get_logger(__name__)
 
@@ -41,6 +42,11 @@ def get_preferences_by_user(user_id: int) -> UserPreferences:
     return _convert_db_preferences(pref_data)
 
 
+def get_preferences_version(user_id: int) -> Optional[str]:
+    """Версия предпочтений пользователя для ETag"""
+    return row_version(user_preferences_repository.get_preference_by_user_id(user_id))
+
+
 def create_preferences(user_id: int, preferences: UserPreferences) -> UserPreferences:
     """Создать новые предпочтения для пользователя"""
     # Проверяем, что пользователь существует и у него еще нет предпочтений
@@ -129,7 +135,7 @@ def delete_preferences(user_id: int) -> Dict[str, str]:
     """Удалить предпочтения пользователя"""
     try:
         pref = get_preferences_by_user(user_id)
-        user_preferences_repository.delete_preference(pref.ID)
+        user_preferences_repository.delete_preference(pref.id)
         return {"message": f"Preferences for user {user_id} deleted successfully"}
     except PreferencesNotFoundError:
         return {"message": f"No preferences found for user {user_id}"}
@@ -164,8 +170,8 @@ def find_compatible_users(user_id: int, max_distance: int = 50) -> List[Dict[str
         'distance': max_distance
     }
     
-    if user_pref.OtherPreferences and 'interests' in user_pref.OtherPreferences:
-        search_params['interests'] = user_pref.OtherPreferences['interests']
+    if user_pref.other_preferences and 'interests' in user_pref.other_preferences:
+        search_params['interests'] = user_pref.other_preferences['interests']
     
     # Ищем пользователей с подходящими предпочтениями
     compatible_users = user_preferences_repository.get_users_by_preferences(**search_params)
@@ -204,14 +210,14 @@ def get_common_preferences(user_id1: int, user_id2: int) -> Dict[str, Any]:
     pref2 = get_preferences_by_user(user_id2)
     
     common_interests = []
-    if pref1.OtherPreferences and pref2.OtherPreferences:
-        interests1 = pref1.OtherPreferences.get('interests', [])
-        interests2 = pref2.OtherPreferences.get('interests', [])
+    if pref1.other_preferences and pref2.other_preferences:
+        interests1 = pref1.other_preferences.get('interests', [])
+        interests2 = pref2.other_preferences.get('interests', [])
         common_interests = list(set(interests1) & set(interests2))
     
     total_interests = max(
-        len(pref1.OtherPreferences.get('interests', [])) if pref1.OtherPreferences else 0,
-        len(pref2.OtherPreferences.get('interests', [])) if pref2.OtherPreferences else 0,
+        len(pref1.other_preferences.get('interests', [])) if pref1.other_preferences else 0,
+        len(pref2.other_preferences.get('interests', [])) if pref2.other_preferences else 0,
         1  # Чтобы избежать деления на 0
     )
     
@@ -223,14 +229,4 @@ def get_common_preferences(user_id1: int, user_id2: int) -> Dict[str, Any]:
 
 def _convert_db_preferences(pref_data: Dict[str, Any]) -> UserPreferences:
     """Конвертировать данные из БД в Pydantic модель"""
-    return UserPreferences(
-        ID=pref_data['id'],
-        UserID=pref_data['user_id'],
-        AgeMin=pref_data['age_min'],
-        AgeMax=pref_data['age_max'],
-        PreferredGenders=json.loads(pref_data['preferred_genders']) if pref_data['preferred_genders'] else None,
-        PreferredDistance=pref_data['preferred_distance'],
-        OtherPreferences=json.loads(pref_data['other_preferences']) if pref_data['other_preferences'] else None,
-        CreatedAt=pref_data['created_at'],
-        UpdatedAt=pref_data['updated_at']
-    )
\ No newline at end of file
+    return db_model(UserPreferences, pref_data)
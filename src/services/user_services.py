@@ -1,10 +1,13 @@
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Sequence, Union
 from datetime import datetime
-from src.repository import user_repository
-from src.database.models import Users
+from src.repository import user_repository, chat_inbox_repository
+from src.database.models import Users, UserCards
 from fastapi import HTTPException, status
-from src.utils.exam_services import check_if_exists
+from fastapi.responses import Response
+from src.utils.exam_services import check_if_exists, check_for_duplicates
 from src.utils.custom_logging import get_logger
+from src.utils.projection import Fields, projected_response
+from src.utils.serialization import db_models, db_models_by
 
 log = get_logger(__name__)
 
@@ -17,10 +20,12 @@ class UserNotFoundError(HTTPException):
         )
 
 
-def get_all_users() -> List[Users]:
-    """Получить всех пользователей"""
-    users_data = user_repository.get_all_users()
-    return [Users(**user) for user in users_data]
+def get_all_users(fields: Optional[Fields] = None) -> Union[List[Users], Response]:
+    """Получить всех пользователей; с fields — разреженный JSON только с этими полями"""
+    users_data = user_repository.get_all_users(fields)
+    if fields:
+        return projected_response(Users, users_data, fields)
+    return db_models(Users, users_data)
 
 
 def get_user_by_id(user_id: int) -> Users:
@@ -31,6 +36,11 @@ def get_user_by_id(user_id: int) -> Users:
     return Users(**user_data)
 
 
+def get_user_cards_by_ids(user_ids: Sequence[int]) -> Dict[int, UserCards]:
+    """Получить публичные карточки пользователей по списку ID одним запросом (ключ — ID, ненайденных нет)"""
+    return db_models_by(UserCards, user_repository.get_user_cards_by_ids(list(user_ids)))
+
+
 def get_user_by_email(email: str) -> Optional[Users]:
     """Получить пользователя по email"""
     user_data = user_repository.get_user_by_email(email)
@@ -39,11 +49,8 @@ def get_user_by_email(email: str) -> Optional[Users]:
 
 def create_user(email: str, password: str, first_name: str) -> Users:
     """Создать нового пользователя"""
-    if user_repository.get_user_by_email(email):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail='User with this email already exists'
-        )
+    check_if_exists("users", "email", email, 'User with this email already exists',
+                    cache=user_repository.email_cache)
 
     # Исправлено: используем строчные буквы для полей Pydantic модели
     user = Users(
@@ -65,6 +72,8 @@ def update_user(user_id: int, updates: Dict[str, Any]) -> Users:
     # Подготовка данных для обновления
     update_data = {}
     if 'email' in updates and updates['email'] is not None:
+        check_for_duplicates("users", "email", updates['email'], user_id,
+                             'User with this email already exists', cache=user_repository.email_cache)
         update_data['email'] = updates['email']
     if 'password' in updates and updates['password'] is not None:
         update_data['password'] = updates['password']
@@ -80,6 +89,8 @@ def update_user(user_id: int, updates: Dict[str, Any]) -> Users:
         )
 
     user_repository.update_user(user_id, update_data)
+    if 'first_name' in update_data:
+        chat_inbox_repository.update_other_user_name(user_id, update_data['first_name'])
     return get_user_by_id(user_id)
 
 
@@ -103,8 +114,7 @@ def authenticate_user(email: str, password: str) -> Optional[Users]:
         return None
     
     user = Users(**user_data)
-    # Используем заглавные буквы, как определено в модели
-    if user.Password != password:  # Используем Password, а не password
+    if user.password != password:
         return None
     return user
 
@@ -0,0 +1,382 @@
+import base64
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from src.utils.custom_logging import get_logger
+from src.utils.env import Env
+from src.utils.resp_client import RespConnection
+
+log = get_logger(__name__)
+env = Env()
+
+DEFAULT_MAX_ENTRIES = 10000
+DEFAULT_NEAR_TTL_SECONDS = 5
+DEFAULT_REDIS_URL = "redis://localhost:6379/0"
+DEFAULT_KEY_PREFIX = "addy:cache"
+ERROR_LOG_INTERVAL = 30.0
+RESUBSCRIBE_DELAY = 1.0
+# После сбоя Redis не опрашивается 1, 2, 4 ... 30 секунд — всё это время работает ближний кэш
+BREAKER_BASE_SECONDS = 1.0
+BREAKER_MAX_SECONDS = 30.0
+
+# Отсутствие ключа в бэкенде (в отличие от закешированного None)
+MISSING = object()
+
+
+class CacheBackend:
+    """Хранилище записей кэшей сущностей: пространство имён (имя кэша) + ключ -> значение"""
+
+    name = "base"
+
+    def get(self, namespace: str, key: Hashable) -> Any:
+        raise NotImplementedError
+
+    def set(self, namespace: str, key: Hashable, value: Any, ttl: float) -> None:
+        raise NotImplementedError
+
+    def patch(self, namespace: str, key: Hashable, fields: Dict[str, Any], ttl: float) -> None:
+        raise NotImplementedError
+
+    def delete(self, namespace: str, key: Optional[Hashable] = None) -> None:
+        raise NotImplementedError
+
+    def stats(self, namespace: str) -> Dict[str, Any]:
+        return {"backend": self.name}
+
+
+class _LruStore:
+    """LRU-словарь с временем жизни записей"""
+
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.evictions = 0
+        self.expirations = 0
+
+
+class LocalCacheBackend(CacheBackend):
+    """Кэш в памяти процесса: у каждого воркера своя копия"""
+
+    name = "local"
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES) -> None:
+        self._max_entries = max_entries
+        self._stores: Dict[str, _LruStore] = {}
+        self._lock = threading.Lock()
+
+    def _store(self, namespace: str) -> _LruStore:
+        store = self._stores.get(namespace)
+        if store is None:
+            store = self._stores[namespace] = _LruStore(self._max_entries)
+        return store
+
+    def get(self, namespace: str, key: Hashable) -> Any:
+        with self._lock:
+            store = self._store(namespace)
+            entry = store.entries.get(key)
+            if entry is None:
+                return MISSING
+            expires_at, value = entry
+            if time.monotonic() >= expires_at:
+                del store.entries[key]
+                store.expirations += 1
+                return MISSING
+            store.entries.move_to_end(key)
+            return value
+
+    def set(self, namespace: str, key: Hashable, value: Any, ttl: float) -> None:
+        with self._lock:
+            store = self._store(namespace)
+            store.entries[key] = (time.monotonic() + ttl, value)
+            store.entries.move_to_end(key)
+            while len(store.entries) > store.max_entries:
+                store.entries.popitem(last=False)
+                store.evictions += 1
+
+    def patch(self, namespace: str, key: Hashable, fields: Dict[str, Any], ttl: float) -> None:
+        with self._lock:
+            entry = self._store(namespace).entries.get(key)
+            if entry is not None and entry[1] is not None:
+                entry[1].update(fields)
+
+    def delete(self, namespace: str, key: Optional[Hashable] = None) -> None:
+        with self._lock:
+            store = self._store(namespace)
+            if key is None:
+                store.entries.clear()
+            else:
+                store.entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            for store in self._stores.values():
+                store.entries.clear()
+
+    def stats(self, namespace: str) -> Dict[str, Any]:
+        with self._lock:
+            store = self._store(namespace)
+            return {
+                "backend": self.name,
+                "size": len(store.entries),
+                "max_entries": store.max_entries,
+                "evictions": store.evictions,
+                "expirations": store.expirations
+            }
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"__type__": "datetime", "value": value.isoformat()}
+    if isinstance(value, date):
+        return {"__type__": "date", "value": value.isoformat()}
+    if isinstance(value, timedelta):
+        return {"__type__": "timedelta", "value": value.total_seconds()}
+    if isinstance(value, Decimal):
+        return {"__type__": "decimal", "value": str(value)}
+    if isinstance(value, (bytes, bytearray)):
+        return {"__type__": "bytes", "value": base64.b64encode(value).decode("ascii")}
+    raise TypeError(f"Cannot cache value of type {type(value).__name__}")
+
+
+def _decode_value(obj: Dict[str, Any]) -> Any:
+    kind = obj.get("__type__")
+    if kind == "datetime":
+        return datetime.fromisoformat(obj["value"])
+    if kind == "date":
+        return date.fromisoformat(obj["value"])
+    if kind == "timedelta":
+        return timedelta(seconds=obj["value"])
+    if kind == "decimal":
+        return Decimal(obj["value"])
+    if kind == "bytes":
+        return base64.b64decode(obj["value"])
+    return obj
+
+
+def dumps_row(value: Any) -> bytes:
+    """Сериализовать строку БД (datetime, Decimal и bytes сохраняют тип)"""
+    return json.dumps(value, default=_encode_value, ensure_ascii=False).encode("utf-8")
+
+
+def loads_row(payload: bytes) -> Any:
+    return json.loads(payload, object_hook=_decode_value)
+
+
+class RedisCacheBackend(CacheBackend):
+    """
+    Общий кэш для всех воркеров в Redis (или совместимом сервере) поверх RESP-клиента.
+    Перед Redis стоит короткоживущий локальный кэш; сброс ключа публикуется в канал
+    инвалидации, и остальные воркеры удаляют его из своего локального кэша.
+    Недоступность Redis не ломает запросы: после сбоя автомат размыкается, и до пробного
+    запроса через растущий интервал кэш работает только на ближнем локальном уровне
+    """
+
+    name = "redis"
+
+    def __init__(
+        self,
+        url: str = DEFAULT_REDIS_URL,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        near_ttl: float = DEFAULT_NEAR_TTL_SECONDS,
+        prefix: str = DEFAULT_KEY_PREFIX
+    ) -> None:
+        self.url = url
+        self.prefix = prefix
+        self.channel = f"{prefix}:invalidate"
+        self._near_ttl = near_ttl
+        self._near = LocalCacheBackend(max_entries)
+        self._conn = RespConnection.from_url(url)
+        self._origin = uuid.uuid4().hex
+        self._errors = 0
+        self._consecutive_failures = 0
+        self._retry_at = 0.0
+        self._breaker_lock = threading.Lock()
+        self._invalidations_received = 0
+        self._last_error_log = 0.0
+        self._listener: Optional[threading.Thread] = None
+        self._listener_lock = threading.Lock()
+
+    def _key(self, namespace: str, key: Hashable) -> str:
+        return f"{self.prefix}:{namespace}:{key}"
+
+    def _backoff(self) -> float:
+        return min(BREAKER_BASE_SECONDS * 2 ** max(self._consecutive_failures - 1, 0), BREAKER_MAX_SECONDS)
+
+    def _available(self) -> bool:
+        """Можно ли обращаться к Redis: автомат замкнут или пришло время пробного запроса"""
+        if not self._consecutive_failures:
+            return True
+        with self._breaker_lock:
+            now = time.monotonic()
+            if now < self._retry_at:
+                return False
+            # Пробный запрос делает один поток, остальные до его результата обходят Redis
+            self._retry_at = now + self._backoff()
+            return True
+
+    def _succeeded(self) -> None:
+        if self._consecutive_failures:
+            log.info(f"Shared cache is available again ({self.url})")
+            self._consecutive_failures = 0
+
+    def _failed(self, operation: str, error: Exception, trip: bool = True) -> None:
+        self._errors += 1
+        now = time.monotonic()
+        if trip:
+            with self._breaker_lock:
+                self._consecutive_failures += 1
+                self._retry_at = now + self._backoff()
+        if now - self._last_error_log >= ERROR_LOG_INTERVAL:
+            self._last_error_log = now
+            log.warning(f"Shared cache {operation} failed ({self.url}): {error}")
+
+    def _ensure_listener(self) -> None:
+        if self._listener is not None:
+            return
+        with self._listener_lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name="cache-invalidation", daemon=True)
+                self._listener.start()
+
+    def _listen(self) -> None:
+        while True:
+            connection = RespConnection.from_url(self.url)
+            try:
+                for _, payload in connection.listen(self.channel):
+                    self._on_invalidation(payload)
+            except Exception as e:
+                # Подписка переподключается сама и на автомат запросов не влияет
+                self._failed("subscribe", e, trip=False)
+            # Сообщения, пришедшие во время обрыва, потеряны — локальный кэш больше не надёжен
+            self._near.clear()
+            time.sleep(RESUBSCRIBE_DELAY)
+
+    def _on_invalidation(self, payload: bytes) -> None:
+        message = json.loads(payload)
+        if message.get("origin") == self._origin:
+            return
+        self._invalidations_received += 1
+        self._near.delete(message["namespace"], message.get("key"))
+
+    def get(self, namespace: str, key: Hashable) -> Any:
+        self._ensure_listener()
+        value = self._near.get(namespace, key)
+        if value is not MISSING or not self._available():
+            return value
+        try:
+            payload = self._conn.execute("GET", self._key(namespace, key))
+        except Exception as e:
+            self._failed("read", e)
+            return MISSING
+        self._succeeded()
+        if payload is None:
+            return MISSING
+        value = loads_row(payload)
+        self._near.set(namespace, key, value, self._near_ttl)
+        return value
+
+    def set(self, namespace: str, key: Hashable, value: Any, ttl: float) -> None:
+        self._near.set(namespace, key, value, min(ttl, self._near_ttl))
+        if not self._available():
+            return
+        try:
+            self._conn.execute("SET", self._key(namespace, key), dumps_row(value), "PX", int(ttl * 1000))
+        except Exception as e:
+            self._failed("write", e)
+            return
+        self._succeeded()
+
+    def patch(self, namespace: str, key: Hashable, fields: Dict[str, Any], ttl: float) -> None:
+        # GET -> изменить -> SET в общем кэше не атомарен: параллельный patch или загрузка
+        # свежей строки другим воркером затирались бы. Поэтому в Redis ключ удаляется
+        # (следующее чтение загрузит строку из БД), а ближний кэш правится на месте.
+        # Ближние кэши остальных воркеров сбрасываются через канал инвалидации
+        self._near.patch(namespace, key, fields, ttl)
+        self._invalidate(namespace, key)
+
+    def _delete_namespace(self, namespace: str) -> None:
+        cursor = b"0"
+        pattern = self._key(namespace, "*")
+        while True:
+            cursor, keys = self._conn.execute("SCAN", cursor, "MATCH", pattern, "COUNT", 500)
+            if keys:
+                self._conn.execute("DEL", *keys)
+            if cursor in (b"0", "0"):
+                break
+
+    def _invalidate(self, namespace: str, key: Optional[Hashable]) -> None:
+        """Удалить ключ (или всё пространство имён) в Redis и оповестить остальные воркеры"""
+        if not self._available():
+            return
+        try:
+            if key is None:
+                self._delete_namespace(namespace)
+            else:
+                self._conn.execute("DEL", self._key(namespace, key))
+            message = {"origin": self._origin, "namespace": namespace, "key": key}
+            self._conn.execute("PUBLISH", self.channel, json.dumps(message))
+        except Exception as e:
+            self._failed("invalidate", e)
+            return
+        self._succeeded()
+
+    def delete(self, namespace: str, key: Optional[Hashable] = None) -> None:
+        self._near.delete(namespace, key)
+        self._invalidate(namespace, key)
+
+    def stats(self, namespace: str) -> Dict[str, Any]:
+        near = self._near.stats(namespace)
+        return {
+            "backend": self.name,
+            "near_size": near["size"],
+            "near_ttl_seconds": self._near_ttl,
+            "errors": self._errors,
+            "available": not self._consecutive_failures,
+            "invalidations_received": self._invalidations_received
+        }
+
+
+def _env_number(name: str, default: float) -> float:
+    value = env.__getattr__(name)
+    return float(value) if value else default
+
+
+def create_cache_backend() -> CacheBackend:
+    """Создать бэкенд по CACHE_BACKEND (local | redis) и CACHE_REDIS_URL"""
+    kind = (env.__getattr__("CACHE_BACKEND") or LocalCacheBackend.name).lower()
+    max_entries = int(_env_number("ENTITY_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES))
+    if kind == RedisCacheBackend.name:
+        return RedisCacheBackend(
+            env.__getattr__("CACHE_REDIS_URL") or DEFAULT_REDIS_URL,
+            max_entries,
+            _env_number("CACHE_NEAR_TTL_SECONDS", DEFAULT_NEAR_TTL_SECONDS)
+        )
+    if kind != LocalCacheBackend.name:
+        log.warning(f"Unknown CACHE_BACKEND '{kind}', using in-process cache")
+    return LocalCacheBackend(max_entries)
+
+
+_backend: Optional[CacheBackend] = None
+_backend_lock = threading.Lock()
+
+
+def get_cache_backend() -> CacheBackend:
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_cache_backend()
+    return _backend
+
+
+def set_cache_backend(backend: CacheBackend) -> None:
+    """Подменить бэкенд кэшей сущностей (например, на общий для нескольких воркеров)"""
+    global _backend
+    with _backend_lock:
+        _backend = backend
@@ -0,0 +1,194 @@
+import asyncio
+import json
+from abc import ABC, abstractmethod
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional, Set
+
+from src.utils.custom_logging import get_logger
+from src.utils.env import Env
+from src.utils.resp_client import RespConnection
+
+env = Env()
+log = get_logger(__name__)
+
+SUBSCRIBER_QUEUE_SIZE = 256
+RESUBSCRIBE_DELAY = 1.0
+DEFAULT_REDIS_URL = "redis://localhost:6379/0"
+
+Deliver = Callable[[int, Dict[str, Any]], None]
+
+
+class ChatBroker(ABC):
+    """
+    Транспорт событий чата между воркерами.
+    Реализация для нескольких процессов (Redis pub/sub, NATS и т.п.) должна
+    рассылать publish всем воркерам и вызывать в каждом из них deliver
+    """
+
+    # Доставляет ли брокер события из других процессов (воркеров симуляций, других воркеров uvicorn)
+    cross_process = False
+
+    def attach(self, deliver: Deliver) -> None:
+        self._deliver = deliver
+
+    def start(self) -> None:
+        """Начать приём событий (вызывается при первой подписке)"""
+
+    @abstractmethod
+    def publish(self, conversation_id: int, event: Dict[str, Any]) -> None:
+        """Разослать событие темы conversation_id всем процессам с подписчиками"""
+
+
+class LocalBroker(ChatBroker):
+    """Доставка событий внутри одного процесса"""
+
+    def publish(self, conversation_id: int, event: Dict[str, Any]) -> None:
+        self._deliver(conversation_id, event)
+
+
+class RespBroker(ChatBroker):
+    """
+    Доставка событий между процессами через Redis pub/sub: publish уходит в канал,
+    фоновый поток каждого процесса с подписчиками получает все события канала
+    (включая свои) и передаёт их в deliver
+    """
+
+    cross_process = True
+
+    def __init__(self, url: str, channel: str) -> None:
+        self.url = url
+        self.channel = channel
+        self._conn = RespConnection.from_url(url)
+        self._listener: Optional[threading.Thread] = None
+        self._listener_lock = threading.Lock()
+
+    def start(self) -> None:
+        if self._listener is not None:
+            return
+        with self._listener_lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name=f"events-{self.channel}", daemon=True)
+                self._listener.start()
+
+    def publish(self, conversation_id: int, event: Dict[str, Any]) -> None:
+        payload = json.dumps({"topic": conversation_id, "event": event}, ensure_ascii=False, default=str)
+        self._conn.execute("PUBLISH", self.channel, payload)
+
+    def _listen(self) -> None:
+        while True:
+            connection = RespConnection.from_url(self.url)
+            try:
+                for _, payload in connection.listen(self.channel):
+                    message = json.loads(payload)
+                    self._deliver(message["topic"], message["event"])
+            except Exception as e:
+                log.warning(f"Event subscription to {self.channel} failed ({self.url}): {e}")
+            # События, опубликованные во время обрыва, потеряны; потоки симуляций добирают их опросом БД
+            time.sleep(RESUBSCRIBE_DELAY)
+
+
+class ChatSubscription:
+    """Подписка одного соединения (WebSocket или SSE) на набор тем: бесед или симуляций"""
+
+    def __init__(self, user_id: Optional[int], loop: asyncio.AbstractEventLoop) -> None:
+        self.user_id = user_id
+        self.conversation_ids: Set[int] = set()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._loop = loop
+
+    def push(self, event: Dict[str, Any]) -> None:
+        self._loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event: Dict[str, Any]) -> None:
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Медленный клиент не должен блокировать рассылку остальным
+            log.warning(f"Chat event dropped for user {self.user_id}: queue is full")
+
+
+class ChatHub:
+    """Pub/sub для рассылки событий подписчикам тем (бесед чата или симуляций)"""
+
+    def __init__(self, broker: Optional[ChatBroker] = None, topic_key: str = "conversation_id") -> None:
+        self._subscribers: Dict[int, Set[ChatSubscription]] = {}
+        # Подписки меняет цикл событий, а события RespBroker доставляет фоновый поток
+        self._lock = threading.Lock()
+        self._topic_key = topic_key
+        self.set_broker(broker or LocalBroker())
+
+    def set_broker(self, broker: ChatBroker) -> None:
+        """Заменить транспорт (например, на брокер для нескольких воркеров)"""
+        broker.attach(self._deliver)
+        self._broker = broker
+
+    @property
+    def cross_process(self) -> bool:
+        return self._broker.cross_process
+
+    def subscribe(self, user_id: Optional[int], conversation_ids: Iterable[int]) -> ChatSubscription:
+        """Создать подписку пользователя на беседы"""
+        self._broker.start()
+        subscription = ChatSubscription(user_id, asyncio.get_running_loop())
+        self.add_conversations(subscription, conversation_ids)
+        return subscription
+
+    def add_conversations(self, subscription: ChatSubscription, conversation_ids: Iterable[int]) -> None:
+        """Добавить беседы в существующую подписку"""
+        with self._lock:
+            for conversation_id in conversation_ids:
+                subscription.conversation_ids.add(conversation_id)
+                self._subscribers.setdefault(conversation_id, set()).add(subscription)
+
+    def unsubscribe(self, subscription: ChatSubscription) -> None:
+        """Удалить подписку"""
+        with self._lock:
+            for conversation_id in subscription.conversation_ids:
+                subscribers = self._subscribers.get(conversation_id)
+                if subscribers is None:
+                    continue
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[conversation_id]
+            subscription.conversation_ids.clear()
+
+    def publish(self, conversation_id: int, event_type: str, data: Dict[str, Any]) -> None:
+        """Опубликовать событие беседы"""
+        event = {
+            "event": event_type,
+            self._topic_key: conversation_id,
+            "data": data
+        }
+        try:
+            self._broker.publish(conversation_id, event)
+        except Exception as e:
+            # Ошибка доставки не должна ломать запись сообщения
+            log.error(f"Failed to publish event {event_type}: {str(e)}")
+
+    def _deliver(self, conversation_id: int, event: Dict[str, Any]) -> None:
+        with self._lock:
+            subscriptions = list(self._subscribers.get(conversation_id, ()))
+        for subscription in subscriptions:
+            subscription.push(event)
+
+
+chat_hub = ChatHub()
+simulation_hub = ChatHub(topic_key="simulation_id")
+
+
+def configure_event_brokers() -> None:
+    """
+    Выбрать транспорт событий по EVENT_BROKER (local | redis). Для redis события чата
+    и симуляций идут через EVENT_REDIS_URL (по умолчанию CACHE_REDIS_URL), чтобы их
+    получали подписчики во всех воркерах сервера, а публиковали и воркеры симуляций
+    """
+    kind = (env.__getattr__("EVENT_BROKER") or "local").lower()
+    if kind == "local":
+        return
+    if kind != "redis":
+        log.warning(f"Unknown EVENT_BROKER '{kind}', using in-process delivery")
+        return
+    url = env.__getattr__("EVENT_REDIS_URL") or env.__getattr__("CACHE_REDIS_URL") or DEFAULT_REDIS_URL
+    chat_hub.set_broker(RespBroker(url, "addy:events:chat"))
+    simulation_hub.set_broker(RespBroker(url, "addy:events:simulation"))
@@ -0,0 +1,38 @@
+import json
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from src.utils.personality_index import encode_personality
+
+
+def _load(personality_data: Any) -> Optional[Dict[str, Any]]:
+    if isinstance(personality_data, (str, bytes)):
+        return json.loads(personality_data)
+    return personality_data
+
+
+def personality_embedding(personality_data: Any) -> np.ndarray:
+    """Вектор личности из personality_data (dict или JSON-строка из БД)"""
+    return encode_personality(_load(personality_data))
+
+
+def score_compatibility(personality1: Any, personality2: Any) -> float:
+    """Оценить совместимость двух личностей по косинусной близости их векторов (0..1)"""
+    similarity = float(np.dot(personality_embedding(personality1), personality_embedding(personality2)))
+    return round(max(0.0, min(1.0, (similarity + 1) / 2)), 2)
+
+
+def score_embeddings(embeddings1: np.ndarray, embeddings2: np.ndarray) -> List[float]:
+    """Оценить совместимость построчно для двух матриц готовых векторов личности (0..1)"""
+    similarity = np.einsum("ij,ij->i", embeddings1, embeddings2)
+    return [round(max(0.0, min(1.0, (float(value) + 1) / 2)), 2) for value in similarity]
+
+
+def summarize_compatibility(compatibility_score: float) -> str:
+    """Краткое описание уровня совместимости"""
+    if compatibility_score >= 0.75:
+        return "Агенты показали высокую совместимость."
+    if compatibility_score >= 0.5:
+        return "Агенты показали среднюю совместимость."
+    return "Агенты показали низкую совместимость."
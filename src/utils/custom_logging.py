@@ -1,18 +1,139 @@
+import atexit
+import json
 import logging
+import queue
 import sys
-from rich.logging import RichHandler
-from rich.console import Console
-from rich.theme import Theme
+import threading
+import time
+from datetime import datetime, timezone
+from functools import lru_cache
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Tuple
 from src.utils.env import Env
 
 env = Env()
 
+# Режимы вывода: rich — цветной вывод и трейсбеки Rich в потоке запроса (разработка),
+# json — компактные JSON-строки, которые форматирует и пишет фоновый поток (продакшен)
+LOG_MODE_RICH = "rich"
+LOG_MODE_JSON = "json"
 
-def get_logger(name: str) -> logging.Logger:
+DEFAULT_QUEUE_SIZE = 10000
+DEFAULT_SAMPLE_WINDOW_SECONDS = 10.0
+DEFAULT_SAMPLE_BURST = 20
+
+
+def _env_number(name: str, default: float) -> float:
+    value = env.__getattr__(name)
+    return float(value) if value else default
+
+
+def _log_level() -> int:
+    return logging.DEBUG if env.__getattr__('DEBUG') else logging.INFO
+
+
+def log_mode() -> str:
+    """LOG_MODE из окружения; по умолчанию rich при DEBUG, иначе json"""
+    mode = (env.__getattr__('LOG_MODE') or "").lower()
+    if mode in (LOG_MODE_RICH, LOG_MODE_JSON):
+        return mode
+    return LOG_MODE_RICH if env.__getattr__('DEBUG') else LOG_MODE_JSON
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна JSON-строка на запись: время (UTC), уровень, логгер, место вызова, сообщение"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "where": f"{record.module}:{record.lineno}",
+            "msg": record.getMessage()
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        for extra in ("suppressed", "dropped"):
+            if getattr(record, extra, None):
+                entry[extra] = getattr(record, extra)
+        return json.dumps(entry, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+class SamplingFilter(logging.Filter):
     """
-    Возвращает настроенный логгер с RichHandler.
-    Уровень логирования устанавливается в зависимости от settings.debug.
+    Ограничение повторяющихся записей: с одного места вызова (логгер, уровень, строка)
+    проходит не больше burst записей за окно; число отброшенных добавляется
+    к первой записи следующего окна в поле suppressed
+    """
+
+    def __init__(self, window_seconds: float, burst: int) -> None:
+        super().__init__()
+        self.window_seconds = window_seconds
+        self.burst = burst
+        self._windows: Dict[Tuple[str, int, str, int], list] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.CRITICAL:
+            return True
+        key = (record.name, record.levelno, record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.window_seconds:
+                suppressed = window[2] if window else 0
+                self._windows[key] = [now, 1, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+                return True
+            if window[1] < self.burst:
+                window[1] += 1
+                return True
+            window[2] += 1
+            return False
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    QueueHandler, который в потоке запроса подставляет аргументы в сообщение и кладёт
+    запись в очередь: трейсбек форматируется в потоке QueueListener,
+    а при переполнении очереди запись отбрасывается (счётчик — в поле dropped)
     """
+
+    def __init__(self, log_queue: queue.Queue) -> None:
+        super().__init__(log_queue)
+        self._dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Аргументы подставляются сразу: изменяемые объекты могут поменяться до записи в потоке listener.
+        # Трейсбек (exc_info) не форматируется здесь — это дорогая часть, её делает listener
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if self._dropped:
+            record.dropped, self._dropped = self._dropped, 0
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self._dropped += 1
+
+
+class DrainingQueueListener(QueueListener):
+    """QueueListener, который при остановке дожидается места в полной очереди и дописывает её"""
+
+    def enqueue_sentinel(self) -> None:
+        self.queue.put(self._sentinel)
+
+
+def _rich_handler() -> logging.Handler:
+    from rich.logging import RichHandler
+    from rich.console import Console
+    from rich.theme import Theme
+
     console = Console(
         log_time=True,
         log_time_format='%H:%M:%S-%f',
@@ -23,11 +144,7 @@ def get_logger(name: str) -> logging.Logger:
         })
     )
 
-    debug = env.__getattr__('DEBUG')
-
-    log_level = logging.DEBUG if debug else logging.INFO
-
-    handler = RichHandler(
+    return RichHandler(
         show_time=True,
         omit_repeated_times=False,
         show_level=True,
@@ -35,13 +152,49 @@ def get_logger(name: str) -> logging.Logger:
         markup=False,
         rich_tracebacks=True,
         log_time_format='%H:%M:%S-%f',
-        level=log_level,
+        level=_log_level(),
         console=console
     )
 
+
+def _queue_handler() -> logging.Handler:
+    log_queue = queue.Queue(maxsize=int(_env_number('LOG_QUEUE_SIZE', DEFAULT_QUEUE_SIZE)))
+
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(JsonFormatter())
+    listener = DrainingQueueListener(log_queue, output)
+    listener.start()
+    # При завершении процесса listener дописывает оставшиеся в очереди записи
+    atexit.register(listener.stop)
+
+    handler = NonBlockingQueueHandler(log_queue)
+    handler.setLevel(_log_level())
+    handler.addFilter(SamplingFilter(
+        _env_number('LOG_SAMPLE_WINDOW_SECONDS', DEFAULT_SAMPLE_WINDOW_SECONDS),
+        int(_env_number('LOG_SAMPLE_BURST', DEFAULT_SAMPLE_BURST))
+    ))
+    return handler
+
+
+@lru_cache(maxsize=None)
+def _shared_handler() -> logging.Handler:
+    """Один обработчик на процесс: логгеры модулей пишут через общий RichHandler или очередь"""
+    if log_mode() == LOG_MODE_RICH:
+        return _rich_handler()
+    return _queue_handler()
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    Возвращает настроенный логгер: RichHandler в режиме rich (разработка)
+    или неблокирующую очередь с JSON-выводом в режиме json (LOG_MODE).
+    Уровень логирования устанавливается в зависимости от settings.debug.
+    """
+    handler = _shared_handler()
+
     logger = logging.getLogger(name)
     if not logger.handlers:
         logger.addHandler(handler)
-        logger.setLevel(log_level)
+        logger.setLevel(handler.level)
 
-    return logger
\ No newline at end of file
+    return logger
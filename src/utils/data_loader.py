@@ -0,0 +1,160 @@
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple, Type, Union
+
+from fastapi import HTTPException, status
+from fastapi.responses import Response
+from pydantic import BaseModel
+from pydantic_core import to_json
+
+from src.utils.projection import Fields, InvalidFieldsError, projected_items
+
+# Загрузка пачки сущностей по списку ID одним запросом (WHERE id IN (...))
+BatchFetch = Callable[[List[Any]], List[Dict[str, Any]]]
+
+# Предел ID в одном multi-get запросе: держит IN (...) и ответ в разумных размерах
+MAX_BATCH_IDS = 200
+
+
+class InvalidIdsError(HTTPException):
+    def __init__(self, message: str):
+        super().__init__(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=message
+        )
+
+
+def parse_ids(ids: Union[str, Sequence[int], None]) -> Tuple[int, ...]:
+    """Список ID для multi-get (?ids=1,2,3 или тело POST): без повторов, не больше MAX_BATCH_IDS"""
+    if isinstance(ids, str):
+        try:
+            ids = [int(part) for part in ids.split(",") if part.strip()]
+        except ValueError:
+            raise InvalidIdsError("ids must be a comma-separated list of integers")
+    selected = tuple(dict.fromkeys(ids or ()))
+    if not selected:
+        raise InvalidIdsError("ids must not be empty")
+    if len(selected) > MAX_BATCH_IDS:
+        raise InvalidIdsError(f"Too many ids: {len(selected)}. Maximum: {MAX_BATCH_IDS}")
+    return selected
+
+
+class DataLoader:
+    """
+    Пакетный загрузчик одного типа сущностей в рамках запроса: недостающие ID
+    догружаются одним запросом, уже загруженные (и отсутствующие в БД) берутся из памяти
+    """
+
+    def __init__(self, fetch_many: BatchFetch, key: str = "id") -> None:
+        self._fetch_many = fetch_many
+        self._key = key
+        self._loaded: Dict[Any, Optional[Dict[str, Any]]] = {}
+        self.batches = 0
+
+    def load_many(self, ids: Iterable[Any]) -> Dict[Any, Optional[Dict[str, Any]]]:
+        """Сущности по ID (None — не найдена)"""
+        wanted = list(dict.fromkeys(entity_id for entity_id in ids if entity_id is not None))
+        missing = [entity_id for entity_id in wanted if entity_id not in self._loaded]
+        if missing:
+            self.batches += 1
+            for entity_id in missing:
+                self._loaded[entity_id] = None
+            for row in self._fetch_many(missing):
+                self._loaded[row[self._key]] = row
+        return {entity_id: self._loaded[entity_id] for entity_id in wanted}
+
+    def load(self, entity_id: Any) -> Optional[Dict[str, Any]]:
+        return self.load_many([entity_id]).get(entity_id)
+
+
+class DataLoaders:
+    """Загрузчики запроса: по одному на функцию пакетной загрузки (тип сущности)"""
+
+    def __init__(self) -> None:
+        self._loaders: Dict[BatchFetch, DataLoader] = {}
+
+    def loader(self, fetch_many: BatchFetch) -> DataLoader:
+        loader = self._loaders.get(fetch_many)
+        if loader is None:
+            loader = self._loaders[fetch_many] = DataLoader(fetch_many)
+        return loader
+
+    @property
+    def batches(self) -> int:
+        return sum(loader.batches for loader in self._loaders.values())
+
+
+_request_loaders: ContextVar[Optional[DataLoaders]] = ContextVar("request_loaders", default=None)
+
+
+def request_loaders() -> DataLoaders:
+    """Загрузчики текущего запроса; вне запроса — новый набор на каждый вызов"""
+    return _request_loaders.get() or DataLoaders()
+
+
+class DataLoaderMiddleware:
+    """ASGI-middleware: свой набор загрузчиков на каждый HTTP-запрос"""
+
+    def __init__(self, app: Any) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = _request_loaders.set(DataLoaders())
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request_loaders.reset(token)
+
+
+def relation_name(field: str) -> str:
+    """Имя развёрнутого поля: user1_id -> user1"""
+    return field.split("_id")[0]
+
+
+def parse_expand(relations: Mapping[str, BatchFetch], expand: Optional[str]) -> Optional[Fields]:
+    """Разобрать параметр ?expand=a_id,b_id и проверить поля по допустимым связям"""
+    if expand is None:
+        return None
+    selected = tuple(dict.fromkeys(name.strip() for name in expand.split(",") if name.strip()))
+    unknown = [name for name in selected if name not in relations]
+    if unknown or not selected:
+        raise InvalidFieldsError(unknown, relations)
+    return selected
+
+
+def expand_fields(
+    rows: Sequence[Dict[str, Any]],
+    relations: Mapping[str, BatchFetch],
+    loaders: Optional[DataLoaders] = None
+) -> Sequence[Dict[str, Any]]:
+    """
+    Заменить внешние ключи строк (user1_id) развёрнутыми объектами (user1).
+    ID всех строк собираются заранее, поэтому на тип сущности уходит один запрос
+    независимо от числа строк и полей (user1_id и user2_id грузятся вместе)
+    """
+    loaders = loaders or request_loaders()
+    plan: List[Tuple[str, DataLoader]] = [(field, loaders.loader(fetch)) for field, fetch in relations.items()]
+
+    wanted: Dict[DataLoader, List[Any]] = {}
+    for field, loader in plan:
+        wanted.setdefault(loader, []).extend(row.get(field) for row in rows)
+    loaded = {loader: loader.load_many(ids) for loader, ids in wanted.items()}
+
+    for row in rows:
+        for field, loader in plan:
+            if field in row:
+                row[relation_name(field)] = loaded[loader].get(row.pop(field))
+    return rows
+
+
+def expanded_response(
+    model: Type[BaseModel],
+    rows: Iterable[Dict[str, Any]],
+    fields: Optional[Fields],
+    relations: Mapping[str, BatchFetch]
+) -> Response:
+    """JSON-ответ с развёрнутыми связями (fields — выбранные поля, включая разворачиваемые)"""
+    items = expand_fields(projected_items(model, rows, fields), relations)
+    return Response(content=to_json(items), media_type="application/json")
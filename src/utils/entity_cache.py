@@ -0,0 +1,103 @@
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from src.utils.cache_backend import MISSING, CacheBackend, get_cache_backend
+from src.utils.env import Env
+
+env = Env()
+
+DEFAULT_TTL_SECONDS = 60
+
+
+class EntityCache:
+    """
+    Read-through кэш строк одной сущности: ключ -> строка БД.
+    Записи хранятся в бэкенде (в памяти процесса или общем для воркеров) и устаревают
+    через ttl, чтобы изменения в обход репозиториев подтягивались из БД.
+    Запись в БД должна сбрасывать ключ
+    """
+
+    def __init__(self, name: str, ttl: float = DEFAULT_TTL_SECONDS, backend: Optional[CacheBackend] = None) -> None:
+        self.name = name
+        self._ttl = ttl
+        self._backend = backend
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+
+    @property
+    def backend(self) -> CacheBackend:
+        return self._backend or get_cache_backend()
+
+    def get_or_load(
+        self,
+        key: Hashable,
+        loader: Callable[[], Optional[Dict[str, Any]]],
+        cache_missing: bool = True
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Вернуть строку из кэша или загрузить её loader'ом. Отсутствие строки тоже кешируется,
+        если не передан cache_missing=False (для ключей, которые могут появиться в любой момент)
+        """
+        value = self.backend.get(self.name, key)
+        with self._lock:
+            if value is MISSING:
+                self._misses += 1
+            else:
+                self._hits += 1
+        if value is MISSING:
+            row = loader()
+            if row is not None or cache_missing:
+                self.backend.set(self.name, key, None if row is None else dict(row), self._ttl)
+            return row
+        return None if value is None else dict(value)
+
+    def patch(self, key: Hashable, fields: Dict[str, Any]) -> None:
+        """Обновить поля закешированной строки, не сбрасывая её (если строки нет — ничего не делать)"""
+        self.backend.patch(self.name, key, fields, self._ttl)
+
+    def invalidate(self, key: Optional[Hashable] = None) -> None:
+        """Сбросить ключ или весь кэш (в общем бэкенде — у всех воркеров)"""
+        with self._lock:
+            self._invalidations += 1
+        self.backend.delete(self.name, key)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            requests = self._hits + self._misses
+            stats = {
+                "ttl_seconds": self._ttl,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / requests, 4) if requests else 0.0,
+                "invalidations": self._invalidations
+            }
+        stats.update(self.backend.stats(self.name))
+        return stats
+
+
+def _env_number(name: str, default: float) -> float:
+    value = env.__getattr__(name)
+    return float(value) if value else default
+
+
+_caches: Dict[str, EntityCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_entity_cache(name: str) -> EntityCache:
+    """Получить кэш сущности по имени (ttl — ENTITY_CACHE_TTL_SECONDS, бэкенд — CACHE_BACKEND)"""
+    with _caches_lock:
+        cache = _caches.get(name)
+        if cache is None:
+            cache = EntityCache(name, _env_number("ENTITY_CACHE_TTL_SECONDS", DEFAULT_TTL_SECONDS))
+            _caches[name] = cache
+        return cache
+
+
+def get_entity_cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Метрики всех кэшей сущностей"""
+    with _caches_lock:
+        caches = list(_caches.values())
+    return {cache.name: cache.stats() for cache in caches}
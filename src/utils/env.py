@@ -3,10 +3,17 @@ import sys
 from dotenv import load_dotenv, set_key, unset_key
 
 
+_dotenv_loaded = False
+
+
 class Env:
 
     def __init__(self):
-        load_dotenv(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), ".env"))
+        # .env читается один раз на процесс; остальные экземпляры только читают os.environ
+        global _dotenv_loaded
+        if not _dotenv_loaded:
+            load_dotenv(os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), ".env"))
+            _dotenv_loaded = True
 
     def __str__(self):
         env_vars = {k: v for k, v in os.environ.items() if not k.startswith('_')}
@@ -1,49 +1,87 @@
-from typing import Callable, List, Any
+import re
+from typing import Any, Optional
 from fastapi import HTTPException, status
+from src.database.my_connector import db
 from src.utils.custom_logging import get_logger
+from src.utils.entity_cache import EntityCache
 
 log = get_logger(__name__)
 
+_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def _identifier(name: str) -> str:
+    if not _IDENTIFIER.match(name):
+        raise ValueError(f"Invalid SQL identifier: {name!r}")
+    return f"`{name}`"
+
+
+def _cache_key(value: Any) -> Any:
+    # Сравнение строк в MySQL (collation *_ci) не зависит от регистра — ключ кэша тоже
+    return value.casefold() if isinstance(value, str) else value
+
+
+def find_id(
+    table: str,
+    column: str,
+    value: Any,
+    exclude_id: Optional[int] = None,
+    cache: Optional[EntityCache] = None
+) -> Optional[int]:
+    """
+    ID строки, где column = value: SELECT id ... LIMIT 1 по индексу column, без чтения таблицы.
+    exclude_id исключает саму проверяемую запись; cache — кэш value -> {"id": ...},
+    который владелец таблицы сбрасывает при записи. Отсутствие значения не кешируется:
+    запись с ним может создать другой процесс, и закешированное «нет» пропустило бы дубликат
+    """
+    query = f"SELECT id FROM {_identifier(table)} WHERE {_identifier(column)} = %s LIMIT 1"
+    if cache is not None:
+        row = cache.get_or_load(_cache_key(value), lambda: db.fetch_one(query, (value,)), cache_missing=False)
+        return row['id'] if row and row['id'] != exclude_id else None
+
+    if exclude_id is not None:
+        query = f"SELECT id FROM {_identifier(table)} WHERE {_identifier(column)} = %s AND id <> %s LIMIT 1"
+        row = db.fetch_one(query, (value, exclude_id))
+    else:
+        row = db.fetch_one(query, (value,))
+    return row['id'] if row else None
+
 
 def check_for_duplicates(
-    get_all: Callable[[], List[Any]],
+    table: str,
+    column: str,
+    value: Any,
     check_id: int,
-    attr_name: str,
-    attr_value: Any,
-    exception_detail: str
+    exception_detail: str,
+    cache: Optional[EntityCache] = None
 ):
-    existing_items = get_all()
-    for item in existing_items:
-        if int(item.ID) == int(check_id):
-            continue
-        if getattr(item, attr_name) == attr_value:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=exception_detail)
+    """Ошибка 400, если значение уже занято другой записью (check_id — сама запись)"""
+    if find_id(table, column, value, exclude_id=check_id, cache=cache) is not None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=exception_detail)
 
 
 def check_if_exists(
-    get_all: Callable[[], List[Any]],
-    attr_name: str,
-    attr_value: Any,
+    table: str,
+    column: str,
+    value: Any,
     exception_detail: str,
+    cache: Optional[EntityCache] = None
 ):
-    existing_items = get_all()
-    for item in existing_items:
-        if getattr(item, attr_name) == attr_value:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=exception_detail
-            )
+    """Ошибка 400, если запись с таким значением уже есть"""
+    if find_id(table, column, value, cache=cache) is not None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=exception_detail
+        )
 
 
 def return_id_if_exists(
-    get_all: Callable[[], List[Any]],
-    attr_name: str,
-    attr_value: Any
-):
-    existing_items = get_all()
-    for item in existing_items:
-        if getattr(item, attr_name) == attr_value:
-            return item.ID
-    return None
+    table: str,
+    column: str,
+    value: Any,
+    cache: Optional[EntityCache] = None
+) -> Optional[int]:
+    """ID записи с таким значением или None"""
+    return find_id(table, column, value, cache=cache)
@@ -0,0 +1,22 @@
+import re
+
+from src.utils.env import Env
+
+env = Env()
+
+# Операторы булевого режима MySQL FULLTEXT, которые нельзя передавать из пользовательского ввода
+_BOOLEAN_OPERATORS = re.compile(r'[+\-<>()~*"@]')
+
+# ngram_token_size сервера MySQL (по умолчанию 2): более короткие слова в ngram-индекс не попадают
+NGRAM_TOKEN_SIZE = int(env.__getattr__("FULLTEXT_NGRAM_TOKEN_SIZE") or 2)
+
+
+def to_boolean_query(search_term: str) -> str:
+    """
+    Преобразовать поисковую строку в запрос MATCH ... AGAINST ... IN BOOLEAN MODE:
+    каждое слово обязательно и ищется как фраза (для ngram-парсера это поиск подстроки).
+    Слова короче NGRAM_TOKEN_SIZE отбрасываются: обязательное слово, которого нет
+    в индексе, сделало бы результат пустым
+    """
+    words = _BOOLEAN_OPERATORS.sub(" ", search_term or "").split()
+    return " ".join(f'+"{word}"' for word in words if len(word) >= NGRAM_TOKEN_SIZE)
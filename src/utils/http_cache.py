@@ -0,0 +1,182 @@
+import hashlib
+import inspect
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from starlette.datastructures import MutableHeaders
+from starlette.routing import Match
+
+from src.utils.cache_backend import dumps_row
+from src.utils.custom_logging import get_logger
+
+log = get_logger(__name__)
+
+# Ответы с персональными данными: клиент хранит копию, но перепроверяет её на каждом запросе
+PRIVATE_REVALIDATE = "private, no-cache"
+
+
+class ConditionalPolicy:
+    """Политика условного GET для маршрута: функция версии ресурса и заголовок Cache-Control"""
+
+    def __init__(self, endpoint: Callable, version: Callable[..., Optional[str]], cache_control: str) -> None:
+        self.version = version
+        self.cache_control = cache_control
+        # Параметры пути приходят строками; приводим их к типам из сигнатуры обработчика
+        self._converters = {
+            name: parameter.annotation
+            for name, parameter in inspect.signature(endpoint).parameters.items()
+            if parameter.annotation in (int, float)
+        }
+
+    def convert(self, path_params: Dict[str, Any]) -> Dict[str, Any]:
+        return {name: self._converters.get(name, str)(value) for name, value in path_params.items()}
+
+
+_policies: Dict[Callable, ConditionalPolicy] = {}
+_stats = {"not_modified": 0, "tagged": 0, "untagged": 0, "errors": 0}
+_stats_lock = threading.Lock()
+
+
+def conditional_get(version: Callable[..., Optional[str]], cache_control: str = PRIVATE_REVALIDATE) -> Callable:
+    """
+    Включить ETag/If-None-Match для обработчика. version получает параметры пути
+    и возвращает версию ресурса (None — ресурс не кешируется, запрос идёт в обработчик)
+    """
+    def decorator(endpoint: Callable) -> Callable:
+        _policies[endpoint] = ConditionalPolicy(endpoint, version, cache_control)
+        return endpoint
+    return decorator
+
+
+def row_version(row: Optional[Dict[str, Any]]) -> Optional[str]:
+    """Версия строки БД: отпечаток всех полей, включая updated_at"""
+    if row is None:
+        return None
+    return hashlib.sha1(dumps_row(row)).hexdigest()
+
+
+def table_version(summary: Optional[Dict[str, Any]]) -> Optional[str]:
+    """
+    Версия таблицы по числу строк и последнему updated_at. Если последняя запись
+    сделана в текущую секунду, версия не выдаётся: следующая запись в ту же секунду
+    не изменила бы updated_at
+    """
+    if not summary or summary.get("racy"):
+        return None
+    return f"{summary.get('row_count')}:{summary.get('last_updated')}"
+
+
+def _make_etag(route_path: str, query_string: bytes, version: str) -> str:
+    digest = hashlib.sha1(f"{route_path}|{query_string.decode('latin-1')}|{version}".encode("utf-8"))
+    return f'"{digest.hexdigest()}"'
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def _count(name: str) -> None:
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def get_http_cache_stats() -> Dict[str, Any]:
+    """Счётчики условных GET: 304-ответы, ответы с ETag и без него"""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["routes"] = len(_policies)
+    return stats
+
+
+class ConditionalGetMiddleware:
+    """
+    ASGI-middleware условных GET. Для маршрутов с политикой вычисляет сильный ETag
+    по версии ресурса; при совпадении с If-None-Match отвечает 304 без вызова
+    обработчика, иначе добавляет ETag и Cache-Control к ответу 200
+    """
+
+    def __init__(self, app: Any) -> None:
+        self.app = app
+        self._policy_routes: Optional[List[Tuple[int, Any, ConditionalPolicy]]] = None
+
+    def _indexed_policy_routes(self, routes: List[Any]) -> List[Tuple[int, Any, ConditionalPolicy]]:
+        # Маршруты с политикой находятся один раз: таблица маршрутов после старта не меняется
+        if self._policy_routes is None:
+            self._policy_routes = [
+                (index, route, _policies[route.endpoint])
+                for index, route in enumerate(routes)
+                if getattr(route, "endpoint", None) in _policies
+            ]
+        return self._policy_routes
+
+    def _find_policy(self, scope: Dict[str, Any]):
+        routes = scope["app"].router.routes
+        for index, route, policy in self._indexed_policy_routes(routes):
+            match, child_scope = route.matches(scope)
+            if match != Match.FULL:
+                continue
+            # Запрос обслужит более ранний маршрут (например, литеральный путь перед /{id})
+            if any(earlier.matches(scope)[0] == Match.FULL for earlier in routes[:index]):
+                return None, None, None
+            return route, policy, child_scope.get("path_params", {})
+        return None, None, None
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http" or scope["method"] not in ("GET", "HEAD"):
+            await self.app(scope, receive, send)
+            return
+
+        route, policy, path_params = self._find_policy(scope)
+        if policy is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            params = policy.convert(path_params)
+        except ValueError:
+            # Невалидный параметр пути — ошибку валидации вернёт сам FastAPI
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            # Синхронно в потоке цикла, как и обработчики: соединение db не потокобезопасно
+            version = policy.version(**params)
+        except Exception as e:
+            log.warning(f"ETag version lookup failed for {route.path}: {e}")
+            _count("errors")
+            version = None
+        if version is None:
+            _count("untagged")
+            await self.app(scope, receive, send)
+            return
+
+        etag = _make_etag(route.path, scope.get("query_string", b""), version)
+        headers = {key.decode("latin-1").lower(): value.decode("latin-1") for key, value in scope["headers"]}
+        if_none_match = headers.get("if-none-match")
+        if if_none_match and _etag_matches(if_none_match, etag):
+            _count("not_modified")
+            await send({
+                "type": "http.response.start",
+                "status": 304,
+                "headers": [
+                    (b"etag", etag.encode("latin-1")),
+                    (b"cache-control", policy.cache_control.encode("latin-1"))
+                ]
+            })
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        _count("tagged")
+
+        async def send_with_etag(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start" and message["status"] == 200:
+                response_headers = MutableHeaders(scope=message)
+                response_headers["ETag"] = etag
+                response_headers["Cache-Control"] = policy.cache_control
+            await send(message)
+
+        await self.app(scope, receive, send_with_etag)
@@ -0,0 +1,137 @@
+import json
+import re
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional
+
+# Сколько интересов и шаблонов поведения попадает в личность агента
+TOP_INTERESTS = 10
+TOP_PATTERNS = 5
+# Доли сообщений, начиная с которых поведение считается характерным
+QUESTION_RATE = 0.3
+EMOJI_RATE = 0.2
+
+_EMOJI_RE = re.compile("[\U0001F300-\U0001FAFF☀-➿]|[:;]-?[)(DP]")
+
+
+def _load(value: Any) -> Any:
+    if isinstance(value, (str, bytes)):
+        try:
+            return json.loads(value)
+        except ValueError:
+            return value
+    return value
+
+
+def _as_list(value: Any) -> List[str]:
+    if isinstance(value, str):
+        return [value]
+    if isinstance(value, (list, tuple)):
+        return [str(item) for item in value if item is not None]
+    return []
+
+
+class LearningAggregate:
+    """
+    Накопленная статистика агента по обработанным данным обучения.
+    Обновляется инкрементально: каждая запись учитывается один раз
+    """
+
+    def __init__(self, data: Optional[Dict[str, Any]] = None) -> None:
+        data = _load(data) or {}
+        self.interests = Counter(data.get("interests", {}))
+        self.styles = Counter(data.get("styles", {}))
+        self.patterns = Counter(data.get("patterns", {}))
+        self.message_count = data.get("message_count", 0)
+        self.message_length = data.get("message_length", 0)
+        self.question_count = data.get("question_count", 0)
+        self.emoji_count = data.get("emoji_count", 0)
+        self.records = data.get("records", 0)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "interests": dict(self.interests),
+            "styles": dict(self.styles),
+            "patterns": dict(self.patterns),
+            "message_count": self.message_count,
+            "message_length": self.message_length,
+            "question_count": self.question_count,
+            "emoji_count": self.emoji_count,
+            "records": self.records
+        }
+
+    def fold(self, data_type: Optional[str], data_content: Any) -> None:
+        """Учесть одну запись данных обучения"""
+        content = _load(data_content)
+        self.records += 1
+        if not isinstance(content, dict):
+            return
+
+        for message in content.get("messages", []) or []:
+            text = message.get("text") if isinstance(message, dict) else message
+            if not isinstance(text, str):
+                continue
+            self.message_count += 1
+            self.message_length += len(text)
+            self.question_count += "?" in text
+            self.emoji_count += bool(_EMOJI_RE.search(text))
+
+        self.interests.update(_as_list(content.get("interests")))
+        self.styles.update(_as_list(content.get("communication_style") or content.get("style")))
+        self.patterns.update(_as_list(content.get("response_patterns")))
+
+    def personality_updates(self) -> Dict[str, Any]:
+        """Поля личности агента, выводимые из накопленной статистики"""
+        updates: Dict[str, Any] = {}
+        if self.interests:
+            updates["interests"] = [interest for interest, _ in self.interests.most_common(TOP_INTERESTS)]
+        if self.styles:
+            updates["communication_style"] = self.styles.most_common(1)[0][0]
+        elif self.message_count:
+            average = self.message_length / self.message_count
+            updates["communication_style"] = "concise" if average < 40 else "detailed" if average > 160 else "balanced"
+
+        patterns = [pattern for pattern, _ in self.patterns.most_common(TOP_PATTERNS)]
+        if self.message_count:
+            if self.question_count / self.message_count >= QUESTION_RATE and "often asks questions" not in patterns:
+                patterns.append("often asks questions")
+            if self.emoji_count / self.message_count >= EMOJI_RATE and "uses emojis" not in patterns:
+                patterns.append("uses emojis")
+        if patterns:
+            updates["response_patterns"] = patterns
+
+        updates["learning_stats"] = {
+            "records": self.records,
+            "messages": self.message_count,
+            "avg_message_length": round(self.message_length / self.message_count, 1) if self.message_count else 0
+        }
+        return updates
+
+
+def fold_learning_batch(
+    rows: Iterable[Dict[str, Any]],
+    agents: Dict[int, Dict[str, Any]]
+) -> Dict[int, Dict[str, Any]]:
+    """
+    Свернуть пакет записей в агрегаты агентов. agents: agent_id -> {personality_data, aggregate_data}.
+    Возвращает agent_id -> {aggregate_data, personality_data, processed} для агентов из пакета
+    """
+    aggregates: Dict[int, LearningAggregate] = {}
+    processed: Counter = Counter()
+    for row in rows:
+        agent = agents.get(row['agent_id'])
+        if agent is None:
+            continue
+        if row['agent_id'] not in aggregates:
+            aggregates[row['agent_id']] = LearningAggregate(agent.get('aggregate_data'))
+        aggregates[row['agent_id']].fold(row.get('data_type'), row.get('data_content'))
+        processed[row['agent_id']] += 1
+
+    results = {}
+    for agent_id, aggregate in aggregates.items():
+        personality = _load(agents[agent_id].get('personality_data')) or {}
+        results[agent_id] = {
+            "aggregate_data": aggregate.to_dict(),
+            "personality_data": {**personality, **aggregate.personality_updates()},
+            "processed": processed[agent_id]
+        }
+    return results
@@ -0,0 +1,57 @@
+import json
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from src.utils.personality_index import VECTOR_DIM, encode_personality
+
+# Увеличивается при изменении набора признаков или кодирования — старые строки пересчитываются
+FEATURE_VERSION = 2
+STYLE_MAX_LENGTH = 32
+
+
+@dataclass
+class PersonalityFeatures:
+    """Фиксированный набор признаков личности агента, извлекаемый при каждой её записи"""
+    communication_style: Optional[str]
+    attribute_count: int
+    interest_count: int
+    pattern_count: int
+    learning_records: int
+    avg_message_length: Optional[float]
+    embedding: bytes
+    feature_version: int = FEATURE_VERSION
+
+
+def _count(value: Any) -> int:
+    return len(value) if isinstance(value, (list, tuple, dict)) else 0
+
+
+def extract_features(personality_data: Any) -> PersonalityFeatures:
+    """Извлечь признаки и вектор личности из данных personality_data"""
+    if isinstance(personality_data, (str, bytes)):
+        personality_data = json.loads(personality_data)
+    personality: Dict[str, Any] = personality_data if isinstance(personality_data, dict) else {}
+
+    style = personality.get("communication_style")
+    learning_stats = personality.get("learning_stats")
+    learning_stats = learning_stats if isinstance(learning_stats, dict) else {}
+    avg_length = learning_stats.get("avg_message_length")
+
+    return PersonalityFeatures(
+        communication_style=str(style).strip().lower()[:STYLE_MAX_LENGTH] if style else None,
+        attribute_count=len(personality),
+        interest_count=_count(personality.get("interests")),
+        pattern_count=_count(personality.get("response_patterns")),
+        learning_records=int(learning_stats.get("records") or 0),
+        avg_message_length=float(avg_length) if isinstance(avg_length, (int, float)) else None,
+        embedding=encode_personality(personality).tobytes()
+    )
+
+
+def decode_embedding(embedding: Optional[bytes]) -> Optional[np.ndarray]:
+    """Восстановить вектор личности из сохранённых байтов (float32)"""
+    if not embedding or len(embedding) != VECTOR_DIM * 4:
+        return None
+    return np.frombuffer(embedding, dtype=np.float32)
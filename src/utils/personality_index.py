@@ -0,0 +1,242 @@
+import hashlib
+import math
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+VECTOR_DIM = 64
+DEFAULT_LISTS = 256
+DEFAULT_PROBES = 8
+# Минимальное количество векторов, после которого строятся центроиды IVF
+TRAIN_THRESHOLD = 1024
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_PER_LIST = 64
+# Числа кодируются корзинами логарифмической шкалы: NUMERIC_BUCKETS_PER_OCTAVE корзин на удвоение
+NUMERIC_BUCKETS_PER_OCTAVE = 2
+
+
+def _hash_feature(feature: str) -> Tuple[int, float]:
+    """Стабильно отобразить признак в индекс измерения и знак"""
+    digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+    value = int.from_bytes(digest, "little")
+    return value % VECTOR_DIM, 1.0 if (value >> 63) & 1 else -1.0
+
+
+def _numeric_features(prefix: str, value: float) -> Iterable[Tuple[str, float]]:
+    """
+    Число -> две соседние корзины логарифмической шкалы с линейными весами (сумма 1).
+    Вес не зависит от величины, поэтому возраст 30 не перевешивает остальные признаки,
+    а близкие значения попадают в общие корзины
+    """
+    if not math.isfinite(value):
+        return
+    position = math.log2(1.0 + abs(value)) * NUMERIC_BUCKETS_PER_OCTAVE
+    lower = math.floor(position)
+    fraction = position - lower
+    sign = "-" if value < 0 else ""
+    yield f"{prefix}~{sign}{lower}", 1.0 - fraction
+    if fraction:
+        yield f"{prefix}~{sign}{lower + 1}", fraction
+
+
+def _iter_features(prefix: str, value: Any) -> Iterable[Tuple[str, float]]:
+    """Развернуть вложенные данные личности в пары (признак, вес)"""
+    if isinstance(value, dict):
+        for key, nested in value.items():
+            yield from _iter_features(f"{prefix}.{key}" if prefix else str(key), nested)
+    elif isinstance(value, (list, tuple, set)):
+        items = list(value)
+        if not items:
+            return
+        # Вес делится между элементами, чтобы длинные списки не доминировали
+        weight = 1.0 / math.sqrt(len(items))
+        for item in items:
+            for feature, item_weight in _iter_features(prefix, item):
+                yield feature, item_weight * weight
+    elif isinstance(value, bool):
+        yield f"{prefix}={value}", 1.0
+    elif isinstance(value, (int, float)):
+        yield from _numeric_features(prefix, float(value))
+    elif value is not None:
+        yield f"{prefix}={str(value).strip().lower()}", 1.0
+
+
+def encode_personality(personality_data: Optional[Dict[str, Any]]) -> np.ndarray:
+    """
+    Закодировать данные личности агента в вектор фиксированной длины
+    (feature hashing с L2-нормализацией)
+    """
+    vector = np.zeros(VECTOR_DIM, dtype=np.float32)
+    for feature, weight in _iter_features("", personality_data or {}):
+        index, sign = _hash_feature(feature)
+        vector[index] += sign * weight
+    return _normalize(vector)
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+class _InvertedList:
+    """Список векторов одного кластера с амортизированным добавлением и удалением"""
+
+    def __init__(self) -> None:
+        self.ids = np.empty(0, dtype=np.int64)
+        self.vectors = np.empty((0, VECTOR_DIM), dtype=np.float32)
+        self.size = 0
+        self.positions: Dict[int, int] = {}
+
+    def add(self, item_id: int, vector: np.ndarray) -> None:
+        position = self.positions.get(item_id)
+        if position is not None:
+            self.vectors[position] = vector
+            return
+        if self.size == len(self.ids):
+            capacity = max(16, self.size * 2)
+            self.ids = np.resize(self.ids, capacity)
+            vectors = np.zeros((capacity, VECTOR_DIM), dtype=np.float32)
+            vectors[:self.size] = self.vectors[:self.size]
+            self.vectors = vectors
+        self.ids[self.size] = item_id
+        self.vectors[self.size] = vector
+        self.positions[item_id] = self.size
+        self.size += 1
+
+    def remove(self, item_id: int) -> None:
+        position = self.positions.pop(item_id, None)
+        if position is None:
+            return
+        last = self.size - 1
+        if position != last:
+            # Переносим последний элемент на место удалённого
+            moved_id = int(self.ids[last])
+            self.ids[position] = moved_id
+            self.vectors[position] = self.vectors[last]
+            self.positions[moved_id] = position
+        self.size = last
+
+
+class PersonalityIndex:
+    """
+    Приближённый поиск ближайших соседей (IVF) по векторам личности агентов.
+    Пока векторов меньше TRAIN_THRESHOLD, поиск выполняется полным перебором.
+    """
+
+    def __init__(self, n_lists: int = DEFAULT_LISTS, n_probes: int = DEFAULT_PROBES) -> None:
+        self._max_lists = n_lists
+        self._n_probes = n_probes
+        self._centroids: Optional[np.ndarray] = None
+        self._lists: List[_InvertedList] = [_InvertedList()]
+        self._assignments: Dict[int, int] = {}
+        self._lock = threading.RLock()
+        self.loaded = False
+        # Отметка времени последнего учтённого изменения в БД и момент последней догрузки
+        self.watermark: Any = None
+        self.synced_at = 0.0
+
+    def __len__(self) -> int:
+        return len(self._assignments)
+
+    def __contains__(self, item_id: int) -> bool:
+        return item_id in self._assignments
+
+    def build(self, items: Iterable[Tuple[int, np.ndarray]]) -> None:
+        """Полностью перестроить индекс"""
+        with self._lock:
+            self._centroids = None
+            self._lists = [_InvertedList()]
+            self._assignments = {}
+            for item_id, vector in items:
+                self._lists[0].add(item_id, vector)
+                self._assignments[item_id] = 0
+            if len(self._assignments) >= TRAIN_THRESHOLD:
+                self._train()
+            self.loaded = True
+
+    def upsert(self, item_id: int, vector: np.ndarray) -> None:
+        """Добавить или обновить вектор"""
+        with self._lock:
+            list_id = self._nearest_lists(vector, 1)[0] if self._centroids is not None else 0
+            previous = self._assignments.get(item_id)
+            if previous is not None and previous != list_id:
+                self._lists[previous].remove(item_id)
+            self._lists[list_id].add(item_id, vector)
+            self._assignments[item_id] = list_id
+            if self._centroids is None and len(self._assignments) >= TRAIN_THRESHOLD:
+                self._train()
+
+    def remove(self, item_id: int) -> None:
+        """Удалить вектор из индекса"""
+        with self._lock:
+            list_id = self._assignments.pop(item_id, None)
+            if list_id is not None:
+                self._lists[list_id].remove(item_id)
+
+    def search(
+        self,
+        vector: np.ndarray,
+        k: int = 10,
+        threshold: float = 0.0,
+        exclude: Optional[int] = None
+    ) -> List[Tuple[int, float]]:
+        """Найти k ближайших векторов с косинусной близостью не ниже threshold"""
+        with self._lock:
+            if self._centroids is not None:
+                probes = self._nearest_lists(vector, self._n_probes)
+            else:
+                probes = [0]
+
+            ids = np.concatenate([self._lists[i].ids[:self._lists[i].size] for i in probes])
+            if len(ids) == 0:
+                return []
+            scores = np.concatenate([
+                self._lists[i].vectors[:self._lists[i].size] @ vector for i in probes
+            ])
+
+        mask = scores >= threshold
+        if exclude is not None:
+            mask &= ids != exclude
+        ids, scores = ids[mask], scores[mask]
+        if len(ids) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            ids, scores = ids[top], scores[top]
+        order = np.argsort(-scores)
+        return [(int(ids[i]), float(scores[i])) for i in order]
+
+    def _nearest_lists(self, vector: np.ndarray, count: int) -> List[int]:
+        scores = self._centroids @ vector
+        if count >= len(scores):
+            return list(np.argsort(-scores))
+        return list(np.argpartition(-scores, count - 1)[:count])
+
+    def _train(self) -> None:
+        """Построить центроиды k-means по выборке векторов и распределить векторы по спискам"""
+        ids = np.concatenate([lst.ids[:lst.size] for lst in self._lists])
+        vectors = np.concatenate([lst.vectors[:lst.size] for lst in self._lists])
+        n_lists = max(1, min(self._max_lists, int(math.sqrt(len(ids)))))
+
+        rng = np.random.default_rng()
+        sample_size = min(len(vectors), n_lists * KMEANS_SAMPLE_PER_LIST)
+        sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, n_lists, replace=False)].copy()
+
+        for _ in range(KMEANS_ITERATIONS):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            counts = np.bincount(labels, minlength=n_lists)
+            # Пустые кластеры сохраняют прежний центроид
+            centroids = np.where(counts[:, None] > 0, _normalize(sums), centroids)
+
+        labels = np.argmax(vectors @ centroids.T, axis=1)
+        self._centroids = centroids
+        self._lists = [_InvertedList() for _ in range(n_lists)]
+        self._assignments = {}
+        for item_id, vector, label in zip(ids.tolist(), vectors, labels.tolist()):
+            self._lists[label].add(item_id, vector)
+            self._assignments[item_id] = label
+
+
+personality_index = PersonalityIndex()
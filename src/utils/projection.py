@@ -0,0 +1,60 @@
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Type
+
+from fastapi import HTTPException, status
+from fastapi.responses import Response
+from pydantic import BaseModel, TypeAdapter, create_model
+
+from src.utils.serialization import coerce_row
+
+Fields = Tuple[str, ...]
+
+
+class InvalidFieldsError(HTTPException):
+    def __init__(self, unknown: Sequence[str], allowed: Iterable[str]):
+        super().__init__(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(unknown) or '(empty)'}. Allowed: {', '.join(allowed)}"
+        )
+
+
+def parse_fields(model: Type[BaseModel], fields: Optional[str]) -> Optional[Fields]:
+    """Разобрать параметр ?fields=a,b и проверить поля по модели (None — все поля)"""
+    if fields is None:
+        return None
+    selected = tuple(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+    unknown = [name for name in selected if name not in model.model_fields]
+    if unknown or not selected:
+        raise InvalidFieldsError(unknown, model.model_fields)
+    return selected
+
+
+def select_columns(fields: Optional[Fields], alias: Optional[str] = None) -> str:
+    """Список колонок для SELECT: выбранные поля или все (поля уже проверены по модели)"""
+    prefix = f"{alias}." if alias else ""
+    if not fields:
+        return f"{prefix}*"
+    return ", ".join(f"{prefix}`{name}`" for name in fields)
+
+
+@lru_cache(maxsize=256)
+def _projection_adapter(model: Type[BaseModel], fields: Fields) -> TypeAdapter:
+    projection = create_model(
+        f"{model.__name__}Projection",
+        **{name: (model.model_fields[name].annotation, ...) for name in fields}
+    )
+    return TypeAdapter(list[projection])
+
+
+def projected_response(model: Type[BaseModel], rows: Iterable[Dict[str, Any]], fields: Fields) -> Response:
+    """JSON-ответ только с выбранными полями (строки проверяются по урезанной модели)"""
+    adapter = _projection_adapter(model, fields)
+    items = adapter.validate_python([coerce_row(model, row) for row in rows])
+    return Response(content=adapter.dump_json(items), media_type="application/json")
+
+
+def projected_items(model: Type[BaseModel], rows: Iterable[Dict[str, Any]], fields: Optional[Fields]) -> List[Dict[str, Any]]:
+    """Проверенные строки как JSON-совместимые словари (None — все поля модели)"""
+    adapter = _projection_adapter(model, fields or tuple(model.model_fields))
+    items = adapter.validate_python([coerce_row(model, row) for row in rows])
+    return adapter.dump_python(items, mode="json")
@@ -0,0 +1,159 @@
+import socket
+import threading
+from typing import Any, Iterator, List, Optional, Tuple
+from urllib.parse import urlparse
+
+DEFAULT_PORT = 6379
+DEFAULT_TIMEOUT = 2.0
+
+
+class RespError(Exception):
+    """Ошибка, которую вернул сервер (-ERR ...)"""
+
+
+def parse_redis_url(url: str) -> Tuple[str, int, int, Optional[str]]:
+    """redis://[:password@]host[:port][/db] -> (host, port, db, password)"""
+    parsed = urlparse(url)
+    db_number = int(parsed.path.lstrip("/") or 0)
+    return parsed.hostname or "localhost", parsed.port or DEFAULT_PORT, db_number, parsed.password
+
+
+def encode_command(*args: Any) -> bytes:
+    """Закодировать команду как массив bulk-строк RESP"""
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if isinstance(arg, bytes):
+            data = arg
+        elif isinstance(arg, str):
+            data = arg.encode("utf-8")
+        else:
+            data = str(arg).encode("utf-8")
+        parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+    return b"".join(parts)
+
+
+class _Reader:
+    """Разбор ответов RESP2 из сокета"""
+
+    def __init__(self, sock: socket.socket) -> None:
+        self._file = sock.makefile("rb")
+
+    def _line(self) -> bytes:
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError("Connection closed by server")
+        return line[:-2]
+
+    def read(self) -> Any:
+        line = self._line()
+        prefix, payload = line[:1], line[1:]
+        if prefix == b"+":
+            return payload.decode("utf-8")
+        if prefix == b"-":
+            return RespError(payload.decode("utf-8"))
+        if prefix == b":":
+            return int(payload)
+        if prefix == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            data = self._file.read(length + 2)
+            return data[:-2]
+        if prefix == b"*":
+            count = int(payload)
+            if count < 0:
+                return None
+            return [self.read() for _ in range(count)]
+        raise ConnectionError(f"Unexpected RESP prefix {prefix!r}")
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class RespConnection:
+    """
+    Минимальный клиент протокола Redis (RESP2) на одном сокете.
+    Потокобезопасен; при обрыве соединение переоткрывается на следующей команде
+    """
+
+    def __init__(
+        self,
+        host: str = "localhost",
+        port: int = DEFAULT_PORT,
+        db: int = 0,
+        password: Optional[str] = None,
+        timeout: float = DEFAULT_TIMEOUT
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.timeout = timeout
+        self._sock: Optional[socket.socket] = None
+        self._reader: Optional[_Reader] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_url(cls, url: str, timeout: float = DEFAULT_TIMEOUT) -> "RespConnection":
+        host, port, db, password = parse_redis_url(url)
+        return cls(host, port, db, password, timeout)
+
+    def _connect(self) -> None:
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._sock = sock
+        self._reader = _Reader(sock)
+        if self.password:
+            self._call("AUTH", self.password)
+        if self.db:
+            self._call("SELECT", self.db)
+
+    def _call(self, *args: Any) -> Any:
+        self._sock.sendall(encode_command(*args))
+        reply = self._reader.read()
+        if isinstance(reply, RespError):
+            raise reply
+        return reply
+
+    def execute(self, *args: Any) -> Any:
+        """Выполнить команду и вернуть разобранный ответ"""
+        with self._lock:
+            if self._sock is None:
+                self._connect()
+            try:
+                return self._call(*args)
+            except (OSError, ConnectionError):
+                self._close()
+                raise
+
+    def _close(self) -> None:
+        if self._reader is not None:
+            self._reader.close()
+        if self._sock is not None:
+            self._sock.close()
+        self._sock = None
+        self._reader = None
+
+    def close(self) -> None:
+        with self._lock:
+            self._close()
+
+    def listen(self, *channels: str) -> Iterator[Tuple[str, bytes]]:
+        """
+        Подписаться на каналы и выдавать (канал, сообщение). Соединение после этого
+        используется только для подписки; итератор завершается при обрыве
+        """
+        with self._lock:
+            if self._sock is None:
+                self._connect()
+            self._sock.settimeout(None)
+            self._sock.sendall(encode_command("SUBSCRIBE", *channels))
+            reader = self._reader
+        while True:
+            try:
+                reply: List[Any] = reader.read()
+            except (OSError, ConnectionError, ValueError):
+                self.close()
+                return
+            if isinstance(reply, list) and len(reply) == 3 and reply[0] == b"message":
+                yield reply[1].decode("utf-8"), reply[2]
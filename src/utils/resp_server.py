@@ -0,0 +1,144 @@
+import argparse
+import asyncio
+import fnmatch
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from src.utils.custom_logging import get_logger
+
+log = get_logger(__name__)
+
+
+def _encode(value: Any) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, bool):
+        return b":%d\r\n" % int(value)
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, Exception):
+        return b"-ERR %s\r\n" % str(value).encode("utf-8")
+    if isinstance(value, str):
+        return b"+%s\r\n" % value.encode("utf-8")
+    if isinstance(value, (list, tuple)):
+        return b"*%d\r\n" % len(value) + b"".join(_encode_bulk(item) if isinstance(item, bytes) else _encode(item) for item in value)
+    return _encode_bulk(value)
+
+
+def _encode_bulk(value: bytes) -> bytes:
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+class RespStandInServer:
+    """
+    Локальная замена Redis для разработки и тестов: строки с истечением срока,
+    DEL/EXISTS/SCAN и PUBLISH/SUBSCRIBE. Данные хранятся в памяти процесса
+    """
+
+    def __init__(self) -> None:
+        self._data: Dict[bytes, Tuple[bytes, Optional[float]]] = {}
+        self._subscribers: Dict[bytes, Set[asyncio.StreamWriter]] = {}
+
+    def _get(self, key: bytes) -> Optional[bytes]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and time.monotonic() >= expires_at:
+            del self._data[key]
+            return None
+        return value
+
+    def _set(self, args: List[bytes]) -> Any:
+        key, value, options = args[0], args[1], [arg.upper() for arg in args[2:]]
+        expires_at = None
+        if b"NX" in options and self._get(key) is not None:
+            return None
+        for option, multiplier in ((b"PX", 0.001), (b"EX", 1.0)):
+            if option in options:
+                expires_at = time.monotonic() + int(args[2 + options.index(option) + 1]) * multiplier
+        self._data[key] = (value, expires_at)
+        return "OK"
+
+    def _scan(self, args: List[bytes]) -> Any:
+        options = [arg.upper() for arg in args[1:]]
+        pattern = args[1 + options.index(b"MATCH") + 1].decode("utf-8") if b"MATCH" in options else "*"
+        keys = [key for key in list(self._data) if self._get(key) is not None
+                and fnmatch.fnmatchcase(key.decode("utf-8"), pattern)]
+        return [b"0", keys]
+
+    async def _publish(self, channel: bytes, message: bytes) -> int:
+        writers = list(self._subscribers.get(channel, ()))
+        for writer in writers:
+            writer.write(_encode([b"message", channel, message]))
+        return len(writers)
+
+    async def _dispatch(self, command: List[bytes], writer: asyncio.StreamWriter) -> Optional[bytes]:
+        name, args = command[0].upper(), command[1:]
+        if name == b"PING":
+            return _encode("PONG")
+        if name in (b"AUTH", b"SELECT"):
+            return _encode("OK")
+        if name == b"FLUSHDB":
+            self._data.clear()
+            return _encode("OK")
+        if name == b"GET":
+            return _encode(self._get(args[0]))
+        if name == b"SET":
+            return _encode(self._set(args))
+        if name == b"DEL":
+            return _encode(sum(1 for key in args if self._get(key) is not None and self._data.pop(key, None)))
+        if name == b"EXISTS":
+            return _encode(sum(1 for key in args if self._get(key) is not None))
+        if name == b"SCAN":
+            return _encode(self._scan(args))
+        if name == b"PUBLISH":
+            return _encode(await self._publish(args[0], args[1]))
+        if name == b"SUBSCRIBE":
+            for position, channel in enumerate(args, start=1):
+                self._subscribers.setdefault(channel, set()).add(writer)
+                writer.write(_encode([b"subscribe", channel, position]))
+            return None
+        return _encode(ValueError(f"unknown command '{name.decode('utf-8')}'"))
+
+    async def _read_command(self, reader: asyncio.StreamReader) -> Optional[List[bytes]]:
+        header = await reader.readline()
+        if not header:
+            return None
+        count = int(header[1:-2])
+        command = []
+        for _ in range(count):
+            length = int((await reader.readline())[1:-2])
+            command.append((await reader.readexactly(length + 2))[:-2])
+        return command
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                command = await self._read_command(reader)
+                if command is None:
+                    break
+                reply = await self._dispatch(command, writer)
+                if reply is not None:
+                    writer.write(reply)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for writers in self._subscribers.values():
+                writers.discard(writer)
+            writer.close()
+
+    async def serve(self, host: str, port: int) -> None:
+        server = await asyncio.start_server(self.handle, host, port)
+        log.info(f"RESP stand-in server listening on {host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local Redis-protocol stand-in for the shared cache")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    arguments = parser.parse_args()
+    asyncio.run(RespStandInServer().serve(arguments.host, arguments.port))
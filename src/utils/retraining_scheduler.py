@@ -0,0 +1,86 @@
+import heapq
+import itertools
+import math
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Веса составляющих приоритета переобучения
+ACTIVITY_WEIGHT = 3.0
+DATA_WEIGHT = 1.0
+SIMULATION_WEIGHT = 1.5
+WAITING_WEIGHT = 2.0
+# За сколько часов вклад активности владельца падает вдвое
+ACTIVITY_HALF_LIFE_HOURS = 24.0
+# Ожидание дольше этого срока даёт полный вклад — давно ждущие агенты не голодают
+WAITING_CAP_HOURS = 48.0
+
+
+def _hours_since(moment: Optional[datetime], now: datetime) -> Optional[float]:
+    if moment is None:
+        return None
+    return max(0.0, (now - moment).total_seconds() / 3600)
+
+
+def retraining_priority(candidate: Dict[str, Any], now: Optional[datetime] = None) -> float:
+    """
+    Приоритет переобучения агента: недавняя активность владельца, объём необработанных
+    данных обучения, ожидающие симуляции и время ожидания самых старых данных
+    """
+    now = now or datetime.now()
+    score = 0.0
+
+    idle_hours = _hours_since(candidate.get('last_activity'), now)
+    if idle_hours is not None:
+        score += ACTIVITY_WEIGHT * 0.5 ** (idle_hours / ACTIVITY_HALF_LIFE_HOURS)
+
+    score += DATA_WEIGHT * math.log1p(int(candidate.get('unprocessed_count') or 0))
+    score += SIMULATION_WEIGHT * math.log1p(int(candidate.get('pending_simulations') or 0))
+
+    waiting_hours = _hours_since(candidate.get('oldest_unprocessed'), now)
+    if waiting_hours is not None:
+        score += WAITING_WEIGHT * min(waiting_hours / WAITING_CAP_HOURS, 1.0)
+
+    return round(score, 4)
+
+
+class RetrainingQueue:
+    """
+    Очередь агентов на переобучение с наибольшим приоритетом в начале.
+    Повторное добавление агента заменяет его приоритет (устаревшие записи кучи пропускаются)
+    """
+
+    def __init__(self) -> None:
+        self._heap: List[Tuple[float, int, int]] = []
+        self._priorities: Dict[int, float] = {}
+        self._counter = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._priorities)
+
+    def __contains__(self, agent_id: int) -> bool:
+        return agent_id in self._priorities
+
+    def push(self, agent_id: int, priority: float) -> None:
+        if self._priorities.get(agent_id) == priority:
+            return
+        self._priorities[agent_id] = priority
+        heapq.heappush(self._heap, (-priority, next(self._counter), agent_id))
+
+    def extend(self, items: Iterable[Tuple[int, float]]) -> None:
+        for agent_id, priority in items:
+            self.push(agent_id, priority)
+
+    def retain(self, agent_ids: Iterable[int]) -> None:
+        """Убрать из очереди агентов, которых нет среди agent_ids"""
+        keep = set(agent_ids)
+        for agent_id in [agent_id for agent_id in self._priorities if agent_id not in keep]:
+            del self._priorities[agent_id]
+
+    def pop(self) -> Tuple[int, float]:
+        """Извлечь агента с наибольшим приоритетом"""
+        while self._heap:
+            negative_priority, _, agent_id = heapq.heappop(self._heap)
+            if self._priorities.get(agent_id) == -negative_priority:
+                del self._priorities[agent_id]
+                return agent_id, -negative_priority
+        raise IndexError("pop from empty retraining queue")
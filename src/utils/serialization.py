@@ -0,0 +1,94 @@
+import json
+import threading
+import typing
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Type, TypeVar
+
+from pydantic import BaseModel, TypeAdapter
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+Coercer = Callable[[Any], Any]
+
+
+def _json_value(value: Any) -> Any:
+    return json.loads(value) if isinstance(value, (str, bytes, bytearray)) else value
+
+
+def _coercer_for(annotation: Any) -> Tuple[Optional[Coercer], bool]:
+    """
+    Приведение значения из БД, которое строгая схема иначе отвергнет:
+    tinyint -> bool (NULL -> False для обязательных флагов), JSON-текст -> dict/list.
+    Остальное pydantic принимает как есть. Возвращает (приведение, применять ли к NULL)
+    """
+    optional = False
+    if typing.get_origin(annotation) is typing.Union:
+        args = [arg for arg in typing.get_args(annotation) if arg is not type(None)]
+        optional = len(args) < len(typing.get_args(annotation))
+        annotation = args[0] if len(args) == 1 else annotation
+    if annotation is bool:
+        return bool, not optional
+    if (typing.get_origin(annotation) or annotation) in (dict, list):
+        return _json_value, False
+    return None, False
+
+
+class _ModelPlan:
+    """Заранее подготовленные для модели приведения полей и валидатор списка"""
+
+    def __init__(self, model: Type[BaseModel]) -> None:
+        coercers = []
+        for name, field in model.model_fields.items():
+            coercer, coerce_null = _coercer_for(field.annotation)
+            if coercer is not None:
+                coercers.append((name, coercer, coerce_null))
+        self.coercers: Tuple[Tuple[str, Coercer, bool], ...] = tuple(coercers)
+        self.list_adapter = TypeAdapter(List[model])
+
+    def coerce(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        copied = False
+        for name, coercer, coerce_null in self.coercers:
+            value = row.get(name)
+            if value is not None or (coerce_null and name in row):
+                coerced = coercer(value)
+                if coerced is not value:
+                    if not copied:
+                        row, copied = dict(row), True
+                    row[name] = coerced
+        return row
+
+
+_plans: Dict[Type[BaseModel], _ModelPlan] = {}
+_plans_lock = threading.Lock()
+
+
+def _plan(model: Type[BaseModel]) -> _ModelPlan:
+    plan = _plans.get(model)
+    if plan is None:
+        with _plans_lock:
+            plan = _plans.get(model)
+            if plan is None:
+                plan = _plans[model] = _ModelPlan(model)
+    return plan
+
+
+def coerce_row(model: Type[BaseModel], row: Dict[str, Any]) -> Dict[str, Any]:
+    """Привести значения строки БД к типам полей модели (без валидации)"""
+    return _plan(model).coerce(row)
+
+
+def db_model(model: Type[ModelT], row: Dict[str, Any]) -> ModelT:
+    """Модель из строки БД (лишние колонки игнорируются)"""
+    plan = _plan(model)
+    return model.model_validate(plan.coerce(row))
+
+
+def db_models(model: Type[ModelT], rows: Iterable[Dict[str, Any]]) -> List[ModelT]:
+    """Список моделей из строк БД одним вызовом валидатора pydantic-core"""
+    plan = _plan(model)
+    return plan.list_adapter.validate_python([plan.coerce(row) for row in rows])
+
+
+def db_models_by(model: Type[ModelT], rows: Iterable[Dict[str, Any]], key: str = "id") -> Dict[Any, ModelT]:
+    """Модели из строк БД в словаре по значению колонки key (ответы multi-get)"""
+    rows = list(rows)
+    return dict(zip((row[key] for row in rows), db_models(model, rows)))
@@ -0,0 +1,291 @@
+import hashlib
+import json
+import random
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from src.utils.compatibility import score_compatibility, summarize_compatibility
+from src.utils.env import Env
+
+env = Env()
+
+# Меняется при любом изменении логики движка или бэкендов, влияющем на результат
+ENGINE_VERSION = "template-2"
+
+DEFAULT_TURNS = 8
+DEFAULT_BACKEND_BATCH_SIZE = 64
+
+
+@dataclass
+class SimulationSpec:
+    """Входные данные одной симуляции: два агента и их личности"""
+    simulation_id: int
+    agent1_id: int
+    personality1: Dict[str, Any]
+    agent2_id: int
+    personality2: Dict[str, Any]
+    # Совместимость личностей, если уже посчитана по сохранённым векторам (иначе считается движком)
+    affinity: Optional[float] = None
+
+
+@dataclass
+class TurnRequest:
+    """Запрос к бэкенду на одну реплику"""
+    simulation_id: int
+    turn: int
+    speaker_personality: Dict[str, Any]
+    listener_personality: Dict[str, Any]
+    history: List[str]
+    affinity: float
+    seed: str
+
+
+@dataclass
+class TurnResult:
+    """Ответ бэкенда: текст реплики и её тональность (-1..1)"""
+    text: str
+    sentiment: float
+
+
+@dataclass
+class SimulationTurn:
+    """Реплика симуляции, готовая к сохранению"""
+    simulation_id: int
+    turn: int
+    sender_agent_id: int
+    message_text: str
+    sentiment_score: float
+
+
+@dataclass
+class SimulationResult:
+    """Итог симуляции"""
+    simulation_id: int
+    compatibility_score: float
+    simulation_summary: str
+    turns: List[SimulationTurn] = field(default_factory=list)
+
+
+class ModelBackend:
+    """
+    Интерфейс бэкенда генерации реплик. generate получает пакет запросов
+    от разных симуляций и возвращает ответы в том же порядке
+    """
+
+    name = "base"
+
+    def generate(self, requests: List[TurnRequest]) -> List[TurnResult]:
+        raise NotImplementedError
+
+
+_CORPUS = (
+    "мне нравится узнавать новое и делиться впечатлениями. "
+    "я часто думаю о том куда поехать в следующий раз. "
+    "по выходным люблю гулять и встречаться с друзьями. "
+    "иногда хочется просто тихо провести вечер с книгой. "
+    "мне кажется важно уметь слушать собеседника. "
+    "хорошая музыка всегда поднимает мне настроение. "
+    "я стараюсь пробовать что то новое каждый месяц. "
+    "люблю когда разговор идёт легко и без спешки. "
+    "мне интересно что вдохновляет других людей. "
+    "я ценю честность и чувство юмора."
+)
+
+
+def _build_chain(corpus: str) -> Dict[str, List[str]]:
+    words = corpus.split()
+    chain: Dict[str, List[str]] = {}
+    for current, following in zip(words, words[1:]):
+        chain.setdefault(current, []).append(following)
+    return chain
+
+
+class TemplateBackend(ModelBackend):
+    """
+    Детерминированный локальный бэкенд: шаблоны по интересам и стилю общения
+    плюс цепь Маркова первого порядка. Один и тот же вход всегда даёт один и тот же диалог
+    """
+
+    name = "template"
+
+    _chain = _build_chain(_CORPUS)
+    _starts = [word for word in _CORPUS.split() if word in ("мне", "я", "люблю", "по", "иногда", "хорошая")]
+
+    def generate(self, requests: List[TurnRequest]) -> List[TurnResult]:
+        return [self._generate_one(request) for request in requests]
+
+    def _generate_one(self, request: TurnRequest) -> TurnResult:
+        rng = random.Random(f"{request.seed}:{request.turn}:{ENGINE_VERSION}")
+        speaker = request.speaker_personality or {}
+        listener = request.listener_personality or {}
+
+        interests = self._list(speaker.get("interests"))
+        shared = [i for i in interests if i in self._list(listener.get("interests"))]
+        topic = rng.choice(shared or interests) if (shared or interests) else None
+        patterns = " ".join(self._list(speaker.get("response_patterns"))).lower()
+
+        if request.turn == 0:
+            text = "Привет! " + (f"Вижу, тебе тоже интересно {topic}." if topic in shared else "Рад познакомиться.")
+        elif topic:
+            text = rng.choice([
+                f"Кстати, про {topic}: ",
+                f"Если говорить о {topic}, ",
+                "Понимаю, "
+            ]) + self._sentence(rng)
+        else:
+            text = self._sentence(rng).capitalize()
+
+        if "question" in patterns or "вопрос" in patterns:
+            text += rng.choice([" А ты как думаешь?", " Расскажешь подробнее?", " А у тебя как?"])
+        if "emoji" in patterns or "эмодзи" in patterns:
+            text += rng.choice([" :)", " ;)", " :D"])
+
+        sentiment = request.affinity * 2 - 1 + rng.uniform(-0.2, 0.2) + (0.1 if topic in shared else 0.0)
+        return TurnResult(text=text, sentiment=round(max(-1.0, min(1.0, sentiment)), 2))
+
+    def _sentence(self, rng: random.Random, max_words: int = 14) -> str:
+        word = rng.choice(self._starts)
+        words = [word]
+        while not word.endswith(".") and len(words) < max_words:
+            word = rng.choice(self._chain.get(word) or ["."])
+            words.append(word)
+        sentence = " ".join(words)
+        return sentence if sentence.endswith(".") else sentence + "."
+
+    @staticmethod
+    def _list(value: Any) -> List[str]:
+        if isinstance(value, str):
+            return [value]
+        if isinstance(value, (list, tuple)):
+            return [str(item) for item in value]
+        return []
+
+
+_backends: Dict[str, Callable[[], ModelBackend]] = {
+    TemplateBackend.name: TemplateBackend
+}
+
+
+def register_backend(name: str, factory: Callable[[], ModelBackend]) -> None:
+    """Зарегистрировать бэкенд генерации под именем (для SIMULATION_BACKEND)"""
+    _backends[name] = factory
+
+
+def get_backend(name: str) -> ModelBackend:
+    """Создать бэкенд по имени"""
+    if name not in _backends:
+        raise ValueError(f"Unknown simulation backend: {name}")
+    return _backends[name]()
+
+
+def _load(personality_data: Any) -> Dict[str, Any]:
+    if isinstance(personality_data, (str, bytes)):
+        return json.loads(personality_data)
+    return personality_data or {}
+
+
+def personality_pair_key(personality1: Dict[str, Any], personality2: Dict[str, Any]) -> str:
+    """Стабильный хеш пары личностей (порядок агентов важен: первый начинает диалог)"""
+    payload = json.dumps([personality1, personality2], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def simulation_cache_key(personality1: Any, personality2: Any, engine_version: str) -> str:
+    """Ключ кеша результата симуляции: хеш обеих личностей и версии движка"""
+    pair_key = personality_pair_key(_load(personality1), _load(personality2))
+    return hashlib.sha256(f"{pair_key}:{engine_version}".encode("utf-8")).hexdigest()
+
+
+class SimulationEngine:
+    """
+    Пошаговая генерация диалогов для пакета симуляций. На каждом ходе запросы
+    всех симуляций пакета отправляются в бэкенд пачками по batch_size
+    """
+
+    def __init__(self, backend: ModelBackend, turns: int = DEFAULT_TURNS,
+                 batch_size: int = DEFAULT_BACKEND_BATCH_SIZE) -> None:
+        self.backend = backend
+        self.turns = turns
+        self.batch_size = batch_size
+
+    @property
+    def version(self) -> str:
+        return f"{ENGINE_VERSION}:{self.backend.name}:{self.turns}"
+
+    def run(
+        self,
+        specs: List[SimulationSpec],
+        on_round: Optional[Callable[[List[SimulationTurn]], None]] = None
+    ) -> List[SimulationResult]:
+        """Прогнать симуляции; on_round получает реплики каждого хода всех симуляций разом"""
+        for spec in specs:
+            spec.personality1 = _load(spec.personality1)
+            spec.personality2 = _load(spec.personality2)
+
+        affinities = [
+            spec.affinity if spec.affinity is not None else score_compatibility(spec.personality1, spec.personality2)
+            for spec in specs
+        ]
+        seeds = [personality_pair_key(spec.personality1, spec.personality2) for spec in specs]
+        histories: List[List[str]] = [[] for _ in specs]
+        results = [SimulationResult(spec.simulation_id, 0.0, "") for spec in specs]
+
+        for turn in range(self.turns):
+            requests = []
+            for spec, affinity, seed, history in zip(specs, affinities, seeds, histories):
+                first_speaks = turn % 2 == 0
+                requests.append(TurnRequest(
+                    simulation_id=spec.simulation_id,
+                    turn=turn,
+                    speaker_personality=spec.personality1 if first_speaks else spec.personality2,
+                    listener_personality=spec.personality2 if first_speaks else spec.personality1,
+                    history=history,
+                    affinity=affinity,
+                    seed=seed
+                ))
+
+            responses: List[TurnResult] = []
+            for start in range(0, len(requests), self.batch_size):
+                responses.extend(self.backend.generate(requests[start:start + self.batch_size]))
+
+            round_turns = []
+            for spec, history, result, response in zip(specs, histories, results, responses):
+                history.append(response.text)
+                simulation_turn = SimulationTurn(
+                    simulation_id=spec.simulation_id,
+                    turn=turn,
+                    sender_agent_id=spec.agent1_id if turn % 2 == 0 else spec.agent2_id,
+                    message_text=response.text,
+                    sentiment_score=response.sentiment
+                )
+                result.turns.append(simulation_turn)
+                round_turns.append(simulation_turn)
+
+            if on_round and round_turns:
+                on_round(round_turns)
+
+        for result, affinity in zip(results, affinities):
+            mean_sentiment = (
+                sum(t.sentiment_score for t in result.turns) / len(result.turns) if result.turns else 0.0
+            )
+            result.compatibility_score = round(0.6 * affinity + 0.4 * (mean_sentiment + 1) / 2, 2)
+            result.simulation_summary = (
+                f"{summarize_compatibility(result.compatibility_score)} "
+                f"Диалог из {len(result.turns)} реплик, средняя тональность {mean_sentiment:.2f}."
+            )
+        return results
+
+
+_engine: Optional[SimulationEngine] = None
+
+
+def get_simulation_engine() -> SimulationEngine:
+    """Движок по настройкам окружения (SIMULATION_BACKEND, SIMULATION_TURNS, SIMULATION_BACKEND_BATCH_SIZE)"""
+    global _engine
+    if _engine is None:
+        _engine = SimulationEngine(
+            get_backend(env.__getattr__("SIMULATION_BACKEND") or TemplateBackend.name),
+            int(env.__getattr__("SIMULATION_TURNS") or DEFAULT_TURNS),
+            int(env.__getattr__("SIMULATION_BACKEND_BATCH_SIZE") or DEFAULT_BACKEND_BATCH_SIZE)
+        )
+    return _engine
@@ -0,0 +1,153 @@
+import zlib
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Формат: MAGIC + версия (1 байт) + zlib(колонки)
+# Колонки: число реплик, словарь «прочих» отправителей, коды отправителей,
+# тональности, смещения времени (мс), длины текстов, тексты подряд
+MAGIC = b"AT"
+FORMAT_VERSION = 1
+COMPRESSION_LEVEL = 6
+
+# Коды отправителей: 0 — agent1 симуляции, 1 — agent2, 2+k — k-й агент из словаря
+SPEAKER_AGENT1 = 0
+SPEAKER_AGENT2 = 1
+SPEAKER_ROLES = {SPEAKER_AGENT1: "agent1", SPEAKER_AGENT2: "agent2"}
+
+
+def _write_varint(buffer: bytearray, value: int) -> None:
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            buffer.append(byte | 0x80)
+        else:
+            buffer.append(byte)
+            return
+
+
+def _read_varint(data: bytes, offset: int) -> Tuple[int, int]:
+    result = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, offset
+        shift += 7
+
+
+def _encode_sentiment(score: Any) -> int:
+    # 0 — NULL, иначе score * 100 + 101 (DECIMAL(3,2) в диапазоне -1..1 без потерь)
+    return 0 if score is None else int(round(float(score) * 100)) + 101
+
+
+def _decode_sentiment(code: int) -> Optional[float]:
+    return None if code == 0 else (code - 101) / 100
+
+
+def encode_transcript(
+    messages: Iterable[Dict[str, Any]],
+    agent1_id: int,
+    agent2_id: int
+) -> Tuple[bytes, int, int, Optional[datetime]]:
+    """
+    Сжать сообщения симуляции (sender_agent_id, message_text, sentiment_score, created_at)
+    в один блоб. Возвращает (блоб, число реплик, размер без сжатия, время первой реплики)
+    """
+    messages = list(messages)
+    others: List[int] = []
+    speakers: List[int] = []
+    for message in messages:
+        sender = message['sender_agent_id']
+        if sender == agent1_id:
+            speakers.append(SPEAKER_AGENT1)
+        elif sender == agent2_id:
+            speakers.append(SPEAKER_AGENT2)
+        else:
+            if sender not in others:
+                others.append(sender)
+            speakers.append(2 + others.index(sender))
+
+    base_time = messages[0].get('created_at') if messages else None
+    texts = [message['message_text'].encode("utf-8") for message in messages]
+
+    columns = bytearray()
+    _write_varint(columns, len(messages))
+    _write_varint(columns, len(others))
+    for agent_id in others:
+        _write_varint(columns, agent_id)
+    for speaker in speakers:
+        _write_varint(columns, speaker)
+    for message in messages:
+        _write_varint(columns, _encode_sentiment(message.get('sentiment_score')))
+    for message in messages:
+        created_at = message.get('created_at')
+        delta = int((created_at - base_time).total_seconds() * 1000) if created_at and base_time else 0
+        _write_varint(columns, max(0, delta))
+    for text in texts:
+        _write_varint(columns, len(text))
+    for text in texts:
+        columns.extend(text)
+
+    blob = MAGIC + bytes([FORMAT_VERSION]) + zlib.compress(bytes(columns), COMPRESSION_LEVEL)
+    return blob, len(messages), len(columns), base_time
+
+
+class CompactTranscript:
+    """Транскрипт симуляции, распаковываемый при первом обращении к репликам"""
+
+    def __init__(self, blob: bytes, agent1_id: int, agent2_id: int, base_time: Optional[datetime]) -> None:
+        if blob[:2] != MAGIC or blob[2] != FORMAT_VERSION:
+            raise ValueError("Unsupported transcript format")
+        self._blob = blob
+        self.agent1_id = agent1_id
+        self.agent2_id = agent2_id
+        self.base_time = base_time
+        self._turns: Optional[List[Dict[str, Any]]] = None
+
+    @property
+    def turns(self) -> List[Dict[str, Any]]:
+        """Реплики в порядке диалога: role, sender_agent_id, message_text, sentiment_score, created_at"""
+        if self._turns is None:
+            self._turns = self._decode()
+        return self._turns
+
+    def _decode(self) -> List[Dict[str, Any]]:
+        data = zlib.decompress(self._blob[3:])
+        count, offset = _read_varint(data, 0)
+        others_count, offset = _read_varint(data, offset)
+        others = []
+        for _ in range(others_count):
+            agent_id, offset = _read_varint(data, offset)
+            others.append(agent_id)
+
+        def column() -> List[int]:
+            nonlocal offset
+            values = []
+            for _ in range(count):
+                value, offset = _read_varint(data, offset)
+                values.append(value)
+            return values
+
+        speakers, sentiments, deltas, lengths = column(), column(), column(), column()
+
+        turns = []
+        for speaker, sentiment, delta, length in zip(speakers, sentiments, deltas, lengths):
+            text = data[offset:offset + length].decode("utf-8")
+            offset += length
+            if speaker == SPEAKER_AGENT1:
+                sender = self.agent1_id
+            elif speaker == SPEAKER_AGENT2:
+                sender = self.agent2_id
+            else:
+                sender = others[speaker - 2]
+            turns.append({
+                "role": SPEAKER_ROLES.get(speaker, "other"),
+                "sender_agent_id": sender,
+                "message_text": text,
+                "sentiment_score": _decode_sentiment(sentiment),
+                "created_at": self.base_time + timedelta(milliseconds=delta) if self.base_time else None
+            })
+        return turns
@@ -1,20 +1,27 @@
-from typing import Dict
+from functools import lru_cache
+from typing import Dict, List
 import inspect
 
+from src.utils.data_loader import BatchFetch, DataLoaders, expand_fields, relation_name
+
+
+@lru_cache(maxsize=None)
+def _accepts_dirs(get_entity_by_id) -> bool:
+    # Сигнатура функции не меняется — инспектируем её один раз
+    return 'dirs' in inspect.signature(get_entity_by_id).parameters
+
 
 def transform_field(field: str,
                     iter_data: Dict,
                     get_entity_by_id):
 
-    name_entity = field.split("_id")[0]
+    name_entity = relation_name(field)
     entity_id = iter_data.get(field)
 
     if entity_id:
         # Проверяем, является ли get_entity_by_id функцией или объектом
         if callable(get_entity_by_id):
-            # Инспектируем сигнатуру функции для проверки наличия аргумента dirs
-            sig = inspect.signature(get_entity_by_id)
-            if 'dirs' in sig.parameters:
+            if _accepts_dirs(get_entity_by_id):
                 entity = get_entity_by_id(entity_id, dirs=True)
             else:
                 entity = get_entity_by_id(entity_id)
@@ -29,3 +36,12 @@ def transform_field(field: str,
 
     return iter_data
 
+
+def transform_fields(field: str,
+                     rows: List[Dict],
+                     get_entities_by_ids: BatchFetch,
+                     loaders: DataLoaders = None) -> List[Dict]:
+    """Пакетный вариант transform_field: одно поле во всех строках одним запросом IN (...)"""
+    if not callable(get_entities_by_ids):
+        raise ValueError("Argument get_entities_by_ids must be a function")
+    return expand_fields(rows, {field: get_entities_by_ids}, loaders)